@@ -5,7 +5,7 @@ Comprehensive course management with curriculum organization
 
 from typing import List, Optional, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, UploadFile, File
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, joinedload, contains_eager
 from sqlalchemy import func, and_, or_, desc
 
 from ..database import get_db
@@ -16,7 +16,7 @@ from ..schemas.content_schemas import (
     LessonSummaryResponse, QuizSummaryResponse
 )
 from ..core.security import get_current_user_token, require_admin_role, rate_limit_check
-from ..utils.pagination import paginate_query
+from ..utils.pagination import CursorError, paginate, page_metadata, count_by_parent
 from ..utils.cache import cache_result, invalidate_cache_pattern
 from ..utils.validators import validate_course_data
 from ..utils.file_handler import save_course_thumbnail, delete_course_files
@@ -33,6 +33,8 @@ async def list_courses(
     request: Request,
     page: int = Query(1, ge=1, description="Page number"),
     page_size: int = Query(20, ge=1, le=100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor or prev_cursor of a previous page; takes precedence over page"),
+    count: Optional[str] = Query(None, regex="^(exact|estimated|cached|none)$", description="How to compute the total; none skips it"),
     subject_id: Optional[int] = Query(None, description="Filter by subject"),
     search: Optional[str] = Query(None, description="Search in course name and description"),
     level: Optional[str] = Query(None, description="Filter by course level"),
@@ -47,8 +49,8 @@ async def list_courses(
     List courses with filtering, searching, and pagination
     """
     try:
-        # Build query with joins for efficient loading
-        query = db.query(Course).join(Subject)
+        # Build query with joins for efficient loading; the joined subject fills course.subject
+        query = db.query(Course).join(Subject).options(contains_eager(Course.subject))
         
         # Apply filters
         if subject_id:
@@ -83,31 +85,20 @@ async def list_courses(
         else:
             sort_column = getattr(Course, sort_by, Course.name)
         
-        if sort_order == "desc":
-            query = query.order_by(sort_column.desc())
-        else:
-            query = query.order_by(sort_column.asc())
-        
-        # Add secondary sort by order_index
-        query = query.order_by(Course.order_index)
+        # Secondary sort by order_index; the id makes the order total, for cursors
+        sort_keys = [(sort_column, sort_order == "desc"), (Course.order_index, False), (Course.id, False)]
         
         # Get paginated results
-        result = paginate_query(query, page, page_size)
+        result = paginate(query, sort_keys, page, page_size, cursor, count)
+        
+        # Get lesson and quiz counts of the whole page in one grouped query each
+        course_ids = [course.id for course in result["items"]]
+        lesson_counts = count_by_parent(db, Lesson.course_id, course_ids, Lesson.is_active == True)
+        quiz_counts = count_by_parent(db, Quiz.course_id, course_ids, Quiz.is_active == True)
         
         # Prepare response with additional data
         courses_with_details = []
         for course in result["items"]:
-            # Get lesson and quiz counts
-            lesson_count = db.query(func.count(Lesson.id)).filter(
-                Lesson.course_id == course.id,
-                Lesson.is_active == True
-            ).scalar()
-            
-            quiz_count = db.query(func.count(Quiz.id)).filter(
-                Quiz.course_id == course.id,
-                Quiz.is_active == True
-            ).scalar()
-            
             # Get enrollment count (if implemented)
             enrollment_count = 0  # Would come from enrollment service
             
@@ -120,8 +111,8 @@ async def list_courses(
                 "level": course.level,
                 "duration_hours": course.duration_hours,
                 "order_index": course.order_index,
-                "lesson_count": lesson_count,
-                "quiz_count": quiz_count,
+                "lesson_count": lesson_counts.get(course.id, 0),
+                "quiz_count": quiz_counts.get(course.id, 0),
                 "enrollment_count": enrollment_count,
                 "thumbnail_url": course.thumbnail_url,
                 "difficulty": course.difficulty,
@@ -137,12 +128,14 @@ async def list_courses(
         
         return CourseListResponse(
             courses=courses_with_details,
-            total=result["total"],
-            page=result["page"],
-            page_size=result["page_size"],
-            total_pages=result["total_pages"]
+            **page_metadata(result)
         )
         
+    except CursorError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Error listing courses: {e}")
         raise HTTPException(
@@ -5,21 +5,21 @@ Comprehensive lesson management with content delivery and progress tracking
 
 from typing import List, Optional, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, UploadFile, File, Form
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, joinedload, contains_eager
 from sqlalchemy import func, and_, or_, desc
 
 from ..database import get_db
-from ..models.content_models import Lesson, Course, Subject
-from ..models.progress_models import LessonProgress
+from ..models.content_models import Lesson, Course, CourseEnrollment, LessonProgress, Subject
 from ..schemas.content_schemas import (
     LessonCreate, LessonUpdate, LessonResponse,
-    LessonListResponse, LessonDetailResponse
+    LessonListResponse, LessonDetailResponse, LessonHeartbeatRequest
 )
 from ..core.security import get_current_user_token, require_admin_role, rate_limit_check
-from ..utils.pagination import paginate_query
-from ..utils.cache import cache_result, invalidate_cache_pattern
+from ..utils.pagination import CursorError, paginate, page_metadata
+from ..utils.cache import cache, cache_result, invalidate_cache_pattern
 from ..utils.validators import validate_lesson_data
 from ..utils.file_handler import save_lesson_files, delete_lesson_files
+from ..services.progress_buffer import LessonHeartbeat, lesson_progress_buffer
 
 import logging
 
@@ -27,12 +27,16 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+HEARTBEAT_INFO_TTL = 300
+
 
 @router.get("/", response_model=LessonListResponse)
 async def list_lessons(
     request: Request,
     page: int = Query(1, ge=1, description="Page number"),
     page_size: int = Query(20, ge=1, le=100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor or prev_cursor of a previous page; takes precedence over page"),
+    count: Optional[str] = Query(None, regex="^(exact|estimated|cached|none)$", description="How to compute the total; none skips it"),
     course_id: Optional[int] = Query(None, description="Filter by course"),
     lesson_type: Optional[str] = Query(None, description="Filter by lesson type"),
     difficulty_level: Optional[str] = Query(None, description="Filter by difficulty"),
@@ -49,7 +53,9 @@ async def list_lessons(
     """
     try:
         # Build query with joins for efficient loading
-        query = db.query(Lesson).join(Course).join(Subject)
+        query = db.query(Lesson).join(Course).join(Subject).options(
+            contains_eager(Lesson.course).contains_eager(Course.subject)
+        )
         
         # Apply filters
         if course_id:
@@ -89,30 +95,34 @@ async def list_lessons(
         else:
             sort_column = getattr(Lesson, sort_by, Lesson.order_index)
         
-        if sort_order == "desc":
-            query = query.order_by(sort_column.desc())
-        else:
-            query = query.order_by(sort_column.asc())
+        sort_keys = [(sort_column, sort_order == "desc")]
         
         # Add secondary sort by order_index if not primary sort
         if sort_by != "order_index":
-            query = query.order_by(Lesson.order_index)
+            sort_keys.append((Lesson.order_index, False))
+        # The id makes the order total, for cursors
+        sort_keys.append((Lesson.id, False))
         
         # Get paginated results
-        result = paginate_query(query, page, page_size)
+        result = paginate(query, sort_keys, page, page_size, cursor, count)
         
         # Prepare response with progress data for current user
         lessons_with_progress = []
         user_id = current_user.get("user_id")
         
-        for lesson in result["items"]:
-            # Get user progress for this lesson
-            progress = None
-            if user_id:
-                progress = db.query(LessonProgress).filter(
-                    LessonProgress.lesson_id == lesson.id,
+        # Get user progress for every lesson on the page at once
+        progress_by_lesson = {}
+        if user_id and result["items"]:
+            progress_by_lesson = {
+                progress.lesson_id: progress
+                for progress in db.query(LessonProgress).filter(
+                    LessonProgress.lesson_id.in_([lesson.id for lesson in result["items"]]),
                     LessonProgress.user_id == user_id
-                ).first()
+                )
+            }
+        
+        for lesson in result["items"]:
+            progress = progress_by_lesson.get(lesson.id)
             
             lesson_dict = {
                 "id": lesson.id,
@@ -141,12 +151,14 @@ async def list_lessons(
         
         return LessonListResponse(
             lessons=lessons_with_progress,
-            total=result["total"],
-            page=result["page"],
-            page_size=result["page_size"],
-            total_pages=result["total_pages"]
+            **page_metadata(result)
         )
         
+    except CursorError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Error listing lessons: {e}")
         raise HTTPException(
@@ -546,6 +558,89 @@ async def upload_lesson_files(
         )
 
 
+@router.post("/{lesson_id}/heartbeat", response_model=Dict[str, Any], status_code=status.HTTP_202_ACCEPTED)
+async def record_lesson_heartbeat(
+    lesson_id: int,
+    heartbeat: LessonHeartbeatRequest,
+    db: Session = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(get_current_user_token)
+):
+    """
+    Report lesson playback progress. Heartbeats are buffered and written in
+    batches; a completion is applied immediately.
+    """
+    # Not behind rate_limit_check: its per-IP limit would lock out a classroom sharing one address
+    try:
+        user_id = current_user.get("user_id")
+        if not user_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="User context required to track progress"
+            )
+        
+        # Lesson course, cached so heartbeats do not query the database
+        def load():
+            course_id = db.query(Lesson.course_id).filter(Lesson.id == lesson_id).scalar()
+            return {"course_id": course_id} if course_id else {}
+        info = cache.get_or_compute(f"lesson:{lesson_id}:heartbeat_info", load, HEARTBEAT_INFO_TTL)
+        
+        if not info:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Lesson not found"
+            )
+        
+        # Only students enrolled in the course track progress (cached once enrolled)
+        if current_user.get("role", "") not in ["admin", "super_admin"]:
+            enrollment_key = f"user:{user_id}:enrollment:{info['course_id']}"
+            if not cache.get(enrollment_key):
+                enrolled = db.query(CourseEnrollment.id).filter(
+                    CourseEnrollment.user_id == user_id,
+                    CourseEnrollment.course_id == info["course_id"],
+                    CourseEnrollment.is_active == True
+                ).first() is not None
+                if not enrolled:
+                    raise HTTPException(
+                        status_code=status.HTTP_403_FORBIDDEN,
+                        detail="You must be enrolled in the course to track progress"
+                    )
+                cache.set(enrollment_key, True, HEARTBEAT_INFO_TTL)
+        
+        event = LessonHeartbeat(
+            user_id=user_id,
+            lesson_id=lesson_id,
+            course_id=info["course_id"],
+            position=heartbeat.position,
+            seconds=heartbeat.seconds,
+            completion_percentage=heartbeat.completion_percentage
+        )
+        
+        if not heartbeat.completed:
+            lesson_progress_buffer.add(event)
+            return {"lesson_id": lesson_id, "status": "accepted"}
+        
+        progress = lesson_progress_buffer.complete(db, event)
+        logger.info(f"Lesson {lesson_id} completed by user {user_id}")
+        
+        return {
+            "lesson_id": lesson_id,
+            "status": "completed",
+            "is_completed": progress.is_completed,
+            "completed_at": progress.completed_at,
+            "time_spent": progress.time_spent,
+            "last_position": progress.last_position
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error recording heartbeat for lesson {lesson_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to record lesson progress"
+        )
+
+
 @router.delete("/{lesson_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_lesson(
     lesson_id: int,
@@ -10,7 +10,7 @@ from sqlalchemy import func, and_, or_, desc
 
 from ..database import get_db
 from ..models.progress_models import QuizProgress, CourseProgress, LessonProgress
-from ..models.content_models import Quiz, Course, Lesson, Subject
+from ..models.content_models import Quiz, Course, Lesson, Subject, UserCourseProgressSummary
 from ..schemas.progress_schemas import (
     QuizProgressResponse, CourseProgressResponse, LessonProgressResponse,
     ProgressSummaryResponse, ProgressStatsResponse
@@ -18,6 +18,7 @@ from ..schemas.progress_schemas import (
 from ..core.security import get_current_user_token, require_admin_role, rate_limit_check
 from ..utils.pagination import paginate_query
 from ..utils.cache import cache_result, invalidate_cache_pattern
+from ..services.progress_summary import progress_summary, recent_completion_totals, COUNTERS, USER_COUNTERS
 
 import logging
 from datetime import datetime, timedelta
@@ -312,92 +313,44 @@ async def get_progress_summary(
                 detail="User ID required"
             )
         
-        # Build base queries
-        course_query = db.query(Course).join(Subject)
-        lesson_query = db.query(Lesson).join(Course).join(Subject)
-        quiz_query = db.query(Quiz).join(Course).join(Subject)
+        # Catalog totals are per subject, not per user (cached)
+        totals = progress_summary.catalog_totals(db, subject_id)
+        total_courses, total_lessons, total_quizzes = totals["courses"], totals["lessons"], totals["quizzes"]
         
-        # Apply school isolation (if not admin)
-        user_role = current_user.get("role", "")
-        if user_role not in ["admin", "super_admin"]:
-            school_id = current_user.get("school_id")
-            if school_id:
-                course_query = course_query.filter(Subject.school_id == school_id)
-                lesson_query = lesson_query.filter(Subject.school_id == school_id)
-                quiz_query = quiz_query.filter(Subject.school_id == school_id)
-        
-        # Apply subject filter
+        # The user's counters: one primary key lookup of the maintained summary
+        summary = progress_summary.get_summary(db, target_user_id)
         if subject_id:
-            course_query = course_query.filter(Subject.id == subject_id)
-            lesson_query = lesson_query.filter(Subject.id == subject_id)
-            quiz_query = quiz_query.filter(Subject.id == subject_id)
-        
-        # Get totals
-        total_courses = course_query.filter(Course.is_active == True).count()
-        total_lessons = lesson_query.filter(Lesson.is_active == True).count()
-        total_quizzes = quiz_query.filter(Quiz.is_active == True).count()
-        
-        # Get completed counts
-        completed_courses = db.query(func.count(CourseProgress.id)).filter(
-            CourseProgress.user_id == target_user_id,
-            CourseProgress.status == "completed"
-        ).scalar()
-        
-        completed_lessons = db.query(func.count(LessonProgress.id)).filter(
-            LessonProgress.user_id == target_user_id,
-            LessonProgress.status == "completed"
-        ).scalar()
-        
-        completed_quizzes = db.query(func.count(QuizProgress.id)).filter(
-            QuizProgress.user_id == target_user_id,
-            QuizProgress.status == "completed"
-        ).scalar()
-        
-        # Get in progress counts
-        in_progress_courses = db.query(func.count(CourseProgress.id)).filter(
-            CourseProgress.user_id == target_user_id,
-            CourseProgress.status == "in_progress"
-        ).scalar()
+            # Subject-scoped counters come from the user's per-course summaries of that subject
+            course_rows = db.query(UserCourseProgressSummary).filter(
+                UserCourseProgressSummary.user_id == target_user_id,
+                UserCourseProgressSummary.subject_id == subject_id
+            ).all()
+            counters = {name: sum(getattr(row, name) for row in course_rows) for name in COUNTERS}
+            counters["completed_courses"] = sum(row.status == "completed" for row in course_rows)
+            counters["in_progress_courses"] = sum(row.status == "in_progress" for row in course_rows)
+        else:
+            counters = {name: getattr(summary, name) if summary else 0 for name in USER_COUNTERS}
         
-        in_progress_lessons = db.query(func.count(LessonProgress.id)).filter(
-            LessonProgress.user_id == target_user_id,
-            LessonProgress.status == "in_progress"
-        ).scalar()
+        completed_courses = counters["completed_courses"]
+        completed_lessons = counters["completed_lessons"]
+        completed_quizzes = counters["completed_quizzes"]
+        in_progress_courses = counters["in_progress_courses"]
+        in_progress_lessons = counters["in_progress_lessons"]
         
         # Calculate percentages
         course_completion_rate = (completed_courses / total_courses * 100) if total_courses > 0 else 0
         lesson_completion_rate = (completed_lessons / total_lessons * 100) if total_lessons > 0 else 0
         quiz_completion_rate = (completed_quizzes / total_quizzes * 100) if total_quizzes > 0 else 0
         
-        # Get total time spent
-        total_time_lessons = db.query(func.sum(LessonProgress.time_spent)).filter(
-            LessonProgress.user_id == target_user_id
-        ).scalar() or 0
-        
-        total_time_quizzes = db.query(func.sum(QuizProgress.time_spent)).filter(
-            QuizProgress.user_id == target_user_id
-        ).scalar() or 0
-        
-        total_time_spent = total_time_lessons + total_time_quizzes
-        
-        # Get recent activity (last 7 days)
-        week_ago = datetime.utcnow() - timedelta(days=7)
+        total_time_spent = counters["lesson_time_spent"] + counters["quiz_time_spent"]
         
-        recent_lesson_completions = db.query(func.count(LessonProgress.id)).filter(
-            LessonProgress.user_id == target_user_id,
-            LessonProgress.completed_at >= week_ago
-        ).scalar()
-        
-        recent_quiz_completions = db.query(func.count(QuizProgress.id)).filter(
-            QuizProgress.user_id == target_user_id,
-            QuizProgress.completed_at >= week_ago
-        ).scalar()
+        # Recent activity (last 7 days)
+        recent_lesson_completions, recent_quiz_completions = recent_completion_totals(
+            summary.recent_completions if summary else None, datetime.utcnow().date()
+        )
         
-        # Get average quiz scores
-        avg_quiz_score = db.query(func.avg(QuizProgress.percentage)).filter(
-            QuizProgress.user_id == target_user_id,
-            QuizProgress.status == "completed"
-        ).scalar() or 0
+        # Average of the best quiz scores
+        avg_quiz_score = counters["quiz_percentage_total"] / completed_quizzes if completed_quizzes else 0
         
         logger.info(f"Retrieved progress summary for user {target_user_id}")
         
@@ -418,7 +371,7 @@ async def get_progress_summary(
             recent_lesson_completions=recent_lesson_completions,
             recent_quiz_completions=recent_quiz_completions,
             average_quiz_score=round(avg_quiz_score, 2),
-            last_activity=datetime.utcnow()
+            last_activity=(summary.last_activity_at if summary else None) or datetime.utcnow()
         )
         
     except HTTPException:
@@ -16,9 +16,10 @@ from ..schemas.content_schemas import (
     QuestionImportResponse
 )
 from ..core.security import get_current_user_token, require_admin_role, rate_limit_check
-from ..utils.pagination import paginate_query
+from ..utils.pagination import CursorError, paginate, page_metadata
 from ..utils.cache import cache_result, invalidate_cache_pattern
 from ..utils.validators import validate_question_data
+from ..utils.quiz_grader import invalidate_answer_key
 from ..utils.file_handler import process_question_import_file
 
 import logging
@@ -36,6 +37,8 @@ async def list_questions(
     quiz_id: int = Query(..., description="Quiz ID to get questions for"),
     page: int = Query(1, ge=1, description="Page number"),
     page_size: int = Query(50, ge=1, le=100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor or prev_cursor of a previous page; takes precedence over page"),
+    count: Optional[str] = Query(None, regex="^(exact|estimated|cached|none)$", description="How to compute the total; none skips it"),
     question_type: Optional[str] = Query(None, description="Filter by question type"),
     search: Optional[str] = Query(None, description="Search in question text"),
     is_active: Optional[bool] = Query(None, description="Filter by active status"),
@@ -88,13 +91,10 @@ async def list_questions(
         
         # Apply sorting
         sort_column = getattr(Question, sort_by, Question.order_index)
-        if sort_order == "desc":
-            query = query.order_by(sort_column.desc())
-        else:
-            query = query.order_by(sort_column.asc())
+        sort_keys = [(sort_column, sort_order == "desc"), (Question.id, False)]
         
         # Get paginated results
-        result = paginate_query(query, page, page_size)
+        result = paginate(query, sort_keys, page, page_size, cursor, count)
         
         # Prepare response
         questions = [
@@ -120,14 +120,16 @@ async def list_questions(
         
         return QuestionListResponse(
             questions=questions,
-            total=result["total"],
-            page=result["page"],
-            page_size=result["page_size"],
-            total_pages=result["total_pages"]
+            **page_metadata(result)
         )
         
     except HTTPException:
         raise
+    except CursorError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Error listing questions for quiz {quiz_id}: {e}")
         raise HTTPException(
@@ -280,6 +282,7 @@ async def create_question(
         
         # Invalidate related caches
         invalidate_cache_pattern(f"quiz:{question_data.quiz_id}:*")
+        invalidate_answer_key(question_data.quiz_id)
         invalidate_cache_pattern(f"questions:*")
         
         logger.info(f"Created question {new_question.id} by user {current_user.get('user_id')}")
@@ -387,6 +390,7 @@ async def create_questions_bulk(
         
         # Invalidate related caches
         invalidate_cache_pattern(f"quiz:{bulk_data.quiz_id}:*")
+        invalidate_answer_key(bulk_data.quiz_id)
         invalidate_cache_pattern(f"questions:*")
         
         logger.info(f"Created {len(created_questions)} questions in bulk by user {current_user.get('user_id')}")
@@ -480,6 +484,7 @@ async def import_questions(
         
         # Invalidate related caches
         invalidate_cache_pattern(f"quiz:{quiz_id}:*")
+        invalidate_answer_key(quiz_id)
         invalidate_cache_pattern(f"questions:*")
         
         logger.info(f"Imported {result['imported_count']} questions for quiz {quiz_id} by user {current_user.get('user_id')}")
@@ -556,6 +561,7 @@ async def update_question(
         
         # Invalidate related caches
         invalidate_cache_pattern(f"quiz:{question.quiz_id}:*")
+        invalidate_answer_key(question.quiz_id)
         invalidate_cache_pattern(f"questions:*")
         
         logger.info(f"Updated question {question_id} by user {current_user.get('user_id')}")
@@ -638,6 +644,7 @@ async def delete_question(
         
         # Invalidate related caches
         invalidate_cache_pattern(f"quiz:{quiz_id}:*")
+        invalidate_answer_key(quiz_id)
         invalidate_cache_pattern(f"questions:*")
         
         logger.info(f"Deleted question {question_id} by user {current_user.get('user_id')}")
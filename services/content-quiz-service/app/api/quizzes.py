@@ -5,23 +5,25 @@ Comprehensive quiz management with AI-powered generation and automated grading
 
 from typing import List, Optional, Dict, Any
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, BackgroundTasks
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, joinedload, contains_eager
 from sqlalchemy import func, and_, or_, desc
 
 from ..database import get_db
-from ..models.content_models import Quiz, Course, Subject, Question, QuizSubmission
-from ..models.progress_models import QuizProgress
+from ..models.content_models import Quiz, Course, Subject, Question, QuizProgress, QuizSubmission
 from ..schemas.content_schemas import (
     QuizCreate, QuizUpdate, QuizResponse,
     QuizListResponse, QuizDetailResponse,
-    QuizSubmissionCreate, QuizSubmissionResponse
+    QuizSubmissionCreate, QuizSubmissionResponse,
+    QuizBatchGradeRequest, QuizBatchGradeResponse, QuizStatsResponse
 )
 from ..core.security import get_current_user_token, require_admin_role, rate_limit_check
-from ..utils.pagination import paginate_query
+from ..utils.pagination import CursorError, paginate, page_metadata, count_by_parent, latest_by_parent
 from ..utils.cache import cache_result, invalidate_cache_pattern
 from ..utils.validators import validate_quiz_data
-from ..utils.quiz_grader import grade_quiz_submission
+from ..utils.quiz_grader import grade_quiz_submissions
 from ..utils.ai_quiz_generator import generate_quiz_questions
+from ..services.grading_queue import grading_queue
+from ..services.quiz_stats import quiz_stats
 
 import logging
 from datetime import datetime, timedelta
@@ -36,6 +38,8 @@ async def list_quizzes(
     request: Request,
     page: int = Query(1, ge=1, description="Page number"),
     page_size: int = Query(20, ge=1, le=100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor or prev_cursor of a previous page; takes precedence over page"),
+    count: Optional[str] = Query(None, regex="^(exact|estimated|cached|none)$", description="How to compute the total; none skips it"),
     course_id: Optional[int] = Query(None, description="Filter by course"),
     quiz_type: Optional[str] = Query(None, description="Filter by quiz type"),
     search: Optional[str] = Query(None, description="Search in quiz title and description"),
@@ -51,7 +55,9 @@ async def list_quizzes(
     """
     try:
         # Build query with joins for efficient loading
-        query = db.query(Quiz).join(Course).join(Subject)
+        query = db.query(Quiz).join(Course).join(Subject).options(
+            contains_eager(Quiz.course).contains_eager(Course.subject)
+        )
         
         # Apply filters
         if course_id:
@@ -88,30 +94,33 @@ async def list_quizzes(
         else:
             sort_column = getattr(Quiz, sort_by, Quiz.order_index)
         
-        if sort_order == "desc":
-            query = query.order_by(sort_column.desc())
-        else:
-            query = query.order_by(sort_column.asc())
+        sort_keys = [(sort_column, sort_order == "desc")]
         
         # Add secondary sort by order_index if not primary sort
         if sort_by != "order_index":
-            query = query.order_by(Quiz.order_index)
+            sort_keys.append((Quiz.order_index, False))
+        # The id makes the order total, for cursors
+        sort_keys.append((Quiz.id, False))
         
         # Get paginated results
-        result = paginate_query(query, page, page_size)
+        result = paginate(query, sort_keys, page, page_size, cursor, count)
         
         # Prepare response with submission data for current user
         quizzes_with_submissions = []
         user_id = current_user.get("user_id")
+        quiz_ids = [quiz.id for quiz in result["items"]]
+        
+        # Question counts and the user's latest submission of every quiz on the page, one query each
+        question_counts = count_by_parent(db, Question.quiz_id, quiz_ids, Question.is_active == True)
+        latest_submissions = {}
+        if user_id:
+            latest_submissions = latest_by_parent(
+                db, QuizSubmission, QuizSubmission.quiz_id, QuizSubmission.submitted_at, quiz_ids,
+                QuizSubmission.user_id == user_id
+            )
         
         for quiz in result["items"]:
-            # Get user's latest submission for this quiz
-            submission = None
-            if user_id:
-                submission = db.query(QuizSubmission).filter(
-                    QuizSubmission.quiz_id == quiz.id,
-                    QuizSubmission.user_id == user_id
-                ).order_by(QuizSubmission.submitted_at.desc()).first()
+            submission = latest_submissions.get(quiz.id)
             
             quiz_dict = {
                 "id": quiz.id,
@@ -124,7 +133,7 @@ async def list_quizzes(
                 "time_limit": quiz.time_limit,
                 "passing_score": quiz.passing_score,
                 "total_questions": quiz.total_questions,
-                "question_count": quiz.question_count,
+                "question_count": question_counts.get(quiz.id, 0),
                 "order_index": quiz.order_index,
                 "is_active": quiz.is_active,
                 "user_submission": {
@@ -143,12 +152,14 @@ async def list_quizzes(
         
         return QuizListResponse(
             quizzes=quizzes_with_submissions,
-            total=result["total"],
-            page=result["page"],
-            page_size=result["page_size"],
-            total_pages=result["total_pages"]
+            **page_metadata(result)
         )
         
+    except CursorError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Error listing quizzes: {e}")
         raise HTTPException(
@@ -401,13 +412,15 @@ async def submit_quiz(
     quiz_id: int,
     request: Request,
     submission_data: QuizSubmissionCreate,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: Dict[str, Any] = Depends(get_current_user_token),
     _: None = Depends(lambda r: rate_limit_check(r, limit=5))
 ):
     """
     Submit quiz answers for grading
+    
+    Grading happens in the grading worker; the student is notified over
+    WebSocket when the result is ready.
     """
     try:
         # Get quiz
@@ -463,17 +476,14 @@ async def submit_quiz(
         )
         
         db.add(new_submission)
+        db.flush()
+        
+        # Queue grading in the same transaction so a stored submission is never left ungraded
+        grading_queue.enqueue(db, new_submission.id, quiz_id, user_id, commit=False)
+        quiz_stats.record_attempt(db, quiz_id)
         db.commit()
         db.refresh(new_submission)
         
-        # Grade the submission in background
-        background_tasks.add_task(
-            grade_quiz_submission,
-            new_submission.id,
-            quiz_id,
-            submission_data.answers
-        )
-        
         logger.info(f"Quiz {quiz_id} submitted by user {user_id}")
         
         return QuizSubmissionResponse(
@@ -501,6 +511,88 @@ async def submit_quiz(
         )
 
 
+@router.post("/{quiz_id}/grade", response_model=QuizBatchGradeResponse)
+async def grade_quiz_submissions_batch(
+    quiz_id: int,
+    request: Request,
+    grade_request: QuizBatchGradeRequest,
+    db: Session = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(require_admin_role),
+    _: None = Depends(lambda r: rate_limit_check(r, limit=10))
+):
+    """
+    Grade many submissions of a quiz against its compiled answer key (Admin only)
+    """
+    try:
+        quiz = db.query(Quiz).options(
+            joinedload(Quiz.course).joinedload(Course.subject)
+        ).filter(Quiz.id == quiz_id).first()
+        
+        if not quiz:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Quiz not found"
+            )
+        
+        if quiz.course.subject.school_id != current_user.get("school_id"):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Access denied to this quiz"
+            )
+        
+        summary = await grade_quiz_submissions(
+            quiz_id,
+            submission_ids=grade_request.submission_ids,
+            regrade=grade_request.regrade,
+            limit=grade_request.limit
+        )
+        
+        logger.info(f"Batch graded {summary['graded']} submissions of quiz {quiz_id} by user {current_user.get('user_id')}")
+        
+        return QuizBatchGradeResponse(quiz_id=quiz_id, **summary)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error batch grading quiz {quiz_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to grade submissions"
+        )
+
+
+@router.get("/{quiz_id}/stats", response_model=QuizStatsResponse)
+async def get_quiz_stats(
+    quiz_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: Dict[str, Any] = Depends(require_admin_role),
+    _: None = Depends(lambda r: rate_limit_check(r, limit=50))
+):
+    """
+    Get score statistics of a quiz's graded submissions (Admin only)
+    """
+    try:
+        if not db.query(Quiz.id).filter(Quiz.id == quiz_id).first():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Quiz not found"
+            )
+        
+        # Running aggregates maintained as submissions are graded
+        stats = quiz_stats.get_stats(db, quiz_id)
+        return QuizStatsResponse(**quiz_stats.describe(stats))
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting statistics of quiz {quiz_id}: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to retrieve quiz statistics"
+        )
+
+
 @router.post("/{quiz_id}/generate-ai-questions", response_model=Dict[str, Any])
 async def generate_ai_quiz_questions(
     quiz_id: int,
@@ -15,7 +15,7 @@ from ..schemas.content_schemas import (
     SubjectListResponse, SubjectDetailResponse
 )
 from ..core.security import get_current_user_token, require_admin_role, rate_limit_check
-from ..utils.pagination import paginate_query
+from ..utils.pagination import CursorError, paginate, page_metadata, count_by_parent
 from ..utils.cache import cache_result, invalidate_cache_pattern
 from ..utils.validators import validate_subject_data
 
@@ -31,6 +31,8 @@ async def list_subjects(
     request: Request,
     page: int = Query(1, ge=1, description="Page number"),
     page_size: int = Query(20, ge=1, le=100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="next_cursor or prev_cursor of a previous page; takes precedence over page"),
+    count: Optional[str] = Query(None, regex="^(exact|estimated|cached|none)$", description="How to compute the total; none skips it"),
     search: Optional[str] = Query(None, description="Search in subject name and description"),
     grade_level: Optional[str] = Query(None, description="Filter by grade level"),
     is_active: Optional[bool] = Query(None, description="Filter by active status"),
@@ -73,21 +75,15 @@ async def list_subjects(
         
         # Apply sorting
         sort_column = getattr(Subject, sort_by, Subject.name)
-        if sort_order == "desc":
-            query = query.order_by(sort_column.desc())
-        else:
-            query = query.order_by(sort_column.asc())
+        sort_keys = [(sort_column, sort_order == "desc"), (Subject.id, False)]
         
         # Get paginated results
-        result = paginate_query(query, page, page_size)
+        result = paginate(query, sort_keys, page, page_size, cursor, count)
         
-        # Add course count for each subject
+        # Add course count for each subject, in one grouped query for the page
+        course_counts = count_by_parent(db, Course.subject_id, [subject.id for subject in result["items"]])
         subjects_with_counts = []
         for subject in result["items"]:
-            course_count = db.query(func.count(Course.id)).filter(
-                Course.subject_id == subject.id
-            ).scalar()
-            
             subject_dict = {
                 "id": subject.id,
                 "name": subject.name,
@@ -97,7 +93,7 @@ async def list_subjects(
                 "color_theme": subject.color_theme,
                 "icon": subject.icon,
                 "is_active": subject.is_active,
-                "course_count": course_count,
+                "course_count": course_counts.get(subject.id, 0),
                 "created_at": subject.created_at,
                 "updated_at": subject.updated_at
             }
@@ -107,12 +103,14 @@ async def list_subjects(
         
         return SubjectListResponse(
             subjects=subjects_with_counts,
-            total=result["total"],
-            page=result["page"],
-            page_size=result["page_size"],
-            total_pages=result["total_pages"]
+            **page_metadata(result)
         )
         
+    except CursorError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     except Exception as e:
         logger.error(f"Error listing subjects: {e}")
         raise HTTPException(
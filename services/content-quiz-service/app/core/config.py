@@ -74,6 +74,11 @@ class Settings(BaseSettings):
     OPENAI_MODEL: str = Field(default="gpt-3.5-turbo", env="OPENAI_MODEL")
     OPENAI_MAX_TOKENS: int = Field(default=2000, env="OPENAI_MAX_TOKENS")
     OPENAI_TEMPERATURE: float = Field(default=0.7, env="OPENAI_TEMPERATURE")
+    AI_QUESTION_BACKEND: str = Field(default="auto", env="AI_QUESTION_BACKEND")  # auto, openai or fake
+    AI_GENERATION_CONCURRENCY: int = Field(default=4, env="AI_GENERATION_CONCURRENCY")  # LLM requests in flight per generation
+    AI_QUESTIONS_PER_PROMPT: int = Field(default=5, env="AI_QUESTIONS_PER_PROMPT")
+    AI_QUESTION_CACHE_TTL: int = Field(default=7 * 24 * 3600, env="AI_QUESTION_CACHE_TTL")  # generated question pools
+    AI_DUPLICATE_THRESHOLD: float = Field(default=0.7, env="AI_DUPLICATE_THRESHOLD")  # shingle Jaccard similarity
     
     # Rate limiting
     RATE_LIMIT_PER_MINUTE: int = Field(default=100, env="RATE_LIMIT_PER_MINUTE")
@@ -96,6 +101,18 @@ class Settings(BaseSettings):
     MAX_QUIZ_QUESTIONS: int = Field(default=100, env="MAX_QUIZ_QUESTIONS")
     MIN_QUIZ_QUESTIONS: int = Field(default=5, env="MIN_QUIZ_QUESTIONS")
     
+    # Grading queue and worker
+    GRADING_BATCH_SIZE: int = Field(default=200, env="GRADING_BATCH_SIZE")
+    GRADING_LEASE_SECONDS: int = Field(default=120, env="GRADING_LEASE_SECONDS")
+    GRADING_MAX_ATTEMPTS: int = Field(default=5, env="GRADING_MAX_ATTEMPTS")
+    GRADING_RETRY_BASE_SECONDS: int = Field(default=10, env="GRADING_RETRY_BASE_SECONDS")
+    GRADING_POLL_INTERVAL: float = Field(default=1.0, env="GRADING_POLL_INTERVAL")
+    USER_EVENTS_CHANNEL: str = Field(default="edunerve:user_events", env="USER_EVENTS_CHANNEL")
+    
+    # Lesson progress heartbeats
+    PROGRESS_FLUSH_INTERVAL: float = Field(default=5.0, env="PROGRESS_FLUSH_INTERVAL")  # seconds between batched writes
+    PROGRESS_BATCH_SIZE: int = Field(default=500, env="PROGRESS_BATCH_SIZE")  # (user, lesson) rows per write
+    
     # Content validation
     MIN_LESSON_CONTENT_LENGTH: int = Field(default=100, env="MIN_LESSON_CONTENT_LENGTH")
     MAX_LESSON_CONTENT_LENGTH: int = Field(default=50000, env="MAX_LESSON_CONTENT_LENGTH")
@@ -103,6 +120,11 @@ class Settings(BaseSettings):
     # Performance settings
     CACHE_TTL: int = Field(default=3600, env="CACHE_TTL")  # 1 hour
     QUERY_CACHE_SIZE: int = Field(default=1000, env="QUERY_CACHE_SIZE")
+    LOCAL_CACHE_TTL: float = Field(default=30, env="LOCAL_CACHE_TTL")  # in-process tier, seconds
+    CACHE_LOCK_TIMEOUT: int = Field(default=10, env="CACHE_LOCK_TIMEOUT")  # single-flight recompute lock
+    CACHE_SERIALIZER: str = Field(default="auto", env="CACHE_SERIALIZER")  # auto, orjson, msgpack or json
+    PAGINATION_DEFAULT_COUNT: str = Field(default="exact", env="PAGINATION_DEFAULT_COUNT")  # exact, estimated, cached or none
+    PAGINATION_COUNT_CACHE_TTL: int = Field(default=60, env="PAGINATION_COUNT_CACHE_TTL")
     
     # Monitoring and health checks
     HEALTH_CHECK_TIMEOUT: int = Field(default=5, env="HEALTH_CHECK_TIMEOUT")
@@ -14,6 +14,7 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 import uvicorn
+import asyncio
 import os
 import time
 import redis
@@ -25,6 +26,8 @@ from .core.config import settings
 from .core.security import SecurityConfig
 from .api import subjects, courses, lessons, quizzes, questions, progress, study_sessions, study_goals, badges
 from .schemas import ErrorResponse
+from .utils.cache import cache, CacheStats
+from .services.progress_buffer import lesson_progress_buffer
 
 # Load environment variables
 load_dotenv()
@@ -82,6 +85,15 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.warning(f"⚠️ Redis connection failed: {e}")
     
+    # Drop cache entries that predate the current tag sets (incremental SCAN, in the background);
+    # a marker key makes this a no-op on every later start
+    app.state.cache_cleanup = asyncio.create_task(asyncio.to_thread(cache.cleanup_legacy_keys))
+    # The in-process cache tier is only used while invalidations from other workers are received
+    cache.start_invalidation_listener()
+    
+    # Lesson heartbeats are buffered in memory and written in batches
+    app.state.progress_flusher = asyncio.create_task(lesson_progress_buffer.start())
+    
     # Create secure upload directories
     upload_dirs = ["uploads", "uploads/content", "uploads/quizzes", "uploads/temp"]
     for upload_dir in upload_dirs:
@@ -108,6 +120,8 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     logger.info("🔴 Shutting down Content & Quiz Service...")
+    await lesson_progress_buffer.stop()
+    cache.stop_invalidation_listener()
     try:
         redis_client.close()
     except:
@@ -353,6 +367,8 @@ async def detailed_health_check(request: Request):
         config_issues.append("missing_database_url")
     
     health_status["checks"]["configuration"] = "healthy" if not config_issues else f"issues: {', '.join(config_issues)}"
+    health_status["performance"]["cache"] = CacheStats.get_tier_stats()
+    health_status["performance"]["lesson_heartbeats"] = lesson_progress_buffer.summary()
     
     return health_status
 
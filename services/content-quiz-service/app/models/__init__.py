@@ -8,8 +8,7 @@ from .content_models import (
 )
 
 from .progress_models import (
-    StudentProgress, LearningSession, LearningPath, Achievement,
-    PerformanceAlert
+    LearningPath, LearningPathStep, ProgressSnapshot
 )
 
 from .study_models import (
@@ -23,8 +22,7 @@ __all__ = [
     "QuestionOption", "LessonProgress", "ContentFile",
     
     # Progress models
-    "StudentProgress", "LearningSession", "LearningPath", "Achievement",
-    "PerformanceAlert",
+    "LearningPath", "LearningPathStep", "ProgressSnapshot",
     
     # Study models
     "StudySession", "StudyStreak", "Badge", "StudentBadge", "StudyGoal",
@@ -3,7 +3,7 @@ Content and Quiz Models for EduNerve Platform
 Comprehensive content management with courses, lessons, quizzes, and progress tracking
 """
 
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON, Float, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON, Float, Index, Enum as SQLEnum
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -232,6 +232,7 @@ class Question(Base):
     difficulty_level = Column(String(20), default=DifficultyLevel.BEGINNER.value)
     points = Column(Float, default=1.0)
     explanation = Column(Text)
+    correct_answer = Column(JSON)  # Expected answer: text, option, or a list of options or blanks
     
     # Media content
     image_url = Column(String(255))
@@ -301,6 +302,10 @@ class CourseEnrollment(Base):
 class LessonProgress(Base):
     """User lesson progress tracking"""
     __tablename__ = "lesson_progress"
+    __table_args__ = (
+        # One row per user and lesson; batched heartbeat writes rely on it
+        Index("uq_lesson_progress_user_lesson", "user_id", "lesson_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -372,6 +377,68 @@ class QuestionResponse(Base):
     question = relationship("Question", back_populates="responses")
     selected_option = relationship("QuestionOption")
 
+class QuizSubmission(Base):
+    """Submitted quiz answers, graded by the grading worker"""
+    __tablename__ = "quiz_submissions"
+    __table_args__ = (
+        Index("ix_quiz_submissions_quiz_user", "quiz_id", "user_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    
+    # Submission
+    answers = Column(JSON)  # {"<question_id>": answer}
+    time_taken = Column(Integer)  # in seconds
+    submitted_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Results, set when graded
+    score = Column(Float)
+    max_score = Column(Float)
+    percentage = Column(Float)
+    is_passed = Column(Boolean)
+    feedback = Column(JSON)
+    question_results = Column(JSON)
+    graded_at = Column(DateTime)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    quiz = relationship("Quiz")
+
+class QuizProgress(Base):
+    """User's best graded result and totals per quiz, kept by the grader"""
+    __tablename__ = "quiz_progress"
+    __table_args__ = (
+        Index("uq_quiz_progress_user_quiz", "user_id", "quiz_id", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), nullable=False)
+    course_id = Column(Integer, ForeignKey("courses.id"), nullable=True)  # Quizzes belong to topics
+    
+    # Best graded submission
+    status = Column(String(20), default="completed")
+    score = Column(Float, default=0.0)
+    max_score = Column(Float, default=0.0)
+    percentage = Column(Float, default=0.0)
+    is_passed = Column(Boolean, default=False)
+    completed_at = Column(DateTime)
+    
+    # Totals over graded submissions
+    attempts = Column(Integer, default=0)
+    time_spent = Column(Integer, default=0)  # in seconds
+    first_completed_at = Column(DateTime)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    quiz = relationship("Quiz")
+
 class ContentFile(Base):
     """File attachments for content"""
     __tablename__ = "content_files"
@@ -507,3 +574,109 @@ class StudyTimer(Base):
     
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# ========================================
+# GRADING QUEUE MODELS
+# ========================================
+
+class GradingJob(Base):
+    """Durable grading work item, one per quiz submission"""
+    __tablename__ = "grading_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    submission_id = Column(Integer, unique=True, nullable=False)  # One job per submission
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), nullable=False, index=True)
+    user_id = Column(Integer, nullable=False)
+    
+    # Queue state: pending, processing, completed, failed
+    status = Column(String(20), default="pending", nullable=False, index=True)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    available_at = Column(DateTime, default=datetime.utcnow)  # Not claimable before (retry backoff)
+    
+    # Lease held by the worker processing the job
+    locked_by = Column(String(100))
+    locked_until = Column(DateTime)
+    last_error = Column(Text)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+
+# ========================================
+# PROGRESS SUMMARY MODELS
+# ========================================
+
+class UserProgressSummary(Base):
+    """Per-user progress totals, maintained incrementally from progress events"""
+    __tablename__ = "user_progress_summaries"
+    
+    user_id = Column(Integer, primary_key=True)
+    
+    completed_courses = Column(Integer, default=0, nullable=False)
+    in_progress_courses = Column(Integer, default=0, nullable=False)
+    completed_lessons = Column(Integer, default=0, nullable=False)
+    in_progress_lessons = Column(Integer, default=0, nullable=False)
+    completed_quizzes = Column(Integer, default=0, nullable=False)
+    quiz_percentage_total = Column(Float, default=0.0, nullable=False)  # Sum of best percentages, for the average
+    lesson_time_spent = Column(Integer, default=0, nullable=False)
+    quiz_time_spent = Column(Integer, default=0, nullable=False)
+    
+    # Completions per day over the last week: {"2024-05-06": [lessons, quizzes]}
+    recent_completions = Column(JSON, default=dict)
+    
+    last_activity_at = Column(DateTime)
+    rebuilt_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class UserCourseProgressSummary(Base):
+    """Per-user, per-course progress totals, maintained incrementally from progress events"""
+    __tablename__ = "user_course_progress_summaries"
+    
+    user_id = Column(Integer, primary_key=True)
+    course_id = Column(Integer, ForeignKey("courses.id"), primary_key=True)
+    subject_id = Column(Integer, index=True)
+    
+    # Course status: not_started, in_progress, completed
+    status = Column(String(20), default="not_started", nullable=False)
+    completed_lessons = Column(Integer, default=0, nullable=False)
+    in_progress_lessons = Column(Integer, default=0, nullable=False)
+    completed_quizzes = Column(Integer, default=0, nullable=False)
+    quiz_percentage_total = Column(Float, default=0.0, nullable=False)
+    lesson_time_spent = Column(Integer, default=0, nullable=False)
+    quiz_time_spent = Column(Integer, default=0, nullable=False)
+    progress_percentage = Column(Float, default=0.0, nullable=False)
+    
+    last_activity_at = Column(DateTime)
+    completed_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# ========================================
+# QUIZ STATISTICS MODELS
+# ========================================
+
+class QuizStatistics(Base):
+    """Running score aggregates of a quiz's graded submissions, updated as they are graded"""
+    __tablename__ = "quiz_statistics"
+    
+    quiz_id = Column(Integer, ForeignKey("quizzes.id"), primary_key=True)
+    
+    attempt_count = Column(Integer, default=0, nullable=False)  # Submissions, graded or not
+    graded_count = Column(Integer, default=0, nullable=False)
+    pass_count = Column(Integer, default=0, nullable=False)
+    score_sum = Column(Float, default=0.0, nullable=False)
+    score_sq_sum = Column(Float, default=0.0, nullable=False)  # For the standard deviation
+    min_score = Column(Float)
+    max_score = Column(Float)
+    percentage_sum = Column(Float, default=0.0, nullable=False)
+    
+    # Graded submissions per 1-point percentage bucket (100 buckets, 100% in the last), for percentiles
+    histogram = Column(JSON)
+    
+    # Per-question difficulty and discrimination, computed by the item analysis job
+    question_stats = Column(JSON)
+    analyzed_at = Column(DateTime)
+    analyzed_count = Column(Integer)  # graded_count when last analyzed
+    
+    rebuilt_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
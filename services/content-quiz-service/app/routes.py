@@ -10,7 +10,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_, desc, func
 
 from app.database import get_db
-from app.models import Content, Quiz, Submission, Grade, ContentStats, QuizAttempt, Course, Lesson, CourseEnrollment, LessonProgress
+from app.models import Content, Quiz, Grade, ContentStats, Course, Lesson, CourseEnrollment, LessonProgress
 from app.schemas import (
     ContentCreate, ContentResponse, ContentUpdate, QuizCreate, QuizResponse,
     QuizUpdate, AIQuizRequest, AIQuizResponse, SubmissionCreate, SubmissionResponse,
@@ -26,6 +26,8 @@ from app.auth import (
 )
 from app.ai_service import quiz_generator, ai_grader, extract_keywords_from_text, summarize_content
 from app.file_utils import process_content_file, text_extractor, FileUploadError
+from app.services.progress_summary import progress_summary
+from app.services.quiz_stats import quiz_stats
 import json
 import logging
 
@@ -913,41 +915,9 @@ async def get_quiz_stats(
     if not quiz:
         raise quiz_not_found
     
-    # Get submission stats
-    submissions = db.query(Submission).filter(
-        Submission.quiz_id == quiz_id,
-        Submission.status == "graded"
-    ).all()
-    
-    if not submissions:
-        return QuizStats(
-            quiz_id=quiz_id,
-            total_attempts=0,
-            total_submissions=0,
-            average_score=0.0,
-            highest_score=0.0,
-            lowest_score=0.0,
-            pass_rate=0.0
-        )
-    
-    scores = [s.total_score for s in submissions if s.total_score is not None]
-    percentages = [s.percentage for s in submissions if s.percentage is not None]
-    
-    total_attempts = db.query(QuizAttempt).filter(
-        QuizAttempt.quiz_id == quiz_id
-    ).count()
-    
-    passed_count = len([p for p in percentages if p >= quiz.pass_mark])
-    
-    return QuizStats(
-        quiz_id=quiz_id,
-        total_attempts=total_attempts,
-        total_submissions=len(submissions),
-        average_score=sum(scores) / len(scores) if scores else 0.0,
-        highest_score=max(scores) if scores else 0.0,
-        lowest_score=min(scores) if scores else 0.0,
-        pass_rate=(passed_count / len(submissions)) * 100 if submissions else 0.0
-    )
+    # Running aggregates maintained as submissions are graded
+    stats = quiz_stats.get_stats(db, quiz_id)
+    return QuizStats(**quiz_stats.describe(stats))
 
 
 @router.get("/stats/content/{content_id}", response_model=ContentStatsSchema)
@@ -1186,6 +1156,9 @@ async def update_lesson_progress(
             LessonProgress.student_id == current_user.id
         ).first()
         
+        previous_status = ("completed" if progress.completed else "in_progress") if progress else None
+        previous_time_spent = (progress.time_spent or 0) if progress else 0
+        
         if not progress:
             progress = LessonProgress(
                 lesson_id=lesson_id,
@@ -1201,11 +1174,21 @@ async def update_lesson_progress(
         if progress_update.completed and not progress.completed_at:
             progress.completed_at = datetime.utcnow()
         
-        db.commit()
-        db.refresh(progress)
+        # Apply the change to the progress summaries, in the same transaction
+        course_summary = progress_summary.record_lesson_progress(
+            db,
+            current_user.id,
+            lesson.course_id,
+            previous_status,
+            "completed" if progress.completed else "in_progress",
+            time_spent_delta=(progress.time_spent or 0) - previous_time_spent
+        )
         
         # Update course enrollment progress
-        _update_course_progress(enrollment.id, db)
+        _update_course_progress(enrollment, course_summary)
+        
+        db.commit()
+        db.refresh(progress)
         
         logger.info(f"Progress updated for lesson {lesson_id} by user {current_user.id}")
         return progress
@@ -1216,42 +1199,18 @@ async def update_lesson_progress(
         logger.error(f"Error updating lesson progress: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to update lesson progress")
 
-def _update_course_progress(enrollment_id: int, db: Session):
-    """Helper function to update course progress"""
-    try:
-        enrollment = db.query(CourseEnrollment).filter(
-            CourseEnrollment.id == enrollment_id
-        ).first()
-        
-        if not enrollment:
-            return
-        
-        # Get total lessons in course
-        total_lessons = db.query(Lesson).filter(
-            Lesson.course_id == enrollment.course_id
-        ).count()
-        
-        # Get completed lessons
-        completed_lessons = db.query(LessonProgress).filter(
-            LessonProgress.student_id == enrollment.student_id,
-            LessonProgress.completed == True
-        ).join(Lesson).filter(
-            Lesson.course_id == enrollment.course_id
-        ).count()
-        
-        # Update enrollment progress
-        enrollment.completed_lessons = completed_lessons
-        enrollment.progress_percentage = (completed_lessons / total_lessons * 100) if total_lessons > 0 else 0
-        enrollment.last_accessed = datetime.utcnow()
-        
-        # Mark as completed if all lessons are done
-        if completed_lessons == total_lessons and total_lessons > 0:
-            enrollment.completed_at = datetime.utcnow()
-        
-        db.commit()
-        
-    except Exception as e:
-        logger.error(f"Error updating course progress: {str(e)}")
+def _update_course_progress(enrollment, course_summary):
+    """Copy the user's course summary, maintained incrementally, onto the enrollment"""
+    if course_summary is None:
+        return
+    
+    enrollment.completed_lessons = course_summary.completed_lessons
+    enrollment.progress_percentage = course_summary.progress_percentage
+    enrollment.last_accessed = datetime.utcnow()
+    
+    # Mark as completed if all lessons are done
+    if course_summary.status == "completed" and not enrollment.completed_at:
+        enrollment.completed_at = course_summary.completed_at
 
 # Health check
 @router.get("/health", response_model=MessageResponse)
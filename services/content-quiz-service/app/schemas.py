@@ -330,6 +330,12 @@ class QuizStats(BaseModel):
     highest_score: float
     lowest_score: float
     pass_rate: float
+    average_percentage: float = 0.0
+    score_std_dev: float = 0.0
+    percentiles: Dict[str, Optional[float]] = {}  # p25, p50, p75 and p90 of the percentages
+    score_distribution: List[int] = []  # graded submissions per 1-point percentage bucket
+    question_stats: Optional[List[Dict[str, Any]]] = None  # difficulty and discrimination per question
+    analyzed_at: Optional[datetime] = None
 
 
 class ContentStats(BaseModel):
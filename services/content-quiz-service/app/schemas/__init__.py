@@ -9,7 +9,7 @@ from .content_schemas import (
     QuizCreate, QuizUpdate, QuizResponse,
     QuestionCreate, QuestionUpdate, QuestionResponse,
     QuizAttemptCreate, QuizAttemptResponse,
-    LessonProgressCreate, LessonProgressResponse,
+    LessonProgressCreate, LessonProgressResponse, LessonHeartbeatRequest,
     ContentFileCreate, ContentFileResponse,
     ErrorResponse, PaginatedResponse
 )
@@ -31,7 +31,7 @@ __all__ = [
     "QuizCreate", "QuizUpdate", "QuizResponse",
     "QuestionCreate", "QuestionUpdate", "QuestionResponse",
     "QuizAttemptCreate", "QuizAttemptResponse",
-    "LessonProgressCreate", "LessonProgressResponse",
+    "LessonProgressCreate", "LessonProgressResponse", "LessonHeartbeatRequest",
     "ContentFileCreate", "ContentFileResponse",
     "ErrorResponse", "PaginatedResponse",
     
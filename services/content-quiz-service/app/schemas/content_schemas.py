@@ -55,6 +55,23 @@ class BaseContentSchema(BaseModel):
         use_enum_values = True
 
 
+class PaginatedResponse(BaseModel):
+    """
+    Pagination fields of list responses. Follow next_cursor/prev_cursor to
+    move between pages; total is None when the client asked for count=none
+    and approximate when total_is_estimate is set.
+    """
+    total: Optional[int] = None
+    total_is_estimate: bool = False
+    page: Optional[int] = None
+    page_size: int
+    total_pages: Optional[int] = None
+    has_next: bool = False
+    has_prev: bool = False
+    next_cursor: Optional[str] = None
+    prev_cursor: Optional[str] = None
+
+
 # Subject schemas
 class SubjectBase(BaseModel):
     """Base subject schema"""
@@ -110,13 +127,9 @@ class SubjectDetailResponse(SubjectResponse):
     courses: Optional[List[Dict[str, Any]]] = None
 
 
-class SubjectListResponse(BaseModel):
+class SubjectListResponse(PaginatedResponse):
     """Schema for paginated subject list"""
     subjects: List[SubjectResponse]
-    total: int
-    page: int
-    page_size: int
-    total_pages: int
 
 
 # Course schemas
@@ -185,13 +198,9 @@ class CourseDetailResponse(CourseResponse):
     quizzes: Optional[List[Dict[str, Any]]] = None
 
 
-class CourseListResponse(BaseModel):
+class CourseListResponse(PaginatedResponse):
     """Schema for paginated course list"""
     courses: List[Dict[str, Any]]  # Using Dict to include subject_name
-    total: int
-    page: int
-    page_size: int
-    total_pages: int
 
 
 # Lesson schemas
@@ -270,13 +279,9 @@ class LessonDetailResponse(LessonResponse):
     previous_lesson_id: Optional[int] = None
 
 
-class LessonListResponse(BaseModel):
+class LessonListResponse(PaginatedResponse):
     """Schema for paginated lesson list"""
     lessons: List[Dict[str, Any]]
-    total: int
-    page: int
-    page_size: int
-    total_pages: int
 
 
 # Quiz schemas
@@ -351,13 +356,14 @@ class QuizDetailResponse(QuizResponse):
     questions: Optional[List[Dict[str, Any]]] = None
 
 
-class QuizListResponse(BaseModel):
+class QuizListResponse(PaginatedResponse):
     """Schema for paginated quiz list"""
     quizzes: List[Dict[str, Any]]
-    total: int
-    page: int
-    page_size: int
-    total_pages: int
+
+
+class QuestionListResponse(PaginatedResponse):
+    """Schema for paginated question list"""
+    questions: List[Dict[str, Any]]
 
 
 # Question schemas
@@ -445,6 +451,14 @@ class LessonProgressResponse(ProgressBase, BaseContentSchema):
     is_completed: bool = False
 
 
+class LessonHeartbeatRequest(BaseModel):
+    """Periodic progress report from a lesson player"""
+    position: int = Field(default=0, ge=0, description="Playback position in seconds")
+    seconds: int = Field(default=0, ge=0, le=300, description="Seconds watched since the previous heartbeat")
+    completion_percentage: float = Field(default=0.0, ge=0, le=100)
+    completed: bool = Field(default=False, description="Completions are applied immediately")
+
+
 class QuizSubmissionBase(BaseModel):
     """Base quiz submission schema"""
     quiz_id: int
@@ -467,6 +481,39 @@ class QuizSubmissionResponse(QuizSubmissionBase, BaseContentSchema):
     submitted_at: datetime
 
 
+class QuizBatchGradeRequest(BaseModel):
+    """Request to grade many submissions of a quiz at once"""
+    submission_ids: Optional[List[int]] = Field(None, max_items=1000, description="Submissions to grade; defaults to all ungraded")
+    regrade: bool = Field(False, description="Also grade submissions that already have a score")
+    limit: int = Field(1000, ge=1, le=1000, description="Maximum submissions graded in this call")
+
+
+class QuizBatchGradeResponse(BaseModel):
+    """Outcome of a batch grading run"""
+    quiz_id: int
+    graded: int
+    average_percentage: float
+    pass_rate: float
+    skipped: List[int] = []
+
+
+class QuizStatsResponse(BaseModel):
+    """Score statistics of a quiz's graded submissions"""
+    quiz_id: int
+    total_attempts: int
+    total_submissions: int
+    average_score: float
+    highest_score: float
+    lowest_score: float
+    pass_rate: float
+    average_percentage: float = 0.0
+    score_std_dev: float = 0.0
+    percentiles: Dict[str, Optional[float]] = {}  # p25, p50, p75 and p90 of the percentages
+    score_distribution: List[int] = []  # graded submissions per 1-point percentage bucket
+    question_stats: Optional[List[Dict[str, Any]]] = None  # difficulty and discrimination per question
+    analyzed_at: Optional[datetime] = None
+
+
 # File upload schemas
 class FileUploadResponse(BaseModel):
     """File upload response"""
@@ -0,0 +1,224 @@
+"""
+Grading Queue Service
+Durable quiz grading jobs leased with SELECT ... FOR UPDATE SKIP LOCKED; the
+worker process in grading_worker grades them outside the web workers
+"""
+
+import logging
+import os
+import socket
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..database import SessionLocal
+from ..models.content_models import GradingJob
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay(attempt: int) -> int:
+    """Exponential backoff in seconds before a failed job is retried"""
+    return min(settings.GRADING_RETRY_BASE_SECONDS * 2 ** max(attempt - 1, 0), 900)
+
+
+@dataclass
+class GradingLease:
+    """A grading job claimed by this worker"""
+    job_id: int
+    submission_id: int
+    quiz_id: int
+    user_id: int
+    attempt: int
+    max_attempts: int
+
+
+class GradingQueue:
+    """Grading jobs stored in the grading_jobs table, one per submission"""
+
+    def __init__(self, session_factory=SessionLocal, lease_seconds: Optional[int] = None, max_attempts: Optional[int] = None):
+        self.session_factory = session_factory
+        self.lease_seconds = lease_seconds or settings.GRADING_LEASE_SECONDS
+        self.max_attempts = max_attempts or settings.GRADING_MAX_ATTEMPTS
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    def enqueue(self, db: Session, submission_id: int, quiz_id: int, user_id: int, commit: bool = True) -> GradingJob:
+        """
+        Queue a submission for grading; a submission is only ever queued once.
+        With commit=False the job is written in the caller's transaction.
+        """
+        job = db.query(GradingJob).filter(GradingJob.submission_id == submission_id).first()
+        if job:
+            return job
+
+        job = GradingJob(
+            submission_id=submission_id,
+            quiz_id=quiz_id,
+            user_id=user_id,
+            status="pending",
+            max_attempts=self.max_attempts,
+            available_at=datetime.utcnow()
+        )
+        db.add(job)
+        if commit:
+            db.commit()
+        return job
+
+    def claim(self, limit: int) -> List[GradingLease]:
+        """
+        Lease up to limit jobs that are due, or whose previous lease expired.
+        Concurrent workers skip each other's locked rows instead of waiting.
+        """
+        now = datetime.utcnow()
+        db = self.session_factory()
+        try:
+            # Leases that expired on the final attempt are given up on
+            db.execute(
+                update(GradingJob)
+                .where(
+                    GradingJob.status == "processing",
+                    GradingJob.locked_until < now,
+                    GradingJob.attempts >= GradingJob.max_attempts
+                )
+                .values(status="failed", locked_by=None, locked_until=None, last_error="Lease expired after final attempt")
+            )
+
+            claimable = select(GradingJob.id).where(
+                or_(
+                    and_(GradingJob.status == "pending", GradingJob.available_at <= now),
+                    and_(GradingJob.status == "processing", GradingJob.locked_until < now)
+                )
+            ).order_by(GradingJob.id).limit(limit).with_for_update(skip_locked=True)
+
+            rows = db.execute(
+                update(GradingJob)
+                .where(GradingJob.id.in_(claimable.scalar_subquery()))
+                .values(
+                    status="processing",
+                    locked_by=self.worker_id,
+                    locked_until=now + timedelta(seconds=self.lease_seconds),
+                    attempts=GradingJob.attempts + 1,
+                    started_at=now
+                )
+                .returning(
+                    GradingJob.id, GradingJob.submission_id, GradingJob.quiz_id,
+                    GradingJob.user_id, GradingJob.attempts, GradingJob.max_attempts
+                )
+                .execution_options(synchronize_session=False)
+            ).all()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        return [
+            GradingLease(
+                job_id=row.id,
+                submission_id=row.submission_id,
+                quiz_id=row.quiz_id,
+                user_id=row.user_id,
+                attempt=row.attempts,
+                max_attempts=row.max_attempts
+            )
+            for row in rows
+        ]
+
+    def extend(self, leases: List[GradingLease]) -> List[GradingLease]:
+        """Renew leases this worker still holds (the heartbeat); returns those, dropping any lost to another worker"""
+        if not leases:
+            return []
+        db = self.session_factory()
+        try:
+            held = set(db.execute(
+                update(GradingJob)
+                .where(
+                    GradingJob.id.in_([lease.job_id for lease in leases]),
+                    GradingJob.status == "processing",
+                    GradingJob.locked_by == self.worker_id
+                )
+                .values(locked_until=datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+                .returning(GradingJob.id)
+                .execution_options(synchronize_session=False)
+            ).scalars())
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        return [lease for lease in leases if lease.job_id in held]
+
+    def lock(self, db: Session, leases: List[GradingLease]) -> List[GradingLease]:
+        """
+        Lock the jobs of leases this worker still holds until the caller's
+        transaction ends, so they cannot be re-claimed while their grades are
+        stored; returns those leases
+        """
+        held = set(db.execute(
+            select(GradingJob.id)
+            .where(
+                GradingJob.id.in_([lease.job_id for lease in leases]),
+                GradingJob.status == "processing",
+                GradingJob.locked_by == self.worker_id
+            )
+            .with_for_update()
+        ).scalars())
+        return [lease for lease in leases if lease.job_id in held]
+
+    def complete(self, db: Session, leases: List[GradingLease]) -> int:
+        """Mark leased jobs done in the caller's transaction (the one that stored the grades)"""
+        result = db.execute(
+            update(GradingJob)
+            .where(
+                GradingJob.id.in_([lease.job_id for lease in leases]),
+                GradingJob.status == "processing",
+                GradingJob.locked_by == self.worker_id
+            )
+            .values(status="completed", completed_at=datetime.utcnow(), locked_until=None, last_error=None)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
+
+    def fail(self, leases: List[GradingLease], error: str):
+        """Schedule a retry with backoff, or give up after the final attempt"""
+        now = datetime.utcnow()
+        db = self.session_factory()
+        try:
+            for lease in leases:
+                if lease.attempt >= lease.max_attempts:
+                    values = {"status": "failed", "locked_by": None, "locked_until": None, "last_error": error}
+                    logger.error(f"Grading submission {lease.submission_id} failed after {lease.attempt} attempts: {error}")
+                else:
+                    values = {
+                        "status": "pending",
+                        "available_at": now + timedelta(seconds=retry_delay(lease.attempt)),
+                        "locked_by": None,
+                        "locked_until": None,
+                        "last_error": error
+                    }
+                db.execute(
+                    update(GradingJob)
+                    .where(GradingJob.id == lease.job_id, GradingJob.locked_by == self.worker_id)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def stats(self, db: Session) -> Dict[str, int]:
+        """Number of jobs in each status"""
+        return dict(db.query(GradingJob.status, func.count(GradingJob.id)).group_by(GradingJob.status).all())
+
+
+# Initialize grading queue
+grading_queue = GradingQueue()
@@ -0,0 +1,204 @@
+"""
+Grading Worker Service
+Worker process that claims grading jobs and grades them in per-quiz batches
+outside the web workers, publishing each result to the student
+
+    python -m app.services.grading_worker
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from ..core.config import settings
+from ..database import SessionLocal
+from ..models.content_models import QuizSubmission
+from ..utils.quiz_grader import get_answer_key, grade_submissions, invalidate_grading_caches
+from .grading_queue import GradingLease, GradingQueue
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class GradingResultNotifier:
+    """
+    Publishes a "quiz_graded" event per graded submission; the sync-messaging
+    service relays it to the student's WebSocket connections
+    """
+
+    def __init__(self, channel: Optional[str] = None, client=None):
+        self.channel = channel or settings.USER_EVENTS_CHANNEL
+        self._client = client
+
+    def _redis(self):
+        if self._client is None and REDIS_AVAILABLE:
+            if settings.REDIS_URL:
+                self._client = redis.Redis.from_url(settings.REDIS_URL)
+            else:
+                self._client = redis.Redis(
+                    host=settings.REDIS_HOST,
+                    port=settings.REDIS_PORT,
+                    db=settings.REDIS_DB,
+                    password=settings.REDIS_PASSWORD
+                )
+        return self._client
+
+    def publish(self, submissions: List[Any]):
+        """Notify students; grades are already stored, so failures are only logged"""
+        client = self._redis()
+        if client is None or not submissions:
+            return
+        try:
+            pipeline = client.pipeline(transaction=False)
+            for submission in submissions:
+                pipeline.publish(self.channel, json.dumps({
+                    "user_id": submission.user_id,
+                    "event_type": "quiz_graded",
+                    "data": {
+                        "submission_id": submission.id,
+                        "quiz_id": submission.quiz_id,
+                        "score": submission.score,
+                        "max_score": submission.max_score,
+                        "percentage": submission.percentage,
+                        "is_passed": submission.is_passed
+                    },
+                    "timestamp": datetime.utcnow().isoformat()
+                }))
+            pipeline.execute()
+        except Exception as e:
+            logger.warning(f"Failed to publish grading results: {e}")
+
+
+class GradingWorker:
+    """Claims grading jobs in batches and grades each quiz's submissions in one pass"""
+
+    def __init__(
+        self,
+        queue: Optional[GradingQueue] = None,
+        notifier: Optional[GradingResultNotifier] = None,
+        session_factory=SessionLocal,
+        batch_size: Optional[int] = None,
+        poll_interval: Optional[float] = None
+    ):
+        self.queue = queue or GradingQueue(session_factory=session_factory)
+        self.notifier = notifier or GradingResultNotifier()
+        self.session_factory = session_factory
+        self.batch_size = batch_size or settings.GRADING_BATCH_SIZE
+        self.poll_interval = poll_interval if poll_interval is not None else settings.GRADING_POLL_INTERVAL
+        self.stats = {"claimed": 0, "graded": 0, "failed": 0, "lost": 0}
+
+    def process_batch(self) -> int:
+        """Claim and grade one batch; returns the number of jobs claimed"""
+        leases = self.queue.claim(self.batch_size)
+        self.stats["claimed"] += len(leases)
+
+        by_quiz: Dict[int, List[GradingLease]] = defaultdict(list)
+        for lease in leases:
+            by_quiz[lease.quiz_id].append(lease)
+
+        for quiz_id, quiz_leases in by_quiz.items():
+            # Renew the leases before each quiz, so a long batch keeps the jobs it has not reached yet
+            quiz_leases = self._heartbeat(quiz_leases)
+            if not quiz_leases:
+                continue
+            error = self._grade_quiz(quiz_id, quiz_leases)
+            if error is None:
+                continue
+            if len(quiz_leases) == 1:
+                self._fail(quiz_leases, error)
+                continue
+            # Retry one by one so a single bad submission does not hold back the rest
+            for lease in self._heartbeat(quiz_leases):
+                error = self._grade_quiz(quiz_id, [lease])
+                if error is not None:
+                    self._fail([lease], error)
+        return len(leases)
+
+    def _heartbeat(self, leases: List[GradingLease]) -> List[GradingLease]:
+        """Extend the leases still held; jobs re-claimed by another worker are left to it"""
+        held = self.queue.extend(leases)
+        if len(held) < len(leases):
+            self.stats["lost"] += len(leases) - len(held)
+            logger.warning(f"Lost the lease of {len(leases) - len(held)} grading jobs to another worker")
+        return held
+
+    def _grade_quiz(self, quiz_id: int, leases: List[GradingLease]) -> Optional[str]:
+        """Grade the leased submissions of one quiz and complete their jobs in one transaction; returns the error, if any"""
+        # Graded submissions are read again after the commit, to notify students
+        db = self.session_factory(expire_on_commit=False)
+        graded = []
+        try:
+            # Locking the jobs first means a lease lost since the heartbeat is not graded twice
+            leases = self.queue.lock(db, leases)
+            submissions = db.query(QuizSubmission).filter(
+                QuizSubmission.id.in_([lease.submission_id for lease in leases])
+            ).with_for_update().all() if leases else []
+            # Grading is idempotent per submission: redelivered jobs of graded submissions just complete
+            graded = [submission for submission in submissions if submission.graded_at is None]
+            if graded:
+                key = get_answer_key(db, quiz_id)
+                if key is None or not key.questions:
+                    raise ValueError(f"Quiz {quiz_id} has no gradable questions")
+                grade_submissions(db, key, graded)
+            if leases:
+                self.queue.complete(db, leases)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error grading {len(leases)} submissions of quiz {quiz_id}: {e}")
+            return str(e)
+        finally:
+            db.close()
+
+        self.stats["graded"] += len(graded)
+        invalidate_grading_caches(quiz_id, {submission.user_id for submission in graded})
+        self.notifier.publish(graded)
+        return None
+
+    def _fail(self, leases: List[GradingLease], error: str):
+        self.queue.fail(leases, error)
+        self.stats["failed"] += len(leases)
+
+    async def run(self, stop: Optional[asyncio.Event] = None):
+        """Work the queue until stopped, sleeping only when it is empty"""
+        stop = stop or asyncio.Event()
+        logger.info(f"Grading worker {self.queue.worker_id} started")
+        while not stop.is_set():
+            try:
+                claimed = await asyncio.to_thread(self.process_batch)
+            except Exception as e:
+                logger.error(f"Grading worker error: {e}")
+                claimed = 0
+            if not claimed:
+                try:
+                    await asyncio.wait_for(stop.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        logger.info(f"Grading worker {self.queue.worker_id} stopped")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Run the quiz grading worker")
+    parser.add_argument("--batch-size", type=int, help="jobs claimed per batch")
+    parser.add_argument("--poll-interval", type=float, help="seconds to wait when the queue is empty")
+    args = parser.parse_args(argv)
+
+    worker = GradingWorker(batch_size=args.batch_size, poll_interval=args.poll_interval)
+    try:
+        asyncio.run(worker.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=settings.LOG_LEVEL, format=settings.LOG_FORMAT)
+    main()
@@ -0,0 +1,276 @@
+"""
+Lesson Progress Buffer
+High-frequency lesson heartbeats (playback position and watch time) merged in
+memory per (user, lesson) and written in batches, so a class watching a video
+costs a few statements every flush interval instead of a transaction per
+heartbeat. Completions are written immediately.
+"""
+
+import asyncio
+import logging
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..database import SessionLocal
+from ..models.content_models import CourseEnrollment, LessonProgress
+from .progress_summary import lesson_status, progress_summary
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LessonHeartbeat:
+    """Progress reported by a lesson player, or several of them merged"""
+    user_id: int
+    lesson_id: int
+    course_id: int
+    position: int = 0
+    seconds: int = 0
+    completion_percentage: float = 0.0
+    at: datetime = field(default_factory=datetime.utcnow)
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        return (self.user_id, self.lesson_id)
+
+    def merge(self, other: "LessonHeartbeat"):
+        """Furthest position and percentage, summed watch time"""
+        self.position = max(self.position, other.position)
+        self.completion_percentage = max(self.completion_percentage, other.completion_percentage)
+        self.seconds += other.seconds
+        self.at = max(self.at, other.at)
+
+
+def _greatest(column, value):
+    # GREATEST is not portable (SQLite has no such function)
+    return case((func.coalesce(column, 0) < value, value), else_=column)
+
+
+def _upsert(db: Session, table):
+    """INSERT ... ON CONFLICT for the session's database"""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(table)
+    return sqlite.insert(table)
+
+
+class LessonProgressBuffer:
+    """
+    Buffers lesson heartbeats and writes them to lesson_progress in batches
+
+    Each flush writes the batch with one INSERT ... ON CONFLICT DO UPDATE on
+    (user_id, lesson_id): new rows are inserted, existing ones get the watch
+    time added and their position raised (increments, so flushes from several
+    workers add up), and the time is applied to the progress summaries once
+    per user and course. Batches that fail are merged back and retried on the
+    next flush.
+    """
+
+    def __init__(self, session_factory=SessionLocal, batch_size: Optional[int] = None, flush_interval: Optional[float] = None):
+        self.session_factory = session_factory
+        self.batch_size = batch_size or settings.PROGRESS_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.PROGRESS_FLUSH_INTERVAL
+        self.pending: Dict[Tuple[int, int], LessonHeartbeat] = {}
+        self.stats: Counter = Counter()
+        self.running = False
+        self._lock = Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def add(self, heartbeat: LessonHeartbeat):
+        """Buffer a heartbeat, merged with any pending one of the same user and lesson"""
+        with self._lock:
+            self._merge(heartbeat)
+            full = len(self.pending) >= self.batch_size
+        self.stats["received"] += 1
+        if full and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _merge(self, heartbeat: LessonHeartbeat):
+        current = self.pending.get(heartbeat.key)
+        if current is None:
+            self.pending[heartbeat.key] = heartbeat
+        else:
+            current.merge(heartbeat)
+            self.stats["coalesced"] += 1
+
+    def _requeue(self, heartbeats: List[LessonHeartbeat]):
+        with self._lock:
+            for heartbeat in heartbeats:
+                self._merge(heartbeat)
+
+    def _take(self, key: Tuple[int, int]) -> Optional[LessonHeartbeat]:
+        with self._lock:
+            return self.pending.pop(key, None)
+
+    async def flush(self) -> Dict[str, int]:
+        """Write everything buffered so far"""
+        return await asyncio.to_thread(self.flush_pending)
+
+    def flush_pending(self) -> Dict[str, int]:
+        with self._lock:
+            heartbeats = list(self.pending.values())
+            self.pending = {}
+        summary = {"written": 0, "failed": 0}
+        if not heartbeats:
+            return summary
+
+        db = self.session_factory()
+        try:
+            for start in range(0, len(heartbeats), self.batch_size):
+                chunk = heartbeats[start:start + self.batch_size]
+                try:
+                    self.apply(db, chunk)
+                    db.commit()
+                except Exception as e:
+                    logger.error(f"Error writing lesson heartbeats: {str(e)}")
+                    db.rollback()
+                    self._requeue(chunk)
+                    summary["failed"] += len(chunk)
+                    continue
+                summary["written"] += len(chunk)
+        finally:
+            db.close()
+        self.stats["written"] += summary["written"]
+        self.stats["failed"] += summary["failed"]
+        return summary
+
+    def apply(self, db: Session, heartbeats: List[LessonHeartbeat]) -> Dict[str, int]:
+        """Write one batch of merged heartbeats in the caller's transaction"""
+        table = LessonProgress.__table__
+        statement = _upsert(db, table).values([
+            {
+                "user_id": heartbeat.user_id,
+                "lesson_id": heartbeat.lesson_id,
+                "started_at": heartbeat.at,
+                "last_position": heartbeat.position,
+                "time_spent": heartbeat.seconds,
+                "completion_percentage": heartbeat.completion_percentage,
+                "is_completed": False
+            }
+            for heartbeat in heartbeats
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.lesson_id],
+            set_={
+                "time_spent": func.coalesce(table.c.time_spent, 0) + statement.excluded.time_spent,
+                "last_position": _greatest(table.c.last_position, statement.excluded.last_position),
+                "completion_percentage": _greatest(table.c.completion_percentage, statement.excluded.completion_percentage)
+            }
+        ).returning(table.c.user_id, table.c.lesson_id, table.c.started_at)
+        # started_at is only written on insert, so rows still carrying the heartbeat's time are new
+        by_key = {heartbeat.key: heartbeat for heartbeat in heartbeats}
+        inserted = {
+            (user_id, lesson_id)
+            for user_id, lesson_id, started_at in db.execute(statement)
+            if started_at == by_key[(user_id, lesson_id)].at
+        }
+
+        activity: Dict[Tuple[int, int], List] = defaultdict(lambda: [0, 0, None])
+        for heartbeat in heartbeats:
+            course = activity[(heartbeat.user_id, heartbeat.course_id)]
+            course[0] += heartbeat.key in inserted
+            course[1] += heartbeat.seconds
+            course[2] = max(course[2] or heartbeat.at, heartbeat.at)
+
+        for (user_id, course_id), (started, seconds, at) in activity.items():
+            progress_summary.record_lesson_activity(db, user_id, course_id, started, seconds, at)
+        return {"updated": len(heartbeats) - len(inserted), "inserted": len(inserted)}
+
+    def complete(self, db: Session, heartbeat: LessonHeartbeat) -> LessonProgress:
+        """
+        Mark a lesson completed right away, together with any watch time still
+        buffered for it, and update the user's course summary and enrollment
+        """
+        pending = self._take(heartbeat.key)
+        if pending is not None:
+            heartbeat.merge(pending)
+        try:
+            progress = db.query(LessonProgress).filter(
+                LessonProgress.user_id == heartbeat.user_id,
+                LessonProgress.lesson_id == heartbeat.lesson_id
+            ).order_by(LessonProgress.id).with_for_update().first()
+            previous_status = lesson_status(progress)
+            if progress is None:
+                progress = LessonProgress(
+                    user_id=heartbeat.user_id,
+                    lesson_id=heartbeat.lesson_id,
+                    started_at=heartbeat.at,
+                    last_position=0,
+                    time_spent=0
+                )
+                db.add(progress)
+
+            progress.time_spent = (progress.time_spent or 0) + heartbeat.seconds
+            progress.last_position = max(progress.last_position or 0, heartbeat.position)
+            progress.completion_percentage = 100.0
+            progress.is_completed = True
+            if not progress.completed_at:
+                progress.completed_at = heartbeat.at
+
+            course_summary = progress_summary.record_lesson_progress(
+                db, heartbeat.user_id, heartbeat.course_id, previous_status, "completed",
+                time_spent_delta=heartbeat.seconds, at=heartbeat.at
+            )
+            if course_summary is not None:
+                db.execute(
+                    update(CourseEnrollment)
+                    .where(CourseEnrollment.user_id == heartbeat.user_id, CourseEnrollment.course_id == heartbeat.course_id)
+                    .values(
+                        lessons_completed=course_summary.completed_lessons,
+                        progress_percentage=course_summary.progress_percentage,
+                        last_accessed_at=heartbeat.at,
+                        current_lesson_id=heartbeat.lesson_id,
+                        is_completed=course_summary.status == "completed",
+                        completed_at=course_summary.completed_at
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            # The completion failed; keep the watch time for the next flush
+            if pending is not None:
+                self._requeue([pending])
+            raise
+
+        db.refresh(progress)
+        self.stats["completed"] += 1
+        return progress
+
+    # === LIFECYCLE ===
+
+    async def start(self):
+        """Flush every PROGRESS_FLUSH_INTERVAL seconds, or as soon as a batch is full"""
+        self.running = True
+        self._wakeup = asyncio.Event()
+        while self.running:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing lesson heartbeats: {str(e)}")
+
+    async def stop(self):
+        """Stop the flusher and write what is still buffered"""
+        self.running = False
+        if self._wakeup is not None:
+            self._wakeup.set()
+        await self.flush()
+
+    def summary(self) -> Dict[str, int]:
+        return {**self.stats, "pending": len(self.pending)}
+
+
+# Initialize lesson progress buffer
+lesson_progress_buffer = LessonProgressBuffer()
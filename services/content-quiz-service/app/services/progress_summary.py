@@ -0,0 +1,460 @@
+"""
+Progress Summary Service
+Per-user and per-user-per-course progress totals, kept current by applying
+lesson and quiz progress events as increments, so dashboards read one row
+instead of aggregating the progress tables.
+
+    python -m app.services.progress_summary rebuild [--user-id ID ...]
+    python -m app.services.progress_summary check [--user-id ID ...] [--fix]
+"""
+
+import argparse
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..database import SessionLocal
+from ..models.content_models import (
+    Course, Lesson, LessonProgress, Quiz, QuizProgress, QuizSubmission, Topic, UserCourseProgressSummary, UserProgressSummary
+)
+from ..utils.cache import cache
+
+logger = logging.getLogger(__name__)
+
+RECENT_DAYS = 7
+COURSE_INFO_TTL = 300
+
+# Counter columns shared by both summary tables
+COUNTERS = (
+    "completed_lessons", "in_progress_lessons", "completed_quizzes",
+    "quiz_percentage_total", "lesson_time_spent", "quiz_time_spent"
+)
+USER_COUNTERS = COUNTERS + ("completed_courses", "in_progress_courses")
+
+
+def lesson_status(progress) -> Optional[str]:
+    """Status of a lesson progress row: None (no row), in_progress or completed"""
+    if progress is None:
+        return None
+    return "completed" if progress.is_completed else "in_progress"
+
+
+def status_deltas(previous: Optional[str], current: Optional[str], noun: str) -> Dict[str, int]:
+    """Counter changes for a lesson or course moving between statuses: completed_<noun>, in_progress_<noun>"""
+    deltas = {f"completed_{noun}": 0, f"in_progress_{noun}": 0}
+    for status, sign in ((previous, -1), (current, 1)):
+        if status in ("completed", "in_progress"):
+            deltas[f"{status}_{noun}"] += sign
+    return deltas
+
+
+def course_status(completed_lessons: int, in_progress_lessons: int, completed_quizzes: int, total_lessons: int) -> str:
+    if total_lessons > 0 and completed_lessons >= total_lessons:
+        return "completed"
+    if completed_lessons or in_progress_lessons or completed_quizzes:
+        return "in_progress"
+    return "not_started"
+
+
+def add_recent_completions(recent: Optional[Dict[str, List[int]]], day: date, lessons: int, quizzes: int, today: date) -> Dict[str, List[int]]:
+    """Add completions to a day bucket and drop buckets older than the window"""
+    cutoff = (today - timedelta(days=RECENT_DAYS - 1)).isoformat()
+    updated = {key: list(value) for key, value in (recent or {}).items() if key >= cutoff}
+    if day.isoformat() >= cutoff:
+        bucket = updated.setdefault(day.isoformat(), [0, 0])
+        bucket[0] = max(bucket[0] + lessons, 0)
+        bucket[1] = max(bucket[1] + quizzes, 0)
+    return updated
+
+
+def recent_completion_totals(recent: Optional[Dict[str, List[int]]], today: date) -> Tuple[int, int]:
+    """Lesson and quiz completions of the last RECENT_DAYS days"""
+    cutoff = (today - timedelta(days=RECENT_DAYS - 1)).isoformat()
+    lessons = quizzes = 0
+    for day, (day_lessons, day_quizzes) in (recent or {}).items():
+        if day >= cutoff:
+            lessons += day_lessons
+            quizzes += day_quizzes
+    return lessons, quizzes
+
+
+class ProgressSummaryService:
+    """Applies progress events to the summary tables, and rebuilds or checks them from the progress tables"""
+
+    # === INCREMENTAL UPDATES ===
+
+    def course_info(self, db: Session, course_id: int) -> Dict[str, Any]:
+        """Subject and lesson total of a course (cached; lesson changes invalidate course:{id}:*)"""
+        def load():
+            subject_id = db.query(Course.subject_id).filter(Course.id == course_id).scalar()
+            total_lessons = db.query(func.count(Lesson.id)).filter(Lesson.course_id == course_id).scalar()
+            return {"subject_id": subject_id, "total_lessons": total_lessons or 0}
+        return cache.get_or_compute(f"course:{course_id}:summary_info", load, COURSE_INFO_TTL)
+
+    def _bump(self, db: Session, model, keys: Dict[str, Any], deltas: Dict[str, Any], values: Dict[str, Any]):
+        """
+        Add deltas to a summary row with UPDATE col = col + delta (no lost
+        updates between concurrent events), creating the row if missing.
+        last_activity_at only moves forward, as events can arrive late.
+        Returns the updated row, locked until the caller's transaction ends.
+        """
+        increments = {getattr(model, name): getattr(model, name) + delta for name, delta in deltas.items() if delta}
+        criteria = [getattr(model, name) == value for name, value in keys.items()]
+        assignments = dict(values)
+        if assignments.get("last_activity_at") is not None:
+            column, at = model.last_activity_at, assignments["last_activity_at"]
+            assignments["last_activity_at"] = case((or_(column.is_(None), column < at), at), else_=column)
+        statement = update(model).where(*criteria).values({**increments, **assignments}).execution_options(synchronize_session=False)
+
+        if db.execute(statement).rowcount == 0:
+            try:
+                with db.begin_nested():
+                    db.add(model(**keys, **{name: delta for name, delta in deltas.items()}, **values))
+            except IntegrityError:
+                # Created concurrently; apply the increments to that row
+                db.execute(statement)
+        return db.get(model, tuple(keys.values()) if len(keys) > 1 else next(iter(keys.values())), populate_existing=True)
+
+    def _apply(
+        self,
+        db: Session,
+        user_id: int,
+        course_id: Optional[int],
+        deltas: Dict[str, Any],
+        at: datetime,
+        recent: Tuple[int, int] = (0, 0)
+    ) -> Optional[UserCourseProgressSummary]:
+        """Apply counter deltas to a user's course row and summary row in the caller's transaction"""
+        course_row = None
+        course_deltas = {}
+        if course_id is not None:
+            info = self.course_info(db, course_id)
+            course_row = self._bump(
+                db, UserCourseProgressSummary,
+                {"user_id": user_id, "course_id": course_id},
+                {name: deltas.get(name, 0) for name in COUNTERS},
+                {"last_activity_at": at, "subject_id": info["subject_id"]}
+            )
+            previous_status = course_row.status
+            course_row.status = course_status(
+                course_row.completed_lessons, course_row.in_progress_lessons,
+                course_row.completed_quizzes, info["total_lessons"]
+            )
+            if info["total_lessons"]:
+                course_row.progress_percentage = round(min(course_row.completed_lessons / info["total_lessons"] * 100, 100.0), 2)
+            if course_row.status == "completed" and previous_status != "completed":
+                course_row.completed_at = at
+            # Course status changes move the user's course counters
+            course_deltas = status_deltas(previous_status, course_row.status, "courses")
+
+        summary = self._bump(
+            db, UserProgressSummary,
+            {"user_id": user_id},
+            {
+                **{name: deltas.get(name, 0) for name in COUNTERS},
+                **course_deltas
+            },
+            {"last_activity_at": at}
+        )
+        if any(recent):
+            summary.recent_completions = add_recent_completions(
+                summary.recent_completions, at.date(), recent[0], recent[1], datetime.utcnow().date()
+            )
+        return course_row
+
+    def record_lesson_progress(
+        self,
+        db: Session,
+        user_id: int,
+        course_id: int,
+        previous_status: Optional[str],
+        status: Optional[str],
+        time_spent_delta: int = 0,
+        at: Optional[datetime] = None
+    ) -> Optional[UserCourseProgressSummary]:
+        """
+        Apply a lesson progress change (see lesson_status) in the caller's
+        transaction; returns the user's updated course summary
+        """
+        at = at or datetime.utcnow()
+        deltas = status_deltas(previous_status, status, "lessons")
+        deltas["lesson_time_spent"] = time_spent_delta or 0
+        if not any(deltas.values()):
+            return None
+        completions = (status == "completed") - (previous_status == "completed")
+        return self._apply(db, user_id, course_id, deltas, at, (completions, 0))
+
+    def record_lesson_activity(
+        self,
+        db: Session,
+        user_id: int,
+        course_id: int,
+        started_lessons: int = 0,
+        time_spent_delta: int = 0,
+        at: Optional[datetime] = None
+    ) -> Optional[UserCourseProgressSummary]:
+        """
+        Apply a batch of watch time in one course, where started_lessons
+        lessons got their first (in progress) row, in the caller's transaction
+        """
+        deltas = {"in_progress_lessons": started_lessons, "lesson_time_spent": time_spent_delta or 0}
+        if not any(deltas.values()):
+            return None
+        return self._apply(db, user_id, course_id, deltas, at or datetime.utcnow())
+
+    def record_quiz_progress(
+        self,
+        db: Session,
+        user_id: int,
+        course_id: Optional[int],
+        first_completion: bool,
+        percentage_delta: float = 0.0,
+        time_spent_delta: int = 0,
+        at: Optional[datetime] = None
+    ):
+        """
+        Apply a graded quiz attempt in the caller's transaction: a first
+        completion, a change of best percentage, and time spent. Quizzes
+        belong to topics, not courses, so only the user's totals count them
+        (as compute does); course_id is accepted for callers that have one.
+        """
+        at = at or datetime.utcnow()
+        deltas = {
+            "completed_quizzes": 1 if first_completion else 0,
+            "quiz_percentage_total": percentage_delta or 0.0,
+            "quiz_time_spent": time_spent_delta or 0
+        }
+        self._apply(db, user_id, None, deltas, at, (0, 1 if first_completion else 0))
+
+    # === REBUILD AND CONSISTENCY ===
+
+    def compute(self, db: Session, user_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, Any]]:
+        """
+        Summaries recomputed from the progress tables with grouped queries:
+        {user_id: {"summary": {...}, "courses": {course_id: {...}}}}
+        """
+        user_filter = list(user_ids) if user_ids is not None else None
+        week_start = datetime.combine(datetime.utcnow().date() - timedelta(days=RECENT_DAYS - 1), datetime.min.time())
+        users: Dict[int, Dict[str, Any]] = defaultdict(lambda: {"courses": defaultdict(lambda: dict.fromkeys(COUNTERS, 0)), "recent": {}, "last_activity_at": None})
+
+        def touch(user, at):
+            if at and (user["last_activity_at"] is None or at > user["last_activity_at"]):
+                user["last_activity_at"] = at
+
+        lessons = db.query(
+            LessonProgress.user_id,
+            Lesson.course_id,
+            func.sum(case((LessonProgress.is_completed == True, 1), else_=0)),
+            func.sum(case((LessonProgress.is_completed == True, 0), else_=1)),
+            func.coalesce(func.sum(LessonProgress.time_spent), 0),
+            func.max(func.coalesce(LessonProgress.completed_at, LessonProgress.started_at))
+        ).join(Lesson, Lesson.id == LessonProgress.lesson_id)
+        if user_filter is not None:
+            lessons = lessons.filter(LessonProgress.user_id.in_(user_filter))
+        for user_id, course_id, completed, in_progress, time_spent, last_at in lessons.group_by(LessonProgress.user_id, Lesson.course_id):
+            row = users[user_id]["courses"][course_id]
+            row.update(completed_lessons=int(completed or 0), in_progress_lessons=int(in_progress or 0), lesson_time_spent=int(time_spent or 0))
+            touch(users[user_id], last_at)
+
+        # Quiz progress rows hold each user's best result per quiz, kept by the grader.
+        # Quizzes belong to topics rather than courses, so they only count towards user totals.
+        best_percentage = case((QuizProgress.max_score > 0, QuizProgress.score * 100.0 / QuizProgress.max_score), else_=0.0)
+        quizzes = db.query(
+            QuizProgress.user_id,
+            func.count(QuizProgress.id),
+            func.coalesce(func.sum(best_percentage), 0.0),
+            func.coalesce(func.sum(QuizProgress.time_spent), 0)
+        ).filter(QuizProgress.status == "completed")
+        # The latest graded submission is the user's last quiz activity
+        last_submissions = db.query(QuizSubmission.user_id, func.max(QuizSubmission.submitted_at)).filter(
+            QuizSubmission.graded_at.isnot(None)
+        )
+        if user_filter is not None:
+            quizzes = quizzes.filter(QuizProgress.user_id.in_(user_filter))
+            last_submissions = last_submissions.filter(QuizSubmission.user_id.in_(user_filter))
+        for user_id, completed, percentage_total, time_spent in quizzes.group_by(QuizProgress.user_id):
+            row = users[user_id]["courses"][None]
+            row.update(completed_quizzes=int(completed), quiz_percentage_total=float(percentage_total), quiz_time_spent=int(time_spent or 0))
+        for user_id, last_at in last_submissions.group_by(QuizSubmission.user_id):
+            if user_id in users:
+                touch(users[user_id], last_at)
+
+        # Completions per day of the last week
+        recent_lessons = db.query(LessonProgress.user_id, func.date(LessonProgress.completed_at), func.count(LessonProgress.id)).filter(
+            LessonProgress.is_completed == True, LessonProgress.completed_at >= week_start
+        )
+        # A quiz counts on the day of its first completion
+        recent_quizzes = db.query(QuizProgress.user_id, func.date(QuizProgress.first_completed_at), func.count(QuizProgress.id)).filter(
+            QuizProgress.status == "completed", QuizProgress.first_completed_at >= week_start
+        )
+        if user_filter is not None:
+            recent_lessons = recent_lessons.filter(LessonProgress.user_id.in_(user_filter))
+            recent_quizzes = recent_quizzes.filter(QuizProgress.user_id.in_(user_filter))
+        for index, (query, user_column, completed_column) in enumerate((
+            (recent_lessons, LessonProgress.user_id, LessonProgress.completed_at),
+            (recent_quizzes, QuizProgress.user_id, QuizProgress.first_completed_at)
+        )):
+            for user_id, day, completed in query.group_by(user_column, func.date(completed_column)):
+                bucket = users[user_id]["recent"].setdefault(str(day), [0, 0])
+                bucket[index] += completed
+
+        course_ids = {course_id for user in users.values() for course_id in user["courses"] if course_id is not None}
+        course_info = {course_id: self.course_info(db, course_id) for course_id in course_ids}
+
+        result = {}
+        for user_id, user in users.items():
+            summary = dict.fromkeys(USER_COUNTERS, 0)
+            courses = {}
+            for course_id, row in user["courses"].items():
+                for name in COUNTERS:
+                    summary[name] += row[name]
+                if course_id is None:
+                    continue
+                info = course_info[course_id]
+                status = course_status(row["completed_lessons"], row["in_progress_lessons"], row["completed_quizzes"], info["total_lessons"])
+                if status == "completed":
+                    summary["completed_courses"] += 1
+                elif status == "in_progress":
+                    summary["in_progress_courses"] += 1
+                courses[course_id] = {
+                    **row,
+                    "subject_id": info["subject_id"],
+                    "status": status,
+                    "progress_percentage": round(min(row["completed_lessons"] / info["total_lessons"] * 100, 100.0), 2) if info["total_lessons"] else 0.0
+                }
+            summary["recent_completions"] = user["recent"]
+            summary["last_activity_at"] = user["last_activity_at"]
+            result[user_id] = {"summary": summary, "courses": courses}
+        return result
+
+    def rebuild(self, db: Session, user_ids: Optional[Iterable[int]] = None) -> Dict[str, int]:
+        """Replace the summaries of the given users (all users by default) with recomputed ones"""
+        user_ids = list(user_ids) if user_ids is not None else None
+        computed = self.compute(db, user_ids)
+        now = datetime.utcnow()
+
+        summaries = db.query(UserProgressSummary)
+        course_rows = db.query(UserCourseProgressSummary)
+        if user_ids is not None:
+            summaries = summaries.filter(UserProgressSummary.user_id.in_(user_ids))
+            course_rows = course_rows.filter(UserCourseProgressSummary.user_id.in_(user_ids))
+        summaries.delete(synchronize_session=False)
+        course_rows.delete(synchronize_session=False)
+
+        for user_id, data in computed.items():
+            db.add(UserProgressSummary(user_id=user_id, rebuilt_at=now, **data["summary"]))
+            for course_id, row in data["courses"].items():
+                db.add(UserCourseProgressSummary(
+                    user_id=user_id,
+                    course_id=course_id,
+                    last_activity_at=data["summary"]["last_activity_at"],
+                    completed_at=data["summary"]["last_activity_at"] if row["status"] == "completed" else None,
+                    **row
+                ))
+        # Users asked for by id get a row even without progress, so reads find one
+        for user_id in set(user_ids or ()) - set(computed):
+            db.add(UserProgressSummary(user_id=user_id, rebuilt_at=now, recent_completions={}, **dict.fromkeys(USER_COUNTERS, 0)))
+        db.commit()
+        return {"users": len(computed), "courses": sum(len(data["courses"]) for data in computed.values())}
+
+    def check(self, db: Session, user_ids: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        """Differences between the stored summaries and recomputed ones, one entry per user"""
+        user_ids = list(user_ids) if user_ids is not None else None
+        computed = self.compute(db, user_ids)
+
+        stored = db.query(UserProgressSummary)
+        stored_courses = db.query(UserCourseProgressSummary)
+        if user_ids is not None:
+            stored = stored.filter(UserProgressSummary.user_id.in_(user_ids))
+            stored_courses = stored_courses.filter(UserCourseProgressSummary.user_id.in_(user_ids))
+        stored = {row.user_id: row for row in stored}
+        courses_by_user = defaultdict(dict)
+        for row in stored_courses:
+            courses_by_user[row.user_id][row.course_id] = row
+
+        mismatches = []
+        for user_id in set(computed) | set(stored):
+            expected = computed.get(user_id, {"summary": dict.fromkeys(USER_COUNTERS, 0), "courses": {}})
+            differences = {}
+            row = stored.get(user_id)
+            for name in USER_COUNTERS:
+                actual = getattr(row, name) if row else 0
+                if abs((actual or 0) - expected["summary"][name]) > 1e-6:
+                    differences[name] = {"stored": actual, "expected": expected["summary"][name]}
+
+            for course_id in set(expected["courses"]) | set(courses_by_user[user_id]):
+                course_row = courses_by_user[user_id].get(course_id)
+                expected_course = expected["courses"].get(course_id)
+                for name in COUNTERS + ("status",):
+                    actual = getattr(course_row, name) if course_row else None
+                    wanted = expected_course[name] if expected_course else None
+                    if actual != wanted and not (isinstance(wanted, float) and actual is not None and abs(actual - wanted) <= 1e-6):
+                        differences[f"course:{course_id}:{name}"] = {"stored": actual, "expected": wanted}
+
+            if differences:
+                mismatches.append({"user_id": user_id, "differences": differences})
+        return mismatches
+
+    # === READS ===
+
+    def get_summary(self, db: Session, user_id: int) -> Optional[UserProgressSummary]:
+        """A user's summary row; users without one (not yet backfilled) are rebuilt on first read"""
+        summary = db.get(UserProgressSummary, user_id)
+        if summary is None:
+            self.rebuild(db, [user_id])
+            summary = db.get(UserProgressSummary, user_id)
+        return summary
+
+    def catalog_totals(self, db: Session, subject_id: Optional[int] = None) -> Dict[str, int]:
+        """Published courses, lessons and quizzes, shared by all schools (cached briefly; catalogs change rarely)"""
+        def load():
+            courses = db.query(func.count(Course.id)).filter(Course.is_published == True)
+            lessons = db.query(func.count(Lesson.id)).join(Course, Course.id == Lesson.course_id).filter(Lesson.is_published == True)
+            quizzes = db.query(func.count(Quiz.id)).join(Topic, Topic.id == Quiz.topic_id).filter(Quiz.is_published == True)
+            if subject_id:
+                courses, lessons = (query.filter(Course.subject_id == subject_id) for query in (courses, lessons))
+                quizzes = quizzes.filter(Topic.subject_id == subject_id)
+            return {"courses": courses.scalar(), "lessons": lessons.scalar(), "quizzes": quizzes.scalar()}
+        return cache.get_or_compute(f"progress:catalog:{subject_id}", load, COURSE_INFO_TTL)
+
+
+# Initialize progress summary service
+progress_summary = ProgressSummaryService()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Rebuild or check the progress summary tables")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--user-id", type=int, action="append", dest="user_ids", help="limit to these users (repeatable)")
+    parser.add_argument("--fix", action="store_true", help="with check: rebuild the users that differ")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            result = progress_summary.rebuild(db, args.user_ids)
+            logger.info(f"Rebuilt progress summaries of {result['users']} users ({result['courses']} courses)")
+            return 0
+
+        mismatches = progress_summary.check(db, args.user_ids)
+        for mismatch in mismatches:
+            logger.warning(f"User {mismatch['user_id']} summary differs: {mismatch['differences']}")
+        logger.info(f"{len(mismatches)} progress summaries differ from the progress tables")
+        if mismatches and args.fix:
+            progress_summary.rebuild(db, [mismatch["user_id"] for mismatch in mismatches])
+            logger.info(f"Rebuilt {len(mismatches)} progress summaries")
+            return 0
+        return 1 if mismatches else 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=settings.LOG_LEVEL, format=settings.LOG_FORMAT)
+    raise SystemExit(main())
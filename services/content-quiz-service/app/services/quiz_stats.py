@@ -0,0 +1,271 @@
+"""
+Quiz Statistics Service
+Running score aggregates per quiz, updated as submissions are graded so the
+statistics page reads one row, and an item analysis job computing each
+question's difficulty and discrimination from the stored question results.
+
+    python -m app.services.quiz_stats rebuild [--quiz-id ID ...]
+    python -m app.services.quiz_stats analyze [--quiz-id ID ...]
+"""
+
+import argparse
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import Integer, case, cast, func, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from ..core.config import settings
+from ..database import SessionLocal
+from ..models.content_models import Question, QuizStatistics, QuizSubmission
+from ..utils.score_stats import HISTOGRAM_BUCKETS, ScoreAggregate, empty_histogram, item_analysis
+
+logger = logging.getLogger(__name__)
+
+ITEM_ANALYSIS_MIN_SUBMISSIONS = 5
+
+
+class QuizStatsService:
+    """Maintains the quiz_statistics rows and runs item analysis over graded submissions"""
+
+    # === INCREMENTAL UPDATES ===
+
+    def _locked_row(self, db: Session, quiz_id: int) -> QuizStatistics:
+        """The quiz's statistics row, created if missing, locked until the caller's transaction ends"""
+        query = db.query(QuizStatistics).filter(QuizStatistics.quiz_id == quiz_id).with_for_update()
+        row = query.first()
+        if row is None:
+            try:
+                with db.begin_nested():
+                    db.add(QuizStatistics(quiz_id=quiz_id, histogram=empty_histogram()))
+            except IntegrityError:
+                # Created concurrently; lock that row instead
+                pass
+            row = query.populate_existing().first()
+        return row
+
+    def record_attempt(self, db: Session, quiz_id: int):
+        """Count a new (flushed) submission in the caller's transaction"""
+        statement = update(QuizStatistics).where(QuizStatistics.quiz_id == quiz_id).values(
+            attempt_count=QuizStatistics.attempt_count + 1
+        ).execution_options(synchronize_session=False)
+        if db.execute(statement).rowcount == 0:
+            # First submission seen for this quiz, or not yet backfilled: count everything stored
+            self.rebuild(db, [quiz_id], commit=False)
+
+    def record_graded(self, db: Session, quiz_id: int, results: List[Tuple[Optional[float], Optional[float], bool]]):
+        """Add first-time grades, as (score, percentage, is_passed), in the caller's transaction"""
+        if not results:
+            return
+        row = db.query(QuizStatistics).filter(QuizStatistics.quiz_id == quiz_id).with_for_update().first()
+        if row is None:
+            # The grades are flushed by the rebuild's queries, so they are counted
+            self.rebuild(db, [quiz_id], commit=False)
+            return
+        aggregate = ScoreAggregate.from_row(row)
+        for score, percentage, passed in results:
+            aggregate.add(score, percentage, passed)
+        aggregate.store(row)
+
+    # === REBUILD ===
+
+    def compute(self, db: Session, quiz_ids: Optional[Iterable[int]] = None) -> Dict[int, Dict[str, Any]]:
+        """Aggregates of the given quizzes (all by default) recomputed from their submissions"""
+        quiz_filter = list(quiz_ids) if quiz_ids is not None else None
+        graded = QuizSubmission.graded_at.isnot(None)
+
+        def scoped(query):
+            if quiz_filter is not None:
+                query = query.filter(QuizSubmission.quiz_id.in_(quiz_filter))
+            return query.group_by(QuizSubmission.quiz_id)
+
+        computed: Dict[int, Dict[str, Any]] = defaultdict(lambda: {"attempt_count": 0, "aggregate": ScoreAggregate()})
+        for quiz_id, attempts in scoped(db.query(QuizSubmission.quiz_id, func.count(QuizSubmission.id))):
+            computed[quiz_id]["attempt_count"] = attempts
+
+        score = func.coalesce(QuizSubmission.score, 0.0)
+        totals = scoped(db.query(
+            QuizSubmission.quiz_id,
+            func.count(QuizSubmission.id),
+            func.sum(case((QuizSubmission.is_passed == True, 1), else_=0)),
+            func.sum(score),
+            func.sum(score * score),
+            func.min(score),
+            func.max(score),
+            func.coalesce(func.sum(QuizSubmission.percentage), 0.0)
+        ).filter(graded))
+        for quiz_id, count, passed, score_sum, score_sq_sum, min_score, max_score, percentage_sum in totals:
+            aggregate = computed[quiz_id]["aggregate"]
+            aggregate.graded_count = count
+            aggregate.pass_count = passed or 0
+            aggregate.score_sum = score_sum or 0.0
+            aggregate.score_sq_sum = score_sq_sum or 0.0
+            aggregate.min_score = min_score
+            aggregate.max_score = max_score
+            aggregate.percentage_sum = percentage_sum
+
+        percentage = func.coalesce(QuizSubmission.percentage, 0.0)
+        bucket = case((percentage >= 100, HISTOGRAM_BUCKETS - 1), else_=cast(percentage, Integer))
+        buckets = db.query(QuizSubmission.quiz_id, bucket, func.count(QuizSubmission.id)).filter(graded)
+        if quiz_filter is not None:
+            buckets = buckets.filter(QuizSubmission.quiz_id.in_(quiz_filter))
+        for quiz_id, index, count in buckets.group_by(QuizSubmission.quiz_id, bucket):
+            computed[quiz_id]["aggregate"].histogram[min(max(int(index), 0), HISTOGRAM_BUCKETS - 1)] += count
+        return computed
+
+    def rebuild(self, db: Session, quiz_ids: Optional[Iterable[int]] = None, commit: bool = True) -> Dict[str, int]:
+        """
+        Replace the statistics of the given quizzes (all by default) with
+        recomputed ones. With commit=False they are written in the caller's
+        transaction: regrades cannot be applied as increments.
+        """
+        quiz_ids = list(quiz_ids) if quiz_ids is not None else None
+        computed = self.compute(db, quiz_ids)
+        existing = db.query(QuizStatistics.quiz_id)
+        if quiz_ids is not None:
+            existing = existing.filter(QuizStatistics.quiz_id.in_(quiz_ids))
+        targets = set(computed) | {quiz_id for quiz_id, in existing} | set(quiz_ids or ())
+
+        now = datetime.utcnow()
+        for quiz_id in targets:
+            data = computed.get(quiz_id) or {"attempt_count": 0, "aggregate": ScoreAggregate()}
+            row = self._locked_row(db, quiz_id)
+            data["aggregate"].store(row)
+            row.attempt_count = data["attempt_count"]
+            row.rebuilt_at = now
+        if commit:
+            db.commit()
+        return {"quizzes": len(targets)}
+
+    # === ITEM ANALYSIS ===
+
+    def analyze(self, db: Session, quiz_ids: Optional[Iterable[int]] = None) -> Dict[str, int]:
+        """
+        Compute per-question difficulty and discrimination of the given quizzes,
+        by default of every quiz graded since its last analysis
+        """
+        if quiz_ids is None:
+            quiz_ids = [quiz_id for quiz_id, in db.query(QuizStatistics.quiz_id).filter(
+                QuizStatistics.graded_count >= ITEM_ANALYSIS_MIN_SUBMISSIONS,
+                or_(
+                    QuizStatistics.analyzed_count.is_(None),
+                    QuizStatistics.analyzed_count != QuizStatistics.graded_count
+                )
+            )]
+
+        analyzed = 0
+        for quiz_id in quiz_ids:
+            try:
+                question_stats = self.analyze_quiz(db, quiz_id)
+                row = self._locked_row(db, quiz_id)
+                row.question_stats = question_stats
+                row.analyzed_at = datetime.utcnow()
+                row.analyzed_count = row.graded_count
+                db.commit()
+                analyzed += 1
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error analyzing quiz {quiz_id}: {e}")
+        return {"analyzed": analyzed}
+
+    def analyze_quiz(self, db: Session, quiz_id: int) -> List[Dict[str, Any]]:
+        """Item statistics of a quiz's active questions over its graded submissions"""
+        questions = db.query(Question.id, Question.points).filter(
+            Question.quiz_id == quiz_id,
+            Question.is_active == True
+        ).order_by(Question.display_order, Question.id).all()
+        column = {question_id: index for index, (question_id, _) in enumerate(questions)}
+
+        rows = []
+        results = db.query(QuizSubmission.question_results).filter(
+            QuizSubmission.quiz_id == quiz_id,
+            QuizSubmission.graded_at.isnot(None)
+        ).yield_per(1000)
+        for question_results, in results:
+            row = self._score_row(question_results or [], column)
+            if row is not None:
+                rows.append(row)
+
+        scores = np.array(rows, dtype=float).reshape(len(rows), len(questions))
+        points = np.array([points or 0 for _, points in questions], dtype=float)
+        items = item_analysis(scores, points)
+        return [{"question_id": question_id, **item} for (question_id, _), item in zip(questions, items)]
+
+    @staticmethod
+    def _score_row(question_results: List[Dict[str, Any]], column: Dict[int, int]) -> Optional[List[float]]:
+        """
+        Points per current question of one submission's results, NaN for questions
+        it has no result for. Results stored without question ids are positional
+        and only used while they still line up with the quiz's questions.
+        """
+        row = [np.nan] * len(column)
+        if question_results and all("question_id" in result for result in question_results):
+            for result in question_results:
+                index = column.get(result["question_id"])
+                if index is not None:
+                    row[index] = result.get("score", 0) or 0
+            return row
+        if len(question_results) != len(column):
+            return None
+        return [result.get("score", 0) or 0 for result in question_results]
+
+    # === READS ===
+
+    def get_stats(self, db: Session, quiz_id: int) -> QuizStatistics:
+        """A quiz's statistics row; quizzes without one (not yet backfilled) are rebuilt on first read"""
+        row = db.get(QuizStatistics, quiz_id)
+        if row is None:
+            self.rebuild(db, [quiz_id])
+            row = db.get(QuizStatistics, quiz_id)
+        return row
+
+    def describe(self, row: QuizStatistics) -> Dict[str, Any]:
+        """Statistics of a quiz as returned by the API"""
+        aggregate = ScoreAggregate.from_row(row)
+        return {
+            "quiz_id": row.quiz_id,
+            "total_attempts": row.attempt_count or 0,
+            "total_submissions": aggregate.graded_count,
+            "average_score": round(aggregate.mean, 2),
+            "highest_score": aggregate.max_score or 0.0,
+            "lowest_score": aggregate.min_score or 0.0,
+            "pass_rate": round(aggregate.pass_rate, 2),
+            "average_percentage": round(aggregate.average_percentage, 2),
+            "score_std_dev": round(aggregate.std_dev, 2),
+            "percentiles": aggregate.percentiles(),
+            "score_distribution": aggregate.histogram,
+            "question_stats": row.question_stats,
+            "analyzed_at": row.analyzed_at
+        }
+
+
+# Initialize quiz statistics service
+quiz_stats = QuizStatsService()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Rebuild quiz statistics or run item analysis")
+    parser.add_argument("command", choices=["rebuild", "analyze"])
+    parser.add_argument("--quiz-id", type=int, action="append", dest="quiz_ids", help="limit to these quizzes (repeatable)")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        if args.command == "rebuild":
+            result = quiz_stats.rebuild(db, args.quiz_ids)
+            logger.info(f"Rebuilt statistics of {result['quizzes']} quizzes")
+        else:
+            result = quiz_stats.analyze(db, args.quiz_ids)
+            logger.info(f"Analyzed questions of {result['analyzed']} quizzes")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=settings.LOG_LEVEL, format=settings.LOG_FORMAT)
+    raise SystemExit(main())
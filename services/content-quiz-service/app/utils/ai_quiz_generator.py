@@ -3,30 +3,44 @@ AI Quiz Question Generator
 AI-powered quiz question generation with multiple question types
 """
 
-from typing import Dict, List, Any, Optional
+from collections import Counter, defaultdict
+from typing import Dict, List, Any, Optional, Tuple
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func
 
+from ..core.config import settings
 from ..database import get_db
 from ..models.content_models import Quiz, Question, Course, Subject
-from ..utils.cache import cache_result, invalidate_cache_pattern
+from ..utils.cache import cache, cache_result, invalidate_cache_pattern
+from ..utils.llm_backends import LLMBackend, get_llm_backend
+from ..utils.question_dedup import NearDuplicateFilter, normalize_text
 
+import asyncio
+import hashlib
 import logging
 import json
-import openai
 import random
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-# OpenAI client setup (configure with your API key)
-# openai.api_key = os.getenv("OPENAI_API_KEY")
+QUESTION_POOL_LIMIT = 200  # cached questions kept per (topic, type, difficulty)
+MAX_GENERATION_ROUNDS = 2  # rounds of requests for questions rejected as duplicates or unparseable
 
 
 class QuestionGenerator:
     """AI-powered question generator for quizzes"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        backend: Optional[LLMBackend] = None,
+        concurrency: Optional[int] = None,
+        questions_per_prompt: Optional[int] = None
+    ):
+        self.backend = backend if backend is not None else get_llm_backend()
+        self.concurrency = concurrency or settings.AI_GENERATION_CONCURRENCY
+        self.questions_per_prompt = questions_per_prompt or settings.AI_QUESTIONS_PER_PROMPT
+        self.stats = Counter()
         self.question_templates = {
             "multiple_choice": {
                 "prompt_template": """Generate a multiple choice question about {topic} at {difficulty} difficulty level.
@@ -150,44 +164,101 @@ class QuestionGenerator:
         
         return prompt
     
+    def generate_batch_prompt(
+        self,
+        question_type: str,
+        topic: str,
+        difficulty: str,
+        context: str,
+        count: int,
+        existing_questions: List[str] = None
+    ) -> str:
+        """Prompt for several questions of one type, answered as {"questions": [...]}"""
+        
+        if question_type not in self.question_templates:
+            raise ValueError(f"Unsupported question type: {question_type}")
+        
+        template = self.question_templates[question_type]["prompt_template"]
+        prompt = context + f"""
+        Question type: {question_type}
+        Difficulty: {difficulty}
+        Number of questions: {count}
+        
+        Generate {count} different questions. Each question must follow this format:
+        """ + template.format(topic=topic, difficulty=difficulty) + """
+        
+        Return a JSON object {"questions": [...]} holding the questions."""
+        
+        if existing_questions:
+            prompt += f"\n\nExisting questions to avoid duplicating:\n"
+            for i, eq in enumerate(existing_questions[-5:], 1):  # Show last 5 questions
+                prompt += f"{i}. {eq}\n"
+            prompt += "\nEnsure the new questions are unique and cover different aspects."
+        
+        return prompt
+    
+    def _extract_json(self, response_text: str) -> Any:
+        text = response_text.strip()
+        if text.startswith('{') or text.startswith('['):
+            return json.loads(text)
+        # Extract JSON from response text
+        start_idx = min((index for index in (text.find('{'), text.find('[')) if index >= 0), default=-1)
+        end_idx = max(text.rfind('}'), text.rfind(']')) + 1
+        if start_idx >= 0 and end_idx > start_idx:
+            return json.loads(text[start_idx:end_idx])
+        raise ValueError("No JSON found in response")
+    
+    def _validate_question(self, question_data: Any, question_type: str) -> Dict[str, Any]:
+        if not isinstance(question_data, dict):
+            raise ValueError("Question is not a JSON object")
+        
+        # Validate required fields
+        required_fields = ["question_text", "correct_answer", "explanation"]
+        for field in required_fields:
+            if field not in question_data:
+                raise ValueError(f"Missing required field: {field}")
+        
+        # Set default values
+        question_data.setdefault("difficulty", "intermediate")
+        question_data.setdefault("tags", [])
+        
+        # Question type specific validation
+        if question_type == "multiple_choice":
+            if "options" not in question_data or len(question_data["options"]) < 4:
+                raise ValueError("Multiple choice questions need 4 options")
+        
+        return question_data
+    
     def parse_ai_response(self, response_text: str, question_type: str) -> Dict[str, Any]:
         """Parse AI response into structured question data"""
         try:
-            # Try to parse as JSON
-            if response_text.strip().startswith('{'):
-                question_data = json.loads(response_text)
-            else:
-                # Extract JSON from response text
-                start_idx = response_text.find('{')
-                end_idx = response_text.rfind('}') + 1
-                if start_idx >= 0 and end_idx > start_idx:
-                    json_str = response_text[start_idx:end_idx]
-                    question_data = json.loads(json_str)
-                else:
-                    raise ValueError("No JSON found in response")
-            
-            # Validate required fields
-            required_fields = ["question_text", "correct_answer", "explanation"]
-            for field in required_fields:
-                if field not in question_data:
-                    raise ValueError(f"Missing required field: {field}")
-            
-            # Set default values
-            question_data.setdefault("difficulty", "intermediate")
-            question_data.setdefault("tags", [])
-            
-            # Question type specific validation
-            if question_type == "multiple_choice":
-                if "options" not in question_data or len(question_data["options"]) < 4:
-                    raise ValueError("Multiple choice questions need 4 options")
-            
-            return question_data
+            return self._validate_question(self._extract_json(response_text), question_type)
             
         except Exception as e:
             logger.error(f"Error parsing AI response: {e}")
             logger.error(f"Response text: {response_text}")
             raise ValueError(f"Failed to parse AI response: {e}")
     
+    def parse_ai_batch_response(self, response_text: str, question_type: str) -> List[Dict[str, Any]]:
+        """Parse a response holding several questions; invalid questions are dropped"""
+        try:
+            data = self._extract_json(response_text)
+        except Exception as e:
+            logger.error(f"Error parsing AI response: {e}")
+            logger.error(f"Response text: {response_text}")
+            return []
+        
+        if isinstance(data, dict):
+            data = data.get("questions", [data])
+        
+        questions = []
+        for question_data in data if isinstance(data, list) else []:
+            try:
+                questions.append(self._validate_question(question_data, question_type))
+            except ValueError as e:
+                logger.warning(f"Dropping generated question: {e}")
+        return questions
+    
     def generate_fallback_question(self, topic: str, question_type: str, difficulty: str) -> Dict[str, Any]:
         """Generate a fallback question when AI generation fails"""
         
@@ -218,6 +289,122 @@ class QuestionGenerator:
         
         return base_question
     
+    def question_cache_key(self, topic: str, question_type: str, difficulty: str) -> str:
+        """Cache key of generated questions, hashed from the request and the prompt template"""
+        content = json.dumps([
+            normalize_text(topic),
+            question_type,
+            difficulty,
+            self.question_templates[question_type]["prompt_template"]
+        ])
+        return f"ai_questions:{hashlib.sha256(content.encode()).hexdigest()[:32]}"
+    
+    def _points(self, question_type: str, difficulty: str) -> int:
+        return self.question_templates[question_type]["points"].get(difficulty, 2)
+    
+    def _batches(self, count: int) -> List[int]:
+        """Split a number of questions into prompt-sized requests"""
+        size = max(1, self.questions_per_prompt)
+        return [min(size, count - start) for start in range(0, count, size)]
+    
+    async def _request(self, semaphore: asyncio.Semaphore, prompt: str, question_type: str) -> List[Dict[str, Any]]:
+        async with semaphore:
+            self.stats["requests"] += 1
+            try:
+                response_text = await self.backend.complete(prompt)
+            except Exception as e:
+                logger.error(f"AI question generation failed: {e}")
+                return []
+        return self.parse_ai_batch_response(response_text, question_type)
+    
+    async def generate_questions(
+        self,
+        topic: str,
+        question_types: List[str],
+        difficulty: str,
+        course_name: str,
+        subject_name: str,
+        existing_questions: List[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Generate one question per entry of question_types, in that order.
+        
+        Questions cached for the same (topic, type, difficulty) are reused
+        first. The rest are requested several per prompt, with at most
+        AI_GENERATION_CONCURRENCY requests in flight. Near duplicates of the
+        existing questions or of each other are dropped and requested again;
+        whatever is still missing gets a fallback question.
+        """
+        for question_type in question_types:
+            if question_type not in self.question_templates:
+                raise ValueError(f"Unsupported question type: {question_type}")
+        
+        existing_questions = list(existing_questions or [])
+        context = self.generate_topic_context(topic, course_name, subject_name)
+        seen = NearDuplicateFilter(threshold=settings.AI_DUPLICATE_THRESHOLD)
+        seen.extend(existing_questions)
+        
+        wanted = Counter(question_types)
+        accepted: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        generated: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        
+        def accept(question_type: str, question: Dict[str, Any]) -> bool:
+            if len(accepted[question_type]) >= wanted[question_type]:
+                return False
+            if not seen.add(question["question_text"]):
+                self.stats["duplicates"] += 1
+                return False
+            accepted[question_type].append(question)
+            return True
+        
+        # Reuse questions generated earlier for the same request
+        pools = {}
+        for question_type in wanted:
+            pools[question_type] = cache.get(self.question_cache_key(topic, question_type, difficulty)) or []
+            for question in pools[question_type]:
+                if len(accepted[question_type]) >= wanted[question_type]:
+                    break
+                if accept(question_type, dict(question)):
+                    self.stats["cached"] += 1
+        
+        if self.backend is not None:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            for _ in range(MAX_GENERATION_ROUNDS):
+                requests: List[Tuple[str, str]] = [
+                    (question_type, self.generate_batch_prompt(
+                        question_type, topic, difficulty, context, count, existing_questions
+                    ))
+                    for question_type in wanted
+                    for count in self._batches(wanted[question_type] - len(accepted[question_type]))
+                ]
+                if not requests:
+                    break
+                responses = await asyncio.gather(*(
+                    self._request(semaphore, prompt, question_type) for question_type, prompt in requests
+                ))
+                for (question_type, _), questions in zip(requests, responses):
+                    for question in questions:
+                        if accept(question_type, question):
+                            generated[question_type].append(question)
+            
+            for question_type, questions in generated.items():
+                pool = (pools[question_type] + questions)[-QUESTION_POOL_LIMIT:]
+                cache.set(self.question_cache_key(topic, question_type, difficulty), pool, settings.AI_QUESTION_CACHE_TTL)
+        else:
+            logger.warning("Using fallback question generation (AI not configured)")
+        
+        # Hand questions out in the order requested
+        results = []
+        for question_type in question_types:
+            if accepted[question_type]:
+                question_data = dict(accepted[question_type].pop(0))
+            else:
+                self.stats["fallbacks"] += 1
+                question_data = self.generate_fallback_question(topic, question_type, difficulty)
+            question_data["points"] = self._points(question_type, difficulty)
+            results.append(question_data)
+        return results
+    
     async def generate_single_question(
         self,
         topic: str,
@@ -228,39 +415,10 @@ class QuestionGenerator:
         existing_questions: List[str] = None
     ) -> Dict[str, Any]:
         """Generate a single question using AI"""
-        
-        try:
-            # Generate prompt
-            prompt = self.generate_question_prompt(
-                question_type, topic, difficulty, course_name, subject_name, existing_questions
-            )
-            
-            # Mock AI response (replace with actual AI call)
-            # response = await openai.ChatCompletion.acreate(
-            #     model="gpt-3.5-turbo",
-            #     messages=[{"role": "user", "content": prompt}],
-            #     max_tokens=500,
-            #     temperature=0.7
-            # )
-            # response_text = response.choices[0].message.content
-            
-            # For now, use fallback (replace with actual AI implementation)
-            logger.warning("Using fallback question generation (AI not configured)")
-            question_data = self.generate_fallback_question(topic, question_type, difficulty)
-            
-            # Add points based on difficulty and type
-            points = self.question_templates[question_type]["points"].get(difficulty, 2)
-            question_data["points"] = points
-            
-            return question_data
-            
-        except Exception as e:
-            logger.error(f"AI question generation failed: {e}")
-            # Use fallback
-            question_data = self.generate_fallback_question(topic, question_type, difficulty)
-            points = self.question_templates[question_type]["points"].get(difficulty, 2)
-            question_data["points"] = points
-            return question_data
+        questions = await self.generate_questions(
+            topic, [question_type], difficulty, course_name, subject_name, existing_questions
+        )
+        return questions[0]
 
 
 async def generate_quiz_questions(
@@ -306,21 +464,21 @@ async def generate_quiz_questions(
             Question.quiz_id == quiz_id
         ).scalar() or 0
         
-        for i in range(num_questions):
+        # Vary question types
+        slots = [question_types[i % len(question_types)] for i in range(num_questions)]
+        
+        # Generate all questions at once: batched prompts, requested concurrently
+        questions = await generator.generate_questions(
+            topic=topic,
+            question_types=slots,
+            difficulty=difficulty,
+            course_name=course_name,
+            subject_name=subject_name,
+            existing_questions=existing_question_texts
+        )
+        
+        for i, (question_type, question_data) in enumerate(zip(slots, questions)):
             try:
-                # Vary question types
-                question_type = question_types[i % len(question_types)]
-                
-                # Generate question
-                question_data = await generator.generate_single_question(
-                    topic=topic,
-                    question_type=question_type,
-                    difficulty=difficulty,
-                    course_name=course_name,
-                    subject_name=subject_name,
-                    existing_questions=existing_question_texts
-                )
-                
                 # Create question in database
                 new_question = Question(
                     quiz_id=quiz_id,
@@ -340,9 +498,6 @@ async def generate_quiz_questions(
                 db.add(new_question)
                 generated_questions.append(new_question)
                 
-                # Add to existing questions list to avoid duplicates
-                existing_question_texts.append(question_data["question_text"])
-                
             except Exception as e:
                 logger.error(f"Error generating question {i+1}: {e}")
                 continue
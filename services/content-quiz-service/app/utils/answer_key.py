@@ -0,0 +1,313 @@
+"""
+Compiled Answer Keys
+Pre-normalized answer keys for grading many submissions of the same quiz
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TRUTHY_ANSWERS = frozenset(['true', '1', 'yes', 't'])
+
+
+def normalize_answer(value: Any) -> str:
+    """Normalize an answer for case and whitespace insensitive comparison"""
+    return str(value).strip().lower()
+
+
+def _as_set(value: Any) -> Optional[frozenset]:
+    try:
+        return frozenset(value)
+    except TypeError:
+        return None
+
+
+@dataclass
+class CompiledQuestion:
+    """One question with its correct answer normalized once, ahead of grading"""
+    id: int
+    question_type: str
+    points: float
+    correct_answer: Any
+    explanation: Optional[str] = None
+    question_text: str = ""
+    difficulty: Optional[str] = None
+    tags: List[str] = field(default_factory=list)
+    correct_text: str = ""
+    correct_lower: str = ""
+    correct_bool: bool = False
+    correct_set: Optional[frozenset] = None
+    correct_blanks: Optional[List[str]] = None
+    keywords: Optional[frozenset] = None
+
+    @classmethod
+    def from_question(cls, question) -> "CompiledQuestion":
+        correct_answer = question.correct_answer
+        compiled = cls(
+            id=question.id,
+            question_type=question.question_type,
+            points=question.points,
+            correct_answer=correct_answer,
+            explanation=question.explanation,
+            question_text=question.question_text or "",
+            difficulty=getattr(question, "difficulty", None),
+            tags=list(getattr(question, "tags", None) or [])
+        )
+        compiled.correct_text = normalize_answer(correct_answer)
+        compiled.correct_lower = str(correct_answer).lower()
+        compiled.correct_bool = compiled.correct_lower in TRUTHY_ANSWERS
+        if isinstance(correct_answer, list):
+            compiled.correct_set = _as_set(correct_answer)
+            compiled.correct_blanks = [normalize_answer(blank) for blank in correct_answer]
+        words = compiled.correct_text.split()
+        if len(words) > 1:
+            compiled.keywords = frozenset(words)
+        return compiled
+
+    def score(self, user_answer: Any) -> Dict[str, Any]:
+        """Score one answer; same rules and result shape as calculate_question_score"""
+        try:
+            is_correct, score = self._grade(user_answer)
+            return {
+                "is_correct": is_correct,
+                "score": round(score, 2),
+                "max_score": self.points,
+                "explanation": self.explanation
+            }
+        except Exception as e:
+            logger.error(f"Error calculating score for question {self.id}: {e}")
+            return {
+                "is_correct": False,
+                "score": 0,
+                "max_score": self.points,
+                "explanation": "Error in grading",
+                "error": str(e)
+            }
+
+    def _grade(self, user_answer: Any) -> Tuple[bool, float]:
+        points = self.points
+        correct_answer = self.correct_answer
+        question_type = self.question_type
+
+        if question_type == "multiple_choice":
+            if isinstance(user_answer, str):
+                is_correct = user_answer.lower() == self.correct_lower
+            elif isinstance(user_answer, list):
+                # Multiple select
+                if isinstance(correct_answer, list):
+                    if self.correct_set is not None:
+                        is_correct = frozenset(user_answer) == self.correct_set
+                    else:
+                        is_correct = set(user_answer) == set(correct_answer)
+                else:
+                    is_correct = len(user_answer) == 1 and user_answer[0] == correct_answer
+            else:
+                is_correct = user_answer == correct_answer
+            return is_correct, points if is_correct else 0
+
+        if question_type == "true_false":
+            is_correct = (str(user_answer).lower() in TRUTHY_ANSWERS) == self.correct_bool
+            return is_correct, points if is_correct else 0
+
+        if question_type == "short_answer":
+            if not user_answer or not correct_answer:
+                return False, 0
+            user_text = normalize_answer(user_answer)
+            if user_text == self.correct_text:
+                return True, points
+            if self.keywords is None:
+                return False, 0
+            match_ratio = len(self.keywords.intersection(user_text.split())) / len(self.keywords)
+            if match_ratio >= 0.8:  # 80% keyword match
+                return True, points
+            if match_ratio >= 0.5:  # 50% keyword match - partial credit
+                return False, points * 0.5
+            return False, 0
+
+        if question_type == "essay":
+            # Marked for manual review
+            return True, points
+
+        if question_type == "fill_blank":
+            if self.correct_blanks is not None and isinstance(user_answer, list):
+                if len(user_answer) != len(self.correct_blanks):
+                    return False, 0
+                correct_count = sum(
+                    normalize_answer(user_blank) == correct_blank
+                    for user_blank, correct_blank in zip(user_answer, self.correct_blanks)
+                )
+                if correct_count == len(self.correct_blanks):
+                    return True, points
+                return False, points * (correct_count / len(self.correct_blanks))
+            is_correct = normalize_answer(user_answer) == self.correct_text
+            return is_correct, points if is_correct else 0
+
+        if question_type == "matching":
+            if not (isinstance(user_answer, dict) and isinstance(correct_answer, dict)):
+                return False, 0
+            correct_matches = sum(
+                1 for key, correct_value in correct_answer.items()
+                if key in user_answer and user_answer[key] == correct_value
+            )
+            if correct_matches == len(correct_answer):
+                return True, points
+            return False, points * (correct_matches / len(correct_answer))
+
+        if question_type == "ordering":
+            if not (isinstance(user_answer, list) and isinstance(correct_answer, list)):
+                return False, 0
+            if user_answer == correct_answer:
+                return True, points
+            correct_positions = sum(
+                1 for user_item, correct_item in zip(user_answer, correct_answer) if user_item == correct_item
+            )
+            return False, points * (correct_positions / len(correct_answer))
+
+        logger.warning(f"Unknown question type: {question_type}")
+        return False, 0
+
+    def weak_area(self) -> Dict[str, Any]:
+        text = self.question_text
+        return {
+            "question_id": self.id,
+            "question_text": text[:100] + "..." if len(text) > 100 else text,
+            "difficulty": self.difficulty,
+            "tags": self.tags
+        }
+
+
+@dataclass
+class BatchGradingResult:
+    """Scores of N submissions against one answer key, one row per submission"""
+    scores: np.ndarray  # (N, Q) points awarded
+    correct: np.ndarray  # (N, Q) bool
+    results: List[List[Dict[str, Any]]]  # per-question results, as stored on submissions
+    type_correct: np.ndarray  # (N, T)
+    type_score: np.ndarray  # (N, T)
+
+    @property
+    def totals(self) -> np.ndarray:
+        return self.scores.sum(axis=1)
+
+
+class CompiledAnswerKey:
+    """Every active question of a quiz compiled for grading, with point and type arrays"""
+
+    def __init__(
+        self,
+        quiz_id: int,
+        version: Hashable,
+        passing_score: float,
+        questions: List[CompiledQuestion],
+        course_id: Optional[int] = None
+    ):
+        self.quiz_id = quiz_id
+        self.version = version
+        self.course_id = course_id
+        self.passing_score = passing_score if passing_score is not None else 70.0
+        self.questions = questions
+        self.answer_keys = [str(question.id) for question in questions]
+        self.points = np.array([question.points or 0 for question in questions], dtype=float)
+        self.max_score = float(self.points.sum())
+
+        # Question types in order of first appearance, and a (Q, T) one-hot matrix
+        self.question_types: List[str] = list(dict.fromkeys(question.question_type for question in questions))
+        type_index = {question_type: index for index, question_type in enumerate(self.question_types)}
+        self.type_matrix = np.zeros((len(questions), len(self.question_types)))
+        for index, question in enumerate(questions):
+            self.type_matrix[index, type_index[question.question_type]] = 1
+        self.type_totals = self.type_matrix.sum(axis=0).astype(int)
+        self.type_max_scores = self.points @ self.type_matrix
+
+    @classmethod
+    def compile(cls, quiz, questions, version: Hashable = None) -> "CompiledAnswerKey":
+        return cls(
+            quiz_id=quiz.id,
+            version=version,
+            passing_score=quiz.passing_score,
+            questions=[CompiledQuestion.from_question(question) for question in questions],
+            course_id=getattr(quiz, "course_id", None)
+        )
+
+    def grade_batch(self, submissions: List[Dict[str, Any]]) -> BatchGradingResult:
+        """Score every submission's answers; aggregates are computed on the whole (N, Q) matrix"""
+        results = [
+            [question.score(answers.get(key)) for question, key in zip(self.questions, self.answer_keys)]
+            for answers in submissions
+        ]
+        shape = (len(submissions), len(self.questions))
+        scores = np.array([[result["score"] for result in row] for row in results], dtype=float).reshape(shape)
+        correct = np.array([[result["is_correct"] for result in row] for row in results], dtype=bool).reshape(shape)
+        return BatchGradingResult(
+            scores=scores,
+            correct=correct,
+            results=results,
+            type_correct=correct.astype(float) @ self.type_matrix,
+            type_score=scores @ self.type_matrix
+        )
+
+    def question_type_stats(self, batch: BatchGradingResult, row: int) -> Dict[str, Dict[str, Any]]:
+        """Per question type stats of one submission, in the shape generate_detailed_feedback uses"""
+        return {
+            question_type: {
+                "correct": int(batch.type_correct[row, index]),
+                "total": int(self.type_totals[index]),
+                "score": float(batch.type_score[row, index]),
+                "max_score": float(self.type_max_scores[index])
+            }
+            for index, question_type in enumerate(self.question_types)
+        }
+
+    def weak_areas(self, batch: BatchGradingResult, row: int) -> List[Dict[str, Any]]:
+        return [self.questions[index].weak_area() for index in np.flatnonzero(~batch.correct[row])]
+
+
+class AnswerKeyCache:
+    """In-process LRU of compiled answer keys, keyed by (quiz_id, version)"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._keys: "OrderedDict[int, CompiledAnswerKey]" = OrderedDict()
+        self._lock = Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def get(self, quiz_id: int, version: Hashable, loader: Callable[[], CompiledAnswerKey]) -> CompiledAnswerKey:
+        """Return the key compiled for this version, compiling it with loader when missing or stale"""
+        with self._lock:
+            key = self._keys.get(quiz_id)
+            if key is not None and key.version == version:
+                self._keys.move_to_end(quiz_id)
+                self.stats["hits"] += 1
+                return key
+            self.stats["misses"] += 1
+
+        key = loader()
+        with self._lock:
+            self._keys[quiz_id] = key
+            self._keys.move_to_end(quiz_id)
+            while len(self._keys) > self.max_entries:
+                self._keys.popitem(last=False)
+        return key
+
+    def invalidate(self, quiz_id: int):
+        with self._lock:
+            if self._keys.pop(quiz_id, None) is not None:
+                self.stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+    def __len__(self):
+        return len(self._keys)
+
+
+# Initialize answer key cache
+answer_key_cache = AnswerKeyCache()
@@ -1,20 +1,56 @@
 """
 Caching Utilities
-Redis-based caching with advanced features and fallback mechanisms
+Two-tier caching: a bounded in-process LRU in front of Redis, with cross-worker
+invalidation over Redis pub/sub and single-flight recomputation of misses
 """
 
+import asyncio
+import inspect
 import json
-import pickle
 import hashlib
 import logging
-from typing import Any, Optional, List, Dict, Callable, Union
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Optional, List, Dict, Callable, Tuple, Union
 from functools import wraps
 import time
+import uuid
 import redis
 from ..core.config import settings
 
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+# Namespace of the tag sets that index cached keys by prefix; sorted sets scored by
+# member expiry (the earlier plain sets under "_tag" expire on their own)
+TAG_NAMESPACE = "_tags"
+# Tag sets outlive the entries they index; expired members are pruned on every write
+TAG_SET_TTL = 86400
+# Set once the legacy key cleanup has finished, outside the service's cache keyspace so clear_all keeps it
+LEGACY_CLEANUP_MARKER = f"edunerve-maintenance:{settings.SERVICE_NAME}:cache-legacy-cleanup:{TAG_NAMESPACE}"
+LEGACY_CLEANUP_LEASE = 3600
+SCAN_BATCH_SIZE = 500
+# Namespace of the single-flight locks held while a missing entry is recomputed
+LOCK_NAMESPACE = "_lock"
+# Every worker drops its local copies of keys announced here
+INVALIDATION_CHANNEL = f"edunerve:{settings.SERVICE_NAME}:cache-invalidation"
+FLIGHT_LOCK_STRIPES = 64
+
+_MISSING = object()
+
 # Redis client setup
 try:
     redis_client = redis.Redis(
@@ -38,59 +74,322 @@ except Exception as e:
     REDIS_AVAILABLE = False
 
 
+
+def _to_primitive(value: Any) -> Any:
+    """Fallback for values the serializers cannot encode natively"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    if hasattr(value, "dict"):
+        return value.dict()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+class CacheCodec:
+    """
+    Serializes cache values with orjson or msgpack (plain JSON when neither is
+    installed). Payloads start with a marker naming their codec, so workers
+    with different codecs can share entries.
+    """
+    
+    MARKERS = {"orjson": b"o:", "msgpack": b"m:", "json": b"j:"}
+    
+    def __init__(self, name: str = "auto"):
+        if name == "auto":
+            name = "orjson" if ORJSON_AVAILABLE else "msgpack" if MSGPACK_AVAILABLE else "json"
+        if (name == "orjson" and not ORJSON_AVAILABLE) or (name == "msgpack" and not MSGPACK_AVAILABLE):
+            logger.warning(f"{name} is not installed; caching with JSON")
+            name = "json"
+        self.name = name
+    
+    def dumps(self, value: Any) -> bytes:
+        if self.name == "orjson":
+            return b"o:" + orjson.dumps(
+                value, default=_to_primitive, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+            )
+        if self.name == "msgpack":
+            return b"m:" + msgpack.packb(value, default=_to_primitive, use_bin_type=True)
+        return b"j:" + json.dumps(value, default=_to_primitive).encode("utf-8")
+    
+    @staticmethod
+    def loads(data: bytes) -> Any:
+        marker, payload = data[:2], data[2:]
+        if marker == b"o:":
+            return orjson.loads(payload) if ORJSON_AVAILABLE else json.loads(payload)
+        if marker == b"m:":
+            return msgpack.unpackb(payload, raw=False)
+        if marker == b"j:":
+            return json.loads(payload)
+        # Unmarked entries are counters (INCR) or JSON written before the markers; pickles are never loaded
+        return json.loads(data)
+
+
+class LocalCache:
+    """Bounded in-process LRU of serialized entries with short TTLs"""
+    
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+    
+    def set(self, key: str, data: bytes, ttl: Optional[float] = None):
+        if self.max_entries <= 0:
+            return
+        expires_at = time.monotonic() + min(ttl or self.ttl, self.ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def delete_prefix(self, prefix: str) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if key.startswith(prefix)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
+
+
+class TierStats:
+    """Hit and miss counters of one cache tier"""
+    
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+    
+    def record(self, hit: bool):
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+    
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
 class CacheManager:
-    """Advanced cache management with Redis backend"""
+    """Two-tier cache: in-process LRU in front of Redis"""
     
-    def __init__(self, redis_client=redis_client, default_ttl=3600):
+    def __init__(
+        self,
+        redis_client=redis_client,
+        default_ttl=3600,
+        local_size: Optional[int] = None,
+        local_ttl: Optional[float] = None,
+        codec: Optional[CacheCodec] = None
+    ):
         self.redis = redis_client
         self.default_ttl = default_ttl
-        self.available = REDIS_AVAILABLE
-        
+        self.available = redis_client is not None
+        self.codec = codec or CacheCodec(settings.CACHE_SERIALIZER)
+        self.local = LocalCache(
+            settings.QUERY_CACHE_SIZE if local_size is None else local_size,
+            settings.LOCAL_CACHE_TTL if local_ttl is None else local_ttl
+        )
+        self.instance_id = uuid.uuid4().hex
+        self.tier_stats = {"local": TierStats(), "redis": TierStats()}
+        self.flight_stats = {"computed": 0, "waited": 0, "lock_timeouts": 0}
+        self._flight_locks = [threading.Lock() for _ in range(FLIGHT_LOCK_STRIPES)]
+        self._async_flights: Dict[str, asyncio.Future] = {}
+        self._subscriber = None
+        self._local_paused_until = 0.0
+    
     def _serialize(self, value: Any) -> bytes:
         """Serialize value for storage"""
-        try:
-            # Try JSON first for simple types
-            if isinstance(value, (dict, list, str, int, float, bool, type(None))):
-                return json.dumps(value, default=str).encode('utf-8')
-            else:
-                # Fall back to pickle for complex objects
-                return pickle.dumps(value)
-        except Exception as e:
-            logger.error(f"Serialization failed: {e}")
-            return pickle.dumps(value)
+        return self.codec.dumps(value)
     
     def _deserialize(self, data: bytes) -> Any:
         """Deserialize value from storage"""
         try:
-            # Try JSON first
-            return json.loads(data.decode('utf-8'))
-        except (UnicodeDecodeError, json.JSONDecodeError):
-            try:
-                # Fall back to pickle
-                return pickle.loads(data)
-            except Exception as e:
-                logger.error(f"Deserialization failed: {e}")
-                return None
+            return self.codec.loads(data)
+        except Exception as e:
+            logger.error(f"Deserialization failed: {e}")
+            return None
+    
+    # === LOCAL TIER AND CROSS-WORKER INVALIDATION ===
+    
+    @property
+    def local_enabled(self) -> bool:
+        """The local tier is only used while this worker hears other workers' invalidations"""
+        return self._subscriber is not None and time.monotonic() >= self._local_paused_until
+    
+    def start_invalidation_listener(self) -> bool:
+        """Subscribe to invalidations from other workers and enable the local tier"""
+        if not self.available or self._subscriber is not None:
+            return self._subscriber is not None
+        try:
+            pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{INVALIDATION_CHANNEL: self._on_invalidation})
+            self._subscriber = pubsub.run_in_thread(
+                sleep_time=1.0, daemon=True, exception_handler=self._on_listener_error
+            )
+            logger.info("Local cache tier enabled")
+            return True
+        except Exception as e:
+            logger.warning(f"Cache invalidation listener unavailable, local tier disabled: {e}")
+            return False
+    
+    def stop_invalidation_listener(self):
+        if self._subscriber is not None:
+            self._subscriber.stop()
+            self._subscriber = None
+        self.local.clear()
+    
+    def _on_listener_error(self, error, pubsub, thread):
+        # Invalidations may have been missed while disconnected
+        logger.warning(f"Cache invalidation listener error: {error}")
+        self.local.clear()
+        self._local_paused_until = time.monotonic() + self.local.ttl
+        time.sleep(1.0)
+    
+    def _on_invalidation(self, message: Dict[str, Any]):
+        try:
+            event = json.loads(message["data"])
+        except (TypeError, ValueError, KeyError):
+            return
+        if event.get("origin") == self.instance_id:
+            return
+        if event.get("clear"):
+            self.local.clear()
+        for prefix in event.get("prefixes", []):
+            self.local.delete_prefix(prefix)
+        for key in event.get("keys", []):
+            self.local.delete(key)
+    
+    def _publish_invalidation(self, target=None, keys: List[str] = (), prefixes: List[str] = (), clear: bool = False):
+        """Tell the other workers to drop local copies (on a pipeline when given)"""
+        message = json.dumps({"origin": self.instance_id, "keys": list(keys), "prefixes": list(prefixes), "clear": clear})
+        (target or self.redis).publish(INVALIDATION_CHANNEL, message)
     
     def _generate_key(self, key: str, prefix: str = "edunerve") -> str:
         """Generate namespaced cache key"""
         return f"{prefix}:{settings.SERVICE_NAME}:{key}"
     
+    @staticmethod
+    def _tags_for_key(key: str) -> List[str]:
+        """Every prefix of the key ending at a colon: quiz:5:user:7:results -> quiz:, quiz:5:, ..."""
+        return [key[:index + 1] for index, char in enumerate(key) if char == ":"]
+    
+    @staticmethod
+    def _tag_for_pattern(pattern: str) -> Optional[str]:
+        """The tag a "prefix:*" pattern invalidates, or None for patterns tags cannot answer"""
+        if not pattern.endswith(":*"):
+            return None
+        prefix = pattern[:-1]
+        if any(char in prefix for char in "*?[]\\"):
+            return None
+        return prefix
+    
+    def _tag_key(self, tag: str) -> str:
+        return self._generate_key(f"{TAG_NAMESPACE}:{tag}")
+    
+    def _tag(self, pipeline, key: str, cache_key: str, ttl: int):
+        """Register a cached key in the tag set of each of its prefixes, dropping expired members"""
+        now = time.time()
+        for tag in self._tags_for_key(key):
+            tag_key = self._tag_key(tag)
+            pipeline.zadd(tag_key, {cache_key: now + ttl})
+            pipeline.zremrangebyscore(tag_key, "-inf", now)
+            pipeline.expire(tag_key, max(TAG_SET_TTL, ttl))
+    
+    def _delete_tag(self, tag: str) -> int:
+        """Delete every key registered under a tag without scanning the keyspace"""
+        tag_key = self._tag_key(tag)
+        # Detach the set first so keys cached from now on start a fresh one
+        detached = self._generate_key(f"{TAG_NAMESPACE}:deleting:{uuid.uuid4().hex}")
+        try:
+            self.redis.rename(tag_key, detached)
+        except redis.exceptions.ResponseError:
+            return 0  # No such tag: nothing cached under it
+        
+        deleted = 0
+        try:
+            batch = []
+            for member, _ in self.redis.zscan_iter(detached, count=SCAN_BATCH_SIZE):
+                batch.append(member)
+                if len(batch) >= SCAN_BATCH_SIZE:
+                    deleted += self.redis.unlink(*batch)
+                    batch = []
+            if batch:
+                deleted += self.redis.unlink(*batch)
+        finally:
+            self.redis.unlink(detached)
+        return deleted
+    
+    def scan_delete(self, pattern: str, batch_size: int = SCAN_BATCH_SIZE) -> int:
+        """Delete keys matching a raw Redis pattern with incremental SCAN, never KEYS"""
+        deleted = 0
+        batch = []
+        for key in self.redis.scan_iter(match=pattern, count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                deleted += self.redis.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += self.redis.unlink(*batch)
+        return deleted
+    
     def get(self, key: str, default: Any = None) -> Any:
-        """Get value from cache"""
+        """Get value from cache, trying the local tier before Redis"""
         if not self.available:
             return default
         
+        local_enabled = self.local_enabled
+        if local_enabled:
+            data = self.local.get(key)
+            self.tier_stats["local"].record(data is not None)
+            if data is not None:
+                return self._deserialize(data)
+        
         try:
             cache_key = self._generate_key(key)
             data = self.redis.get(cache_key)
+            self.tier_stats["redis"].record(data is not None)
             
             if data is None:
                 return default
             
+            if local_enabled:
+                self.local.set(key, data)
             return self._deserialize(data)
             
         except Exception as e:
+            self.tier_stats["redis"].errors += 1
             logger.error(f"Cache get failed for key {key}: {e}")
             return default
     
@@ -106,9 +405,17 @@ class CacheManager:
             if ttl is None:
                 ttl = self.default_ttl
             
-            return self.redis.setex(cache_key, ttl, serialized)
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.setex(cache_key, ttl, serialized)
+            self._tag(pipeline, key, cache_key, ttl)
+            # Other workers may hold the previous value even if this one has no local tier
+            self._publish_invalidation(pipeline, keys=[key])
+            if self.local_enabled:
+                self.local.set(key, serialized, ttl)
+            return bool(pipeline.execute()[0])
             
         except Exception as e:
+            self.local.delete(key)
             logger.error(f"Cache set failed for key {key}: {e}")
             return False
     
@@ -117,26 +424,41 @@ class CacheManager:
         if not self.available:
             return False
         
+        self.local.delete(key)
         try:
             cache_key = self._generate_key(key)
-            return bool(self.redis.delete(cache_key))
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.delete(cache_key)
+            self._publish_invalidation(pipeline, keys=[key])
+            return bool(pipeline.execute()[0])
             
         except Exception as e:
             logger.error(f"Cache delete failed for key {key}: {e}")
             return False
     
     def delete_pattern(self, pattern: str) -> int:
-        """Delete all keys matching pattern"""
+        """
+        Delete all keys matching pattern
+        
+        "prefix:*" patterns (all the service uses) delete the members of the
+        prefix's tag set, so the cost is the number of keys invalidated.
+        """
         if not self.available:
             return 0
         
         try:
-            cache_pattern = self._generate_key(pattern)
-            keys = self.redis.keys(cache_pattern)
+            tag = self._tag_for_pattern(pattern)
+            if tag is not None:
+                self.local.delete_prefix(tag)
+                deleted = self._delete_tag(tag)
+                self._publish_invalidation(prefixes=[tag])
+                return deleted
             
-            if keys:
-                return self.redis.delete(*keys)
-            return 0
+            # Patterns that are not a "prefix:*" fall back to an incremental scan
+            self.local.clear()
+            deleted = self.scan_delete(self._generate_key(pattern))
+            self._publish_invalidation(clear=True)
+            return deleted
             
         except Exception as e:
             logger.error(f"Cache delete pattern failed for {pattern}: {e}")
@@ -186,33 +508,55 @@ class CacheManager:
         if not self.available:
             return None
         
+        self.local.delete(key)
         try:
             cache_key = self._generate_key(key)
-            return self.redis.incr(cache_key, amount)
+            pipeline = self.redis.pipeline(transaction=False)
+            pipeline.incr(cache_key, amount)
+            self._publish_invalidation(pipeline, keys=[key])
+            return pipeline.execute()[0]
             
         except Exception as e:
             logger.error(f"Cache increment failed for key {key}: {e}")
             return None
     
     def get_multi(self, keys: List[str]) -> Dict[str, Any]:
-        """Get multiple values from cache"""
+        """Get multiple values from cache, fetching only local misses from Redis"""
         if not self.available:
             return {}
         
+        result = {}
+        local_enabled = self.local_enabled
+        missing = keys
+        if local_enabled:
+            missing = []
+            for key in keys:
+                data = self.local.get(key)
+                self.tier_stats["local"].record(data is not None)
+                if data is None:
+                    missing.append(key)
+                else:
+                    result[key] = self._deserialize(data)
+            if not missing:
+                return result
+        
         try:
-            cache_keys = [self._generate_key(key) for key in keys]
+            cache_keys = [self._generate_key(key) for key in missing]
             values = self.redis.mget(cache_keys)
             
-            result = {}
-            for i, value in enumerate(values):
+            for key, value in zip(missing, values):
+                self.tier_stats["redis"].record(value is not None)
                 if value is not None:
-                    result[keys[i]] = self._deserialize(value)
+                    if local_enabled:
+                        self.local.set(key, value)
+                    result[key] = self._deserialize(value)
             
             return result
             
         except Exception as e:
+            self.tier_stats["redis"].errors += 1
             logger.error(f"Cache get_multi failed: {e}")
-            return {}
+            return result
     
     def set_multi(self, mapping: Dict[str, Any], ttl: Optional[int] = None) -> bool:
         """Set multiple values in cache"""
@@ -223,44 +567,276 @@ class CacheManager:
             if ttl is None:
                 ttl = self.default_ttl
             
-            pipeline = self.redis.pipeline()
+            local_enabled = self.local_enabled
+            pipeline = self.redis.pipeline(transaction=False)
             
             for key, value in mapping.items():
                 cache_key = self._generate_key(key)
                 serialized = self._serialize(value)
                 pipeline.setex(cache_key, ttl, serialized)
+                self._tag(pipeline, key, cache_key, ttl)
+                if local_enabled:
+                    self.local.set(key, serialized, ttl)
             
+            self._publish_invalidation(pipeline, keys=list(mapping))
             pipeline.execute()
             return True
             
         except Exception as e:
+            for key in mapping:
+                self.local.delete(key)
             logger.error(f"Cache set_multi failed: {e}")
             return False
     
     def clear_all(self) -> bool:
         """Clear all cache entries for this service"""
+        self.local.clear()
         if not self.available:
             return False
         
         try:
-            pattern = self._generate_key("*")
-            keys = self.redis.keys(pattern)
+            deleted = self.scan_delete(self._generate_key("*"))
+            self._publish_invalidation(clear=True)
             
-            if keys:
-                self.redis.delete(*keys)
-            
-            logger.info(f"Cleared {len(keys)} cache entries")
+            logger.info(f"Cleared {deleted} cache entries")
             return True
             
         except Exception as e:
             logger.error(f"Cache clear_all failed: {e}")
             return False
+    
+    # === SINGLE-FLIGHT RECOMPUTATION ===
+    
+    def _flight_lock(self, key: str) -> threading.Lock:
+        return self._flight_locks[hash(key) % FLIGHT_LOCK_STRIPES]
+    
+    def _redis_lock(self, key: str):
+        """Cross-worker lock held by whoever recomputes a missing entry"""
+        return self.redis.lock(
+            self._generate_key(f"{LOCK_NAMESPACE}:{key}"),
+            timeout=settings.CACHE_LOCK_TIMEOUT,
+            blocking=False
+        )
+    
+    def _wait_for_value(self, key: str) -> Any:
+        """Poll Redis until another worker has stored the entry, or the lock timeout passes"""
+        deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+        delay = 0.01
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            delay = min(delay * 2, 0.2)
+        self.flight_stats["lock_timeouts"] += 1
+        return _MISSING
+    
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl: Optional[int] = None) -> Any:
+        """
+        Return the cached value, or compute and cache it. Concurrent misses of
+        the same key, in this process or in other workers, run compute once;
+        the others wait for its result.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if not self.available:
+            return compute()
+        
+        with self._flight_lock(key):
+            # Another thread may have filled it while we waited for the lock
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                self.flight_stats["waited"] += 1
+                return value
+            
+            lock = None
+            try:
+                lock = self._redis_lock(key)
+                if not lock.acquire():
+                    lock = None
+                    value = self._wait_for_value(key)
+                    if value is not _MISSING:
+                        self.flight_stats["waited"] += 1
+                        return value
+            except Exception as e:
+                lock = None
+                logger.warning(f"Cache lock failed for key {key}: {e}")
+            
+            try:
+                self.flight_stats["computed"] += 1
+                value = compute()
+                if value is not None:
+                    self.set(key, value, ttl)
+                return value
+            finally:
+                if lock is not None:
+                    try:
+                        lock.release()
+                    except Exception:
+                        pass  # Expired while computing; the value is stored either way
+    
+    async def get_or_compute_async(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        ttl: Optional[int] = None
+    ) -> Any:
+        """get_or_compute for coroutine functions; compute is awaited once per miss"""
+        value = await asyncio.to_thread(self.get, key, _MISSING)
+        if value is not _MISSING:
+            return value
+        if not self.available:
+            return await compute()
+        
+        flight = self._async_flights.get(key)
+        if flight is not None:
+            self.flight_stats["waited"] += 1
+            return await asyncio.shield(flight)
+        
+        flight = asyncio.get_running_loop().create_future()
+        self._async_flights[key] = flight
+        try:
+            value = await self._compute_async(key, compute, ttl)
+            flight.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            flight.exception()  # Waiters re-raise it; don't log it as unretrieved
+            raise
+        finally:
+            del self._async_flights[key]
+    
+    async def _compute_async(self, key: str, compute: Callable[[], Any], ttl: Optional[int]) -> Any:
+        lock = None
+        try:
+            lock = self._redis_lock(key)
+            if not await asyncio.to_thread(lock.acquire):
+                lock = None
+                value = await asyncio.to_thread(self._wait_for_value, key)
+                if value is not _MISSING:
+                    self.flight_stats["waited"] += 1
+                    return value
+        except Exception as e:
+            lock = None
+            logger.warning(f"Cache lock failed for key {key}: {e}")
+        
+        try:
+            self.flight_stats["computed"] += 1
+            value = await compute()
+            if value is not None:
+                await asyncio.to_thread(self.set, key, value, ttl)
+            return value
+        finally:
+            if lock is not None:
+                try:
+                    await asyncio.to_thread(lock.release)
+                except Exception:
+                    pass
+    
+    def cleanup_legacy_keys(
+        self,
+        batch_size: int = SCAN_BATCH_SIZE,
+        max_seconds: Optional[float] = None,
+        force: bool = False
+    ) -> Dict[str, int]:
+        """
+        Delete cached keys no tag set knows about (written before the current
+        tag sets existed), so tag invalidation cannot miss them.
+        Walks the service's keys with SCAN in small batches; safe to run
+        while serving and to stop early with max_seconds. Runs once per
+        deployment of a tag namespace: a marker key makes later calls
+        (every worker start) a no-op, and only one worker scans at a time.
+        """
+        summary = {"scanned": 0, "deleted": 0}
+        if not self.available:
+            return summary
+        
+        try:
+            if not force and self.redis.get(LEGACY_CLEANUP_MARKER) == b"done":
+                return summary
+            if not self.redis.set(LEGACY_CLEANUP_MARKER, b"running", nx=True, ex=LEGACY_CLEANUP_LEASE) and not force:
+                return summary  # Another worker is scanning
+        except Exception as e:
+            logger.error(f"Legacy cache cleanup failed: {e}")
+            return summary
+        
+        service_prefix = self._generate_key("")
+        internal_prefix = self._generate_key("_").encode()
+        started = time.monotonic()
+        
+        def process(batch: List[bytes]):
+            # A key is tagged if it is a member of its deepest tag set
+            pipeline = self.redis.pipeline(transaction=False)
+            checked = []
+            for cache_key in batch:
+                tags = self._tags_for_key(cache_key.decode()[len(service_prefix):])
+                if tags:
+                    checked.append(cache_key)
+                    pipeline.zscore(self._tag_key(tags[-1]), cache_key)
+            legacy = [cache_key for cache_key, score in zip(checked, pipeline.execute()) if score is None]
+            if legacy:
+                summary["deleted"] += self.redis.unlink(*legacy)
+        
+        finished = False
+        try:
+            batch = []
+            for cache_key in self.redis.scan_iter(match=f"{service_prefix}*", count=batch_size):
+                if cache_key.startswith(internal_prefix):
+                    continue  # Tag sets and single-flight locks
+                summary["scanned"] += 1
+                batch.append(cache_key)
+                if len(batch) >= batch_size:
+                    process(batch)
+                    batch = []
+                    if max_seconds is not None and time.monotonic() - started > max_seconds:
+                        break
+            else:
+                if batch:
+                    process(batch)
+                finished = True
+        except Exception as e:
+            logger.error(f"Legacy cache cleanup failed: {e}")
+        
+        try:
+            if finished:
+                self.redis.set(LEGACY_CLEANUP_MARKER, b"done")
+            else:
+                # Stopped early: the next start scans again
+                self.redis.delete(LEGACY_CLEANUP_MARKER)
+        except Exception as e:
+            logger.error(f"Legacy cache cleanup marker update failed: {e}")
+        
+        logger.info(f"Legacy cache cleanup scanned {summary['scanned']} keys, deleted {summary['deleted']}")
+        return summary
 
 
 # Global cache manager instance
 cache = CacheManager()
 
 
+def _build_cache_key(func: Callable, key_template: Optional[str], key_builder: Optional[Callable], args, kwargs) -> str:
+    if key_builder:
+        return key_builder(*args, **kwargs)
+    if key_template:
+        # Get function signature for argument mapping
+        sig = inspect.signature(func)
+        bound_args = sig.bind(*args, **kwargs)
+        bound_args.apply_defaults()
+        
+        try:
+            return key_template.format(**bound_args.arguments)
+        except KeyError as e:
+            logger.warning(f"Cache key template missing argument: {e}")
+            return f"{func.__name__}:{hash(str(args) + str(kwargs))}"
+    # Default key based on function name and arguments
+    args_hash = hashlib.md5(str(args).encode() + str(kwargs).encode()).hexdigest()
+    return f"{func.__name__}:{args_hash}"
+
+
 def cache_result(
     key_template: str = None,
     ttl: int = 3600,
@@ -269,51 +845,33 @@ def cache_result(
     """
     Decorator to cache function results
     
+    Concurrent misses of the same key are computed once (see
+    CacheManager.get_or_compute). Works on sync and async functions.
+    
     Args:
         key_template: Template for cache key (can use {arg_name} placeholders)
         ttl: Time to live in seconds
         key_builder: Custom function to build cache key
     """
     def decorator(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not cache.available:
+                    return await func(*args, **kwargs)
+                
+                cache_key = _build_cache_key(func, key_template, key_builder, args, kwargs)
+                return await cache.get_or_compute_async(cache_key, lambda: func(*args, **kwargs), ttl)
+            
+            return async_wrapper
+        
         @wraps(func)
         def wrapper(*args, **kwargs):
             if not cache.available:
                 return func(*args, **kwargs)
             
-            # Build cache key
-            if key_builder:
-                cache_key = key_builder(*args, **kwargs)
-            elif key_template:
-                # Get function signature for argument mapping
-                import inspect
-                sig = inspect.signature(func)
-                bound_args = sig.bind(*args, **kwargs)
-                bound_args.apply_defaults()
-                
-                try:
-                    cache_key = key_template.format(**bound_args.arguments)
-                except KeyError as e:
-                    logger.warning(f"Cache key template missing argument: {e}")
-                    cache_key = f"{func.__name__}:{hash(str(args) + str(kwargs))}"
-            else:
-                # Default key based on function name and arguments
-                args_hash = hashlib.md5(str(args).encode() + str(kwargs).encode()).hexdigest()
-                cache_key = f"{func.__name__}:{args_hash}"
-            
-            # Try to get from cache
-            cached_result = cache.get(cache_key)
-            if cached_result is not None:
-                logger.debug(f"Cache hit for {cache_key}")
-                return cached_result
-            
-            # Execute function and cache result
-            logger.debug(f"Cache miss for {cache_key}")
-            result = func(*args, **kwargs)
-            
-            if result is not None:
-                cache.set(cache_key, result, ttl)
-            
-            return result
+            cache_key = _build_cache_key(func, key_template, key_builder, args, kwargs)
+            return cache.get_or_compute(cache_key, lambda: func(*args, **kwargs), ttl)
         
         return wrapper
     return decorator
@@ -377,6 +935,24 @@ class CacheStats:
         except Exception:
             return 0.0
     
+    @staticmethod
+    def get_tier_stats() -> Dict[str, Any]:
+        """Hit ratios of the local and Redis tiers, as seen by this worker"""
+        local = cache.tier_stats["local"].snapshot()
+        local.update({"enabled": cache.local_enabled, "size": len(cache.local), "max_entries": cache.local.max_entries})
+        redis_tier = cache.tier_stats["redis"].snapshot()
+        
+        # Local misses fall through to Redis, so lookups are local hits plus Redis lookups
+        hits = local["hits"] + redis_tier["hits"]
+        lookups = local["hits"] + redis_tier["hits"] + redis_tier["misses"]
+        return {
+            "local": local,
+            "redis": redis_tier,
+            "overall_hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "single_flight": dict(cache.flight_stats),
+            "serializer": cache.codec.name
+        }
+    
     @staticmethod
     def get_service_keys_count() -> int:
         """Get count of keys for this service"""
@@ -385,7 +961,11 @@ class CacheStats:
         
         try:
             pattern = cache._generate_key("*")
-            return len(cache.redis.keys(pattern))
+            internal_prefix = cache._generate_key("_").encode()
+            return sum(
+                1 for key in cache.redis.scan_iter(match=pattern, count=SCAN_BATCH_SIZE)
+                if not key.startswith(internal_prefix)
+            )
         except Exception:
             return 0
 
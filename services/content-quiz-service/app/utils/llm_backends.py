@@ -0,0 +1,145 @@
+"""
+LLM Backends
+Chat completion backends for AI question generation: OpenAI, and a
+deterministic fake for benchmarks and tests that needs no network
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from ..core.config import settings
+
+try:
+    from openai import AsyncOpenAI
+    OPENAI_AVAILABLE = True
+except ImportError:
+    OPENAI_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class LLMBackend(ABC):
+    """Sends one prompt and returns the completion text"""
+
+    name = "base"
+
+    @abstractmethod
+    async def complete(self, prompt: str) -> str:
+        """Return the completion text for one prompt"""
+        pass
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI chat completions, asking for a JSON object"""
+
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str] = None, model: Optional[str] = None):
+        self.client = AsyncOpenAI(api_key=api_key or settings.OPENAI_API_KEY)
+        self.model = model or settings.OPENAI_MODEL
+
+    async def complete(self, prompt: str) -> str:
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=settings.OPENAI_MAX_TOKENS,
+            temperature=settings.OPENAI_TEMPERATURE,
+            response_format={"type": "json_object"}
+        )
+        return response.choices[0].message.content
+
+
+FAKE_TEMPLATES = (
+    "How does {0} relate to {1} when {2} and {3} change?",
+    "Which {0} best explains the {1} seen in {topic}?",
+    "Why would a {0} reduce {1} but not {2}?",
+    "What happens to {0} if {1} doubles while {2} stays fixed?",
+    "Compare {0} with {1}: which one depends on {2}?",
+    "Name the {0} that links {1}, {2} and {3}."
+)
+
+FAKE_VOCABULARY = (
+    "energy", "cell", "force", "market", "equation", "river", "climate", "protein", "voltage",
+    "history", "grammar", "fraction", "planet", "enzyme", "trade", "circuit", "poem", "atom",
+    "ratio", "erosion", "verb", "density", "election", "triangle", "molecule", "harvest",
+    "current", "velocity", "colony", "budget", "nucleus", "sentence", "angle", "oxygen",
+    "province", "vector", "habitat", "tariff", "metaphor", "gravity", "acid", "census"
+)
+
+
+class FakeLLMBackend(LLMBackend):
+    """
+    Deterministic stand-in for an LLM: the same prompt always gets the same,
+    well-formed questions, with an optional simulated round-trip latency
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.seed = seed
+        self.calls = 0
+
+    async def complete(self, prompt: str) -> str:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        count = int(self._field(prompt, "Number of questions", "1"))
+        question_type = self._field(prompt, "Question type", "multiple_choice")
+        topic = self._field(prompt, "Topic", "the topic")
+        difficulty = self._field(prompt, "Difficulty", "intermediate")
+
+        digest = hashlib.sha256(f"{self.seed}:{prompt}".encode()).digest()
+        rng = random.Random(digest)
+        questions = [self._question(rng, question_type, topic, difficulty) for _ in range(count)]
+        return json.dumps({"questions": questions})
+
+    @staticmethod
+    def _field(prompt: str, name: str, default: str) -> str:
+        match = re.search(rf"^\s*{name}:\s*(.+?)\s*$", prompt, re.MULTILINE)
+        return match.group(1) if match else default
+
+    @staticmethod
+    def _question(rng: random.Random, question_type: str, topic: str, difficulty: str):
+        words = rng.sample(FAKE_VOCABULARY, 6)
+        text = rng.choice(FAKE_TEMPLATES).format(*words, topic=topic)
+        question = {
+            "question_text": text,
+            "explanation": f"The {words[0]} of a {words[4]} depends on its {words[5]}.",
+            "difficulty": difficulty,
+            "tags": [topic.lower().replace(" ", "_"), words[0]]
+        }
+        if question_type == "multiple_choice":
+            question["options"] = [f"{letter}) {word}" for letter, word in zip("ABCD", rng.sample(FAKE_VOCABULARY, 4))]
+            question["correct_answer"] = rng.choice("ABCD")
+        elif question_type == "true_false":
+            question["correct_answer"] = rng.random() < 0.5
+        elif question_type == "fill_blank":
+            question["question_text"] = text.replace(words[0], "___", 1)
+            question["correct_answer"] = words[0]
+        else:
+            question["correct_answer"] = words[3]
+        return question
+
+
+def get_llm_backend(name: Optional[str] = None) -> Optional[LLMBackend]:
+    """
+    The configured backend (AI_QUESTION_BACKEND); auto uses OpenAI when a key
+    is set. None when no backend is usable.
+    """
+    name = (name or settings.AI_QUESTION_BACKEND).lower()
+    if name == "fake":
+        return FakeLLMBackend()
+    if name in ("auto", "openai"):
+        if OPENAI_AVAILABLE and settings.OPENAI_API_KEY:
+            return OpenAIBackend()
+        if name == "openai":
+            logger.warning("OpenAI backend requested but the openai package or OPENAI_API_KEY is missing")
+        return None
+    raise ValueError(f"Unknown LLM backend: {name}")
@@ -1,28 +1,238 @@
 """
 Pagination Utilities
 Efficient database pagination with performance optimization
+
+Large lists are paged with keyset cursors: rows are ordered by the requested
+sort key plus unique tie-breakers (ending with the primary key), and the next
+page starts after the last row's key values instead of at an OFFSET. Cursors
+are opaque, signed tokens. Totals can be exact, estimated by the planner,
+cached, or skipped.
 """
 
+import base64
+import hashlib
+import hmac
+import json
+import logging
 import math
-from typing import Dict, Any, List, Optional
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Any, List, Optional, Sequence, Tuple
 from sqlalchemy.orm import Query
-from sqlalchemy import func
+from sqlalchemy import and_, false, func, or_, text
+
+from ..core.config import settings
+from .cache import cache
+
+logger = logging.getLogger(__name__)
+
+COUNT_MODES = ("exact", "estimated", "cached", "none")
+# Planner estimates below this are replaced by an exact count, which is cheap there
+EXACT_COUNT_THRESHOLD = 1000
+
+# (column, descending) pairs; the last one must be unique and not null
+SortKeys = Sequence[Tuple[Any, bool]]
+
+
+class CursorError(ValueError):
+    """A pagination cursor that is malformed, tampered with, or from another listing"""
+
+
+# === CURSORS ===
+
+def _dump_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    if hasattr(value, "value") and not isinstance(value, (int, float, str)):
+        return value.value  # Enum members
+    return value
+
+
+def _load_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "dec" in value:
+            return Decimal(value["dec"])
+        raise CursorError("Invalid cursor value")
+    return value
+
+
+def _signature(payload: bytes) -> bytes:
+    return hmac.new(settings.SECRET_KEY.encode(), payload, hashlib.sha256).digest()[:16]
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def sort_fingerprint(sort_keys: SortKeys) -> str:
+    """Identifies an ordering, so a cursor cannot be replayed against a different sort"""
+    spec = ",".join(f"{column}:{'desc' if descending else 'asc'}" for column, descending in sort_keys)
+    return hashlib.md5(spec.encode()).hexdigest()[:8]
+
+
+def encode_cursor(values: Sequence[Any], direction: str, fingerprint: str) -> str:
+    """Opaque, signed cursor holding the sort key values of a boundary row"""
+    payload = json.dumps(
+        {"k": [_dump_value(value) for value in values], "d": direction, "s": fingerprint},
+        separators=(",", ":")
+    ).encode()
+    return f"{_b64encode(payload)}.{_b64encode(_signature(payload))}"
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> Tuple[List[Any], str]:
+    """Verify a cursor and return its key values and direction"""
+    try:
+        encoded_payload, encoded_signature = cursor.split(".", 1)
+        payload = _b64decode(encoded_payload)
+        signature = _b64decode(encoded_signature)
+    except ValueError:
+        raise CursorError("Malformed cursor")
+    if not hmac.compare_digest(signature, _signature(payload)):
+        raise CursorError("Invalid cursor signature")
+    
+    data = json.loads(payload)
+    if data.get("s") != fingerprint:
+        raise CursorError("Cursor does not match the requested sort order")
+    if data.get("d") not in ("next", "prev"):
+        raise CursorError("Invalid cursor direction")
+    return [_load_value(value) for value in data["k"]], data["d"]
+
+
+def _after(sort_keys: SortKeys, values: Sequence[Any], reverse: bool = False):
+    """
+    Rows strictly after the given key values in the keyset order; with reverse,
+    rows strictly before them. NULLs sort last in every column.
+    """
+    (column, descending), value = sort_keys[0], values[0]
+    forward = descending == reverse  # True when "after" means greater
+    rest = sort_keys[1:]
+    
+    if value is None:
+        if reverse:
+            # Every non-null value sorts before a NULL
+            beyond = column.isnot(None)
+            return or_(beyond, and_(column.is_(None), _after(rest, values[1:], reverse))) if rest else beyond
+        return and_(column.is_(None), _after(rest, values[1:], reverse)) if rest else false()
+    
+    beyond = column > value if forward else column < value
+    if not reverse:
+        beyond = or_(beyond, column.is_(None))
+    if not rest:
+        return beyond
+    return or_(beyond, and_(column == value, _after(rest, values[1:], reverse)))
+
+
+def _orderings(sort_keys: SortKeys, reverse: bool = False) -> List[Any]:
+    orderings = []
+    for column, descending in sort_keys:
+        if descending != reverse:
+            ordering = column.desc()
+        else:
+            ordering = column.asc()
+        orderings.append(ordering.nulls_first() if reverse else ordering.nulls_last())
+    return orderings
+
+
+# === COUNTS ===
+
+def _count_cache_key(query: Query) -> str:
+    statement = query.order_by(None).statement
+    compiled = statement.compile()
+    digest = hashlib.md5((str(compiled) + repr(sorted(compiled.params.items(), key=str))).encode()).hexdigest()
+    table = query.column_descriptions[0]["entity"].__tablename__
+    return f"count:{table}:{digest}"
+
+
+def estimate_count(query: Query) -> Optional[int]:
+    """
+    Planner row estimate of a query: pg_class.reltuples for a whole table,
+    EXPLAIN's estimate otherwise. None where the database cannot estimate.
+    """
+    session = query.session
+    bind = session.get_bind()
+    if bind.dialect.name != "postgresql":
+        return None
+    
+    statement = query.order_by(None).statement
+    try:
+        if statement.whereclause is None and len(statement.get_final_froms()) == 1:
+            table = query.column_descriptions[0]["entity"].__tablename__
+            estimate = session.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+                {"table": table}
+            ).scalar()
+        else:
+            estimate = None
+        if estimate is None or estimate < 0:
+            compiled = statement.compile(dialect=bind.dialect)
+            plan = session.connection().exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+            ).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = plan[0]["Plan"]["Plan Rows"]
+        return int(estimate)
+    except Exception as e:
+        logger.warning(f"Count estimate failed: {e}")
+        return None
+
+
+def count_total(query: Query, count: str = "exact") -> Tuple[Optional[int], bool]:
+    """
+    Total rows of a query as (total, is_estimate)
+    
+    exact: COUNT(*); estimated: planner estimate, exact when small or
+    unavailable; cached: exact count shared for PAGINATION_COUNT_CACHE_TTL
+    seconds; none: no count at all.
+    """
+    if count not in COUNT_MODES:
+        raise ValueError(f"Unknown count mode: {count}")
+    if count == "none":
+        return None, False
+    
+    counted = query.order_by(None)
+    if count == "estimated":
+        estimate = estimate_count(counted)
+        if estimate is not None and estimate >= EXACT_COUNT_THRESHOLD:
+            return estimate, True
+    elif count == "cached":
+        return cache.get_or_compute(
+            _count_cache_key(counted), counted.count, settings.PAGINATION_COUNT_CACHE_TTL
+        ), False
+    return counted.count(), False
 
 
 def paginate_query(
     query: Query,
     page: int = 1,
     page_size: int = 20,
-    max_page_size: int = 100
+    max_page_size: int = 100,
+    count: str = "exact"
 ) -> Dict[str, Any]:
     """
-    Paginate a SQLAlchemy query with efficient counting
+    Paginate a SQLAlchemy query with OFFSET
+    
+    Each page scans and discards every row before it; prefer keyset_paginate
+    for anything but shallow pages.
     
     Args:
         query: SQLAlchemy query to paginate
         page: Page number (1-indexed)
         page_size: Items per page
         max_page_size: Maximum allowed page size
+        count: How to compute the total (see count_total)
         
     Returns:
         Dictionary with pagination information and items
@@ -34,20 +244,19 @@ def paginate_query(
     # Calculate offset
     offset = (page - 1) * page_size
     
-    # Get total count efficiently
-    total = query.count()
-    
-    # Calculate pagination metadata
-    total_pages = math.ceil(total / page_size) if total > 0 else 1
-    has_next = page < total_pages
+    # Get one extra item to check if there are more
+    items = query.offset(offset).limit(page_size + 1).all()
+    has_next = len(items) > page_size
+    items = items[:page_size]
     has_prev = page > 1
     
-    # Get paginated items
-    items = query.offset(offset).limit(page_size).all()
+    total, total_is_estimate = count_total(query, count)
+    total_pages = (math.ceil(total / page_size) if total > 0 else 1) if total is not None else None
     
     return {
         "items": items,
         "total": total,
+        "total_is_estimate": total_is_estimate,
         "page": page,
         "page_size": page_size,
         "total_pages": total_pages,
@@ -59,6 +268,174 @@ def paginate_query(
     }
 
 
+def keyset_paginate(
+    query: Query,
+    sort_keys: SortKeys,
+    cursor: Optional[str] = None,
+    page_size: int = 20,
+    max_page_size: int = 100,
+    count: str = "none"
+) -> Dict[str, Any]:
+    """
+    Paginate a SQLAlchemy query with keyset cursors
+    
+    The query's own ORDER BY is replaced by sort_keys. Every page costs one
+    index range scan of page_size + 1 rows, however deep it is.
+    
+    Args:
+        query: SQLAlchemy query selecting one entity
+        sort_keys: (column, descending) pairs, ending with the primary key
+        cursor: next_cursor or prev_cursor of a previous page
+        page_size: Items per page
+        max_page_size: Maximum allowed page size
+        count: How to compute the total (see count_total)
+        
+    Returns:
+        Dictionary with items, cursors and the total
+        
+    Raises:
+        CursorError: cursor is invalid or from another sort order
+    """
+    page_size = min(max(1, page_size), max_page_size)
+    fingerprint = sort_fingerprint(sort_keys)
+    columns = [column for column, _ in sort_keys]
+    
+    values, direction = decode_cursor(cursor, fingerprint) if cursor else (None, "next")
+    if values is not None and len(values) != len(sort_keys):
+        raise CursorError("Cursor does not match the requested sort order")
+    reverse = direction == "prev"
+    
+    page_query = query.order_by(None)
+    if values is not None:
+        page_query = page_query.filter(_after(sort_keys, values, reverse))
+    # Sort key values come back with each row, for the cursors
+    rows = page_query.add_columns(*columns).order_by(*_orderings(sort_keys, reverse)).limit(page_size + 1).all()
+    
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if reverse:
+        rows.reverse()
+    
+    has_next = has_more if not reverse else values is not None
+    has_prev = values is not None if not reverse else has_more
+    next_cursor = prev_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(rows[-1][1:], "next", fingerprint)
+    if rows and has_prev:
+        prev_cursor = encode_cursor(rows[0][1:], "prev", fingerprint)
+    
+    total, total_is_estimate = count_total(query, count)
+    return {
+        "items": [row[0] for row in rows],
+        "total": total,
+        "total_is_estimate": total_is_estimate,
+        "page_size": page_size,
+        "has_next": has_next,
+        "has_prev": has_prev,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor
+    }
+
+
+def paginate(
+    query: Query,
+    sort_keys: SortKeys,
+    page: int = 1,
+    page_size: int = 20,
+    cursor: Optional[str] = None,
+    count: Optional[str] = None,
+    max_page_size: int = 100
+) -> Dict[str, Any]:
+    """
+    Paginate a list endpoint's query with keyset cursors. Page numbers beyond
+    the first are still served (by OFFSET) for existing clients; their pages
+    carry cursors too, so a client can switch over at any point.
+    
+    Returns the keys of keyset_paginate plus page and total_pages.
+    """
+    count = count or settings.PAGINATION_DEFAULT_COUNT
+    if cursor or page <= 1:
+        result = keyset_paginate(query, sort_keys, cursor, page_size, max_page_size, count)
+        result["page"] = None if cursor else 1
+    else:
+        page_size = min(max(1, page_size), max_page_size)
+        fingerprint = sort_fingerprint(sort_keys)
+        rows = (
+            query.order_by(None)
+            .add_columns(*[column for column, _ in sort_keys])
+            .order_by(*_orderings(sort_keys))
+            .offset((page - 1) * page_size)
+            .limit(page_size + 1)
+            .all()
+        )
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        total, total_is_estimate = count_total(query, count)
+        result = {
+            "items": [row[0] for row in rows],
+            "total": total,
+            "total_is_estimate": total_is_estimate,
+            "page": page,
+            "page_size": page_size,
+            "has_next": has_next,
+            "has_prev": True,
+            "next_cursor": encode_cursor(rows[-1][1:], "next", fingerprint) if rows and has_next else None,
+            "prev_cursor": encode_cursor(rows[0][1:], "prev", fingerprint) if rows else None
+        }
+    
+    total, page_size = result["total"], result["page_size"]
+    result["total_pages"] = (math.ceil(total / page_size) if total else 1) if total is not None else None
+    return result
+
+
+def page_metadata(result: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields of a paginate() result that list responses return"""
+    return {
+        key: result.get(key)
+        for key in (
+            "total", "total_is_estimate", "page", "page_size", "total_pages",
+            "has_next", "has_prev", "next_cursor", "prev_cursor"
+        )
+    }
+
+
+def count_by_parent(db, parent_column, parent_ids: Sequence[int], *criteria) -> Dict[int, int]:
+    """
+    Child row counts for a page of parents in one grouped query, e.g.
+    count_by_parent(db, Lesson.course_id, course_ids, Lesson.is_active == True)
+    """
+    if not parent_ids:
+        return {}
+    rows = (
+        db.query(parent_column, func.count())
+        .filter(parent_column.in_(parent_ids), *criteria)
+        .group_by(parent_column)
+        .all()
+    )
+    return {parent_id: child_count for parent_id, child_count in rows}
+
+
+def latest_by_parent(db, model, parent_column, order_column, parent_ids: Sequence[int], *criteria) -> Dict[int, Any]:
+    """
+    The latest child row of each parent on a page in one query, ranking
+    children with ROW_NUMBER() OVER (PARTITION BY parent ORDER BY order_column DESC)
+    """
+    if not parent_ids:
+        return {}
+    ranked = (
+        db.query(
+            model.id.label("child_id"),
+            func.row_number().over(
+                partition_by=parent_column, order_by=(order_column.desc(), model.id.desc())
+            ).label("rank")
+        )
+        .filter(parent_column.in_(parent_ids), *criteria)
+        .subquery()
+    )
+    children = db.query(model).join(ranked, model.id == ranked.c.child_id).filter(ranked.c.rank == 1).all()
+    return {getattr(child, parent_column.key): child for child in children}
+
+
 def paginate_list(
     items: List[Any],
     page: int = 1,
@@ -217,71 +594,19 @@ def create_cursor_pagination(
     
     Args:
         query: SQLAlchemy query
-        cursor: Base64 encoded cursor for pagination
+        cursor: Cursor from a previous page
         limit: Number of items to return
         order_field: Field to order by (must be unique and sortable)
         
     Returns:
         Dictionary with cursor pagination data
     """
-    import base64
-    import json
-    
-    # Decode cursor if provided
-    if cursor:
-        try:
-            cursor_data = json.loads(base64.b64decode(cursor).decode())
-            cursor_value = cursor_data.get("value")
-            direction = cursor_data.get("direction", "next")
-        except:
-            cursor_value = None
-            direction = "next"
-    else:
-        cursor_value = None
-        direction = "next"
-    
-    # Apply cursor filter
-    if cursor_value is not None:
-        order_column = getattr(query.column_descriptions[0]['type'], order_field)
-        if direction == "next":
-            query = query.filter(order_column > cursor_value)
-        else:
-            query = query.filter(order_column < cursor_value)
-    
-    # Apply ordering and limit
     order_column = getattr(query.column_descriptions[0]['type'], order_field)
-    if direction == "prev":
-        query = query.order_by(order_column.desc())
-    else:
-        query = query.order_by(order_column.asc())
-    
-    # Get one extra item to check if there are more
-    items = query.limit(limit + 1).all()
-    
-    has_more = len(items) > limit
-    if has_more:
-        items = items[:limit]
-    
-    # Create next cursor
-    next_cursor = None
-    prev_cursor = None
-    
-    if items and has_more:
-        last_item_value = getattr(items[-1], order_field)
-        next_cursor = base64.b64encode(
-            json.dumps({"value": last_item_value, "direction": "next"}).encode()
-        ).decode()
-    
-    if items and cursor_value is not None:
-        first_item_value = getattr(items[0], order_field)
-        prev_cursor = base64.b64encode(
-            json.dumps({"value": first_item_value, "direction": "prev"}).encode()
-        ).decode()
-    
+    result = keyset_paginate(query, [(order_column, False)], cursor, limit, max_page_size=max(limit, 1))
     return {
-        "items": items,
-        "has_more": has_more,
-        "next_cursor": next_cursor,
-        "prev_cursor": prev_cursor,
+        "items": result["items"],
+        "has_more": result["has_next"],
+        "next_cursor": result["next_cursor"],
+        "prev_cursor": result["prev_cursor"],
         "limit": limit
     }
@@ -0,0 +1,115 @@
+"""
+Near-Duplicate Question Filter
+Character shingles of normalized question text, MinHash signatures and LSH
+bands to find candidate matches, confirmed by exact Jaccard similarity
+"""
+
+import hashlib
+import re
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, List, Set, Tuple
+
+import numpy as np
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, without punctuation and with single spaces"""
+    text = _PUNCTUATION.sub(" ", str(text or "").lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def shingles(text: str, size: int = 5) -> FrozenSet[str]:
+    """Overlapping character n-grams of the normalized text"""
+    text = normalize_text(text)
+    if len(text) <= size:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[index:index + size] for index in range(len(text) - size + 1))
+
+
+def jaccard(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+class MinHasher:
+    """MinHash signatures using multiply-shift hashing of 32-bit shingle hashes"""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        # Odd multipliers make each (a * x + b) >> 32 a universal hash of x
+        self.a = rng.integers(1, 2 ** 32, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 32, size=num_perm, dtype=np.uint64)
+
+    @staticmethod
+    def _hash(shingle: str) -> int:
+        return int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=4).digest(), "little")
+
+    def signature(self, shingle_set: Iterable[str]) -> np.ndarray:
+        values = np.array([self._hash(shingle) for shingle in shingle_set], dtype=np.uint64)
+        if not len(values):
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        # uint64 arithmetic wraps, which is the mod 2**64 of multiply-shift hashing
+        hashed = (np.outer(self.a, values) + self.b[:, None]) >> np.uint64(32)
+        return hashed.min(axis=1)
+
+
+class NearDuplicateFilter:
+    """
+    Remembers question texts and tells whether a new one is a near duplicate
+    (shingle Jaccard similarity at or above threshold) of any seen so far.
+    LSH bands keep lookups from comparing against every stored text.
+    """
+
+    def __init__(self, threshold: float = 0.7, num_perm: int = 64, bands: int = 16, shingle_size: int = 5):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.hasher = MinHasher(num_perm)
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+        self._shingles: List[FrozenSet[str]] = []
+        self._exact: Set[str] = set()
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+    def _find(self, text: str) -> Tuple[bool, FrozenSet[str], List[Tuple[int, bytes]]]:
+        normalized = normalize_text(text)
+        shingle_set = shingles(normalized, self.shingle_size)
+        keys = self._band_keys(self.hasher.signature(shingle_set))
+        if normalized in self._exact:
+            return True, shingle_set, keys
+        candidates = {index for key in keys for index in self._buckets.get(key, ())}
+        duplicate = any(jaccard(shingle_set, self._shingles[index]) >= self.threshold for index in candidates)
+        return duplicate, shingle_set, keys
+
+    def is_duplicate(self, text: str) -> bool:
+        return self._find(text)[0]
+
+    def add(self, text: str) -> bool:
+        """Remember a text; returns False, without adding it, when it is a near duplicate"""
+        duplicate, shingle_set, keys = self._find(text)
+        if duplicate:
+            return False
+        index = len(self._shingles)
+        self._shingles.append(shingle_set)
+        self._exact.add(normalize_text(text))
+        for key in keys:
+            self._buckets[key].append(index)
+        return True
+
+    def extend(self, texts: Iterable[str]):
+        """Remember texts that are already accepted (existing questions), duplicates or not"""
+        for text in texts:
+            self.add(text)
+
+    def __len__(self):
+        return len(self._shingles)
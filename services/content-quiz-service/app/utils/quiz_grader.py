@@ -5,17 +5,22 @@ Automated quiz grading system with intelligent feedback
 
 from typing import Dict, List, Any, Optional
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func
+from sqlalchemy import func, and_
 
 from ..database import get_db
-from ..models.content_models import Quiz, Question, QuizSubmission
-from ..models.progress_models import QuizProgress
+from ..models.content_models import Quiz, Question, QuizProgress, QuizSubmission
 from ..utils.cache import cache_result, invalidate_cache_pattern
+from ..utils.answer_key import CompiledAnswerKey, CompiledQuestion, answer_key_cache
+from ..services.progress_summary import progress_summary
+from ..services.quiz_stats import quiz_stats
 
 import logging
 import json
+from collections import defaultdict
 from datetime import datetime
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
 
@@ -24,150 +29,7 @@ def calculate_question_score(question: Question, user_answer: Any) -> Dict[str,
     Calculate score for a single question based on type and answer
     """
     try:
-        correct_answer = question.correct_answer
-        points = question.points
-        
-        if question.question_type == "multiple_choice":
-            # Handle multiple choice questions
-            if isinstance(user_answer, str):
-                is_correct = user_answer.lower() == str(correct_answer).lower()
-            elif isinstance(user_answer, list):
-                # Multiple select
-                if isinstance(correct_answer, list):
-                    is_correct = set(user_answer) == set(correct_answer)
-                else:
-                    is_correct = len(user_answer) == 1 and user_answer[0] == correct_answer
-            else:
-                is_correct = user_answer == correct_answer
-            
-            score = points if is_correct else 0
-            
-        elif question.question_type == "true_false":
-            # Handle true/false questions
-            user_bool = str(user_answer).lower() in ['true', '1', 'yes', 't']
-            correct_bool = str(correct_answer).lower() in ['true', '1', 'yes', 't']
-            is_correct = user_bool == correct_bool
-            score = points if is_correct else 0
-            
-        elif question.question_type == "short_answer":
-            # Handle short answer questions with flexible matching
-            if not user_answer or not correct_answer:
-                is_correct = False
-                score = 0
-            else:
-                user_text = str(user_answer).strip().lower()
-                correct_text = str(correct_answer).strip().lower()
-                
-                # Exact match
-                if user_text == correct_text:
-                    is_correct = True
-                    score = points
-                # Partial match (for keywords)
-                elif len(correct_text.split()) > 1:
-                    correct_words = set(correct_text.split())
-                    user_words = set(user_text.split())
-                    match_ratio = len(correct_words.intersection(user_words)) / len(correct_words)
-                    
-                    if match_ratio >= 0.8:  # 80% keyword match
-                        is_correct = True
-                        score = points
-                    elif match_ratio >= 0.5:  # 50% keyword match - partial credit
-                        is_correct = False
-                        score = points * 0.5
-                    else:
-                        is_correct = False
-                        score = 0
-                else:
-                    is_correct = False
-                    score = 0
-                    
-        elif question.question_type == "essay":
-            # Essay questions need manual grading or AI assistance
-            # For now, give full points and mark for manual review
-            is_correct = True  # Assume correct until manually reviewed
-            score = points
-            
-        elif question.question_type == "fill_blank":
-            # Handle fill in the blank questions
-            if isinstance(correct_answer, list) and isinstance(user_answer, list):
-                # Multiple blanks
-                if len(user_answer) != len(correct_answer):
-                    is_correct = False
-                    score = 0
-                else:
-                    correct_count = 0
-                    for i, (user_blank, correct_blank) in enumerate(zip(user_answer, correct_answer)):
-                        if str(user_blank).strip().lower() == str(correct_blank).strip().lower():
-                            correct_count += 1
-                    
-                    if correct_count == len(correct_answer):
-                        is_correct = True
-                        score = points
-                    else:
-                        is_correct = False
-                        # Partial credit based on correct blanks
-                        score = points * (correct_count / len(correct_answer))
-            else:
-                # Single blank
-                user_text = str(user_answer).strip().lower()
-                correct_text = str(correct_answer).strip().lower()
-                is_correct = user_text == correct_text
-                score = points if is_correct else 0
-                
-        elif question.question_type == "matching":
-            # Handle matching questions
-            if isinstance(user_answer, dict) and isinstance(correct_answer, dict):
-                correct_matches = 0
-                total_matches = len(correct_answer)
-                
-                for key, correct_value in correct_answer.items():
-                    if key in user_answer and user_answer[key] == correct_value:
-                        correct_matches += 1
-                
-                if correct_matches == total_matches:
-                    is_correct = True
-                    score = points
-                else:
-                    is_correct = False
-                    # Partial credit based on correct matches
-                    score = points * (correct_matches / total_matches)
-            else:
-                is_correct = False
-                score = 0
-                
-        elif question.question_type == "ordering":
-            # Handle ordering questions
-            if isinstance(user_answer, list) and isinstance(correct_answer, list):
-                is_correct = user_answer == correct_answer
-                if is_correct:
-                    score = points
-                else:
-                    # Partial credit for partially correct ordering
-                    correct_positions = 0
-                    min_length = min(len(user_answer), len(correct_answer))
-                    
-                    for i in range(min_length):
-                        if user_answer[i] == correct_answer[i]:
-                            correct_positions += 1
-                    
-                    score = points * (correct_positions / len(correct_answer))
-            else:
-                is_correct = False
-                score = 0
-                
-        else:
-            # Unknown question type
-            logger.warning(f"Unknown question type: {question.question_type}")
-            is_correct = False
-            score = 0
-        
-        return {
-            "is_correct": is_correct,
-            "score": round(score, 2),
-            "max_score": points,
-            "explanation": question.explanation
-        }
-        
+        compiled = CompiledQuestion.from_question(question)
     except Exception as e:
         logger.error(f"Error calculating score for question {question.id}: {e}")
         return {
@@ -177,6 +39,7 @@ def calculate_question_score(question: Question, user_answer: Any) -> Dict[str,
             "explanation": "Error in grading",
             "error": str(e)
         }
+    return compiled.score(user_answer)
 
 
 def generate_detailed_feedback(
@@ -191,25 +54,6 @@ def generate_detailed_feedback(
     try:
         total_score = sum(result["score"] for result in results)
         max_score = sum(result["max_score"] for result in results)
-        percentage = (total_score / max_score * 100) if max_score > 0 else 0
-        is_passed = percentage >= quiz.passing_score
-        
-        # Categorize performance
-        if percentage >= 90:
-            performance_level = "Excellent"
-            performance_message = "Outstanding performance! You have mastered this material."
-        elif percentage >= 80:
-            performance_level = "Good"
-            performance_message = "Good work! You have a solid understanding of the material."
-        elif percentage >= 70:
-            performance_level = "Satisfactory"
-            performance_message = "Satisfactory performance. Consider reviewing the areas where you missed questions."
-        elif percentage >= 60:
-            performance_level = "Needs Improvement"
-            performance_message = "You may need to review the material more thoroughly before retaking."
-        else:
-            performance_level = "Poor"
-            performance_message = "Please review the course material carefully and consider additional study resources."
         
         # Analyze question types performance
         question_type_stats = {}
@@ -224,15 +68,6 @@ def generate_detailed_feedback(
             if results[i]["is_correct"]:
                 question_type_stats[q_type]["correct"] += 1
         
-        # Generate recommendations
-        recommendations = []
-        for q_type, stats in question_type_stats.items():
-            accuracy = (stats["correct"] / stats["total"]) * 100
-            if accuracy < 70:
-                recommendations.append(
-                    f"Focus on improving {q_type.replace('_', ' ')} questions (Current: {accuracy:.1f}%)"
-                )
-        
         # Identify weak areas (incorrect questions)
         weak_areas = []
         for i, (question, result) in enumerate(zip(questions, results)):
@@ -244,30 +79,76 @@ def generate_detailed_feedback(
                     "tags": question.tags or []
                 })
         
-        return {
-            "total_score": total_score,
-            "max_score": max_score,
-            "percentage": round(percentage, 2),
-            "is_passed": is_passed,
-            "performance_level": performance_level,
-            "performance_message": performance_message,
-            "question_type_stats": question_type_stats,
-            "recommendations": recommendations,
-            "weak_areas": weak_areas[:5],  # Limit to top 5 weak areas
-            "study_suggestions": generate_study_suggestions(weak_areas, question_type_stats)
-        }
+        return build_feedback(quiz.passing_score, total_score, max_score, question_type_stats, weak_areas)
         
     except Exception as e:
         logger.error(f"Error generating feedback: {e}")
-        return {
-            "total_score": 0,
-            "max_score": 0,
-            "percentage": 0,
-            "is_passed": False,
-            "performance_level": "Error",
-            "performance_message": "Error generating feedback",
-            "error": str(e)
-        }
+        return _feedback_error(e)
+
+
+def build_feedback(
+    passing_score: float,
+    total_score: float,
+    max_score: float,
+    question_type_stats: Dict[str, Dict[str, Any]],
+    weak_areas: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    Assemble submission feedback from its totals, per-type stats and missed questions
+    """
+    percentage = (total_score / max_score * 100) if max_score > 0 else 0
+    is_passed = percentage >= passing_score
+    
+    # Categorize performance
+    if percentage >= 90:
+        performance_level = "Excellent"
+        performance_message = "Outstanding performance! You have mastered this material."
+    elif percentage >= 80:
+        performance_level = "Good"
+        performance_message = "Good work! You have a solid understanding of the material."
+    elif percentage >= 70:
+        performance_level = "Satisfactory"
+        performance_message = "Satisfactory performance. Consider reviewing the areas where you missed questions."
+    elif percentage >= 60:
+        performance_level = "Needs Improvement"
+        performance_message = "You may need to review the material more thoroughly before retaking."
+    else:
+        performance_level = "Poor"
+        performance_message = "Please review the course material carefully and consider additional study resources."
+    
+    # Generate recommendations
+    recommendations = []
+    for q_type, stats in question_type_stats.items():
+        accuracy = (stats["correct"] / stats["total"]) * 100
+        if accuracy < 70:
+            recommendations.append(
+                f"Focus on improving {q_type.replace('_', ' ')} questions (Current: {accuracy:.1f}%)"
+            )
+    
+    return {
+        "total_score": total_score,
+        "max_score": max_score,
+        "percentage": round(percentage, 2),
+        "is_passed": is_passed,
+        "performance_level": performance_level,
+        "performance_message": performance_message,
+        "question_type_stats": question_type_stats,
+        "recommendations": recommendations,
+        "weak_areas": weak_areas[:5],  # Limit to top 5 weak areas
+        "study_suggestions": generate_study_suggestions(weak_areas, question_type_stats)
+    }
+
+
+def _feedback_error(error: Exception) -> Dict[str, Any]:
+    return {
+        "total_score": 0,
+        "max_score": 0,
+        "percentage": 0,
+        "is_passed": False,
+        "performance_level": "Error",
+        "performance_message": "Error generating feedback",
+        "error": str(error)
+    }
 
 
 def generate_study_suggestions(weak_areas: List[Dict], question_type_stats: Dict) -> List[str]:
@@ -314,98 +195,233 @@ def generate_study_suggestions(weak_areas: List[Dict], question_type_stats: Dict
     return suggestions[:5]  # Limit to top 5 suggestions
 
 
-async def grade_quiz_submission(submission_id: int, quiz_id: int, user_answers: Dict[str, Any]):
+def answer_key_version(db: Session, quiz_id: int) -> Optional[tuple]:
     """
-    Grade a quiz submission and update the database
+    Cheap fingerprint of a quiz's gradable content: any edit to the quiz or its
+    active questions (including adding or deactivating one) changes it
     """
-    db = next(get_db())
+    row = db.query(
+        Quiz.updated_at,
+        func.count(Question.id),
+        func.max(Question.updated_at)
+    ).outerjoin(
+        Question, and_(Question.quiz_id == Quiz.id, Question.is_active == True)
+    ).filter(Quiz.id == quiz_id).group_by(Quiz.id, Quiz.updated_at).first()
+    return tuple(row) if row else None
+
+
+def get_answer_key(db: Session, quiz_id: int) -> Optional[CompiledAnswerKey]:
+    """
+    Get the compiled answer key for a quiz, compiling it on first use or after an edit
+    """
+    version = answer_key_version(db, quiz_id)
+    if version is None:
+        return None
     
-    try:
-        # Get submission
-        submission = db.query(QuizSubmission).filter(
-            QuizSubmission.id == submission_id
-        ).first()
-        
-        if not submission:
-            logger.error(f"Submission {submission_id} not found")
-            return
-        
-        # Get quiz and questions
+    def load() -> CompiledAnswerKey:
         quiz = db.query(Quiz).filter(Quiz.id == quiz_id).first()
-        if not quiz:
-            logger.error(f"Quiz {quiz_id} not found")
-            return
-        
         questions = db.query(Question).filter(
             Question.quiz_id == quiz_id,
             Question.is_active == True
-        ).order_by(Question.order_index).all()
-        
-        if not questions:
-            logger.error(f"No questions found for quiz {quiz_id}")
-            return
-        
-        # Grade each question
-        results = []
-        for question in questions:
-            question_id_str = str(question.id)
-            user_answer = user_answers.get(question_id_str)
-            
-            result = calculate_question_score(question, user_answer)
-            results.append(result)
-        
-        # Generate feedback
-        feedback = generate_detailed_feedback(quiz, questions, user_answers, results)
+        ).order_by(Question.display_order, Question.id).all()
+        return CompiledAnswerKey.compile(quiz, questions, version)
+    
+    return answer_key_cache.get(quiz_id, version, load)
+
+
+def invalidate_answer_key(quiz_id: int):
+    """
+    Drop this process's compiled key for a quiz after its questions change
+    """
+    answer_key_cache.invalidate(quiz_id)
+
+
+def grade_submissions(
+    db: Session,
+    key: CompiledAnswerKey,
+    submissions: List[Any],
+    answers: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """
+    Grade submissions of one quiz against its compiled key and record the results
+    and quiz progress on the session. The caller commits.
+    """
+    if answers is None:
+        answers = [submission.answers or {} for submission in submissions]
+    batch = key.grade_batch(answers)
+    graded_at = datetime.utcnow()
+    # Submissions graded before only get new results: their attempt and time were counted then
+    regraded = {submission.id for submission in submissions if submission.graded_at is not None}
+    # Grades being replaced cannot be taken out of the running quiz statistics
+    regrading = bool(regraded)
+    
+    for row, submission in enumerate(submissions):
+        try:
+            feedback = build_feedback(
+                key.passing_score,
+                float(batch.totals[row]),
+                key.max_score,
+                key.question_type_stats(batch, row),
+                key.weak_areas(batch, row)
+            )
+        except Exception as e:
+            logger.error(f"Error generating feedback: {e}")
+            feedback = _feedback_error(e)
         
-        # Update submission
         submission.score = feedback["total_score"]
         submission.max_score = feedback["max_score"]
         submission.percentage = feedback["percentage"]
         submission.is_passed = feedback["is_passed"]
         submission.feedback = feedback
-        submission.question_results = results
-        submission.graded_at = datetime.utcnow()
-        
-        # Update or create quiz progress
-        progress = db.query(QuizProgress).filter(
-            QuizProgress.user_id == submission.user_id,
-            QuizProgress.quiz_id == quiz_id
-        ).first()
-        
+        submission.question_results = [
+            {"question_id": question.id, **result}
+            for question, result in zip(key.questions, batch.results[row])
+        ]
+        submission.graded_at = graded_at
+    
+    submissions_by_user = defaultdict(list)
+    for submission in submissions:
+        submissions_by_user[submission.user_id].append(submission)
+    user_ids = list(submissions_by_user)
+    
+    # Load everyone's progress and earlier graded submissions for this quiz at once
+    progress_by_user = {
+        progress.user_id: progress
+        for progress in db.query(QuizProgress).filter(
+            QuizProgress.quiz_id == key.quiz_id,
+            QuizProgress.user_id.in_(user_ids)
+        ).all()
+    } if user_ids else {}
+    earlier_by_user = defaultdict(list)
+    if user_ids:
+        for earlier in db.query(QuizSubmission).filter(
+            QuizSubmission.quiz_id == key.quiz_id,
+            QuizSubmission.user_id.in_(user_ids),
+            QuizSubmission.graded_at.isnot(None),
+            QuizSubmission.id.notin_([submission.id for submission in submissions])
+        ).all():
+            earlier_by_user[earlier.user_id].append(earlier)
+    
+    for user_id, graded in submissions_by_user.items():
+        progress = progress_by_user.get(user_id)
+        best_percentage = _percentage(progress.score, progress.max_score) if progress else None
+        # The best score is recomputed, as a regrade can lower it
+        candidates = earlier_by_user[user_id] + graded
+        best = max(candidates, key=lambda submission: (submission.score or 0.0, -submission.id))
+        new = [submission for submission in graded if submission.id not in regraded]
+        time_spent_delta = sum(submission.time_taken or 0 for submission in new)
         if not progress:
             progress = QuizProgress(
-                user_id=submission.user_id,
-                quiz_id=quiz_id,
-                course_id=quiz.course_id,
+                user_id=user_id,
+                quiz_id=key.quiz_id,
+                course_id=key.course_id,
                 status="completed",
-                score=submission.score,
-                max_score=submission.max_score,
-                is_passed=submission.is_passed,
-                attempts=1,
-                time_spent=submission.time_taken,
-                completed_at=submission.submitted_at
+                attempts=len(candidates),
+                time_spent=sum(submission.time_taken or 0 for submission in candidates),
+                first_completed_at=min(submission.submitted_at for submission in candidates)
             )
             db.add(progress)
+            progress_by_user[user_id] = progress
         else:
-            # Update existing progress if this is a better score
-            if submission.score > progress.score:
-                progress.score = submission.score
-                progress.is_passed = submission.is_passed
-                progress.completed_at = submission.submitted_at
-            
-            progress.attempts += 1
-            progress.time_spent = (progress.time_spent or 0) + (submission.time_taken or 0)
+            progress.attempts = (progress.attempts or 0) + len(new)
+            progress.time_spent = (progress.time_spent or 0) + time_spent_delta
+        progress.score = best.score
+        progress.max_score = best.max_score
+        progress.percentage = best.percentage
+        progress.is_passed = best.is_passed
+        progress.completed_at = best.submitted_at
         
-        db.commit()
+        # Best percentages feed the summary's average quiz score
+        progress_summary.record_quiz_progress(
+            db,
+            user_id,
+            key.course_id,
+            first_completion=best_percentage is None,
+            percentage_delta=_percentage(progress.score, progress.max_score) - (best_percentage or 0.0),
+            time_spent_delta=time_spent_delta if best_percentage is not None else progress.time_spent,
+            at=max(submission.submitted_at for submission in graded)
+        )
+    
+    if regrading:
+        quiz_stats.rebuild(db, [key.quiz_id], commit=False)
+    else:
+        quiz_stats.record_graded(db, key.quiz_id, [
+            (submission.score, submission.percentage, submission.is_passed) for submission in submissions
+        ])
+    
+    percentages = batch.totals / key.max_score * 100 if key.max_score > 0 else np.zeros(len(submissions))
+    return {
+        "graded": len(submissions),
+        "average_percentage": round(float(percentages.mean()), 2) if len(submissions) else 0.0,
+        "pass_rate": round(float((percentages >= key.passing_score).mean() * 100), 2) if len(submissions) else 0.0
+    }
+
+
+def _percentage(score: Optional[float], max_score: Optional[float]) -> float:
+    return score * 100.0 / max_score if score is not None and max_score else 0.0
+
+
+def _grade_and_commit(
+    db: Session,
+    quiz_id: int,
+    submissions: List[Any],
+    answers: Optional[List[Dict[str, Any]]] = None
+) -> Optional[Dict[str, Any]]:
+    key = get_answer_key(db, quiz_id)
+    if key is None:
+        logger.error(f"Quiz {quiz_id} not found")
+        return None
+    if not key.questions:
+        logger.error(f"No questions found for quiz {quiz_id}")
+        return None
+    
+    summary = grade_submissions(db, key, submissions, answers)
+    db.commit()
+    
+    invalidate_grading_caches(quiz_id, {submission.user_id for submission in submissions})
+    return summary
+
+
+def invalidate_grading_caches(quiz_id: int, user_ids):
+    """
+    Invalidate the quiz and user progress caches touched by grading
+    """
+    invalidate_cache_pattern(f"quiz:{quiz_id}:*")
+    for user_id in user_ids:
+        invalidate_cache_pattern(f"user:{user_id}:progress:*")
+
+
+async def grade_quiz_submissions(
+    quiz_id: int,
+    submission_ids: Optional[List[int]] = None,
+    regrade: bool = False,
+    limit: int = 1000
+) -> Dict[str, Any]:
+    """
+    Grade many submissions of one quiz in a single pass over its compiled answer key.
+    Without submission_ids, grades the quiz's ungraded submissions (oldest first).
+    """
+    db = next(get_db())
+    
+    try:
+        query = db.query(QuizSubmission).filter(QuizSubmission.quiz_id == quiz_id)
+        if submission_ids:
+            query = query.filter(QuizSubmission.id.in_(submission_ids))
+        if not regrade:
+            query = query.filter(QuizSubmission.graded_at.is_(None))
+        submissions = query.order_by(QuizSubmission.id).limit(limit).all()
         
-        # Invalidate related caches
-        invalidate_cache_pattern(f"quiz:{quiz_id}:*")
-        invalidate_cache_pattern(f"user:{submission.user_id}:progress:*")
+        summary = {"graded": 0, "average_percentage": 0.0, "pass_rate": 0.0}
+        if submissions:
+            summary = _grade_and_commit(db, quiz_id, submissions) or summary
         
-        logger.info(f"Graded submission {submission_id} - Score: {submission.score}/{submission.max_score} ({submission.percentage:.1f}%)")
+        found = {submission.id for submission in submissions}
+        summary["skipped"] = [submission_id for submission_id in submission_ids or [] if submission_id not in found]
+        logger.info(f"Graded {summary['graded']} submissions of quiz {quiz_id}")
+        return summary
         
     except Exception as e:
-        logger.error(f"Error grading submission {submission_id}: {e}")
+        logger.error(f"Error batch grading quiz {quiz_id}: {e}")
         db.rollback()
         raise
     finally:
@@ -0,0 +1,142 @@
+"""
+Score Statistics
+Running aggregates of graded quiz scores with a fixed-bucket percentage
+histogram for percentiles, and item analysis of per-question results
+"""
+
+import math
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+HISTOGRAM_BUCKETS = 100
+PERCENTILES = (25, 50, 75, 90)
+DISCRIMINATION_GROUP = 0.27  # Share of submissions in the upper and lower groups
+
+
+def histogram_bucket(percentage: Optional[float]) -> int:
+    """Bucket of a percentage: one point wide, with 100% in the last bucket"""
+    return min(max(int(percentage or 0), 0), HISTOGRAM_BUCKETS - 1)
+
+
+def empty_histogram() -> List[int]:
+    return [0] * HISTOGRAM_BUCKETS
+
+
+def histogram_percentile(histogram: Optional[List[int]], q: float) -> Optional[float]:
+    """q-th percentile of the percentages in a histogram, interpolated inside its bucket"""
+    total = sum(histogram or [])
+    if not total:
+        return None
+    width = 100.0 / len(histogram)
+    target = q / 100.0 * total
+    cumulative = 0
+    for bucket, count in enumerate(histogram):
+        if count and cumulative + count >= target:
+            return round((bucket + (target - cumulative) / count) * width, 2)
+        cumulative += count
+    return 100.0
+
+
+@dataclass
+class ScoreAggregate:
+    """Count, sums, extremes, passes and histogram of a set of graded scores"""
+    graded_count: int = 0
+    pass_count: int = 0
+    score_sum: float = 0.0
+    score_sq_sum: float = 0.0
+    min_score: Optional[float] = None
+    max_score: Optional[float] = None
+    percentage_sum: float = 0.0
+    histogram: List[int] = field(default_factory=empty_histogram)
+
+    @classmethod
+    def from_row(cls, row) -> "ScoreAggregate":
+        """Aggregate stored on a row with the same column names"""
+        aggregate = cls(**{
+            item.name: getattr(row, item.name)
+            for item in fields(cls)
+            if getattr(row, item.name) is not None
+        })
+        aggregate.histogram = list(aggregate.histogram)
+        if len(aggregate.histogram) != HISTOGRAM_BUCKETS:
+            aggregate.histogram = empty_histogram()
+        return aggregate
+
+    def store(self, row):
+        for item in fields(self):
+            setattr(row, item.name, getattr(self, item.name))
+        # A new list, so the JSON column is seen as changed
+        row.histogram = list(self.histogram)
+
+    def add(self, score: Optional[float], percentage: Optional[float], passed: bool):
+        score = score or 0.0
+        self.graded_count += 1
+        self.pass_count += 1 if passed else 0
+        self.score_sum += score
+        self.score_sq_sum += score * score
+        self.min_score = score if self.min_score is None else min(self.min_score, score)
+        self.max_score = score if self.max_score is None else max(self.max_score, score)
+        self.percentage_sum += percentage or 0.0
+        self.histogram[histogram_bucket(percentage)] += 1
+
+    @property
+    def mean(self) -> float:
+        return self.score_sum / self.graded_count if self.graded_count else 0.0
+
+    @property
+    def std_dev(self) -> float:
+        if not self.graded_count:
+            return 0.0
+        return math.sqrt(max(self.score_sq_sum / self.graded_count - self.mean ** 2, 0.0))
+
+    @property
+    def average_percentage(self) -> float:
+        return self.percentage_sum / self.graded_count if self.graded_count else 0.0
+
+    @property
+    def pass_rate(self) -> float:
+        return self.pass_count / self.graded_count * 100 if self.graded_count else 0.0
+
+    def percentiles(self) -> Dict[str, Optional[float]]:
+        return {f"p{q}": histogram_percentile(self.histogram, q) for q in PERCENTILES}
+
+
+def item_analysis(scores: np.ndarray, points: np.ndarray, group: float = DISCRIMINATION_GROUP) -> List[Dict[str, Any]]:
+    """
+    Classical item statistics of N graded submissions over Q questions.
+    scores is (N, Q) points awarded, NaN where a submission has no result for
+    the question; points is (Q,) points available.
+
+    difficulty: mean share of the points earned (higher is easier)
+    discrimination: mean share earned by the top group by total score minus the bottom group's
+    point_biserial: correlation of the share earned with the rest of the score
+    """
+    scores = np.asarray(scores, dtype=float).reshape(-1, len(points))
+    points = np.asarray(points, dtype=float)
+    credit = np.divide(scores, points, out=np.full(scores.shape, np.nan), where=points > 0)
+    totals = np.nansum(scores, axis=1)
+
+    items = []
+    for index in range(scores.shape[1]):
+        answered = ~np.isnan(credit[:, index])
+        responses = int(answered.sum())
+        item = {"responses": responses, "difficulty": None, "discrimination": None, "point_biserial": None}
+        items.append(item)
+        if not responses:
+            continue
+
+        item_credit = credit[answered, index]
+        item["difficulty"] = round(float(item_credit.mean()), 3)
+        if responses < 2:
+            continue
+
+        by_total = np.argsort(totals[answered], kind="stable")
+        size = max(1, int(round(responses * group)))
+        item["discrimination"] = round(float(item_credit[by_total[-size:]].mean() - item_credit[by_total[:size]].mean()), 3)
+
+        rest = totals[answered] - scores[answered, index]
+        if item_credit.std() > 0 and rest.std() > 0:
+            item["point_biserial"] = round(float(np.corrcoef(item_credit, rest)[0, 1]), 3)
+    return items
@@ -0,0 +1,44 @@
+"""
+Test configuration for the content & quiz service
+"""
+
+import os
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event
+
+# Make the service's app package importable when running pytest from anywhere
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# Settings are validated on import; the tests never connect to this database
+os.environ.setdefault("DATABASE_URL", "sqlite:///./content_quiz_test.db")
+
+
+class QueryCounter:
+    """Records the SQL statements an engine runs inside a with block"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+@pytest.fixture
+def count_queries():
+    """count_queries(engine) -> QueryCounter, to assert a code path's query count"""
+    return QueryCounter
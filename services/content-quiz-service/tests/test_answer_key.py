@@ -0,0 +1,120 @@
+"""
+Tests for compiled answer keys and batch grading
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from app.utils.answer_key import AnswerKeyCache, CompiledAnswerKey, CompiledQuestion
+
+
+def _question(id, question_type, correct_answer, points=2.0, **extra):
+    return SimpleNamespace(
+        id=id,
+        question_type=question_type,
+        correct_answer=correct_answer,
+        points=points,
+        explanation=f"Explanation {id}",
+        question_text=f"Question {id}",
+        difficulty=extra.get("difficulty", "easy"),
+        tags=extra.get("tags", [])
+    )
+
+
+QUESTIONS = [
+    _question(1, "multiple_choice", "B"),
+    _question(2, "true_false", "True"),
+    _question(3, "short_answer", "Photosynthesis uses light energy"),
+    _question(4, "fill_blank", ["Abuja", "Niger"]),
+    _question(5, "matching", {"a": "1", "b": "2"}),
+    _question(6, "ordering", ["x", "y", "z", "w"]),
+    _question(7, "multiple_choice", ["A", "C"]),
+]
+
+
+def _key(version=1):
+    quiz = SimpleNamespace(id=10, passing_score=50.0, course_id=3)
+    return CompiledAnswerKey.compile(quiz, QUESTIONS, version)
+
+
+@pytest.mark.parametrize("index, answer, expected", [
+    (0, "b", (True, 2.0)),
+    (0, ["B"], (True, 2.0)),
+    (1, "yes", (True, 2.0)),
+    (1, "no", (False, 0)),
+    (2, "  photosynthesis uses light ENERGY ", (True, 2.0)),
+    (2, "it uses light", (False, 1.0)),  # 2 of 4 keywords: half credit
+    (2, "", (False, 0)),
+    (3, [" abuja", "Kaduna"], (False, 1.0)),
+    (3, ["ABUJA", "niger "], (True, 2.0)),
+    (4, {"a": "1", "b": "3"}, (False, 1.0)),
+    (5, ["x", "y", "w", "z"], (False, 1.0)),
+    (6, ["C", "A"], (True, 2.0)),
+    (6, "A", (False, 0)),
+])
+def test_compiled_question_scores(index, answer, expected):
+    result = CompiledQuestion.from_question(QUESTIONS[index]).score(answer)
+    assert (result["is_correct"], result["score"]) == expected
+    assert result["max_score"] == 2.0
+
+
+def test_grading_error_is_reported_per_question():
+    compiled = CompiledQuestion.from_question(_question(8, "ordering", []))
+    result = compiled.score(["a"])
+    assert result["score"] == 0 and "error" in result
+
+
+def test_batch_type_stats_match_per_question_results():
+    key = _key()
+    submissions = [
+        {"1": "B", "2": "true", "3": "photosynthesis uses light energy", "4": ["abuja", "niger"],
+         "5": {"a": "1", "b": "2"}, "6": ["x", "y", "z", "w"], "7": ["A", "C"]},
+        {"1": "A", "2": "false", "4": ["abuja", "x"], "7": ["A"]},
+        {},
+    ]
+    batch = key.grade_batch(submissions)
+
+    assert batch.scores.shape == (3, 7)
+    assert list(batch.totals) == [14.0, 1.0, 0.0]
+    for row, answers in enumerate(submissions):
+        results = batch.results[row]
+        stats = key.question_type_stats(batch, row)
+        for question_type in stats:
+            indexes = [i for i, question in enumerate(QUESTIONS) if question.question_type == question_type]
+            assert stats[question_type] == {
+                "correct": sum(results[i]["is_correct"] for i in indexes),
+                "total": len(indexes),
+                "score": pytest.approx(sum(results[i]["score"] for i in indexes)),
+                "max_score": 2.0 * len(indexes)
+            }
+        assert [area["question_id"] for area in key.weak_areas(batch, row)] == [
+            QUESTIONS[i].id for i, result in enumerate(results) if not result["is_correct"]
+        ]
+    assert list(key.question_type_stats(batch, 1)) == [
+        "multiple_choice", "true_false", "short_answer", "fill_blank", "matching", "ordering"
+    ]
+
+
+def test_cache_recompiles_on_new_version_and_invalidation():
+    cache = AnswerKeyCache(max_entries=2)
+    compiled = []
+
+    def loader(version):
+        def load():
+            compiled.append(version)
+            return _key(version)
+        return load
+
+    first = cache.get(10, 1, loader(1))
+    assert cache.get(10, 1, loader(1)) is first
+    assert cache.get(10, 2, loader(2)).version == 2
+    cache.invalidate(10)
+    cache.get(10, 2, loader(2))
+    assert compiled == [1, 2, 2]
+    assert cache.stats == {"hits": 1, "misses": 3, "invalidations": 1}
+
+    # Least recently used quizzes are evicted
+    cache.get(11, 1, loader(1))
+    cache.get(12, 1, loader(1))
+    assert len(cache) == 2
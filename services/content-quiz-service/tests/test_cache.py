@@ -0,0 +1,239 @@
+"""
+Tests for the in-process cache tier, cache serialization, invalidation messages
+and tag-based invalidation against a stub Redis
+"""
+
+import fnmatch
+import json
+import time
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+import redis
+
+from app.utils.cache import (
+    CacheCodec, CacheManager, LocalCache, TierStats, LEGACY_CLEANUP_MARKER, MSGPACK_AVAILABLE
+)
+
+
+def _b(value):
+    return value.encode() if isinstance(value, str) else value
+
+
+class StubRedis:
+    """The subset of redis.Redis the cache manager uses, held in a dict (no expiry)"""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        value = self.data.get(_b(key))
+        return value if isinstance(value, bytes) else None
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and _b(key) in self.data:
+            return None
+        self.data[_b(key)] = _b(value)
+        return True
+
+    def setex(self, key, ttl, value):
+        return self.set(key, value)
+
+    def delete(self, *keys):
+        return sum(self.data.pop(_b(key), None) is not None for key in keys)
+
+    unlink = delete
+
+    def expire(self, key, ttl):
+        return _b(key) in self.data
+
+    def rename(self, source, target):
+        if _b(source) not in self.data:
+            raise redis.exceptions.ResponseError("no such key")
+        self.data[_b(target)] = self.data.pop(_b(source))
+
+    def zadd(self, key, mapping):
+        members = self.data.setdefault(_b(key), {})
+        members.update({_b(member): score for member, score in mapping.items()})
+        return len(mapping)
+
+    def zremrangebyscore(self, key, low, high):
+        members = self.data.get(_b(key), {})
+        expired = [member for member, score in members.items() if score <= float(high)]
+        for member in expired:
+            del members[member]
+        return len(expired)
+
+    def zscore(self, key, member):
+        return self.data.get(_b(key), {}).get(_b(member))
+
+    def zscan_iter(self, key, count=None):
+        return iter(list(self.data.get(_b(key), {}).items()))
+
+    def scan_iter(self, match="*", count=None):
+        return iter([key for key in list(self.data) if fnmatch.fnmatchcase(key.decode(), match)])
+
+    def publish(self, channel, message):
+        return 0
+
+    def pipeline(self, transaction=True):
+        return StubPipeline(self)
+
+
+class StubPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+        return lambda *args, **kwargs: self.commands.append((method, args, kwargs))
+
+    def execute(self):
+        results = [method(*args, **kwargs) for method, args, kwargs in self.commands]
+        self.commands = []
+        return results
+
+
+def test_local_cache_evicts_least_recently_used():
+    local = LocalCache(max_entries=2, ttl=30)
+    local.set("quiz:1", b"a")
+    local.set("quiz:2", b"b")
+    assert local.get("quiz:1") == b"a"  # quiz:2 is now the oldest
+    local.set("quiz:3", b"c")
+
+    assert local.get("quiz:2") is None
+    assert (local.get("quiz:1"), local.get("quiz:3")) == (b"a", b"c")
+
+
+def test_local_cache_ttl_is_capped_and_prefix_delete():
+    local = LocalCache(max_entries=10, ttl=0.05)
+    local.set("quiz:1:stats", b"a", ttl=3600)  # Redis TTLs never extend the local one
+    local.set("quiz:12:stats", b"b")
+    local.set("course:1", b"c")
+
+    assert local.delete_prefix("quiz:1:") == 1
+    assert local.get("quiz:12:stats") == b"b"
+    time.sleep(0.06)
+    assert local.get("course:1") is None
+
+
+@pytest.mark.parametrize("name", ["auto", "json", "msgpack"])
+def test_codec_roundtrip(name):
+    if name == "msgpack" and not MSGPACK_AVAILABLE:
+        pytest.skip("msgpack is not installed")
+    codec = CacheCodec(name)
+    value = {"quiz_id": 5, "scores": [1.5, 2], "passed": True, "title": "Ìwé kíkà"}
+    assert codec.loads(codec.dumps(value)) == value
+
+    converted = codec.loads(codec.dumps({"at": datetime(2024, 5, 6, 8), "score": Decimal("7.5"), "tags": ("a",)}))
+    assert converted == {"at": "2024-05-06T08:00:00", "score": 7.5, "tags": ["a"]}
+
+
+def test_codec_reads_other_codecs_and_legacy_entries():
+    payload = CacheCodec("json").dumps({"a": 1})
+    assert CacheCodec("auto").loads(payload) == {"a": 1}
+    # Counters written by INCR and unmarked JSON from before the markers
+    assert CacheCodec.loads(b"42") == 42
+    assert CacheCodec.loads(b'{"a": 1}') == {"a": 1}
+
+
+def test_invalidation_messages_drop_local_entries():
+    manager = CacheManager(redis_client=None, local_size=10, local_ttl=30)
+    for key in ["quiz:1:stats", "quiz:2:stats", "course:3"]:
+        manager.local.set(key, b"j:1")
+
+    def message(**event):
+        return {"data": json.dumps({"origin": "other-worker", **event})}
+
+    manager._on_invalidation(message(keys=["course:3"]))
+    manager._on_invalidation(message(prefixes=["quiz:1:"]))
+    assert len(manager.local) == 1 and manager.local.get("quiz:2:stats") == b"j:1"
+
+    # A worker ignores its own announcements
+    manager._on_invalidation({"data": json.dumps({"origin": manager.instance_id, "clear": True})})
+    assert len(manager.local) == 1
+    manager._on_invalidation(message(clear=True))
+    assert len(manager.local) == 0
+
+
+def test_local_tier_is_off_without_invalidation_listener():
+    manager = CacheManager(redis_client=None)
+    assert not manager.local_enabled
+    assert not manager.start_invalidation_listener()
+    assert manager.get_or_compute("quiz:1", lambda: {"computed": True}) == {"computed": True}
+
+
+def test_tier_stats():
+    stats = TierStats()
+    for hit in [True, True, False, True]:
+        stats.record(hit)
+    assert stats.snapshot() == {"hits": 3, "misses": 1, "errors": 0, "hit_ratio": 0.75}
+
+
+def test_tag_for_pattern():
+    assert CacheManager._tags_for_key("quiz:5:stats") == ["quiz:", "quiz:5:"]
+    assert CacheManager._tag_for_pattern("quiz:5:*") == "quiz:5:"
+    assert CacheManager._tag_for_pattern("quiz:*:stats") is None
+    assert CacheManager._tag_for_pattern("quiz*") is None
+
+
+def test_pattern_invalidation_deletes_tagged_keys_only():
+    stub = StubRedis()
+    manager = CacheManager(redis_client=stub)
+    manager.set("quiz:5:user:7:results", {"score": 8})
+    manager.set_multi({"quiz:5:stats": {"attempts": 3}, "quiz:6:stats": {"attempts": 1}})
+    assert stub.zscore(manager._tag_key("quiz:5:user:"), manager._generate_key("quiz:5:user:7:results")) is not None
+    assert len(stub.data[_b(manager._tag_key("quiz:"))]) == 3
+
+    assert manager.delete_pattern("quiz:5:*") == 2
+    assert manager.get("quiz:5:stats") is None
+    assert manager.get("quiz:6:stats") == {"attempts": 1}
+    assert _b(manager._tag_key("quiz:5:")) not in stub.data
+    # Nothing was cached under the tag since
+    assert manager.delete_pattern("quiz:5:*") == 0
+
+
+def test_tag_sets_drop_expired_members():
+    stub = StubRedis()
+    manager = CacheManager(redis_client=stub)
+    tag_key = manager._tag_key("quiz:")
+    stub.zadd(tag_key, {manager._generate_key("quiz:1"): time.time() - 1})
+
+    manager.set("quiz:2", {"fresh": True}, ttl=60)
+    assert list(stub.data[_b(tag_key)]) == [_b(manager._generate_key("quiz:2"))]
+
+
+def test_legacy_cleanup_runs_once():
+    stub = StubRedis()
+    manager = CacheManager(redis_client=stub)
+    manager.set("quiz:1:stats", {"attempts": 3})
+    stub.setex(manager._generate_key("quiz:2:stats"), 60, b"j:{}")  # Cached before the tag sets
+
+    assert manager.cleanup_legacy_keys() == {"scanned": 2, "deleted": 1}
+    assert manager.get("quiz:1:stats") == {"attempts": 3}
+    assert stub.get(manager._generate_key("quiz:2:stats")) is None
+    assert stub.get(LEGACY_CLEANUP_MARKER) == b"done"
+
+    # Later worker starts skip the scan, and clear_all keeps the marker
+    manager.clear_all()
+    assert manager.cleanup_legacy_keys() == {"scanned": 0, "deleted": 0}
+    assert manager.cleanup_legacy_keys(force=True)["scanned"] == 0
+
+
+def test_legacy_cleanup_is_single_worker_and_resumable():
+    stub = StubRedis()
+    manager = CacheManager(redis_client=stub)
+    for quiz_id in range(3):
+        stub.setex(manager._generate_key(f"quiz:{quiz_id}"), 60, b"j:{}")
+
+    stub.set(LEGACY_CLEANUP_MARKER, b"running")
+    assert manager.cleanup_legacy_keys() == {"scanned": 0, "deleted": 0}
+    stub.delete(LEGACY_CLEANUP_MARKER)
+
+    # Stopping early leaves no marker, so the next start finishes the job
+    assert manager.cleanup_legacy_keys(batch_size=1, max_seconds=-1) == {"scanned": 1, "deleted": 1}
+    assert stub.get(LEGACY_CLEANUP_MARKER) is None
+    assert manager.cleanup_legacy_keys() == {"scanned": 2, "deleted": 2}
+    assert stub.get(LEGACY_CLEANUP_MARKER) == b"done"
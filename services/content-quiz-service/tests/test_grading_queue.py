@@ -0,0 +1,222 @@
+"""
+Tests for grading job leases: claims, completion by the lease holder and retry
+backoff, and the worker grading leased submissions
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, Integer, Table, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import content_models
+from app.models.content_models import GradingJob, Question, Quiz, QuizProgress, QuizSubmission, UserProgressSummary
+from app.services import grading_queue as grading
+from app.services.grading_worker import GradingWorker
+from app.utils.quiz_grader import get_answer_key, grade_submissions
+
+TABLES = [
+    "grading_jobs", "topics", "quizzes", "questions", "quiz_submissions", "quiz_progress",
+    "quiz_statistics", "user_progress_summaries",
+]
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'grading.db'}")
+    metadata = content_models.Base.metadata
+    # Users live in the auth service
+    if "users" not in metadata.tables:
+        Table("users", metadata, Column("id", Integer, primary_key=True))
+    metadata.create_all(engine, tables=[metadata.tables[name] for name in TABLES])
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def make_queue(session_factory, worker_id):
+    queue = grading.GradingQueue(session_factory=session_factory, lease_seconds=60, max_attempts=3)
+    queue.worker_id = worker_id
+    return queue
+
+
+def jobs(session_factory):
+    db = session_factory()
+    try:
+        return {job.submission_id: job for job in db.query(GradingJob).all()}
+    finally:
+        db.close()
+
+
+def enqueue(queue, session_factory, *submission_ids):
+    db = session_factory()
+    for submission_id in submission_ids:
+        queue.enqueue(db, submission_id, quiz_id=1, user_id=submission_id)
+    db.close()
+
+
+def test_claims_do_not_overlap(session_factory):
+    first = make_queue(session_factory, "w1")
+    second = make_queue(session_factory, "w2")
+    enqueue(first, session_factory, 10, 11, 12, 10)
+    assert len(jobs(session_factory)) == 3
+
+    leases = first.claim(2)
+    assert [(lease.submission_id, lease.attempt) for lease in leases] == [(10, 1), (11, 1)]
+    assert [lease.submission_id for lease in second.claim(2)] == [12]
+    assert second.claim(2) == []
+    assert {job.locked_by for job in jobs(session_factory).values()} == {"w1", "w2"}
+
+
+def test_only_the_lease_holder_completes(session_factory):
+    first = make_queue(session_factory, "w1")
+    second = make_queue(session_factory, "w2")
+    enqueue(first, session_factory, 10, 11)
+    [lost, kept] = first.claim(2)
+
+    # The first lease runs out and another worker picks the job up
+    db = session_factory()
+    db.query(GradingJob).filter(GradingJob.id == lost.job_id).update({"locked_until": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    [reclaimed] = second.claim(2)
+    assert (reclaimed.submission_id, reclaimed.attempt) == (10, 2)
+
+    assert first.complete(db, [lost, kept]) == 1
+    db.commit()
+    db.close()
+    state = jobs(session_factory)
+    assert (state[10].status, state[10].locked_by) == ("processing", "w2")
+    assert (state[11].status, state[11].completed_at is not None) == ("completed", True)
+    db = session_factory()
+    assert first.stats(db) == {"processing": 1, "completed": 1}
+    db.close()
+
+
+def test_failures_back_off_then_give_up(session_factory):
+    queue = make_queue(session_factory, "w1")
+    enqueue(queue, session_factory, 10)
+    assert [grading.retry_delay(attempt) for attempt in (1, 2, 3, 10)] == [10, 20, 40, 900]
+
+    [lease] = queue.claim(1)
+    before = datetime.utcnow()
+    queue.fail([lease], "answer key missing")
+    job = jobs(session_factory)[10]
+    assert (job.status, job.locked_by, job.last_error) == ("pending", None, "answer key missing")
+    assert job.available_at >= before + timedelta(seconds=grading.retry_delay(1))
+    # Not claimable until the backoff has passed
+    assert queue.claim(1) == []
+
+    db = session_factory()
+    db.query(GradingJob).update({"available_at": datetime.utcnow(), "attempts": 2})
+    db.commit()
+    db.close()
+    [lease] = queue.claim(1)
+    assert lease.attempt == lease.max_attempts == 3
+    queue.fail([lease], "still broken")
+    assert jobs(session_factory)[10].status == "failed"
+    assert queue.claim(1) == []
+
+
+def test_expired_final_lease_is_given_up(session_factory):
+    queue = make_queue(session_factory, "w1")
+    enqueue(queue, session_factory, 10)
+    db = session_factory()
+    db.query(GradingJob).update({
+        "status": "processing", "attempts": 3, "locked_by": "gone",
+        "locked_until": datetime.utcnow() - timedelta(seconds=1)
+    })
+    db.commit()
+    db.close()
+
+    assert queue.claim(1) == []
+    job = jobs(session_factory)[10]
+    assert (job.status, job.last_error) == ("failed", "Lease expired after final attempt")
+
+
+class RecordingNotifier:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, submissions):
+        self.published.extend((submission.id, submission.score) for submission in submissions)
+
+
+def submit(session_factory, queue, *answers):
+    """A two-question quiz and one queued submission per answers dict; returns the submission ids"""
+    db = session_factory()
+    if db.get(Quiz, 1) is None:
+        db.add(Quiz(id=1, title="Cells", passing_score=50.0))
+        db.add_all([
+            Question(id=1, quiz_id=1, question_text="Powerhouse of the cell?", question_type="multiple_choice", points=1.0, correct_answer="a"),
+            Question(id=2, quiz_id=1, question_text="Cells have walls", question_type="true_false", points=1.0, correct_answer="false")
+        ])
+    ids = []
+    for user_answers in answers:
+        submission = QuizSubmission(quiz_id=1, user_id=7, answers=user_answers, time_taken=60, submitted_at=datetime.utcnow())
+        db.add(submission)
+        db.flush()
+        queue.enqueue(db, submission.id, 1, 7, commit=False)
+        ids.append(submission.id)
+    db.commit()
+    db.close()
+    return ids
+
+
+def test_worker_grades_leased_submissions(session_factory):
+    queue = make_queue(session_factory, "w1")
+    notifier = RecordingNotifier()
+    worker = GradingWorker(queue=queue, notifier=notifier, session_factory=session_factory, batch_size=10)
+    [first, second] = submit(session_factory, queue, {"1": "a", "2": "false"}, {"1": "b", "2": "false"})
+
+    assert worker.process_batch() == 2
+    assert worker.stats == {"claimed": 2, "graded": 2, "failed": 0, "lost": 0}
+    assert sorted(notifier.published) == [(first, 2.0), (second, 1.0)]
+
+    db = session_factory()
+    assert {job.status for job in db.query(GradingJob)} == {"completed"}
+    progress = db.query(QuizProgress).one()
+    assert (progress.score, progress.percentage, progress.attempts, progress.time_spent) == (2.0, 100.0, 2, 120)
+    summary = db.get(UserProgressSummary, 7)
+    assert (summary.completed_quizzes, summary.quiz_percentage_total, summary.quiz_time_spent) == (1, 100.0, 120)
+    db.close()
+
+
+def test_worker_skips_leases_lost_before_grading(session_factory):
+    queue = make_queue(session_factory, "w1")
+    worker = GradingWorker(queue=queue, notifier=RecordingNotifier(), session_factory=session_factory)
+    [submission_id] = submit(session_factory, queue, {"1": "a"})
+    [lease] = queue.claim(1)
+
+    # The lease runs out mid-batch and another worker re-claims the job
+    db = session_factory()
+    db.query(GradingJob).update({"locked_until": datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    db.close()
+    [reclaimed] = make_queue(session_factory, "w2").claim(1)
+    assert queue.extend([lease]) == []
+
+    assert worker._grade_quiz(1, [lease]) is None
+    db = session_factory()
+    assert db.get(QuizSubmission, submission_id).graded_at is None
+    assert (db.get(GradingJob, reclaimed.job_id).status, db.query(QuizProgress).count()) == ("processing", 0)
+    db.close()
+
+
+def test_regrade_replaces_results_without_counting_attempts_again(session_factory):
+    queue = make_queue(session_factory, "w1")
+    worker = GradingWorker(queue=queue, notifier=RecordingNotifier(), session_factory=session_factory)
+    submit(session_factory, queue, {"1": "a", "2": "false"}, {"1": "b", "2": "false"})
+    worker.process_batch()
+
+    # The answer key changes, lowering the best score, and every submission is regraded
+    db = session_factory()
+    db.get(Question, 1).correct_answer = "c"
+    db.commit()
+    summary = grade_submissions(db, get_answer_key(db, 1), db.query(QuizSubmission).order_by(QuizSubmission.id).all())
+    db.commit()
+    assert summary["graded"] == 2
+
+    progress = db.query(QuizProgress).one()
+    assert (progress.score, progress.percentage, progress.attempts, progress.time_spent) == (1.0, 50.0, 2, 120)
+    user_summary = db.get(UserProgressSummary, 7)
+    assert (user_summary.completed_quizzes, user_summary.quiz_percentage_total, user_summary.quiz_time_spent) == (1, 50.0, 120)
+    db.close()
@@ -0,0 +1,106 @@
+"""
+List pages must load in a fixed number of queries, whatever their size
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, create_engine
+from sqlalchemy.orm import contains_eager, declarative_base, relationship, sessionmaker
+
+from app.utils.pagination import count_by_parent, latest_by_parent, paginate
+
+Base = declarative_base()
+
+
+class Subject(Base):
+    __tablename__ = "subjects"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class Course(Base):
+    __tablename__ = "courses"
+    id = Column(Integer, primary_key=True)
+    subject_id = Column(Integer, ForeignKey("subjects.id"))
+    name = Column(String)
+    subject = relationship("Subject")
+
+
+class Lesson(Base):
+    __tablename__ = "lessons"
+    id = Column(Integer, primary_key=True)
+    course_id = Column(Integer, ForeignKey("courses.id"))
+    is_active = Column(Boolean, default=True)
+
+
+class Submission(Base):
+    __tablename__ = "submissions"
+    id = Column(Integer, primary_key=True)
+    course_id = Column(Integer, ForeignKey("courses.id"))
+    user_id = Column(Integer)
+    submitted_at = Column(DateTime)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    started = datetime(2024, 5, 6, 8)
+    for subject_id in range(1, 4):
+        db.add(Subject(id=subject_id, name=f"Subject {subject_id}"))
+    for course_id in range(1, 13):
+        db.add(Course(id=course_id, subject_id=course_id % 3 + 1, name=f"Course {course_id:02d}"))
+        for index in range(course_id % 4):
+            db.add(Lesson(course_id=course_id, is_active=index != 2))
+        for index in range(course_id % 3):
+            db.add(Submission(course_id=course_id, user_id=7, submitted_at=started + timedelta(hours=index)))
+    db.commit()
+    db.close()
+    return engine
+
+
+def list_courses(db, page_size):
+    """The shape of the course list endpoint: a page, its counts and the user's latest attempts"""
+    query = db.query(Course).join(Subject).options(contains_eager(Course.subject))
+    result = paginate(query, [(Course.name, False), (Course.id, False)], page_size=page_size, count="exact")
+    course_ids = [course.id for course in result["items"]]
+    lesson_counts = count_by_parent(db, Lesson.course_id, course_ids, Lesson.is_active == True)
+    latest = latest_by_parent(db, Submission, Submission.course_id, Submission.submitted_at, course_ids, Submission.user_id == 7)
+    return [
+        {
+            "id": course.id,
+            "subject_name": course.subject.name,
+            "lesson_count": lesson_counts.get(course.id, 0),
+            "latest_submission": latest[course.id].id if course.id in latest else None
+        }
+        for course in result["items"]
+    ]
+
+
+def test_list_query_count_does_not_grow_with_page_size(engine, count_queries):
+    counts = {}
+    for page_size in (2, 12):
+        db = sessionmaker(bind=engine)()
+        with count_queries(engine) as counter:
+            courses = list_courses(db, page_size)
+        counts[page_size] = counter.count
+        assert len(courses) == page_size
+        db.close()
+    assert counts[2] == counts[12] == 4  # page, total, lesson counts, latest submissions
+
+
+def test_page_counts_and_latest_children(engine):
+    db = sessionmaker(bind=engine)()
+    courses = {course["id"]: course for course in list_courses(db, 12)}
+
+    assert courses[3]["lesson_count"] == 2  # The third lesson is inactive
+    assert courses[4]["lesson_count"] == 0
+    assert (courses[5]["subject_name"], courses[5]["lesson_count"]) == ("Subject 3", 1)
+    assert courses[6]["latest_submission"] is None
+
+    latest = db.get(Submission, courses[5]["latest_submission"])
+    assert latest.submitted_at == datetime(2024, 5, 6, 9)
+    assert count_by_parent(db, Lesson.course_id, []) == {}
+    db.close()
@@ -0,0 +1,124 @@
+"""
+Tests for keyset pagination, cursors and counts
+"""
+
+import pytest
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from app.utils.pagination import (
+    CursorError, count_total, create_cursor_pagination, decode_cursor, encode_cursor,
+    keyset_paginate, paginate, sort_fingerprint
+)
+
+Base = declarative_base()
+
+
+class School(Base):
+    __tablename__ = "schools"
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class Course(Base):
+    __tablename__ = "courses"
+    id = Column(Integer, primary_key=True)
+    school_id = Column(Integer, ForeignKey("schools.id"))
+    name = Column(String)
+    order_index = Column(Integer, nullable=True)
+    created_at = Column(DateTime)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([School(id=1, name="Kings"), School(id=2, name="Queens")])
+    # Repeated names and NULL order indexes, so ties and NULLs are exercised
+    names = ["Biology", "Chemistry", "Algebra", "Biology", "Physics", "Algebra", "English"]
+    for index, name in enumerate(names, start=1):
+        session.add(Course(id=index, school_id=1 + index % 2, name=name, order_index=None if index % 3 == 0 else index % 4))
+    session.commit()
+    yield session
+    session.close()
+
+
+def _walk(query, sort_keys, page_size):
+    """Every page following next cursors, then back again following prev cursors"""
+    pages, cursor = [], None
+    while True:
+        result = keyset_paginate(query, sort_keys, cursor, page_size)
+        pages.append([course.id for course in result["items"]])
+        cursor = result["next_cursor"]
+        if cursor is None:
+            break
+    back, cursor = [pages[-1]], result["prev_cursor"]
+    while cursor is not None:
+        result = keyset_paginate(query, sort_keys, cursor, page_size)
+        back.append([course.id for course in result["items"]])
+        cursor = result["prev_cursor"]
+    return pages, back[::-1]
+
+
+@pytest.mark.parametrize("descending", [False, True])
+def test_keyset_pages_match_offset_order(db, descending):
+    sort_keys = [(Course.order_index, descending), (Course.name, not descending), (Course.id, False)]
+    query = db.query(Course)
+    expected = [course.id for course in paginate(query, sort_keys, page_size=100)["items"]]
+    assert sorted(expected) == list(range(1, 8))
+
+    pages, back = _walk(query, sort_keys, page_size=3)
+    assert [course_id for page in pages for course_id in page] == expected
+    assert back == pages
+
+
+def test_keyset_over_joined_sort_column(db):
+    sort_keys = [(School.name, True), (Course.id, False)]
+    query = db.query(Course).join(School).filter(Course.name != "Physics")
+    pages, _ = _walk(query, sort_keys, page_size=2)
+    assert pages == [[1, 3], [7, 2], [4, 6]]
+
+
+def test_offset_pages_carry_cursors(db):
+    sort_keys = [(Course.name, False), (Course.id, False)]
+    query = db.query(Course)
+    second = paginate(query, sort_keys, page=2, page_size=3)
+    assert second["total"] == 7 and second["total_pages"] == 3
+    third = paginate(query, sort_keys, cursor=second["next_cursor"], page_size=3, count="none")
+    assert third["total"] is None
+    assert third["items"] == paginate(query, sort_keys, page=3, page_size=3)["items"]
+    first = paginate(query, sort_keys, cursor=second["prev_cursor"], page_size=3)
+    assert first["items"] == paginate(query, sort_keys, page=1, page_size=3)["items"]
+
+
+def test_cursors_are_signed_and_bound_to_the_sort(db):
+    sort_keys = [(Course.name, False), (Course.id, False)]
+    fingerprint = sort_fingerprint(sort_keys)
+    cursor = encode_cursor(["Biology", 4], "next", fingerprint)
+    assert decode_cursor(cursor, fingerprint) == (["Biology", 4], "next")
+
+    payload, signature = cursor.split(".")
+    forged = encode_cursor(["Zoology", 4], "next", fingerprint).split(".")[0] + "." + signature
+    for bad in [forged, "not-a-cursor", cursor[:-2]]:
+        with pytest.raises(CursorError):
+            decode_cursor(bad, fingerprint)
+    with pytest.raises(CursorError):
+        keyset_paginate(db.query(Course), [(Course.id, True)], cursor)
+
+
+def test_count_modes(db):
+    query = db.query(Course).filter(Course.school_id == 1)
+    assert count_total(query, "exact") == (3, False)
+    # Estimates need Postgres; elsewhere the exact count is used
+    assert count_total(query, "estimated") == (3, False)
+    assert count_total(query, "none") == (None, False)
+    with pytest.raises(ValueError):
+        count_total(query, "approximate")
+
+
+def test_create_cursor_pagination(db):
+    first = create_cursor_pagination(db.query(Course), limit=4)
+    second = create_cursor_pagination(db.query(Course), cursor=first["next_cursor"], limit=4)
+    assert [course.id for course in first["items"] + second["items"]] == list(range(1, 8))
+    assert first["has_more"] and not second["has_more"]
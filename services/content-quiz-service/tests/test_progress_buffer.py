@@ -0,0 +1,122 @@
+"""
+Buffered lesson heartbeats: merging, batched upserts, retries and immediate completions
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, Integer, Table, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import content_models
+from app.models.content_models import CourseEnrollment, LessonProgress, UserCourseProgressSummary, UserProgressSummary
+from app.services import progress_buffer
+from app.services.progress_buffer import LessonHeartbeat, LessonProgressBuffer
+from app.services.progress_summary import progress_summary
+
+TABLES = [
+    "subjects", "topics", "courses", "lessons", "quizzes", "lesson_progress", "course_enrollments",
+    "quiz_submissions", "quiz_progress", "user_progress_summaries", "user_course_progress_summaries",
+]
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'buffer.db'}")
+    metadata = content_models.Base.metadata
+    # Users live in the auth service
+    if "users" not in metadata.tables:
+        Table("users", metadata, Column("id", Integer, primary_key=True))
+    metadata.create_all(engine, tables=[metadata.tables[name] for name in TABLES])
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add(content_models.Course(id=1, subject_id=1, title="Biology"))
+    db.add_all([content_models.Lesson(id=lesson_id, course_id=1, title=f"Lesson {lesson_id}") for lesson_id in (1, 2)])
+    db.add(CourseEnrollment(user_id=7, course_id=1))
+    db.commit()
+    db.close()
+    yield factory
+    engine.dispose()
+
+
+def heartbeat(lesson_id, seconds, position, at=None):
+    return LessonHeartbeat(user_id=7, lesson_id=lesson_id, course_id=1, position=position, seconds=seconds, at=at or datetime.utcnow())
+
+
+def rows(session_factory):
+    db = session_factory()
+    try:
+        return {row.lesson_id: (row.time_spent, row.last_position, row.is_completed) for row in db.query(LessonProgress)}
+    finally:
+        db.close()
+
+
+def test_heartbeats_of_a_lesson_are_merged():
+    buffer = LessonProgressBuffer(session_factory=None, batch_size=10)
+    now = datetime.utcnow()
+    buffer.add(heartbeat(1, 15, 120, now - timedelta(seconds=15)))
+    buffer.add(heartbeat(1, 15, 90, now))
+    buffer.add(heartbeat(2, 15, 30, now))
+
+    merged = buffer.pending[(7, 1)]
+    assert (merged.seconds, merged.position, merged.at) == (30, 120, now)
+    assert buffer.summary() == {"received": 3, "coalesced": 1, "pending": 2}
+
+
+def test_flush_inserts_then_adds_to_rows(session_factory):
+    buffer = LessonProgressBuffer(session_factory=session_factory, batch_size=10)
+    buffer.add(heartbeat(1, 30, 60))
+    buffer.add(heartbeat(2, 10, 20))
+    assert buffer.flush_pending() == {"written": 2, "failed": 0}
+
+    buffer.add(heartbeat(1, 20, 40))
+    assert buffer.flush_pending() == {"written": 1, "failed": 0}
+    assert rows(session_factory) == {1: (50, 60, False), 2: (10, 20, False)}
+
+    db = session_factory()
+    summary = db.get(UserProgressSummary, 7)
+    assert (summary.in_progress_lessons, summary.lesson_time_spent) == (2, 60)
+    assert progress_summary.check(db) == []
+    db.close()
+
+
+def test_failed_batches_are_requeued(session_factory, monkeypatch):
+    buffer = LessonProgressBuffer(session_factory=session_factory, batch_size=10)
+    calls = []
+
+    def fail_once(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise RuntimeError("database unavailable")
+        return original(*args, **kwargs)
+
+    original = progress_summary.record_lesson_activity
+    monkeypatch.setattr(progress_buffer.progress_summary, "record_lesson_activity", fail_once)
+    buffer.add(heartbeat(1, 30, 60))
+    assert buffer.flush_pending() == {"written": 0, "failed": 1}
+    assert rows(session_factory) == {}
+
+    # Heartbeats arriving meanwhile merge with the requeued batch
+    buffer.add(heartbeat(1, 10, 70))
+    assert buffer.flush_pending() == {"written": 1, "failed": 0}
+    assert rows(session_factory) == {1: (40, 70, False)}
+    assert buffer.summary()["pending"] == 0
+
+
+def test_completion_is_written_with_buffered_time(session_factory):
+    buffer = LessonProgressBuffer(session_factory=session_factory, batch_size=10)
+    buffer.add(heartbeat(1, 30, 60))
+    buffer.flush_pending()
+    buffer.add(heartbeat(1, 20, 80))
+
+    db = session_factory()
+    progress = buffer.complete(db, heartbeat(1, 5, 90))
+    assert (progress.is_completed, progress.time_spent, progress.last_position) == (True, 55, 90)
+    assert buffer.summary()["pending"] == 0
+
+    course = db.get(UserCourseProgressSummary, (7, 1))
+    assert (course.completed_lessons, course.in_progress_lessons, course.lesson_time_spent) == (1, 0, 55)
+    enrollment = db.query(CourseEnrollment).one()
+    assert (enrollment.lessons_completed, enrollment.progress_percentage, enrollment.current_lesson_id) == (1, 50.0, 1)
+    assert progress_summary.check(db) == []
+    db.close()
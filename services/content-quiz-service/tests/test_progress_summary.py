@@ -0,0 +1,127 @@
+"""
+Progress summaries kept by increments must match a rebuild from the progress tables
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, Integer, Table, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import content_models
+from app.models.content_models import (
+    LessonProgress, Question, QuizSubmission, UserCourseProgressSummary, UserProgressSummary
+)
+from app.services.progress_summary import ProgressSummaryService
+from app.utils.quiz_grader import get_answer_key, grade_submissions
+
+TABLES = [
+    "subjects", "topics", "courses", "lessons", "quizzes", "questions", "lesson_progress",
+    "quiz_submissions", "quiz_progress", "quiz_statistics",
+    "user_progress_summaries", "user_course_progress_summaries",
+]
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'progress.db'}")
+    metadata = content_models.Base.metadata
+    # Users live in the auth service
+    if "users" not in metadata.tables:
+        Table("users", metadata, Column("id", Integer, primary_key=True))
+    metadata.create_all(engine, tables=[metadata.tables[name] for name in TABLES])
+    session = sessionmaker(bind=engine)()
+    session.add(content_models.Course(id=1, subject_id=1, title="Biology"))
+    session.add_all([content_models.Lesson(id=lesson_id, course_id=1, title=f"Lesson {lesson_id}") for lesson_id in (1, 2)])
+    session.add(content_models.Quiz(id=1, title="Cells", passing_score=50.0))
+    session.add_all([
+        Question(id=question_id, quiz_id=1, question_text=f"Question {question_id}", question_type="true_false", points=1.0, correct_answer="true")
+        for question_id in range(1, 6)
+    ])
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def service():
+    return ProgressSummaryService()
+
+
+def submit_quiz(db, correct, time_taken, at):
+    """A graded submission of the five-question quiz with this many right answers"""
+    submission = QuizSubmission(
+        quiz_id=1, user_id=7, time_taken=time_taken, submitted_at=at,
+        answers={str(question_id): "true" if question_id <= correct else "false" for question_id in range(1, 6)}
+    )
+    db.add(submission)
+    db.flush()
+    grade_submissions(db, get_answer_key(db, 1), [submission])
+
+
+def record_activity(db, service, now):
+    """Lesson progress rows and graded quizzes, with the events the API and grader apply for them"""
+    first = LessonProgress(user_id=7, lesson_id=1, started_at=now - timedelta(hours=3), time_spent=30)
+    db.add(first)
+    service.record_lesson_progress(db, 7, 1, None, "in_progress", 30, at=first.started_at)
+    first.is_completed, first.completed_at, first.time_spent = True, now - timedelta(hours=2), 90
+    service.record_lesson_progress(db, 7, 1, "in_progress", "completed", 60, at=first.completed_at)
+    db.add(LessonProgress(user_id=7, lesson_id=2, started_at=now - timedelta(hours=1), completed_at=now, is_completed=True, time_spent=40))
+    service.record_lesson_progress(db, 7, 1, None, "completed", 40, at=now)
+
+    submit_quiz(db, 3, 100, now - timedelta(hours=1))
+    submit_quiz(db, 4, 50, now)
+    db.commit()
+
+
+def test_increments_match_rebuild(db, service):
+    now = datetime.utcnow()
+    record_activity(db, service, now)
+
+    summary = db.get(UserProgressSummary, 7)
+    assert (summary.completed_lessons, summary.in_progress_lessons, summary.lesson_time_spent) == (2, 0, 130)
+    assert (summary.completed_courses, summary.in_progress_courses) == (1, 0)
+    assert (summary.completed_quizzes, summary.quiz_percentage_total, summary.quiz_time_spent) == (1, 80.0, 150)
+    assert sum(day[1] for day in summary.recent_completions.values()) == 1
+    course = db.get(UserCourseProgressSummary, (7, 1))
+    assert (course.status, course.progress_percentage) == ("completed", 100.0)
+
+    assert service.check(db) == []
+
+
+def test_rebuild_restores_summaries(db, service):
+    now = datetime.utcnow()
+    record_activity(db, service, now)
+    db.query(UserProgressSummary).update({"completed_lessons": 0, "quiz_percentage_total": 0.0})
+    db.commit()
+    assert [mismatch["user_id"] for mismatch in service.check(db)] == [7]
+
+    assert service.rebuild(db) == {"users": 1, "courses": 1}
+    assert service.check(db) == []
+    summary = db.get(UserProgressSummary, 7)
+    assert (summary.completed_lessons, summary.quiz_percentage_total, summary.last_activity_at) == (2, 80.0, now)
+
+    # Users without progress get an empty row on first read
+    assert service.get_summary(db, 8).completed_lessons == 0
+
+
+def test_late_events_do_not_move_last_activity_back(db, service):
+    now = datetime.utcnow()
+    service.record_lesson_progress(db, 7, 1, None, "in_progress", 30, at=now)
+    service.record_lesson_activity(db, 7, 1, time_spent_delta=10, at=now - timedelta(minutes=5))
+    db.commit()
+
+    assert db.get(UserProgressSummary, 7).last_activity_at == now
+    assert db.get(UserCourseProgressSummary, (7, 1)).last_activity_at == now
+    assert db.get(UserProgressSummary, 7).lesson_time_spent == 40
+
+
+def test_catalog_totals_count_published_content(db, service):
+    db.add(content_models.Topic(id=1, subject_id=1, name="Cells"))
+    db.query(content_models.Course).update({"is_published": True})
+    db.query(content_models.Lesson).filter(content_models.Lesson.id == 1).update({"is_published": True})
+    db.query(content_models.Quiz).update({"topic_id": 1, "is_published": True})
+    db.commit()
+
+    assert service.catalog_totals(db, subject_id=1) == {"courses": 1, "lessons": 1, "quizzes": 1}
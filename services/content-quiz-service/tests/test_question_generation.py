@@ -0,0 +1,44 @@
+"""
+Tests for the near-duplicate question filter and the fake LLM backend
+"""
+
+import asyncio
+import json
+
+from app.utils.llm_backends import FakeLLMBackend, get_llm_backend
+from app.utils.question_dedup import NearDuplicateFilter, normalize_text, shingles, jaccard
+
+
+def test_normalize_and_shingles():
+    assert normalize_text("  What is  Photosynthesis?! ") == "what is photosynthesis"
+    assert shingles("Cell wall?") == shingles("cell  WALL")
+    assert jaccard(shingles("the water cycle"), shingles("the water cycle")) == 1.0
+
+
+def test_filter_rejects_near_duplicates_only():
+    seen = NearDuplicateFilter(threshold=0.7)
+    seen.extend(["What is the main function of chlorophyll in photosynthesis?"])
+
+    assert not seen.add("What is the main function of chlorophyll in photosynthesis")
+    assert not seen.add("What is the main function of the chlorophyll in photosynthesis?")
+    assert seen.add("Which gas do plants release during photosynthesis?")
+    assert seen.add("Name the organelle where respiration takes place.")
+    assert len(seen) == 3
+    # Rejected texts are not remembered
+    assert seen.is_duplicate("which gas do plants release during photosynthesis")
+
+
+def test_fake_backend_is_deterministic():
+    prompt = "Topic: Photosynthesis\nQuestion type: multiple_choice\nDifficulty: beginner\nNumber of questions: 3"
+    backend = FakeLLMBackend()
+
+    first = json.loads(asyncio.run(backend.complete(prompt)))["questions"]
+    second = json.loads(asyncio.run(backend.complete(prompt)))["questions"]
+    assert first == second
+    assert backend.calls == 2
+    assert len(first) == 3
+    assert all(len(question["options"]) == 4 and question["difficulty"] == "beginner" for question in first)
+
+    other = json.loads(asyncio.run(FakeLLMBackend(seed=1).complete(prompt)))["questions"]
+    assert other != first
+    assert isinstance(get_llm_backend("fake"), FakeLLMBackend)
@@ -0,0 +1,84 @@
+"""
+Quiz statistics kept as submissions are graded must match a rebuild from the submissions
+"""
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import Column, Integer, Table, create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models import content_models
+from app.models.content_models import Question, QuizStatistics, QuizSubmission
+from app.services.quiz_stats import QuizStatsService, quiz_stats
+from app.utils.quiz_grader import get_answer_key, grade_submissions
+
+TABLES = [
+    "topics", "quizzes", "questions", "quiz_submissions", "quiz_progress",
+    "quiz_statistics", "user_progress_summaries",
+]
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stats.db'}")
+    metadata = content_models.Base.metadata
+    # Users live in the auth service
+    if "users" not in metadata.tables:
+        Table("users", metadata, Column("id", Integer, primary_key=True))
+    metadata.create_all(engine, tables=[metadata.tables[name] for name in TABLES])
+    session = sessionmaker(bind=engine)()
+    session.add(content_models.Quiz(id=1, title="Cells", passing_score=50.0))
+    session.add_all([
+        Question(id=question_id, quiz_id=1, question_text=f"Question {question_id}", question_type="true_false", points=1.0, correct_answer="true")
+        for question_id in range(1, 5)
+    ])
+    session.commit()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def submit(db, user_id, correct):
+    """Store a submission of the four-question quiz with this many right answers, as the API does"""
+    submission = QuizSubmission(
+        quiz_id=1, user_id=user_id, time_taken=60, submitted_at=datetime.utcnow(),
+        answers={str(question_id): "true" if question_id <= correct else "false" for question_id in range(1, 5)}
+    )
+    db.add(submission)
+    db.flush()
+    quiz_stats.record_attempt(db, 1)
+    db.commit()
+    return submission
+
+
+def test_grading_updates_statistics(db):
+    submissions = [submit(db, user_id, correct) for user_id, correct in ((1, 4), (2, 3), (3, 1), (4, 2), (5, 0))]
+    pending = submit(db, 6, 4)
+    grade_submissions(db, get_answer_key(db, 1), submissions)
+    db.commit()
+
+    stats = quiz_stats.describe(quiz_stats.get_stats(db, 1))
+    assert (stats["total_attempts"], stats["total_submissions"]) == (6, 5)
+    assert (stats["average_score"], stats["highest_score"], stats["lowest_score"]) == (2.0, 4.0, 0.0)
+    assert (stats["pass_rate"], stats["average_percentage"]) == (60.0, 50.0)
+    assert sum(stats["score_distribution"]) == 5
+
+    # A rebuild from the submissions gives the same row
+    expected = {name: getattr(db.get(QuizStatistics, 1), name) for name in ("attempt_count", "graded_count", "pass_count", "score_sum", "score_sq_sum", "histogram")}
+    QuizStatsService().rebuild(db, [1])
+    assert {name: getattr(db.get(QuizStatistics, 1), name) for name in expected} == expected
+    assert pending.graded_at is None
+
+    assert quiz_stats.analyze(db) == {"analyzed": 1}
+    question_stats = quiz_stats.get_stats(db, 1).question_stats
+    assert [item["question_id"] for item in question_stats] == [1, 2, 3, 4]
+
+
+def test_quiz_without_statistics_is_rebuilt_on_read(db):
+    submit(db, 1, 2)
+    db.query(QuizStatistics).delete()
+    db.commit()
+
+    stats = quiz_stats.describe(quiz_stats.get_stats(db, 1))
+    assert (stats["total_attempts"], stats["total_submissions"]) == (1, 0)
@@ -0,0 +1,81 @@
+"""
+Tests for running quiz score aggregates and item analysis
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.utils.score_stats import (
+    HISTOGRAM_BUCKETS, ScoreAggregate, histogram_bucket, histogram_percentile, item_analysis
+)
+
+
+def test_histogram_buckets_and_percentiles():
+    assert [histogram_bucket(p) for p in (None, -3, 0, 49.99, 50, 99.5, 100)] == [0, 0, 0, 49, 50, 99, 99]
+
+    histogram = [0] * HISTOGRAM_BUCKETS
+    for percentage in range(100):
+        histogram[histogram_bucket(percentage)] += 1
+    # One submission per bucket: percentiles land on the bucket boundaries
+    assert histogram_percentile(histogram, 50) == 50.0
+    assert histogram_percentile(histogram, 90) == 90.0
+    assert histogram_percentile([0] * HISTOGRAM_BUCKETS, 50) is None
+
+
+def test_running_aggregate_matches_direct_computation():
+    rng = np.random.default_rng(7)
+    scores = rng.uniform(0, 20, size=200).round(1)
+    percentages = scores / 20 * 100
+
+    aggregate = ScoreAggregate()
+    for score, percentage in zip(scores, percentages):
+        aggregate.add(float(score), float(percentage), percentage >= 50)
+
+    assert aggregate.graded_count == 200
+    assert aggregate.mean == pytest.approx(scores.mean())
+    assert aggregate.std_dev == pytest.approx(scores.std())
+    assert (aggregate.min_score, aggregate.max_score) == (scores.min(), scores.max())
+    assert aggregate.pass_rate == pytest.approx((percentages >= 50).mean() * 100)
+    assert sum(aggregate.histogram) == 200
+    # Percentiles from 1-point buckets are within a point of the exact ones
+    for name, value in aggregate.percentiles().items():
+        assert value == pytest.approx(np.percentile(percentages, int(name[1:])), abs=1.0)
+
+
+def test_aggregate_round_trips_through_a_row():
+    aggregate = ScoreAggregate()
+    aggregate.add(8.0, 80.0, True)
+    row = SimpleNamespace(histogram=None)
+    aggregate.store(row)
+
+    restored = ScoreAggregate.from_row(row)
+    restored.add(4.0, 40.0, False)
+    assert (restored.graded_count, restored.pass_count, restored.min_score) == (2, 1, 4.0)
+    # The row keeps its own copy until stored again
+    assert row.graded_count == 1 and sum(row.histogram) == 1
+
+
+def test_item_analysis():
+    points = np.array([1.0, 2.0, 1.0])
+    scores = np.array([
+        # easy, discriminating, unanswered by some
+        [1, 2, 1],
+        [1, 2, np.nan],
+        [1, 2, 0],
+        [1, 0, np.nan],
+        [1, 0, 1],
+        [0, 0, 0],
+    ])
+    easy, discriminating, partial = item_analysis(scores, points)
+
+    assert easy["responses"] == 6
+    assert easy["difficulty"] == pytest.approx(5 / 6, abs=1e-3)
+    assert discriminating["difficulty"] == 0.5
+    assert discriminating["discrimination"] == 1.0
+    assert discriminating["point_biserial"] > 0
+    assert partial["responses"] == 4
+
+    # Questions nobody answered get no statistics
+    assert item_analysis(np.full((2, 1), np.nan), np.array([1.0]))[0]["difficulty"] is None
@@ -378,15 +378,19 @@ async def view_video(
             quality=quality
         )
         
+        renditions = StreamingService.get_renditions(db, file_record.file_id)
+        
         quality_options = StreamingService.get_quality_options(
             content_type="video",
-            file_size=file_record.file_size or 0
+            file_size=file_record.file_size or 0,
+            renditions=renditions
         )
         
-        thumbnail_url = StreamingService.generate_thumbnail(file_id)
+        thumbnail_url = StreamingService.get_thumbnail_url(db, file_record.file_id)
         
         return {
             "stream_url": stream_url,
+            "hls_url": f"/api/v1/files/{file_record.file_id}/hls/master.m3u8" if renditions else None,
             "content_type": file_record.content_type,
             "duration": None,  # Would need metadata extraction
             "file_size": file_record.file_size,
@@ -6,7 +6,7 @@ JWT validation and user context management
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import httpx
 import json
 import os
@@ -199,6 +199,40 @@ def create_file_activity_log(
     db.add(activity)
     db.commit()
 
+def create_file_activity_logs(
+    db: Session,
+    entries: List[Dict[str, Any]],
+    commit: bool = False
+):
+    """Insert many file activity log entries with a single bulk INSERT
+    
+    Each entry has file_id, user_id, action and an optional context. The insert
+    joins the caller's transaction unless commit is set.
+    """
+    from sqlalchemy import insert
+    from .models import FileAnalytics
+    
+    if not entries:
+        return
+    
+    rows = []
+    for entry in entries:
+        context = entry.get("context") or {}
+        rows.append({
+            "file_id": entry["file_id"],
+            "user_id": entry["user_id"],
+            "school_id": context.get("school_id"),
+            "action": entry["action"],
+            "context": context,
+            "ip_address": context.get("ip_address"),
+            "user_agent": context.get("user_agent"),
+            "referrer": context.get("referrer")
+        })
+    
+    db.execute(insert(FileAnalytics), rows)
+    if commit:
+        db.commit()
+
 # Permission constants
 class FilePermissions:
     READ = "file.read"
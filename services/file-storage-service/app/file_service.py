@@ -3,9 +3,10 @@ EduNerve File Storage Service - Core Business Logic
 Handles file operations, processing, and management
 """
 
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, UploadFile
-from typing import Optional, List, Dict, Any, BinaryIO
+from typing import Optional, List, Dict, Any, BinaryIO, Tuple
 import hashlib
 import magic
 import os
@@ -15,12 +16,15 @@ from PIL import Image
 import io
 import json
 import asyncio
+import logging
+from collections import defaultdict
 from cryptography.fernet import Fernet
 import base64
 
+from .database import SessionLocal
 from .models import (
     File, FileVersion, FileShare, FileProcessingJob, 
-    FileCollection, FileAnalytics, FileQuota, FileBackup,
+    FileCollection, FileAnalytics, FileBackup, FileDerivative,
     FileStatus, FileType, AccessLevel
 )
 from .schemas import (
@@ -28,7 +32,13 @@ from .schemas import (
     FileSearchRequest, FileShareRequest, ProcessingJobRequest,
     FileCollectionRequest, FileAnalyticsRequest, FileQuotaResponse
 )
-from .auth import CurrentUser, create_file_activity_log
+from .auth import CurrentUser, create_file_activity_log, create_file_activity_logs
+from .storage_stats import storage_stats
+from .quota import quota_manager
+from .search_index import search_index, InvalidCursorError
+from .text_extraction import is_text_extractable
+
+logger = logging.getLogger(__name__)
 
 class FileStorageService:
     """Core file storage service with database storage"""
@@ -38,6 +48,12 @@ class FileStorageService:
         self.cipher = Fernet(base64.urlsafe_b64encode(self.encryption_key.ljust(32)[:32])) if self.encryption_key else None
         self.max_file_size = int(os.getenv("MAX_FILE_SIZE", "50485760"))  # 50MB
         self.allowed_types = os.getenv("ALLOWED_FILE_TYPES", "").split(",") if os.getenv("ALLOWED_FILE_TYPES") else []
+        self.image_processing_enabled = os.getenv("ENABLE_IMAGE_PROCESSING", "True").lower() == "true"
+        self.video_processing_enabled = os.getenv("ENABLE_VIDEO_PROCESSING", "True").lower() == "true"
+        self.text_extraction_enabled = os.getenv("ENABLE_TEXT_EXTRACTION", "True").lower() == "true"
+        self.responsive_image_widths = [int(w) for w in os.getenv("RESPONSIVE_IMAGE_WIDTHS", "480,960,1600").split(",")]
+        self.hls_renditions = os.getenv("HLS_RENDITIONS", "360p,480p,720p").split(",")
+        self.upload_concurrency = int(os.getenv("MAX_UPLOAD_CONCURRENCY", "4"))
     
     def _get_file_type(self, content_type: str) -> FileType:
         """Determine file type from content type"""
@@ -105,17 +121,9 @@ class FileStorageService:
         
         return metadata
     
-    async def upload_file(
-        self,
-        file: UploadFile,
-        request: FileUploadRequest,
-        current_user: CurrentUser,
-        db: Session
-    ) -> FileResponse:
-        """Upload a file to database storage"""
+    def _prepare_upload(self, filename: str, file_data: bytes) -> Dict[str, Any]:
+        """Validate a file and do the CPU-bound work (type detection, hashing, metadata, encryption)"""
         
-        # Read file data
-        file_data = await file.read()
         file_size = len(file_data)
         
         # Validate file size
@@ -135,75 +143,158 @@ class FileStorageService:
                 detail=f"File type {content_type} not allowed"
             )
         
-        # Check quota
-        await self._check_quota(current_user.id, current_user.school_id, file_size, db)
+        # Encrypt file data if needed
+        encrypted_data = self._encrypt_file_data(file_data)
         
-        # Check for duplicate files
-        file_hash = self._calculate_file_hash(file_data)
-        existing_file = db.query(File).filter(
-            File.file_hash == file_hash,
-            File.school_id == current_user.school_id,
+        return {
+            "filename": filename,
+            "file_size": file_size,
+            "content_type": content_type,
+            "file_hash": self._calculate_file_hash(file_data),
+            "metadata": self._extract_metadata(file_data, content_type),
+            "file_data": encrypted_data,
+            "is_encrypted": len(encrypted_data) != file_size
+        }
+    
+    def _find_existing_files(self, hashes: List[str], school_id: int, db: Session) -> Dict[str, File]:
+        """Find already stored files with the same content, keyed by hash"""
+        
+        if not hashes:
+            return {}
+        
+        existing_files = db.query(File).filter(
+            File.file_hash.in_(hashes),
+            File.school_id == school_id,
             File.status != FileStatus.DELETED
-        ).first()
+        ).all()
         
-        if existing_file:
-            # Return existing file if identical
-            return FileResponse.from_orm(existing_file)
+        return {f.file_hash: f for f in existing_files}
+    
+    async def upload_file(
+        self,
+        file: UploadFile,
+        request: FileUploadRequest,
+        current_user: CurrentUser,
+        db: Session
+    ) -> FileResponse:
+        """Upload a file to database storage"""
         
-        # Extract metadata
-        metadata = self._extract_metadata(file_data, content_type)
+        file_data = await file.read()
+        prepared = self._prepare_upload(file.filename, file_data)
         
-        # Encrypt file data if needed
-        encrypted_data = self._encrypt_file_data(file_data)
-        is_encrypted = len(encrypted_data) != len(file_data)
-        
-        # Create file record
-        file_record = File(
-            file_id=str(uuid.uuid4()),
-            original_filename=file.filename,
-            filename=self._sanitize_filename(file.filename),
-            content_type=content_type,
-            file_type=self._get_file_type(content_type),
-            file_size=file_size,
-            file_data=encrypted_data,
-            file_hash=file_hash,
-            uploaded_by=current_user.id,
-            school_id=current_user.school_id,
-            access_level=request.access_level,
-            entity_type=request.entity_type,
-            entity_id=request.entity_id,
-            tags=request.tags or [],
-            status=FileStatus.UPLOADING,
-            is_encrypted=is_encrypted,
-            metadata=metadata,
-            expires_at=request.expires_at
-        )
+        # Return existing file if identical
+        existing = self._find_existing_files([prepared["file_hash"]], current_user.school_id, db)
+        if existing:
+            return FileResponse.from_orm(existing[prepared["file_hash"]])
         
-        db.add(file_record)
-        db.commit()
-        db.refresh(file_record)
+        records = self._store_files([prepared], request, current_user, db)
+        return FileResponse.from_orm(records[0])
+    
+    async def upload_files(
+        self,
+        files: List[UploadFile],
+        request: FileUploadRequest,
+        current_user: CurrentUser,
+        db: Session
+    ) -> Tuple[List[FileResponse], List[Dict[str, Any]]]:
+        """Upload several files: prepare them in parallel, then store them in one transaction"""
         
-        # Update quota
-        await self._update_quota(current_user.id, current_user.school_id, file_size, 1, db)
+        semaphore = asyncio.Semaphore(self.upload_concurrency)
         
-        # Create activity log
-        create_file_activity_log(
-            db=db,
-            file_id=file_record.file_id,
-            user_id=current_user.id,
-            action="upload",
-            context={"school_id": current_user.school_id}
+        async def prepare(file: UploadFile) -> Dict[str, Any]:
+            async with semaphore:
+                file_data = await file.read()
+                return await asyncio.to_thread(self._prepare_upload, file.filename, file_data)
+        
+        results = await asyncio.gather(*(prepare(file) for file in files), return_exceptions=True)
+        
+        prepared_files, errors = [], []
+        for file, result in zip(files, results):
+            if isinstance(result, Exception):
+                errors.append({"filename": file.filename, "error": getattr(result, "detail", str(result))})
+            else:
+                prepared_files.append(result)
+        
+        existing = self._find_existing_files(
+            [p["file_hash"] for p in prepared_files], current_user.school_id, db
         )
         
-        # Update status to completed
-        file_record.status = FileStatus.COMPLETED
-        db.commit()
+        responses, new_files, seen_hashes = [], [], set()
+        for prepared in prepared_files:
+            file_hash = prepared["file_hash"]
+            if file_hash in existing:
+                responses.append(FileResponse.from_orm(existing[file_hash]))
+            elif file_hash not in seen_hashes:
+                seen_hashes.add(file_hash)
+                new_files.append(prepared)
         
-        # Schedule background processing if needed
-        if content_type.startswith("image/"):
-            await self._schedule_image_processing(file_record.file_id, db)
+        if new_files:
+            records = self._store_files(new_files, request, current_user, db)
+            responses.extend(FileResponse.from_orm(record) for record in records)
         
-        return FileResponse.from_orm(file_record)
+        return responses, errors
+    
+    def _store_files(
+        self,
+        prepared_files: List[Dict[str, Any]],
+        request: FileUploadRequest,
+        current_user: CurrentUser,
+        db: Session
+    ) -> List[File]:
+        """Persist prepared files, their activity logs and processing jobs in one transaction"""
+        
+        total_size = sum(p["file_size"] for p in prepared_files)
+        
+        # One atomic quota reservation for the whole batch; released if storing fails
+        with quota_manager.reservation(
+            db, current_user.id, current_user.school_id, total_size, count=len(prepared_files)
+        ):
+            records = [
+                File(
+                    file_id=str(uuid.uuid4()),
+                    original_filename=prepared["filename"],
+                    filename=self._sanitize_filename(prepared["filename"]),
+                    content_type=prepared["content_type"],
+                    file_type=self._get_file_type(prepared["content_type"]),
+                    file_size=prepared["file_size"],
+                    file_data=prepared["file_data"],
+                    file_hash=prepared["file_hash"],
+                    uploaded_by=current_user.id,
+                    school_id=current_user.school_id,
+                    access_level=request.access_level,
+                    entity_type=request.entity_type,
+                    entity_id=request.entity_id,
+                    tags=request.tags or [],
+                    status=FileStatus.COMPLETED,
+                    is_encrypted=prepared["is_encrypted"],
+                    metadata=prepared["metadata"],
+                    expires_at=request.expires_at
+                )
+                for prepared in prepared_files
+            ]
+            db.add_all(records)
+            
+            for record in records:
+                storage_stats.record_file_change(
+                    db, current_user.school_id, record.file_type, 1, record.file_size
+                )
+                # Schedule background processing (thumbnails, previews, renditions)
+                self._add_processing_job(record.file_id, record.content_type, db)
+            search_index.index_files(db, records)
+            
+            create_file_activity_logs(db, [{
+                "file_id": record.file_id,
+                "user_id": current_user.id,
+                "action": "upload",
+                "context": {"school_id": current_user.school_id}
+            } for record in records])
+            
+            db.commit()
+        
+        for record in records:
+            db.refresh(record)
+        
+        return records
     
     async def get_file(
         self,
@@ -274,6 +365,7 @@ class FileStorageService:
         # Update download count
         file_record.download_count += 1
         file_record.last_accessed = datetime.utcnow()
+        storage_stats.record_download(db, file_record.school_id, file_record.file_type)
         db.commit()
         
         # Create activity log
@@ -316,6 +408,10 @@ class FileStorageService:
             setattr(file_record, field, value)
         
         file_record.updated_at = datetime.utcnow()
+        if "description" in update_data:
+            search_index.index_file(
+                db, file_id, file_record.original_filename, file_record.description, file_record.extracted_text
+            )
         db.commit()
         
         # Create activity log
@@ -352,10 +448,16 @@ class FileStorageService:
         # Soft delete
         file_record.status = FileStatus.DELETED
         file_record.updated_at = datetime.utcnow()
-        db.commit()
+        storage_stats.record_file_change(
+            db, file_record.school_id, file_record.file_type, -1, -(file_record.file_size or 0)
+        )
         
-        # Update quota
-        await self._update_quota(current_user.id, current_user.school_id, -file_record.file_size, -1, db)
+        # Return quota to the owner in the same transaction as the delete
+        quota_manager.release(
+            db, file_record.uploaded_by, file_record.school_id, file_record.file_size or 0, commit=False
+        )
+        search_index.remove_files(db, [file_id])
+        db.commit()
         
         # Create activity log
         create_file_activity_log(
@@ -368,13 +470,246 @@ class FileStorageService:
         
         return {"message": "File deleted successfully"}
     
+    def _authorize_bulk(
+        self,
+        file_ids: List[str],
+        permission: str,
+        current_user: CurrentUser,
+        db: Session
+    ) -> Tuple[list, List[Dict[str, Any]]]:
+        """Load the files of a bulk operation in one query and split allowed from denied"""
+        
+        unique_ids = list(dict.fromkeys(file_ids))
+        rows = db.query(
+            File.file_id, File.uploaded_by, File.school_id, File.file_size, File.file_type
+        ).filter(
+            File.file_id.in_(unique_ids),
+            File.status != FileStatus.DELETED
+        ).all()
+        found = {row.file_id: row for row in rows}
+        
+        allowed, errors = [], []
+        for file_id in unique_ids:
+            row = found.get(file_id)
+            if not row:
+                errors.append({"file_id": file_id, "error": "File not found"})
+            elif row.uploaded_by != current_user.id and not current_user.has_permission(permission):
+                errors.append({"file_id": file_id, "error": "Access denied"})
+            else:
+                allowed.append(row)
+        
+        return allowed, errors
+    
+    async def bulk_delete_files(
+        self,
+        file_ids: List[str],
+        current_user: CurrentUser,
+        db: Session
+    ) -> Dict[str, Any]:
+        """Soft delete many files with set-based updates in a single transaction"""
+        
+        allowed, errors = self._authorize_bulk(file_ids, "file.delete", current_user, db)
+        if not allowed:
+            return {"results": [], "errors": errors}
+        
+        # Only rows this statement flipped are accounted; a concurrent delete keeps its own
+        deleted = db.execute(
+            update(File)
+            .where(
+                File.file_id.in_([row.file_id for row in allowed]),
+                File.status != FileStatus.DELETED
+            )
+            .values(status=FileStatus.DELETED, updated_at=datetime.utcnow())
+            .returning(File.file_id, File.uploaded_by, File.school_id, File.file_size, File.file_type)
+            .execution_options(synchronize_session=False)
+        ).all()
+        deleted_ids = [row.file_id for row in deleted]
+        
+        # Aggregate quota and counter changes so each owner, school and type is updated once
+        quota_usage = defaultdict(lambda: [0, 0])
+        type_usage = defaultdict(lambda: [0, 0])
+        for row in deleted:
+            size = row.file_size or 0
+            for scope in (("user", row.uploaded_by), ("school", row.school_id)):
+                quota_usage[scope][0] += size
+                quota_usage[scope][1] += 1
+            type_usage[(row.school_id, row.file_type)][0] += 1
+            type_usage[(row.school_id, row.file_type)][1] += size
+        
+        quota_manager.release_usage(
+            db, {scope: tuple(usage) for scope, usage in quota_usage.items()}, commit=False
+        )
+        for (school_id, file_type), (count, size) in type_usage.items():
+            storage_stats.record_file_change(db, school_id, file_type, -count, -size)
+        search_index.remove_files(db, deleted_ids)
+        
+        create_file_activity_logs(db, [{
+            "file_id": file_id,
+            "user_id": current_user.id,
+            "action": "delete",
+            "context": {"school_id": current_user.school_id, "bulk": True}
+        } for file_id in deleted_ids])
+        
+        db.commit()
+        
+        # Files another request deleted after authorization
+        deleted_set = set(deleted_ids)
+        errors.extend(
+            {"file_id": row.file_id, "error": "File not found"}
+            for row in allowed if row.file_id not in deleted_set
+        )
+        return {
+            "results": [{"file_id": file_id, "status": "deleted"} for file_id in deleted_ids],
+            "errors": errors,
+            "deleted_ids": deleted_ids
+        }
+    
+    async def bulk_update_files(
+        self,
+        file_ids: List[str],
+        request: FileUpdateRequest,
+        current_user: CurrentUser,
+        db: Session
+    ) -> Dict[str, Any]:
+        """Apply the same metadata update to many files with one UPDATE statement"""
+        
+        allowed, errors = self._authorize_bulk(file_ids, "file.write", current_user, db)
+        update_data = request.dict(exclude_unset=True)
+        if not allowed or not update_data:
+            return {"results": [], "errors": errors}
+        
+        if "filename" in update_data:
+            update_data["filename"] = self._sanitize_filename(update_data["filename"])
+        
+        updated_ids = [row.file_id for row in allowed]
+        values = {getattr(File, field): value for field, value in update_data.items()}
+        values[File.updated_at] = datetime.utcnow()
+        db.query(File).filter(File.file_id.in_(updated_ids)).update(values, synchronize_session=False)
+        if "description" in update_data:
+            search_index.reindex(db, updated_ids)
+        
+        create_file_activity_logs(db, [{
+            "file_id": file_id,
+            "user_id": current_user.id,
+            "action": "update",
+            "context": {"school_id": current_user.school_id, "changes": request.dict(exclude_unset=True), "bulk": True}
+        } for file_id in updated_ids])
+        
+        db.commit()
+        
+        return {
+            "results": [{"file_id": file_id, "status": "updated"} for file_id in updated_ids],
+            "errors": errors
+        }
+    
+    def reclaim_blob_storage(self, db: Session, retention_days: int, chunk_size: int = 100) -> int:
+        """Drop blobs and derivatives of files deleted longer ago than the retention window
+
+        Soft deletes keep their blobs until then so they can still be restored.
+        Works in small batches so no transaction holds many rows.
+        """
+        
+        deleted_before = datetime.utcnow() - timedelta(days=retention_days)
+        reclaimed = 0
+        while True:
+            chunk = [row.file_id for row in db.query(File.file_id).filter(
+                File.status == FileStatus.DELETED,
+                File.updated_at < deleted_before,
+                File.file_data.isnot(None)
+            ).limit(chunk_size).all()]
+            if not chunk:
+                return reclaimed
+            
+            db.query(File).filter(File.file_id.in_(chunk)).update(
+                {File.file_data: None}, synchronize_session=False
+            )
+            db.query(FileDerivative).filter(
+                FileDerivative.file_id.in_(chunk)
+            ).delete(synchronize_session=False)
+            db.commit()
+            reclaimed += len(chunk)
+    
+    def _get_accessible_file_owner(self, file_id: str, current_user: CurrentUser, db: Session):
+        """Check access to a file without loading its blob"""
+        
+        owner = db.query(
+            File.uploaded_by, File.school_id, File.access_level
+        ).filter(
+            File.file_id == file_id,
+            File.status != FileStatus.DELETED
+        ).first()
+        
+        if not owner:
+            raise HTTPException(status_code=404, detail="File not found")
+        
+        if not current_user.can_access_file(owner.uploaded_by, owner.school_id, owner.access_level):
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        return owner
+    
+    async def list_derivatives(
+        self,
+        file_id: str,
+        current_user: CurrentUser,
+        db: Session
+    ) -> List[Dict[str, Any]]:
+        """List thumbnails, responsive sizes, previews and renditions of a file"""
+        
+        self._get_accessible_file_owner(file_id, current_user, db)
+        
+        derivatives = db.query(
+            FileDerivative.kind, FileDerivative.variant, FileDerivative.content_type,
+            FileDerivative.width, FileDerivative.height, FileDerivative.file_size
+        ).filter(
+            FileDerivative.file_id == file_id,
+            FileDerivative.kind != "hls_segment"
+        ).order_by(FileDerivative.kind, FileDerivative.width).all()
+        
+        return [{
+            "kind": d.kind,
+            "variant": d.variant,
+            "content_type": d.content_type,
+            "width": d.width,
+            "height": d.height,
+            "size": d.file_size,
+            "url": (
+                f"/api/v1/files/{file_id}/hls/{d.variant}" if d.kind == "hls_playlist"
+                else f"/api/v1/files/{file_id}/derivatives/{d.kind}/{d.variant}"
+            )
+        } for d in derivatives]
+    
+    async def get_derivative(
+        self,
+        file_id: str,
+        kinds: List[str],
+        variant: Optional[str],
+        current_user: CurrentUser,
+        db: Session
+    ) -> FileDerivative:
+        """Get a derived blob; without a variant the smallest one of the kind is returned"""
+        
+        self._get_accessible_file_owner(file_id, current_user, db)
+        
+        query = db.query(FileDerivative).filter(
+            FileDerivative.file_id == file_id,
+            FileDerivative.kind.in_(kinds)
+        )
+        if variant:
+            query = query.filter(FileDerivative.variant == variant)
+        
+        derivative = query.order_by(FileDerivative.file_size).first()
+        if not derivative:
+            raise HTTPException(status_code=404, detail="Derivative not available")
+        
+        return derivative
+    
     async def search_files(
         self,
         request: FileSearchRequest,
         current_user: CurrentUser,
         db: Session
     ) -> Dict[str, Any]:
-        """Search files"""
+        """Search files using the full-text and tag indexes with keyset pagination"""
         
         query = db.query(File).filter(
             File.school_id == current_user.school_id,
@@ -382,10 +717,9 @@ class FileStorageService:
         )
         
         # Apply filters
+        rank = None
         if request.query:
-            query = query.filter(
-                File.original_filename.ilike(f"%{request.query}%")
-            )
+            query, rank = search_index.apply_text_search(db, query, request.query)
         
         if request.file_type:
             query = query.filter(File.file_type == request.file_type)
@@ -397,8 +731,7 @@ class FileStorageService:
             query = query.filter(File.entity_id == request.entity_id)
         
         if request.tags:
-            for tag in request.tags:
-                query = query.filter(File.tags.contains([tag]))
+            query = search_index.apply_tag_filter(db, query, request.tags)
         
         if request.uploaded_by:
             query = query.filter(File.uploaded_by == request.uploaded_by)
@@ -419,86 +752,85 @@ class FileStorageService:
                 (File.access_level.in_(["public", "school"]))
             )
         
-        # Get total count
-        total = query.count()
+        # Planner estimate (or capped count) instead of a full COUNT on every page
+        if request.exact_total:
+            total, total_is_estimate = search_index.exact_total(query), False
+        else:
+            total, total_is_estimate = search_index.estimate_total(db, query)
         
-        # Apply pagination
-        files = query.offset(request.offset).limit(request.limit).all()
+        # Relevance order for text queries, newest first otherwise
+        sort = "rank" if rank is not None else "created_at"
+        try:
+            rows, next_cursor = search_index.paginate(
+                query,
+                rank if rank is not None else File.created_at,
+                request.limit,
+                cursor=request.cursor,
+                offset=request.offset,
+                scope=search_index.cursor_scope(request.query, sort)
+            )
+        except InvalidCursorError:
+            raise HTTPException(status_code=400, detail="Invalid search cursor")
         
         return {
-            "files": [FileResponse.from_orm(file) for file in files],
+            "files": [FileResponse.from_orm(file) for file, _ in rows],
             "total": total,
+            "total_is_estimate": total_is_estimate,
             "limit": request.limit,
             "offset": request.offset,
-            "has_more": total > request.offset + request.limit
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor
         }
     
-    async def _check_quota(self, user_id: int, school_id: int, file_size: int, db: Session):
-        """Check if user has quota for file upload"""
-        
-        # Get user quota
-        user_quota = db.query(FileQuota).filter(
-            FileQuota.entity_type == "user",
-            FileQuota.entity_id == user_id
-        ).first()
-        
-        if user_quota and user_quota.used_quota + file_size > user_quota.total_quota:
-            raise HTTPException(
-                status_code=413,
-                detail="User quota exceeded"
-            )
-        
-        # Get school quota
-        school_quota = db.query(FileQuota).filter(
-            FileQuota.entity_type == "school",
-            FileQuota.entity_id == school_id
-        ).first()
-        
-        if school_quota and school_quota.used_quota + file_size > school_quota.total_quota:
-            raise HTTPException(
-                status_code=413,
-                detail="School quota exceeded"
-            )
-    
-    async def _update_quota(self, user_id: int, school_id: int, size_change: int, count_change: int, db: Session):
-        """Update quota usage"""
-        
-        # Update user quota
-        user_quota = db.query(FileQuota).filter(
-            FileQuota.entity_type == "user",
-            FileQuota.entity_id == user_id
-        ).first()
-        
-        if user_quota:
-            user_quota.used_quota += size_change
-            user_quota.file_count_used += count_change
-            user_quota.updated_at = datetime.utcnow()
-        
-        # Update school quota
-        school_quota = db.query(FileQuota).filter(
-            FileQuota.entity_type == "school",
-            FileQuota.entity_id == school_id
-        ).first()
-        
-        if school_quota:
-            school_quota.used_quota += size_change
-            school_quota.file_count_used += count_change
-            school_quota.updated_at = datetime.utcnow()
-        
-        db.commit()
+    def _get_processing_jobs(self, content_type: str) -> List[tuple]:
+        """Pick the background job types and parameters for a content type"""
+        jobs = []
+        if content_type.startswith("image/") and self.image_processing_enabled:
+            jobs.append(("image_processing", {
+                "thumbnail_size": [320, 320],
+                "widths": self.responsive_image_widths
+            }))
+        if content_type == "application/pdf" and self.image_processing_enabled:
+            jobs.append(("pdf_preview", {"preview_width": 960, "thumbnail_size": [320, 320]}))
+        if content_type.startswith("video/") and self.video_processing_enabled:
+            jobs.append(("video_transcode", {"renditions": self.hls_renditions}))
+        if self.text_extraction_enabled and is_text_extractable(content_type):
+            jobs.append(("extract_text", {"content_type": content_type}))
+        return jobs
     
-    async def _schedule_image_processing(self, file_id: str, db: Session):
-        """Schedule image processing job"""
-        
-        job = FileProcessingJob(
-            job_id=str(uuid.uuid4()),
-            file_id=file_id,
-            job_type="image_processing",
-            parameters={"generate_thumbnail": True, "optimize": True}
-        )
-        
-        db.add(job)
-        db.commit()
+    def _add_processing_job(self, file_id: str, content_type: str, db: Session):
+        """Add background processing jobs for the worker to the current transaction"""
+        
+        for job_type, parameters in self._get_processing_jobs(content_type):
+            db.add(FileProcessingJob(
+                job_id=str(uuid.uuid4()),
+                file_id=file_id,
+                job_type=job_type,
+                parameters=parameters,
+                status="pending"
+            ))
 
 # Initialize service
 file_service = FileStorageService()
+
+async def blob_reclaim_worker():
+    """Periodically reclaim the blobs of files deleted past the retention window"""
+    interval = int(os.getenv("BLOB_RECLAIM_INTERVAL", "3600"))
+    retention_days = int(os.getenv("DELETED_FILE_RETENTION_DAYS", "30"))
+
+    while True:
+        try:
+            await asyncio.sleep(interval)
+
+            db = SessionLocal()
+            try:
+                reclaimed = await asyncio.to_thread(file_service.reclaim_blob_storage, db, retention_days)
+                if reclaimed:
+                    logger.info(f"Reclaimed blob storage of {reclaimed} deleted files")
+            finally:
+                db.close()
+
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.error(f"Error in blob reclaim worker: {str(e)}")
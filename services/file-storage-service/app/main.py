@@ -5,11 +5,12 @@ Database-based file storage with processing, security, and management
 
 from fastapi import FastAPI, HTTPException, Request, Depends, Query, UploadFile, File as FastAPIFile, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from contextlib import asynccontextmanager
 from typing import List, Optional, Dict, Any
 from sqlalchemy.orm import Session
 import uvicorn
+import asyncio
 import os
 import logging
 import io
@@ -24,7 +25,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Import local modules
-from .database import create_tables, get_db
+from .database import create_tables, get_db, engine
 from .models import File, FileShare, FileCollection, FileQuota, FileAnalytics
 from .schemas import (
     FileUploadRequest, FileResponse, FileUpdateRequest, FileSearchRequest,
@@ -32,8 +33,12 @@ from .schemas import (
     FileAnalyticsRequest, FileAnalyticsResponse, FileQuotaResponse,
     MessageResponse, ErrorResponse, BulkFileOperation, BulkFileOperationResponse
 )
-from .auth import get_current_user, get_current_teacher, get_current_admin, CurrentUser
-from .file_service import file_service
+from .auth import get_current_user, get_current_teacher, get_current_admin, CurrentUser, create_file_activity_log
+from .file_service import file_service, blob_reclaim_worker
+from .media_worker import media_worker
+from .storage_stats import storage_stats, usage_rollup_worker
+from .quota import quota_reconciliation_worker
+from .search_index import search_index
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -43,17 +48,38 @@ async def lifespan(app: FastAPI):
     
     # Create database tables
     create_tables()
+    search_index.setup(engine)
     logger.info("✅ Database tables created successfully")
     
+    # Storage counters are backfilled once per deploy by the release step (see Procfile);
+    # analytics aggregate the files table until that has run
+    
     # Create required directories
     os.makedirs("temp", exist_ok=True)
     os.makedirs("backups", exist_ok=True)
     
+    # Media processing normally runs as a separate worker process (see Procfile)
+    media_worker_in_process = os.getenv("MEDIA_WORKER_IN_PROCESS", "False").lower() == "true"
+    if media_worker_in_process:
+        await media_worker.start()
+        logger.info("✅ Media processing worker started")
+    
+    # Daily usage rollups feed the analytics usage_trends
+    rollup_task = asyncio.create_task(usage_rollup_worker())
+    reconcile_task = asyncio.create_task(quota_reconciliation_worker())
+    reclaim_task = asyncio.create_task(blob_reclaim_worker())
+    
     logger.info("✅ File Storage Service startup complete")
     yield
     
     # Shutdown
     logger.info("🔽 Shutting down File Storage Service...")
+    rollup_task.cancel()
+    reconcile_task.cancel()
+    reclaim_task.cancel()
+    await asyncio.gather(rollup_task, reconcile_task, reclaim_task, return_exceptions=True)
+    if media_worker_in_process:
+        await media_worker.stop()
     logger.info("✅ File Storage Service shutdown complete")
 
 # Initialize FastAPI app
@@ -151,20 +177,15 @@ async def upload_multiple_files(
             tags=tag_list
         )
         
-        # Upload files
-        uploaded_files = []
-        for file in files:
-            try:
-                file_response = await file_service.upload_file(
-                    file=file,
-                    request=upload_request,
-                    current_user=current_user,
-                    db=db
-                )
-                uploaded_files.append(file_response)
-            except Exception as e:
-                logger.error(f"Error uploading file {file.filename}: {str(e)}")
-                # Continue with other files
+        # Upload files (prepared concurrently, stored in one transaction)
+        uploaded_files, errors = await file_service.upload_files(
+            files=files,
+            request=upload_request,
+            current_user=current_user,
+            db=db
+        )
+        for error in errors:
+            logger.error(f"Error uploading file {error['filename']}: {error['error']}")
         
         return uploaded_files
         
@@ -217,6 +238,78 @@ async def download_file(
         logger.error(f"Error downloading file: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to download file")
 
+# === DERIVED MEDIA ENDPOINTS ===
+
+DERIVATIVE_CACHE_HEADERS = {"Cache-Control": "private, max-age=86400"}
+
+@app.get("/api/v1/files/{file_id}/derivatives")
+async def list_file_derivatives(
+    file_id: str,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """List thumbnails, responsive sizes, previews and HLS playlists of a file"""
+    try:
+        return {"derivatives": await file_service.list_derivatives(file_id, current_user, db)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error listing derivatives: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to list derivatives")
+
+@app.get("/api/v1/files/{file_id}/thumbnail")
+async def get_file_thumbnail(
+    file_id: str,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get the thumbnail of a file"""
+    try:
+        derivative = await file_service.get_derivative(file_id, ["thumbnail"], None, current_user, db)
+        return Response(content=derivative.data, media_type=derivative.content_type, headers=DERIVATIVE_CACHE_HEADERS)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting thumbnail: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get thumbnail")
+
+@app.get("/api/v1/files/{file_id}/derivatives/{kind}/{variant}")
+async def get_file_derivative(
+    file_id: str,
+    kind: str,
+    variant: str,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get a specific derived blob (e.g. responsive/480w, preview/page1)"""
+    try:
+        derivative = await file_service.get_derivative(file_id, [kind], variant, current_user, db)
+        return Response(content=derivative.data, media_type=derivative.content_type, headers=DERIVATIVE_CACHE_HEADERS)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting derivative: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get derivative")
+
+@app.get("/api/v1/files/{file_id}/hls/{variant:path}")
+async def get_hls_rendition(
+    file_id: str,
+    variant: str,
+    current_user: CurrentUser = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Serve HLS playlists and segments; start playback from master.m3u8"""
+    try:
+        derivative = await file_service.get_derivative(
+            file_id, ["hls_playlist", "hls_segment"], variant, current_user, db
+        )
+        return Response(content=derivative.data, media_type=derivative.content_type, headers=DERIVATIVE_CACHE_HEADERS)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting HLS rendition: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get HLS rendition")
+
 @app.put("/api/v1/files/{file_id}", response_model=FileResponse)
 async def update_file(
     file_id: str,
@@ -259,6 +352,8 @@ async def search_files(
     """Search files"""
     try:
         return await file_service.search_files(request, current_user, db)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error searching files: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to search files")
@@ -270,6 +365,7 @@ async def list_files(
     file_type: Optional[str] = Query(None),
     limit: int = Query(20, ge=1, le=100),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None),
     current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -280,10 +376,13 @@ async def list_files(
             entity_id=entity_id,
             file_type=file_type,
             limit=limit,
-            offset=offset
+            offset=offset,
+            cursor=cursor
         )
         
         return await file_service.search_files(search_request, current_user, db)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error listing files: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to list files")
@@ -324,6 +423,14 @@ async def share_file(
         db.commit()
         db.refresh(share_record)
         
+        create_file_activity_log(
+            db=db,
+            file_id=file_id,
+            user_id=current_user.id,
+            action="share",
+            context={"school_id": current_user.school_id}
+        )
+        
         return FileShareResponse.from_orm(share_record)
         
     except HTTPException:
@@ -432,52 +539,10 @@ async def get_file_analytics(
 ):
     """Get file analytics"""
     try:
-        # Basic analytics
-        query = db.query(File).filter(
-            File.school_id == current_user.school_id,
-            File.status != "deleted"
-        )
-        
-        if date_from:
-            query = query.filter(File.created_at >= date_from)
-        if date_to:
-            query = query.filter(File.created_at <= date_to)
-        
-        files = query.all()
-        
-        # Calculate metrics
-        total_files = len(files)
-        total_size = sum(f.file_size for f in files)
-        total_downloads = sum(f.download_count for f in files)
-        
-        # File types distribution
-        file_types = {}
-        for file in files:
-            file_types[file.file_type] = file_types.get(file.file_type, 0) + 1
-        
-        # Top files
-        top_files = sorted(files, key=lambda f: f.download_count, reverse=True)[:10]
-        
-        return FileAnalyticsResponse(
-            total_files=total_files,
-            total_size=total_size,
-            download_count=total_downloads,
-            view_count=0,  # Would need to calculate from analytics
-            share_count=0,  # Would need to calculate from shares
-            file_types=file_types,
-            top_files=[{
-                "file_id": f.file_id,
-                "filename": f.original_filename,
-                "downloads": f.download_count,
-                "size": f.file_size
-            } for f in top_files],
-            usage_trends=[],  # Would need time-series data
-            storage_usage={
-                "total_size": total_size,
-                "file_count": total_files,
-                "average_size": total_size / total_files if total_files > 0 else 0
-            }
+        analytics = storage_stats.get_analytics(
+            db, current_user.school_id, date_from=date_from, date_to=date_to
         )
+        return FileAnalyticsResponse(**analytics)
         
     except Exception as e:
         logger.error(f"Error getting analytics: {str(e)}")
@@ -528,37 +593,26 @@ async def bulk_file_operation(
     """Perform bulk operations on files"""
     try:
         operation_id = f"bulk_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
-        results = []
-        errors = []
-        successful = 0
-        failed = 0
-        
-        for file_id in request.file_ids:
-            try:
-                if request.operation == "delete":
-                    await file_service.delete_file(file_id, current_user, db)
-                    results.append({"file_id": file_id, "status": "deleted"})
-                    successful += 1
-                elif request.operation == "update":
-                    update_request = FileUpdateRequest(**request.parameters)
-                    await file_service.update_file(file_id, update_request, current_user, db)
-                    results.append({"file_id": file_id, "status": "updated"})
-                    successful += 1
-                else:
-                    errors.append({"file_id": file_id, "error": "Unknown operation"})
-                    failed += 1
-                    
-            except Exception as e:
-                errors.append({"file_id": file_id, "error": str(e)})
-                failed += 1
+        
+        if request.operation == "delete":
+            # Soft delete only; blobs are reclaimed by blob_reclaim_worker after the retention window
+            outcome = await file_service.bulk_delete_files(request.file_ids, current_user, db)
+        elif request.operation == "update":
+            update_request = FileUpdateRequest(**request.parameters)
+            outcome = await file_service.bulk_update_files(request.file_ids, update_request, current_user, db)
+        else:
+            outcome = {
+                "results": [],
+                "errors": [{"file_id": file_id, "error": "Unknown operation"} for file_id in request.file_ids]
+            }
         
         return BulkFileOperationResponse(
             operation_id=operation_id,
             total_files=len(request.file_ids),
-            successful=successful,
-            failed=failed,
-            errors=errors,
-            results=results
+            successful=len(outcome["results"]),
+            failed=len(outcome["errors"]),
+            errors=outcome["errors"],
+            results=outcome["results"]
         )
         
     except Exception as e:
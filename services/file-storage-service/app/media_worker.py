@@ -0,0 +1,565 @@
+"""
+EduNerve File Storage Service - Media Processing Worker
+Consumes FileProcessingJob rows and stores thumbnails, responsive sizes,
+PDF previews and HLS renditions as derived blobs, plus extracted search text
+"""
+
+import asyncio
+import functools
+import io
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from PIL import Image, ImageOps
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import Session
+
+try:
+    import fitz  # PyMuPDF
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    PYMUPDF_AVAILABLE = False
+
+from .database import SessionLocal
+from .models import File, FileDerivative, FileProcessingJob, FileStatus
+from .file_service import file_service
+from .search_index import search_index
+from .text_extraction import extract_text
+
+logger = logging.getLogger(__name__)
+
+FFMPEG_BINARY = shutil.which("ffmpeg")
+FFPROBE_BINARY = shutil.which("ffprobe")
+PDFTOPPM_BINARY = shutil.which("pdftoppm")
+
+THUMBNAIL_SIZE = (320, 320)
+PDF_PREVIEW_WIDTH = 960
+IMAGE_OUTPUT_FORMAT = "WEBP"
+IMAGE_OUTPUT_QUALITY = 80
+
+# name -> (height, video bitrate, audio bitrate)
+HLS_RENDITIONS = {
+    "240p": (240, "400k", "64k"),
+    "360p": (360, "800k", "96k"),
+    "480p": (480, "1400k", "128k"),
+    "720p": (720, "2800k", "128k"),
+    "1080p": (1080, "5000k", "192k"),
+}
+DEFAULT_HLS_RENDITIONS = ["360p", "480p", "720p"]
+HLS_SEGMENT_SECONDS = 6
+
+
+def _parse_bitrate(bitrate: str) -> int:
+    """Convert an ffmpeg bitrate string such as 800k into bits per second"""
+    if bitrate.endswith("k"):
+        return int(bitrate[:-1]) * 1000
+    if bitrate.endswith("M"):
+        return int(bitrate[:-1]) * 1000000
+    return int(bitrate)
+
+
+def _encode_image(image: Image.Image, kind: str, variant: str) -> Dict[str, Any]:
+    """Encode a Pillow image into a derivative record"""
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=IMAGE_OUTPUT_FORMAT, quality=IMAGE_OUTPUT_QUALITY, method=4)
+    return {
+        "kind": kind,
+        "variant": variant,
+        "content_type": "image/webp",
+        "width": image.width,
+        "height": image.height,
+        "data": buffer.getvalue()
+    }
+
+
+def _thumbnail(image: Image.Image, size) -> Dict[str, Any]:
+    """Create a bounded thumbnail derivative"""
+    thumb = image.copy()
+    thumb.thumbnail(tuple(size), Image.LANCZOS)
+    return _encode_image(thumb, "thumbnail", f"{thumb.width}x{thumb.height}")
+
+
+# === CPU-BOUND HANDLERS (run inside the process pool) ===
+
+def process_image(file_data: bytes, parameters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Generate a thumbnail and downscaled responsive widths for an image"""
+    image = Image.open(io.BytesIO(file_data))
+    image = ImageOps.exif_transpose(image)
+    image.load()
+
+    outputs = [_thumbnail(image, parameters.get("thumbnail_size", THUMBNAIL_SIZE))]
+
+    for width in sorted(set(parameters.get("widths", []))):
+        # Never upscale; the original already serves the largest size
+        if width >= image.width:
+            continue
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        outputs.append(_encode_image(resized, "responsive", f"{width}w"))
+
+    return outputs
+
+
+def _render_pdf_first_page(file_data: bytes, width: int) -> Image.Image:
+    """Rasterize the first page of a PDF with PyMuPDF or poppler"""
+    if PYMUPDF_AVAILABLE:
+        document = fitz.open(stream=file_data, filetype="pdf")
+        try:
+            page = document.load_page(0)
+            zoom = width / page.rect.width
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+            return Image.open(io.BytesIO(pixmap.tobytes("png")))
+        finally:
+            document.close()
+
+    if PDFTOPPM_BINARY:
+        with tempfile.TemporaryDirectory() as workdir:
+            source_path = os.path.join(workdir, "source.pdf")
+            output_prefix = os.path.join(workdir, "page")
+            with open(source_path, "wb") as source:
+                source.write(file_data)
+            subprocess.run(
+                [
+                    PDFTOPPM_BINARY, "-png", "-f", "1", "-l", "1", "-singlefile",
+                    "-scale-to-x", str(width), "-scale-to-y", "-1",
+                    source_path, output_prefix
+                ],
+                check=True,
+                capture_output=True,
+                timeout=120
+            )
+            with open(f"{output_prefix}.png", "rb") as rendered:
+                image = Image.open(io.BytesIO(rendered.read()))
+                image.load()
+                return image
+
+    raise RuntimeError("No PDF renderer available (install PyMuPDF or poppler-utils)")
+
+
+def process_pdf(file_data: bytes, parameters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Generate a first-page preview and thumbnail for a PDF"""
+    page = _render_pdf_first_page(file_data, parameters.get("preview_width", PDF_PREVIEW_WIDTH))
+    return [
+        _encode_image(page, "preview", "page1"),
+        _thumbnail(page, parameters.get("thumbnail_size", THUMBNAIL_SIZE))
+    ]
+
+
+def _probe_video_height(source_path: str) -> Optional[int]:
+    """Return the height of the first video stream, if ffprobe is installed"""
+    if not FFPROBE_BINARY:
+        return None
+
+    result = subprocess.run(
+        [
+            FFPROBE_BINARY, "-v", "error", "-select_streams", "v:0",
+            "-show_entries", "stream=height", "-of", "csv=p=0", source_path
+        ],
+        capture_output=True,
+        text=True,
+        timeout=60
+    )
+    try:
+        return int(result.stdout.strip().splitlines()[0])
+    except (ValueError, IndexError):
+        return None
+
+
+def process_video(file_data: bytes, parameters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Transcode a video into HLS renditions plus a poster thumbnail with ffmpeg"""
+    if not FFMPEG_BINARY:
+        raise RuntimeError("ffmpeg is not available")
+
+    outputs = []
+    requested = [name for name in parameters.get("renditions", DEFAULT_HLS_RENDITIONS) if name in HLS_RENDITIONS]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source_path = os.path.join(workdir, "source")
+        with open(source_path, "wb") as source:
+            source.write(file_data)
+
+        # Skip renditions above the source resolution, but always keep the smallest one
+        source_height = _probe_video_height(source_path)
+        renditions = sorted(requested, key=lambda name: HLS_RENDITIONS[name][0])
+        if source_height:
+            renditions = [name for name in renditions if HLS_RENDITIONS[name][0] <= source_height] or renditions[:1]
+
+        master_lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+
+        for name in renditions:
+            height, video_bitrate, audio_bitrate = HLS_RENDITIONS[name]
+            rendition_dir = os.path.join(workdir, name)
+            os.makedirs(rendition_dir)
+
+            subprocess.run(
+                [
+                    FFMPEG_BINARY, "-y", "-v", "error", "-i", source_path,
+                    "-vf", f"scale=-2:{height}",
+                    "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main",
+                    "-b:v", video_bitrate, "-maxrate", video_bitrate,
+                    "-bufsize", f"{_parse_bitrate(video_bitrate) * 2 // 1000}k",
+                    "-c:a", "aac", "-b:a", audio_bitrate, "-ac", "2",
+                    "-hls_time", str(HLS_SEGMENT_SECONDS),
+                    "-hls_playlist_type", "vod",
+                    "-hls_segment_filename", os.path.join(rendition_dir, "seg_%04d.ts"),
+                    os.path.join(rendition_dir, "index.m3u8")
+                ],
+                check=True,
+                capture_output=True,
+                timeout=parameters.get("timeout", 3600)
+            )
+
+            for filename in sorted(os.listdir(rendition_dir)):
+                with open(os.path.join(rendition_dir, filename), "rb") as rendered:
+                    is_playlist = filename.endswith(".m3u8")
+                    outputs.append({
+                        "kind": "hls_playlist" if is_playlist else "hls_segment",
+                        "variant": f"{name}/{filename}",
+                        "content_type": "application/vnd.apple.mpegurl" if is_playlist else "video/mp2t",
+                        "height": height,
+                        "data": rendered.read()
+                    })
+
+            bandwidth = _parse_bitrate(video_bitrate) + _parse_bitrate(audio_bitrate)
+            master_lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},NAME=\"{name}\"")
+            master_lines.append(f"{name}/index.m3u8")
+
+        outputs.append({
+            "kind": "hls_playlist",
+            "variant": "master.m3u8",
+            "content_type": "application/vnd.apple.mpegurl",
+            "data": ("\n".join(master_lines) + "\n").encode()
+        })
+
+        # Poster frame for the player and file listings
+        poster_path = os.path.join(workdir, "poster.png")
+        poster = subprocess.run(
+            [
+                FFMPEG_BINARY, "-y", "-v", "error", "-ss", str(parameters.get("poster_offset", 1)),
+                "-i", source_path, "-frames:v", "1", poster_path
+            ],
+            capture_output=True,
+            timeout=120
+        )
+        if poster.returncode == 0 and os.path.exists(poster_path):
+            with Image.open(poster_path) as frame:
+                frame.load()
+                outputs.append(_thumbnail(frame, parameters.get("thumbnail_size", THUMBNAIL_SIZE)))
+
+    return outputs
+
+
+JOB_HANDLERS: Dict[str, Callable[[bytes, Dict[str, Any]], List[Dict[str, Any]]]] = {
+    "image_processing": process_image,
+    "pdf_preview": process_pdf,
+    "video_transcode": process_video,
+    "extract_text": extract_text,
+}
+
+
+def supported_job_types() -> List[str]:
+    """Job types this host has the tooling to run"""
+    job_types = ["image_processing", "extract_text"]
+    if PYMUPDF_AVAILABLE or PDFTOPPM_BINARY:
+        job_types.append("pdf_preview")
+    if FFMPEG_BINARY:
+        job_types.append("video_transcode")
+    return job_types
+
+
+# === JOB QUEUE CONSUMER ===
+
+class MediaProcessingWorker:
+    """Claims processing jobs with a lease and runs them in a process pool"""
+
+    def __init__(
+        self,
+        processes: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        lease_seconds: Optional[int] = None,
+        poll_interval: Optional[float] = None
+    ):
+        self.worker_id = f"media_{socket.gethostname()}_{os.getpid()}"
+        self.processes = processes or int(os.getenv("MEDIA_WORKER_PROCESSES", str(max(1, (os.cpu_count() or 2) - 1))))
+        self.batch_size = batch_size or int(os.getenv("MEDIA_WORKER_BATCH_SIZE", str(self.processes * 2)))
+        self.lease_seconds = lease_seconds or int(os.getenv("MEDIA_JOB_LEASE_SECONDS", "300"))
+        self.poll_interval = poll_interval or float(os.getenv("MEDIA_WORKER_POLL_INTERVAL", "2"))
+        self.job_types = supported_job_types()
+        self.running = False
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.task: Optional[asyncio.Task] = None
+        self.in_flight: set = set()
+
+    async def start(self):
+        """Start consuming jobs"""
+        if self.running:
+            logger.warning("Media worker already running")
+            return
+
+        self.running = True
+        self.executor = ProcessPoolExecutor(max_workers=self.processes)
+        self.task = asyncio.create_task(self._run())
+        logger.info(
+            f"Started media worker {self.worker_id} with {self.processes} processes "
+            f"for job types {', '.join(self.job_types)}"
+        )
+
+    async def stop(self):
+        """Stop consuming jobs; unfinished leases expire and are picked up elsewhere"""
+        if not self.running:
+            return
+
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        if self.in_flight:
+            await asyncio.gather(*self.in_flight, return_exceptions=True)
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        logger.info(f"Media worker {self.worker_id} stopped")
+
+    async def _run(self):
+        """Poll loop: claim up to the free capacity and dispatch jobs"""
+        while self.running:
+            try:
+                capacity = self.batch_size - len(self.in_flight)
+                claimed = []
+                if capacity > 0:
+                    db = SessionLocal()
+                    try:
+                        claimed = self.claim_jobs(db, limit=capacity)
+                    finally:
+                        db.close()
+
+                for job_pk in claimed:
+                    task = asyncio.create_task(self._process_job(job_pk))
+                    self.in_flight.add(task)
+                    task.add_done_callback(self.in_flight.discard)
+
+                if not claimed:
+                    await asyncio.sleep(self.poll_interval)
+                elif capacity - len(claimed) <= 0:
+                    # Pool is saturated; wait for a slot to free up
+                    await asyncio.wait(self.in_flight, return_when=asyncio.FIRST_COMPLETED)
+
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in media worker loop: {str(e)}")
+                await asyncio.sleep(self.poll_interval * 5)
+
+    def claim_jobs(self, db: Session, limit: int) -> List[int]:
+        """Atomically lease pending or expired jobs to this worker"""
+        now = datetime.utcnow()
+
+        # Jobs whose lease expired after the last allowed attempt are given up on
+        db.execute(
+            update(FileProcessingJob)
+            .where(
+                FileProcessingJob.status == "running",
+                FileProcessingJob.locked_until < now,
+                FileProcessingJob.attempts >= FileProcessingJob.max_attempts
+            )
+            .values(status="failed", error_message="Lease expired after final attempt", locked_by=None, locked_until=None)
+        )
+
+        claimable = and_(
+            FileProcessingJob.job_type.in_(self.job_types),
+            FileProcessingJob.attempts < FileProcessingJob.max_attempts,
+            or_(
+                FileProcessingJob.status == "pending",
+                and_(FileProcessingJob.status == "running", FileProcessingJob.locked_until < now)
+            )
+        )
+
+        query = db.query(FileProcessingJob.id).filter(claimable).order_by(FileProcessingJob.created_at).limit(limit)
+        if db.bind.dialect.name == "postgresql":
+            query = query.with_for_update(skip_locked=True)
+        candidate_ids = [row.id for row in query.all()]
+
+        # Compare-and-set per row so competing workers on non-locking backends never double-claim
+        claimed = []
+        lease_until = now + timedelta(seconds=self.lease_seconds)
+        for job_pk in candidate_ids:
+            result = db.execute(
+                update(FileProcessingJob)
+                .where(FileProcessingJob.id == job_pk, claimable)
+                .values(
+                    status="running",
+                    locked_by=self.worker_id,
+                    locked_until=lease_until,
+                    attempts=FileProcessingJob.attempts + 1,
+                    started_at=now
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                claimed.append(job_pk)
+
+        db.commit()
+        return claimed
+
+    def _extend_lease(self, job_pk: int) -> bool:
+        """Push out the lease on a job this worker still owns"""
+        db = SessionLocal()
+        try:
+            result = db.execute(
+                update(FileProcessingJob)
+                .where(FileProcessingJob.id == job_pk, FileProcessingJob.locked_by == self.worker_id)
+                .values(locked_until=datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+            )
+            db.commit()
+            return result.rowcount == 1
+        finally:
+            db.close()
+
+    async def _heartbeat(self, job_pk: int):
+        """Keep the lease alive while a long transcode runs"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not self._extend_lease(job_pk):
+                logger.warning(f"Lost lease on processing job {job_pk}")
+                return
+
+    async def _process_job(self, job_pk: int):
+        """Run one claimed job and persist its outputs"""
+        db = SessionLocal()
+        heartbeat = asyncio.create_task(self._heartbeat(job_pk))
+        try:
+            job = db.query(FileProcessingJob).filter(FileProcessingJob.id == job_pk).first()
+            source = db.query(File).filter(File.file_id == job.file_id).first()
+
+            if not source or source.status == FileStatus.DELETED:
+                self._finish_job(db, job, "failed", error="Source file no longer exists")
+                return
+
+            file_data = file_service._decrypt_file_data(source.file_data, source.is_encrypted)
+            handler = functools.partial(JOB_HANDLERS[job.job_type], file_data, job.parameters or {})
+            started = datetime.utcnow()
+
+            outputs = await asyncio.get_running_loop().run_in_executor(self.executor, handler)
+
+            # Text outputs feed the search index rather than the derivative store
+            texts = [output["text"] for output in outputs if output["kind"] == "text"]
+            derivatives = self._store_derivatives(db, job, [output for output in outputs if output["kind"] != "text"])
+            if texts:
+                source.extracted_text = "\n".join(texts)
+                search_index.index_file(
+                    db, source.file_id, source.original_filename, source.description, source.extracted_text
+                )
+            job.output_metadata = {
+                "derivatives": derivatives,
+                "text_length": sum(len(text) for text in texts),
+                "processing_seconds": (datetime.utcnow() - started).total_seconds()
+            }
+            source.processing_log = {
+                **(source.processing_log or {}),
+                job.job_type: {"status": "completed", "job_id": job.job_id, "completed_at": datetime.utcnow().isoformat()}
+            }
+            if self._finish_job(db, job, "completed"):
+                logger.info(f"Processing job {job.job_id} ({job.job_type}) produced {len(derivatives)} derivatives")
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Processing job {job_pk} failed: {str(e)}")
+            job = db.query(FileProcessingJob).filter(FileProcessingJob.id == job_pk).first()
+            if job:
+                # Retry on the next claim until attempts are exhausted
+                final = (job.attempts or 0) >= (job.max_attempts or 1)
+                self._finish_job(db, job, "failed" if final else "pending", error=str(e))
+        finally:
+            heartbeat.cancel()
+            db.close()
+
+    def _store_derivatives(self, db: Session, job: FileProcessingJob, outputs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Replace the derivatives of this file with the newly produced blobs"""
+        if not outputs:
+            return []
+
+        kinds = {output["kind"] for output in outputs}
+        db.query(FileDerivative).filter(
+            FileDerivative.file_id == job.file_id,
+            FileDerivative.kind.in_(kinds)
+        ).delete(synchronize_session=False)
+
+        summary = []
+        for output in outputs:
+            db.add(FileDerivative(
+                file_id=job.file_id,
+                job_id=job.job_id,
+                kind=output["kind"],
+                variant=output["variant"],
+                content_type=output.get("content_type"),
+                width=output.get("width"),
+                height=output.get("height"),
+                file_size=len(output["data"]),
+                data=output["data"]
+            ))
+            if output["kind"] != "hls_segment":
+                summary.append({
+                    "kind": output["kind"],
+                    "variant": output["variant"],
+                    "size": len(output["data"])
+                })
+        return summary
+
+    def _finish_job(self, db: Session, job: FileProcessingJob, status: str, error: Optional[str] = None) -> bool:
+        """Release the lease and record the final state of a run, if this worker still holds the lease"""
+        now = datetime.utcnow()
+        job_pk, job_id = job.id, job.job_id
+        values = {"status": status, "error_message": error, "locked_by": None, "locked_until": None}
+        if status == "completed":
+            values.update(progress=100, completed_at=now)
+        elif status == "failed":
+            values["completed_at"] = now
+
+        result = db.execute(
+            update(FileProcessingJob)
+            .where(
+                FileProcessingJob.id == job_pk,
+                FileProcessingJob.status == "running",
+                FileProcessingJob.locked_by == self.worker_id,
+                FileProcessingJob.locked_until >= now
+            )
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount != 1:
+            # Another worker reclaimed the job; its run owns the outputs now
+            db.rollback()
+            logger.warning(f"Lease on processing job {job_id} lost before finishing; discarding results")
+            return False
+
+        db.commit()
+        return True
+
+
+# Global worker instance
+media_worker = MediaProcessingWorker()
+
+async def run_media_worker():
+    """Run the media worker until cancelled"""
+    await media_worker.start()
+    try:
+        while media_worker.running:
+            await asyncio.sleep(3600)
+    finally:
+        await media_worker.stop()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_media_worker())
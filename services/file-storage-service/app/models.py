@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, BigInteger, Enum
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Boolean, ForeignKey, BigInteger, Enum, JSON, LargeBinary, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -54,6 +54,7 @@ class File(Base):
     download_count = Column(Integer, default=0)
     description = Column(Text)
     tags = Column(String(500))
+    extracted_text = Column(Text)  # Document text from the media worker, indexed for search
     status = Column(Enum(FileStatus), default=FileStatus.UPLOADED)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -103,15 +104,45 @@ class FileProcessingJob(Base):
     __tablename__ = "file_processing_jobs"
     
     id = Column(Integer, primary_key=True, index=True)
-    file_id = Column(Integer, ForeignKey("files.id"))
-    job_type = Column(String(50), nullable=False)  # thumbnail, conversion, analysis
-    status = Column(Enum(FileStatus), default=FileStatus.PROCESSING)
+    job_id = Column(String(36), unique=True, index=True)
+    file_id = Column(String(36), index=True)  # Public file_id of the source file
+    job_type = Column(String(50), nullable=False)  # image_processing, pdf_preview, video_transcode
+    parameters = Column(JSON)
+    status = Column(String(20), default="pending", index=True)  # pending, running, completed, failed
     progress = Column(Integer, default=0)
     result_data = Column(Text)
+    output_metadata = Column(JSON)
     error_message = Column(Text)
-    started_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Lease: a worker owns a running job until locked_until, after which it can be reclaimed
+    locked_by = Column(String(100))
+    locked_until = Column(DateTime, index=True)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
     completed_at = Column(DateTime)
 
+class FileDerivative(Base):
+    """Blob derived from an original file (thumbnail, responsive size, preview, HLS rendition)"""
+    __tablename__ = "file_derivatives"
+    __table_args__ = (
+        UniqueConstraint("file_id", "kind", "variant", name="uq_file_derivative_variant"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    file_id = Column(String(36), index=True, nullable=False)  # Original file
+    job_id = Column(String(36))  # Processing job that produced it
+    kind = Column(String(30), nullable=False)  # thumbnail, responsive, preview, hls_playlist, hls_segment
+    variant = Column(String(100), nullable=False)  # e.g. 320w, page1, 480p/index.m3u8
+    content_type = Column(String(100))
+    width = Column(Integer)
+    height = Column(Integer)
+    file_size = Column(BigInteger, default=0)
+    data = Column(LargeBinary)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class FileCollection(Base):
     __tablename__ = "file_collections"
     
@@ -133,15 +164,66 @@ class FileAnalytics(Base):
     user_agent = Column(String(500))
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class FileStorageCounter(Base):
+    """Running per-school, per-type storage totals maintained on upload and delete"""
+    __tablename__ = "file_storage_counters"
+    __table_args__ = (
+        UniqueConstraint("school_id", "file_type", name="uq_storage_counter_school_type"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    school_id = Column(Integer, index=True, nullable=False)
+    file_type = Column(String(50), nullable=False)
+    file_count = Column(BigInteger, default=0, nullable=False)
+    total_size = Column(BigInteger, default=0, nullable=False)
+    download_count = Column(BigInteger, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class FileUsageDaily(Base):
+    """Daily per-school usage rollup used for analytics trends"""
+    __tablename__ = "file_usage_daily"
+    __table_args__ = (
+        UniqueConstraint("school_id", "usage_date", name="uq_usage_daily_school_date"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    school_id = Column(Integer, index=True, nullable=False)
+    usage_date = Column(Date, index=True, nullable=False)
+    uploads = Column(Integer, default=0)
+    deletes = Column(Integer, default=0)
+    downloads = Column(Integer, default=0)
+    views = Column(Integer, default=0)
+    shares = Column(Integer, default=0)
+    # Storage snapshot at rollup time
+    file_count = Column(BigInteger, default=0)
+    total_size = Column(BigInteger, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ServiceMarker(Base):
+    """One-off maintenance steps that have completed, e.g. the storage counter backfill"""
+    __tablename__ = "service_markers"
+    
+    name = Column(String(100), primary_key=True)
+    completed_at = Column(DateTime, default=datetime.utcnow)
+
 class FileQuota(Base):
     __tablename__ = "file_quotas"
+    __table_args__ = (
+        UniqueConstraint("entity_type", "entity_id", name="uq_file_quota_entity"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), unique=True)
+    entity_type = Column(String(20), nullable=False)  # user, school
+    entity_id = Column(Integer, nullable=False)
     total_quota = Column(BigInteger, default=1073741824)  # 1GB default
-    used_quota = Column(BigInteger, default=0)
+    used_quota = Column(BigInteger, default=0, nullable=False)
     file_count_limit = Column(Integer, default=1000)
-    current_file_count = Column(Integer, default=0)
+    file_count_used = Column(Integer, default=0, nullable=False)
+    quota_by_type = Column(JSON, default=dict)
+    auto_cleanup = Column(Boolean, default=False)
+    warning_threshold = Column(Integer, default=80)  # Percentage
+    last_reconciled_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class FileBackup(Base):
@@ -0,0 +1,241 @@
+"""
+EduNerve File Storage Service - Quota Accounting
+Atomic quota reservation, release and periodic reconciliation
+"""
+
+import asyncio
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import File, FileQuota, FileStatus
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceededError(HTTPException):
+    """Raised when a reservation would push a user or school over its quota"""
+
+    def __init__(self, entity_type: str):
+        super().__init__(status_code=413, detail=f"{entity_type.capitalize()} quota exceeded")
+        self.entity_type = entity_type
+
+
+class QuotaManager:
+    """Quota accounting built on single conditional UPDATE statements
+
+    Space is reserved with ``used + n <= total`` evaluated inside the UPDATE, so
+    concurrent uploads can never overshoot and no read-modify-write happens in Python.
+    Entities without a quota row are unlimited.
+    """
+
+    def __init__(self, model=None):
+        self.model = model or File
+
+    def _owner_columns(self) -> Dict[str, Any]:
+        """Columns of the file model that identify the owner of each quota scope
+
+        Scopes whose column is not mapped are left alone by reconciliation rather
+        than being reset to zero.
+        """
+        columns = {"user": self.model.uploaded_by}
+        school_id = getattr(self.model, "school_id", None)
+        if school_id is not None:
+            columns["school"] = school_id
+        return columns
+
+    def _scopes(self, user_id: int, school_id: Optional[int]) -> List[Tuple[str, int]]:
+        scopes = [("user", user_id)]
+        if school_id is not None:
+            scopes.append(("school", school_id))
+        return scopes
+
+    def _try_reserve(self, db: Session, entity_type: str, entity_id: int, size: int, count: int) -> bool:
+        """Conditionally add usage to one quota row; False only if the row exists and is full"""
+        stmt = (
+            update(FileQuota)
+            .where(
+                FileQuota.entity_type == entity_type,
+                FileQuota.entity_id == entity_id,
+                FileQuota.used_quota + size <= FileQuota.total_quota,
+                (FileQuota.file_count_limit.is_(None)) |
+                (FileQuota.file_count_used + count <= FileQuota.file_count_limit)
+            )
+            .values(
+                used_quota=FileQuota.used_quota + size,
+                file_count_used=FileQuota.file_count_used + count,
+                updated_at=datetime.utcnow()
+            )
+            .returning(FileQuota.used_quota)
+            .execution_options(synchronize_session=False)
+        )
+        if db.execute(stmt).first() is not None:
+            return True
+
+        # Nothing updated: either the quota is full or the entity has no quota row
+        exists = db.query(FileQuota.id).filter(
+            FileQuota.entity_type == entity_type,
+            FileQuota.entity_id == entity_id
+        ).first()
+        return exists is None
+
+    def reserve(self, db: Session, user_id: int, school_id: Optional[int], size: int, count: int = 1):
+        """Reserve space for the user and school in one short transaction
+
+        The reservation is committed immediately so the quota rows are not locked
+        while the blob itself is written.
+        """
+        try:
+            for entity_type, entity_id in self._scopes(user_id, school_id):
+                if not self._try_reserve(db, entity_type, entity_id, size, count):
+                    raise QuotaExceededError(entity_type)
+            db.commit()
+        except Exception:
+            # Undo any scope that was already reserved in this transaction
+            db.rollback()
+            raise
+
+    def release(
+        self,
+        db: Session,
+        user_id: int,
+        school_id: Optional[int],
+        size: int,
+        count: int = 1,
+        commit: bool = True
+    ):
+        """Give back previously reserved space (failed upload or deleted file)"""
+        self.release_usage(
+            db,
+            {scope: (size, count) for scope in self._scopes(user_id, school_id)},
+            commit=commit
+        )
+
+    def release_usage(
+        self,
+        db: Session,
+        usage: Dict[Tuple[str, int], Tuple[int, int]],
+        commit: bool = True
+    ):
+        """Give back space for many scopes at once, keyed by (entity_type, entity_id)
+
+        Used by bulk deletes so each owner and school is updated once, not once per file.
+        """
+        now = datetime.utcnow()
+        for (entity_type, entity_id), (size, count) in usage.items():
+            db.execute(
+                update(FileQuota)
+                .where(FileQuota.entity_type == entity_type, FileQuota.entity_id == entity_id)
+                .values(
+                    used_quota=FileQuota.used_quota - size,
+                    file_count_used=FileQuota.file_count_used - count,
+                    updated_at=now
+                )
+                .execution_options(synchronize_session=False)
+            )
+        if commit:
+            db.commit()
+
+    @contextmanager
+    def reservation(
+        self,
+        db: Session,
+        user_id: int,
+        school_id: Optional[int],
+        size: int,
+        count: int = 1
+    ) -> Iterator[None]:
+        """Reserve space for the duration of a block and release it if the block fails"""
+        self.reserve(db, user_id, school_id, size, count)
+        try:
+            yield
+        except BaseException:
+            db.rollback()
+            self.release(db, user_id, school_id, size, count)
+            raise
+
+    def reconcile(self, db: Session, grace_seconds: int = 300) -> Dict[str, int]:
+        """Reset quota usage to the sizes of files actually stored
+
+        Corrects drift from crashed uploads or releases that never ran. Rows touched
+        within the grace period are skipped because they may hold in-flight reservations.
+        """
+        model = self.model
+        usage = {
+            entity_type: db.query(
+                column.label("entity_id"),
+                func.coalesce(func.sum(model.file_size), 0).label("used"),
+                func.count(model.id).label("files")
+            ).filter(
+                column.isnot(None),
+                model.status != FileStatus.DELETED
+            ).group_by(column).all()
+            for entity_type, column in self._owner_columns().items()
+        }
+
+        corrected = {}
+        now = datetime.utcnow()
+        settled_before = now - timedelta(seconds=grace_seconds)
+        for entity_type, rows in usage.items():
+            actual = {row.entity_id: (int(row.used), int(row.files)) for row in rows}
+            quotas = db.query(
+                FileQuota.id, FileQuota.entity_id, FileQuota.used_quota, FileQuota.file_count_used
+            ).filter(
+                FileQuota.entity_type == entity_type,
+                FileQuota.updated_at < settled_before
+            ).all()
+
+            drifted = 0
+            for quota in quotas:
+                used, files = actual.get(quota.entity_id, (0, 0))
+                if (quota.used_quota, quota.file_count_used) == (used, files):
+                    continue
+                drifted += 1
+                # Compare-and-set so uploads committed since the read are not overwritten
+                db.execute(
+                    update(FileQuota)
+                    .where(
+                        FileQuota.id == quota.id,
+                        FileQuota.used_quota == quota.used_quota,
+                        FileQuota.file_count_used == quota.file_count_used
+                    )
+                    .values(used_quota=used, file_count_used=files, last_reconciled_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+            corrected[entity_type] = drifted
+
+        db.commit()
+        return corrected
+
+
+# Initialize manager
+quota_manager = QuotaManager()
+
+async def quota_reconciliation_worker():
+    """Periodically reconcile quota usage with stored files"""
+    interval = int(os.getenv("QUOTA_RECONCILE_INTERVAL", "3600"))
+    grace_seconds = int(os.getenv("QUOTA_RECONCILE_GRACE", "300"))
+
+    while True:
+        try:
+            await asyncio.sleep(interval)
+
+            db = SessionLocal()
+            try:
+                corrected = quota_manager.reconcile(db, grace_seconds)
+                if any(corrected.values()):
+                    logger.info(f"Quota reconciliation corrected {corrected}")
+            finally:
+                db.close()
+
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.error(f"Error in quota reconciliation worker: {str(e)}")
@@ -94,15 +94,19 @@ class FileSearchRequest(BaseModel):
     date_to: Optional[datetime] = Field(None, description="Date range end")
     access_level: Optional[AccessLevel] = Field(None, description="Filter by access level")
     limit: int = Field(20, ge=1, le=100, description="Number of results")
-    offset: int = Field(0, ge=0, description="Results offset")
+    offset: int = Field(0, ge=0, description="Results offset (prefer cursor)")
+    cursor: Optional[str] = Field(None, description="Cursor from the previous page's next_cursor")
+    exact_total: bool = Field(False, description="Count all matches exactly instead of estimating")
 
 class FileSearchResponse(BaseModel):
     """File search response"""
     files: List[FileResponse]
     total: int
+    total_is_estimate: bool = False
     limit: int
     offset: int
     has_more: bool
+    next_cursor: Optional[str] = None
 
 # === FILE PROCESSING SCHEMAS ===
 
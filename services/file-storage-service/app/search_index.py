@@ -0,0 +1,326 @@
+"""
+EduNerve File Storage Service - Search Index
+Full-text and tag indexing for file search with keyset pagination
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Any, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Column, Float, MetaData, String, Table, Text, and_, cast, func, literal_column, or_, select, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Query, Session
+
+from .models import File
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for the SQLite fallback count; Postgres uses the planner estimate instead
+COUNT_ESTIMATE_CAP = 1000
+
+# Extracted text beyond this many characters adds little to ranking but bloats the index
+MAX_INDEXED_TEXT = 200000
+
+# Signs pagination cursors so clients cannot forge or retarget them
+CURSOR_SECRET = os.getenv("SEARCH_CURSOR_SECRET") or os.getenv("JWT_SECRET_KEY") or os.getenv("SECRET_KEY")
+
+# 'simple' keeps indexing language-agnostic and makes prefix matching predictable
+POSTGRES_SEARCH_CONFIG = "simple"
+
+POSTGRES_DDL = [
+    "ALTER TABLE files ADD COLUMN IF NOT EXISTS extracted_text TEXT",
+    f"""
+    ALTER TABLE files ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{POSTGRES_SEARCH_CONFIG}', coalesce(original_filename, '')), 'A') ||
+        setweight(to_tsvector('{POSTGRES_SEARCH_CONFIG}', coalesce(description, '')), 'B') ||
+        setweight(to_tsvector('{POSTGRES_SEARCH_CONFIG}', left(coalesce(extracted_text, ''), {MAX_INDEXED_TEXT})), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_files_search_vector ON files USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_files_tags ON files USING gin ((CAST(tags AS jsonb)) jsonb_path_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_files_school_created ON files (school_id, created_at DESC, id DESC)",
+]
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+        file_id UNINDEXED, filename, description, extracted_text, tokenize = 'unicode61'
+    )
+    """,
+]
+
+# The SQLite FTS5 table is managed by setup(), not by the declarative metadata
+files_fts = Table(
+    "files_fts",
+    MetaData(),
+    Column("file_id", String(36)),
+    Column("filename", Text),
+    Column("description", Text),
+    Column("extracted_text", Text),
+)
+
+_TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a pagination cursor is malformed, tampered with, or from another search"""
+
+
+def _search_terms(query: str) -> List[str]:
+    """Split a user query into word terms, dropping operators and punctuation"""
+    return _TERM_PATTERN.findall(query.lower())[:16]
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _signature(payload: bytes) -> bytes:
+    return hmac.new(CURSOR_SECRET.encode(), payload, hashlib.sha256).digest()[:16]
+
+
+class FileSearchIndex:
+    """Dialect-aware full-text and tag search over the files table
+
+    Postgres keeps a generated tsvector column with GIN indexes, so no application
+    maintenance is needed. SQLite (development and tests) uses an FTS5 table that is
+    kept in sync through index_file and remove_files.
+    """
+
+    def __init__(self, model=None):
+        self.model = model or File
+
+    def _dialect(self, db: Session) -> str:
+        return db.bind.dialect.name
+
+    def setup(self, engine: Engine):
+        """Create the search column, FTS table and indexes if they are missing"""
+        if not CURSOR_SECRET:
+            # Unsigned cursors could be forged, so the service must not start without a key
+            raise RuntimeError("SEARCH_CURSOR_SECRET or JWT_SECRET_KEY must be set to sign search cursors")
+        statements = {"postgresql": POSTGRES_DDL, "sqlite": SQLITE_DDL}.get(engine.dialect.name, [])
+        with engine.begin() as conn:
+            for statement in statements:
+                try:
+                    conn.execute(text(statement))
+                except Exception as e:
+                    logger.warning(f"Search index setup statement failed: {str(e)}")
+
+    # === INDEX MAINTENANCE ===
+
+    def index_file(
+        self,
+        db: Session,
+        file_id: str,
+        filename: Optional[str],
+        description: Optional[str],
+        extracted_text: Optional[str]
+    ):
+        """Add or refresh one file's document in the caller's transaction"""
+        if self._dialect(db) != "sqlite":
+            return
+
+        db.execute(files_fts.delete().where(files_fts.c.file_id == file_id))
+        db.execute(files_fts.insert().values(
+            file_id=file_id,
+            filename=filename or "",
+            description=description or "",
+            extracted_text=(extracted_text or "")[:MAX_INDEXED_TEXT]
+        ))
+
+    def index_files(self, db: Session, records: Iterable[Any]):
+        """Index several File rows (or rows with the same attributes) at once"""
+        if self._dialect(db) != "sqlite":
+            return
+
+        for record in records:
+            self.index_file(
+                db,
+                record.file_id,
+                record.original_filename,
+                record.description,
+                getattr(record, "extracted_text", None)
+            )
+
+    def reindex(self, db: Session, file_ids: List[str]):
+        """Refresh the documents of files whose searchable columns changed in bulk"""
+        if self._dialect(db) != "sqlite" or not file_ids:
+            return
+
+        model = self.model
+        rows = db.query(
+            model.file_id, model.original_filename, model.description, model.extracted_text
+        ).filter(model.file_id.in_(file_ids)).all()
+        self.index_files(db, rows)
+
+    def remove_files(self, db: Session, file_ids: List[str]):
+        """Drop the documents of deleted files"""
+        if self._dialect(db) != "sqlite" or not file_ids:
+            return
+
+        db.execute(files_fts.delete().where(files_fts.c.file_id.in_(file_ids)))
+
+    # === QUERYING ===
+
+    def apply_text_search(self, db: Session, query: Query, search: str) -> Tuple[Query, Any]:
+        """Restrict a File query to full-text matches; returns the query and a rank expression
+
+        The rank expression sorts descending (higher is better) on every backend.
+        """
+        terms = _search_terms(search)
+        if not terms:
+            return query, None
+
+        dialect = self._dialect(db)
+        if dialect == "postgresql":
+            # Prefix match each term so partial words behave like the old ILIKE search
+            tsquery = func.to_tsquery(POSTGRES_SEARCH_CONFIG, " & ".join(f"{term}:*" for term in terms))
+            vector = literal_column("files.search_vector")
+            # Double precision so the rank survives the cursor round trip exactly
+            rank = cast(func.ts_rank_cd(vector, tsquery), Float)
+            return query.filter(vector.op("@@")(tsquery)), rank
+
+        if dialect == "sqlite":
+            match = " ".join(f'"{term}"*' for term in terms)
+            # bm25 is lower-is-better, negate it so every backend ranks descending
+            rank = -func.bm25(literal_column("files_fts"))
+            query = query.join(files_fts, files_fts.c.file_id == self.model.file_id).filter(
+                literal_column("files_fts").op("MATCH")(match)
+            )
+            return query, rank
+
+        return query.filter(or_(*[self.model.original_filename.ilike(f"%{term}%") for term in terms])), None
+
+    def apply_tag_filter(self, db: Session, query: Query, tags: List[str]) -> Query:
+        """Require every tag with a single indexed containment predicate where supported"""
+        tags = [tag for tag in tags if tag]
+        if not tags:
+            return query
+
+        File = self.model
+        dialect = self._dialect(db)
+        if dialect == "postgresql":
+            return query.filter(cast(File.tags, JSONB).contains(tags))
+
+        if dialect == "sqlite":
+            tag_values = func.json_each(File.tags).table_valued("value")
+            return query.filter(
+                select(func.count(func.distinct(tag_values.c.value)))
+                .where(tag_values.c.value.in_(tags))
+                .scalar_subquery() == len(set(tags))
+            )
+
+        for tag in tags:
+            query = query.filter(File.tags.contains([tag]))
+        return query
+
+    def estimate_total(self, db: Session, query: Query) -> Tuple[int, bool]:
+        """Return (total, is_estimate) without an exact COUNT over the whole result
+
+        Postgres reads the planner's row estimate; other backends count up to a cap.
+        """
+        if self._dialect(db) == "postgresql":
+            try:
+                statement = query.order_by(None).statement
+                compiled = statement.compile(dialect=db.bind.dialect)
+                plan = db.connection().exec_driver_sql(
+                    f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+                ).scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                return int(plan[0]["Plan"]["Plan Rows"]), True
+            except Exception as e:
+                logger.warning(f"Falling back to capped count for search total: {str(e)}")
+
+        capped = query.order_by(None).with_entities(self.model.id).limit(COUNT_ESTIMATE_CAP + 1).subquery()
+        count = db.query(func.count()).select_from(capped).scalar()
+        return min(count, COUNT_ESTIMATE_CAP), count > COUNT_ESTIMATE_CAP
+
+    def exact_total(self, query: Query) -> int:
+        """Exact number of matches (only when the caller explicitly asks for it)"""
+        return query.order_by(None).with_entities(func.count(self.model.id)).scalar()
+
+    # === KEYSET PAGINATION ===
+
+    def cursor_scope(self, search: Optional[str], sort: str) -> str:
+        """Identifies a search and its ordering, so a cursor cannot be replayed against another"""
+        spec = json.dumps([_search_terms(search or ""), sort])
+        return hashlib.md5(spec.encode()).hexdigest()[:8]
+
+    def encode_cursor(self, sort_value: Any, row_id: int, scope: str = "") -> str:
+        """Encode the last row's sort key into an opaque, signed cursor"""
+        if isinstance(sort_value, datetime):
+            sort_value = {"dt": sort_value.isoformat()}
+        payload = json.dumps({"k": [sort_value, row_id], "s": scope}, separators=(",", ":")).encode()
+        return f"{_b64encode(payload)}.{_b64encode(_signature(payload))}"
+
+    def decode_cursor(self, cursor: str, scope: str = "") -> Tuple[Any, int]:
+        """Verify a cursor produced by encode_cursor for the same scope"""
+        try:
+            encoded_payload, encoded_signature = cursor.split(".", 1)
+            payload = _b64decode(encoded_payload)
+            signature = _b64decode(encoded_signature)
+        except ValueError as e:
+            raise InvalidCursorError("Malformed search cursor") from e
+        if not hmac.compare_digest(signature, _signature(payload)):
+            raise InvalidCursorError("Invalid search cursor signature")
+
+        data = json.loads(payload)
+        if data.get("s") != scope:
+            raise InvalidCursorError("Cursor does not match this search")
+        sort_value, row_id = data["k"]
+        if isinstance(sort_value, dict) and "dt" in sort_value:
+            sort_value = datetime.fromisoformat(sort_value["dt"])
+        return sort_value, int(row_id)
+
+    def paginate(
+        self,
+        query: Query,
+        sort_key: Any,
+        limit: int,
+        cursor: Optional[str] = None,
+        offset: int = 0,
+        scope: str = ""
+    ) -> Tuple[List[Any], Optional[str]]:
+        """Fetch one page ordered by (sort_key DESC, id DESC) after the cursor
+
+        Rows are returned as (File, sort_value) pairs. Cursors only work for the
+        scope (see cursor_scope) they were issued for. Offset is honoured only for
+        callers that have not moved to cursors yet.
+        """
+        File = self.model
+        if cursor:
+            last_value, last_id = self.decode_cursor(cursor, scope)
+            query = query.filter(or_(
+                sort_key < last_value,
+                and_(sort_key == last_value, File.id < last_id)
+            ))
+        elif offset:
+            query = query.offset(offset)
+
+        rows = query.add_columns(sort_key.label("sort_value")).order_by(
+            sort_key.desc(), File.id.desc()
+        ).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_file, last_value = rows[-1]
+            next_cursor = self.encode_cursor(last_value, last_file.id, scope)
+        return rows, next_cursor
+
+
+# Initialize index
+search_index = FileSearchIndex()
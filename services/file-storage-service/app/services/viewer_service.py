@@ -465,17 +465,28 @@ class StreamingService:
         return f"{base_url}/{file_id}?quality={quality}&user={user_id}&token={token or 'temp'}"
     
     @staticmethod
-    def get_quality_options(content_type: str, file_size: int) -> List[str]:
+    def get_renditions(db: Session, file_id: str) -> List[str]:
+        """Get the HLS renditions the media worker has produced for a file"""
+        from ..models import FileDerivative
+        playlists = db.query(FileDerivative.variant).filter(
+            FileDerivative.file_id == file_id,
+            FileDerivative.kind == "hls_playlist",
+            FileDerivative.variant != "master.m3u8"
+        ).all()
+        return [variant.split("/")[0] for (variant,) in playlists]
+    
+    @staticmethod
+    def get_quality_options(
+        content_type: str,
+        file_size: int,
+        renditions: Optional[List[str]] = None
+    ) -> List[str]:
         """Get available quality options for content"""
         if content_type == ContentType.VIDEO.value:
-            # Based on file size, determine available qualities
+            # Only advertise qualities that were actually transcoded
             options = ["auto"]
-            if file_size > 100_000_000:  # > 100MB
-                options.extend(["1080p", "720p", "480p"])
-            elif file_size > 50_000_000:  # > 50MB
-                options.extend(["720p", "480p"])
-            else:
-                options.append("480p")
+            if renditions:
+                options.extend(sorted(renditions, key=lambda r: int(r.rstrip("p")), reverse=True))
             return options
         elif content_type == ContentType.AUDIO.value:
             return ["auto", "high", "medium", "low"]
@@ -483,8 +494,11 @@ class StreamingService:
             return ["auto"]
     
     @staticmethod
-    def generate_thumbnail(file_id: int, position: float = 0) -> Optional[str]:
-        """Generate thumbnail for video content"""
-        # This would integrate with video processing service
-        # For now, returning placeholder
-        return f"/api/v1/content/{file_id}/thumbnail?t={position}"
+    def get_thumbnail_url(db: Session, file_id: str) -> Optional[str]:
+        """Get the thumbnail URL for content, if one has been generated"""
+        from ..models import FileDerivative
+        has_thumbnail = db.query(FileDerivative.id).filter(
+            FileDerivative.file_id == file_id,
+            FileDerivative.kind == "thumbnail"
+        ).first()
+        return f"/api/v1/files/{file_id}/thumbnail" if has_thumbnail else None
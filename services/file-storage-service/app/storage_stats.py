@@ -0,0 +1,397 @@
+"""
+EduNerve File Storage Service - Storage Statistics
+Incremental per-school storage counters and daily usage rollups for analytics
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import case, func, update
+from sqlalchemy.orm import Session, load_only
+
+from .database import SessionLocal, create_tables
+from .models import File, FileAnalytics, FileStatus, FileStorageCounter, FileUsageDaily, ServiceMarker
+
+logger = logging.getLogger(__name__)
+
+# Activity log actions rolled up into FileUsageDaily columns
+USAGE_ACTIONS = {
+    "upload": "uploads",
+    "delete": "deletes",
+    "download": "downloads",
+    "view": "views",
+    "share": "shares",
+}
+
+# Set once rebuild_counters has backfilled every school; until then analytics aggregate the files table
+COUNTERS_MARKER = "storage_counters_initialized"
+
+
+def _dialect_insert(db: Session):
+    """Return the dialect insert construct that supports ON CONFLICT, if any"""
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+
+def _type_value(file_type: Any) -> str:
+    """Normalize enum or string file types"""
+    return getattr(file_type, "value", file_type) or "other"
+
+
+class StorageStatsService:
+    """Maintains storage counters and answers analytics with SQL aggregates"""
+
+    def __init__(self, model=None):
+        self.model = model or File
+        self.counters_ready = False
+
+    def _increment(self, db: Session, school_id: int, file_type: Any, deltas: Dict[str, int]):
+        """Atomically add deltas to a school/type counter row, creating it if needed"""
+        file_type = _type_value(file_type)
+        now = datetime.utcnow()
+        insert = _dialect_insert(db)
+
+        if insert is not None:
+            initial = {"file_count": 0, "total_size": 0, "download_count": 0, **deltas}
+            stmt = insert(FileStorageCounter).values(
+                school_id=school_id,
+                file_type=file_type,
+                updated_at=now,
+                **initial
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["school_id", "file_type"],
+                set_={
+                    **{
+                        column: getattr(FileStorageCounter, column) + getattr(stmt.excluded, column)
+                        for column in deltas
+                    },
+                    "updated_at": now
+                }
+            )
+            db.execute(stmt)
+            return
+
+        result = db.execute(
+            update(FileStorageCounter)
+            .where(FileStorageCounter.school_id == school_id, FileStorageCounter.file_type == file_type)
+            .values(
+                updated_at=now,
+                **{column: getattr(FileStorageCounter, column) + delta for column, delta in deltas.items()}
+            )
+        )
+        if result.rowcount == 0:
+            db.add(FileStorageCounter(school_id=school_id, file_type=file_type, **deltas))
+
+    def record_file_change(
+        self,
+        db: Session,
+        school_id: int,
+        file_type: Any,
+        count_delta: int,
+        size_delta: int
+    ):
+        """Apply an upload (+) or delete (-) to the school's counters in the caller's transaction"""
+        self._increment(db, school_id, file_type, {"file_count": count_delta, "total_size": size_delta})
+
+    def record_download(self, db: Session, school_id: int, file_type: Any):
+        """Count a download in the caller's transaction"""
+        self._increment(db, school_id, file_type, {"download_count": 1})
+
+    def get_storage_totals(self, db: Session, school_id: int) -> Dict[str, Any]:
+        """Read current storage usage from the counters table"""
+        counters = db.query(
+            FileStorageCounter.file_type,
+            FileStorageCounter.file_count,
+            FileStorageCounter.total_size,
+            FileStorageCounter.download_count
+        ).filter(FileStorageCounter.school_id == school_id).all()
+
+        return {
+            "file_types": {c.file_type: int(c.file_count) for c in counters if c.file_count},
+            "total_files": sum(int(c.file_count) for c in counters),
+            "total_size": sum(int(c.total_size) for c in counters),
+            "download_count": sum(int(c.download_count) for c in counters)
+        }
+
+    def aggregate_files(
+        self,
+        db: Session,
+        school_id: int,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """Aggregate file counts, sizes and downloads per type in the database"""
+        query = db.query(
+            self.model.file_type,
+            func.count(self.model.id).label("file_count"),
+            func.coalesce(func.sum(self.model.file_size), 0).label("total_size"),
+            func.coalesce(func.sum(self.model.download_count), 0).label("downloads")
+        ).filter(
+            self.model.school_id == school_id,
+            self.model.status != FileStatus.DELETED
+        )
+
+        if date_from:
+            query = query.filter(self.model.created_at >= date_from)
+        if date_to:
+            query = query.filter(self.model.created_at <= date_to)
+
+        rows = query.group_by(self.model.file_type).all()
+
+        return {
+            "file_types": {_type_value(r.file_type): int(r.file_count) for r in rows},
+            "total_files": sum(int(r.file_count) for r in rows),
+            "total_size": sum(int(r.total_size) for r in rows),
+            "download_count": sum(int(r.downloads) for r in rows)
+        }
+
+    def get_top_files(
+        self,
+        db: Session,
+        school_id: int,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None,
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """Most downloaded files, loading only the columns needed (never the blob)"""
+        query = db.query(self.model).options(
+            load_only(self.model.file_id, self.model.original_filename, self.model.download_count, self.model.file_size)
+        ).filter(
+            self.model.school_id == school_id,
+            self.model.status != FileStatus.DELETED
+        )
+
+        if date_from:
+            query = query.filter(self.model.created_at >= date_from)
+        if date_to:
+            query = query.filter(self.model.created_at <= date_to)
+
+        top_files = query.order_by(self.model.download_count.desc()).limit(limit).all()
+        return [{
+            "file_id": f.file_id,
+            "filename": f.original_filename,
+            "downloads": f.download_count,
+            "size": f.file_size
+        } for f in top_files]
+
+    def get_usage_trends(
+        self,
+        db: Session,
+        school_id: int,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """Daily usage rollups for a school (defaults to the last 30 days)"""
+        end = (date_to or datetime.utcnow()).date()
+        start = date_from.date() if date_from else end - timedelta(days=29)
+
+        rows = db.query(FileUsageDaily).filter(
+            FileUsageDaily.school_id == school_id,
+            FileUsageDaily.usage_date >= start,
+            FileUsageDaily.usage_date <= end
+        ).order_by(FileUsageDaily.usage_date).all()
+
+        return [{
+            "date": row.usage_date.isoformat(),
+            "uploads": row.uploads,
+            "deletes": row.deletes,
+            "downloads": row.downloads,
+            "views": row.views,
+            "shares": row.shares,
+            "file_count": row.file_count,
+            "total_size": row.total_size
+        } for row in rows]
+
+    def get_analytics(
+        self,
+        db: Session,
+        school_id: int,
+        date_from: Optional[datetime] = None,
+        date_to: Optional[datetime] = None
+    ) -> Dict[str, Any]:
+        """Assemble the analytics payload from counters, aggregates and rollups"""
+        if not date_from and not date_to and self.counters_initialized(db):
+            # All-time storage comes from the maintained counters once they have been backfilled
+            aggregates = self.get_storage_totals(db, school_id)
+        else:
+            aggregates = self.aggregate_files(db, school_id, date_from, date_to)
+
+        trends = self.get_usage_trends(db, school_id, date_from, date_to)
+        total_files = aggregates["total_files"]
+        total_size = aggregates["total_size"]
+
+        return {
+            "total_files": total_files,
+            "total_size": total_size,
+            "download_count": aggregates["download_count"],
+            "view_count": sum(t["views"] for t in trends),
+            "share_count": sum(t["shares"] for t in trends),
+            "file_types": aggregates["file_types"],
+            "top_files": self.get_top_files(db, school_id, date_from, date_to),
+            "usage_trends": trends,
+            "storage_usage": {
+                "total_size": total_size,
+                "file_count": total_files,
+                "average_size": total_size / total_files if total_files > 0 else 0
+            }
+        }
+
+    def rollup_usage_day(self, db: Session, usage_date: date) -> int:
+        """Recompute one day's usage rollup for every school from the activity log"""
+        day_start = datetime.combine(usage_date, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+
+        columns = [
+            func.sum(case((FileAnalytics.action == action, 1), else_=0)).label(column)
+            for action, column in USAGE_ACTIONS.items()
+        ]
+        rows = db.query(FileAnalytics.school_id, *columns).filter(
+            FileAnalytics.created_at >= day_start,
+            FileAnalytics.created_at < day_end,
+            FileAnalytics.school_id.isnot(None)
+        ).group_by(FileAnalytics.school_id).all()
+
+        snapshots = {}
+        if usage_date == datetime.utcnow().date():
+            snapshots = {
+                row.school_id: (int(row.file_count or 0), int(row.total_size or 0))
+                for row in db.query(
+                    FileStorageCounter.school_id,
+                    func.sum(FileStorageCounter.file_count).label("file_count"),
+                    func.sum(FileStorageCounter.total_size).label("total_size")
+                ).group_by(FileStorageCounter.school_id).all()
+            }
+
+        for row in rows:
+            values = {column: int(getattr(row, column) or 0) for column in USAGE_ACTIONS.values()}
+            if row.school_id in snapshots:
+                values["file_count"], values["total_size"] = snapshots[row.school_id]
+
+            rollup = db.query(FileUsageDaily).filter(
+                FileUsageDaily.school_id == row.school_id,
+                FileUsageDaily.usage_date == usage_date
+            ).first()
+            if not rollup:
+                rollup = FileUsageDaily(school_id=row.school_id, usage_date=usage_date)
+                db.add(rollup)
+            for column, value in values.items():
+                setattr(rollup, column, value)
+
+        db.commit()
+        return len(rows)
+
+    def counters_initialized(self, db: Session) -> bool:
+        """Whether the counters have been backfilled and can replace the files aggregate"""
+        if not self.counters_ready:
+            self.counters_ready = db.get(ServiceMarker, COUNTERS_MARKER) is not None
+        return self.counters_ready
+
+    def ensure_counters(self, db: Session) -> bool:
+        """Backfill the counters once; returns True if this call ran the rebuild"""
+        if self.counters_initialized(db):
+            return False
+        self.rebuild_counters(db)
+        return True
+
+    def rebuild_counters(self, db: Session, school_id: Optional[int] = None) -> int:
+        """Recompute storage counters from the files table (backfill or drift repair)"""
+        query = db.query(
+            self.model.school_id,
+            self.model.file_type,
+            func.count(self.model.id).label("file_count"),
+            func.coalesce(func.sum(self.model.file_size), 0).label("total_size"),
+            func.coalesce(func.sum(self.model.download_count), 0).label("downloads")
+        ).filter(self.model.status != FileStatus.DELETED)
+        if school_id is not None:
+            query = query.filter(self.model.school_id == school_id)
+        rows = query.group_by(self.model.school_id, self.model.file_type).all()
+
+        counters = db.query(FileStorageCounter)
+        if school_id is not None:
+            counters = counters.filter(FileStorageCounter.school_id == school_id)
+        counters.delete(synchronize_session=False)
+
+        db.add_all([
+            FileStorageCounter(
+                school_id=row.school_id,
+                file_type=_type_value(row.file_type),
+                file_count=int(row.file_count),
+                total_size=int(row.total_size),
+                download_count=int(row.downloads)
+            )
+            for row in rows
+        ])
+        if school_id is None:
+            # Committed with the counters, so readers switch over only once they are complete
+            db.merge(ServiceMarker(name=COUNTERS_MARKER, completed_at=datetime.utcnow()))
+        db.commit()
+        if school_id is None:
+            self.counters_ready = True
+        return len(rows)
+
+
+# Initialize service
+storage_stats = StorageStatsService()
+
+async def usage_rollup_worker():
+    """Periodically refresh today's and yesterday's usage rollups"""
+    interval = int(os.getenv("USAGE_ROLLUP_INTERVAL", "900"))
+
+    while True:
+        try:
+            db = SessionLocal()
+            try:
+                today = datetime.utcnow().date()
+                # Yesterday is refreshed too so late activity after midnight is captured
+                for usage_date in (today - timedelta(days=1), today):
+                    storage_stats.rollup_usage_day(db, usage_date)
+            finally:
+                db.close()
+
+            await asyncio.sleep(interval)
+
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.error(f"Error in usage rollup worker: {str(e)}")
+            await asyncio.sleep(interval)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Backfill or rebuild the storage counters")
+    parser.add_argument("command", choices=["init", "rebuild"])
+    parser.add_argument("--school-id", type=int, help="with rebuild: limit to one school")
+    args = parser.parse_args(argv)
+
+    # Runs as the release step, possibly before any web worker has created the tables
+    create_tables()
+    db = SessionLocal()
+    try:
+        if args.command == "init":
+            if storage_stats.ensure_counters(db):
+                logger.info("Backfilled storage counters")
+            else:
+                logger.info("Storage counters already initialized")
+            return 0
+
+        rows = storage_stats.rebuild_counters(db, args.school_id)
+        logger.info(f"Rebuilt {rows} storage counter rows")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
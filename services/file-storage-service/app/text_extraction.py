@@ -0,0 +1,104 @@
+"""
+EduNerve File Storage Service - Text Extraction
+Pulls searchable text out of documents for the search index
+"""
+
+import io
+import re
+import shutil
+import subprocess
+import zipfile
+from typing import Any, Dict, List
+from xml.etree import ElementTree
+
+try:
+    import fitz  # PyMuPDF
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    PYMUPDF_AVAILABLE = False
+
+PDFTOTEXT_BINARY = shutil.which("pdftotext")
+
+# Stop reading once this much text has been collected
+MAX_EXTRACTED_CHARS = 200000
+
+# Office Open XML parts that hold document text
+OOXML_TEXT_PARTS = {
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": re.compile(r"^word/(document|header\d*|footer\d*)\.xml$"),
+    "application/vnd.openxmlformats-officedocument.presentationml.presentation": re.compile(r"^ppt/slides/slide\d+\.xml$"),
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": re.compile(r"^xl/sharedStrings\.xml$"),
+}
+
+PLAIN_TEXT_TYPES = {"application/json", "application/xml", "application/rtf"}
+
+
+def is_text_extractable(content_type: str) -> bool:
+    """Whether text can be extracted from this content type"""
+    return (
+        content_type == "application/pdf"
+        or content_type.startswith("text/")
+        or content_type in PLAIN_TEXT_TYPES
+        or content_type in OOXML_TEXT_PARTS
+    )
+
+
+def _extract_pdf_text(file_data: bytes) -> str:
+    """Extract PDF text with PyMuPDF or poppler's pdftotext"""
+    if PYMUPDF_AVAILABLE:
+        document = fitz.open(stream=file_data, filetype="pdf")
+        try:
+            parts, length = [], 0
+            for page in document:
+                page_text = page.get_text()
+                parts.append(page_text)
+                length += len(page_text)
+                if length >= MAX_EXTRACTED_CHARS:
+                    break
+            return "\n".join(parts)
+        finally:
+            document.close()
+
+    if PDFTOTEXT_BINARY:
+        result = subprocess.run(
+            [PDFTOTEXT_BINARY, "-q", "-enc", "UTF-8", "-", "-"],
+            input=file_data,
+            capture_output=True,
+            check=True,
+            timeout=120
+        )
+        return result.stdout.decode("utf-8", errors="ignore")
+
+    raise RuntimeError("No PDF text extractor available (install PyMuPDF or poppler-utils)")
+
+
+def _extract_ooxml_text(file_data: bytes, content_type: str) -> str:
+    """Collect the text runs of a docx, pptx or xlsx package"""
+    part_pattern = OOXML_TEXT_PARTS[content_type]
+    parts = []
+    with zipfile.ZipFile(io.BytesIO(file_data)) as package:
+        for name in sorted(package.namelist()):
+            if not part_pattern.match(name):
+                continue
+            root = ElementTree.fromstring(package.read(name))
+            # Word, PowerPoint and Excel all keep text in elements named "t"
+            parts.append(" ".join(
+                element.text for element in root.iter()
+                if element.tag.rsplit("}", 1)[-1] == "t" and element.text
+            ))
+    return "\n".join(parts)
+
+
+def extract_text(file_data: bytes, parameters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Extract searchable text; runs inside the media worker's process pool"""
+    content_type = parameters.get("content_type", "")
+
+    if content_type == "application/pdf":
+        extracted = _extract_pdf_text(file_data)
+    elif content_type in OOXML_TEXT_PARTS:
+        extracted = _extract_ooxml_text(file_data, content_type)
+    else:
+        extracted = file_data[:MAX_EXTRACTED_CHARS * 4].decode("utf-8", errors="ignore")
+
+    # Collapse whitespace so layout noise does not inflate the index
+    extracted = re.sub(r"\s+", " ", extracted).strip()[:MAX_EXTRACTED_CHARS]
+    return [{"kind": "text", "variant": "extracted", "text": extracted}]
@@ -44,6 +44,7 @@ class FileStorageServiceTester:
         await self.test_file_retrieval()
         await self.test_file_download()
         await self.test_file_update()
+        await self.test_file_derivatives()
         
         # File search tests
         await self.test_file_search()
@@ -277,6 +278,33 @@ class FileStorageServiceTester:
             self.log_error("File Update", str(e))
             return False
     
+    async def test_file_derivatives(self):
+        """Test derived media listing (thumbnails, previews, renditions)"""
+        if not self.test_files:
+            self.log_error("File Derivatives", "No test files available")
+            return False
+        
+        try:
+            file_id = self.test_files[0]['file_id']
+            
+            async with aiohttp.ClientSession() as session:
+                headers = {'Authorization': f'Bearer {self.auth_token}'}
+                
+                async with session.get(f"{self.base_url}/api/v1/files/{file_id}/derivatives", 
+                                     headers=headers) as response:
+                    if response.status == 200:
+                        data = await response.json()
+                        self.log_success("File Derivatives", 
+                                       f"Found {len(data['derivatives'])} derivatives")
+                        return True
+                    else:
+                        error_text = await response.text()
+                        self.log_error("File Derivatives", f"Status: {response.status}, Error: {error_text}")
+                        return False
+        except Exception as e:
+            self.log_error("File Derivatives", str(e))
+            return False
+    
     async def test_file_search(self):
         """Test file search functionality"""
         try:
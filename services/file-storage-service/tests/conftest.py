@@ -0,0 +1,13 @@
+"""
+Test configuration for the file storage service
+"""
+
+import os
+import sys
+from pathlib import Path
+
+# Make the service's app package importable when running pytest from anywhere
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# Search cursors are signed; the service refuses to start without a secret
+os.environ.setdefault("SEARCH_CURSOR_SECRET", "test-cursor-secret")
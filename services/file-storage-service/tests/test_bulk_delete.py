@@ -0,0 +1,138 @@
+"""
+Tests for bulk delete accounting: only files the UPDATE actually deleted are released
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import BigInteger, Column, DateTime, Enum, Integer, LargeBinary, String, create_engine, update
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from app import file_service as file_service_module
+from app.auth import CurrentUser
+from app.file_service import file_service
+from app.models import Base, FileDerivative, FileQuota, FileStatus, FileStorageCounter
+from app.search_index import search_index
+
+FileBase = declarative_base()
+
+
+class StoredFile(FileBase):
+    """The columns of the files table that bulk deletes touch"""
+    __tablename__ = "files"
+
+    id = Column(Integer, primary_key=True)
+    file_id = Column(String(36))
+    uploaded_by = Column(Integer)
+    school_id = Column(Integer)
+    file_type = Column(String(50))
+    file_size = Column(BigInteger)
+    file_data = Column(LargeBinary, default=b"blob")
+    status = Column(Enum(FileStatus), default=FileStatus.READY)
+    updated_at = Column(DateTime)
+
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'bulk.db'}", connect_args={"timeout": 30})
+    FileBase.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=engine, tables=[
+        FileQuota.__table__, FileStorageCounter.__table__, FileDerivative.__table__
+    ])
+    search_index.setup(engine)
+    monkeypatch.setattr(file_service_module, "File", StoredFile)
+
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add_all([StoredFile(file_id=f"f{i}", uploaded_by=5, school_id=1, file_type="document", file_size=100) for i in range(4)])
+    db.add_all([
+        FileQuota(entity_type="user", entity_id=5, total_quota=10000, used_quota=400, file_count_used=4),
+        FileQuota(entity_type="school", entity_id=1, total_quota=10000, used_quota=400, file_count_used=4),
+        FileStorageCounter(school_id=1, file_type="document", file_count=4, total_size=400, download_count=0),
+    ])
+    db.commit()
+    db.close()
+    yield factory
+    engine.dispose()
+
+
+@pytest.fixture
+def audit(monkeypatch):
+    entries = []
+    monkeypatch.setattr(file_service_module, "create_file_activity_logs", lambda db, rows: entries.extend(rows))
+    return entries
+
+
+def owner():
+    return CurrentUser(id=5, username="teacher", email="t@example.com", first_name="T", last_name="E", role="teacher", school_id=1)
+
+
+def accounting(factory):
+    db = factory()
+    try:
+        quotas = {(q.entity_type, q.used_quota, q.file_count_used) for q in db.query(FileQuota).all()}
+        counter = db.query(FileStorageCounter).one()
+        return quotas, (counter.file_count, counter.total_size)
+    finally:
+        db.close()
+
+
+def test_bulk_delete_releases_each_file_once(session_factory, audit):
+    db = session_factory()
+    try:
+        outcome = asyncio.run(file_service.bulk_delete_files(["f0", "f1", "f1"], owner(), db))
+    finally:
+        db.close()
+
+    assert outcome["deleted_ids"] == ["f0", "f1"]
+    assert [entry["file_id"] for entry in audit] == ["f0", "f1"]
+    assert accounting(session_factory) == ({("user", 200, 2), ("school", 200, 2)}, (2, 200))
+
+
+def test_concurrent_delete_is_not_accounted_twice(session_factory, audit, monkeypatch):
+    authorize = file_service._authorize_bulk
+
+    def authorize_then_race(file_ids, permission, current_user, db):
+        allowed, errors = authorize(file_ids, permission, current_user, db)
+        # Another request deletes f2 between our read and our UPDATE
+        other = session_factory()
+        other.execute(update(StoredFile).where(StoredFile.file_id == "f2").values(status=FileStatus.DELETED))
+        other.commit()
+        other.close()
+        return allowed, errors
+
+    monkeypatch.setattr(file_service, "_authorize_bulk", authorize_then_race)
+    db = session_factory()
+    try:
+        outcome = asyncio.run(file_service.bulk_delete_files(["f2", "f3"], owner(), db))
+    finally:
+        db.close()
+
+    assert outcome["deleted_ids"] == ["f3"]
+    assert outcome["errors"] == [{"file_id": "f2", "error": "File not found"}]
+    assert [entry["file_id"] for entry in audit] == ["f3"]
+    # The racing delete released f2 itself; this one only gives back f3
+    assert accounting(session_factory) == ({("user", 300, 3), ("school", 300, 3)}, (3, 300))
+
+
+def test_blobs_are_kept_until_the_retention_window_passes(session_factory, audit):
+    db = session_factory()
+    try:
+        asyncio.run(file_service.bulk_delete_files(["f0", "f1"], owner(), db))
+        db.add_all([FileDerivative(file_id=file_id, kind="thumbnail", variant="320w") for file_id in ("f0", "f1")])
+        db.commit()
+
+        # A fresh soft delete can still be restored with its blob
+        assert file_service.reclaim_blob_storage(db, retention_days=30) == 0
+        assert db.query(StoredFile).filter(StoredFile.file_data.isnot(None)).count() == 4
+
+        db.execute(update(StoredFile).where(StoredFile.file_id == "f0").values(
+            updated_at=datetime.utcnow() - timedelta(days=31)
+        ))
+        db.commit()
+        assert file_service.reclaim_blob_storage(db, retention_days=30, chunk_size=1) == 1
+        assert [row.file_id for row in db.query(StoredFile).filter(StoredFile.file_data.is_(None))] == ["f0"]
+        assert [row.file_id for row in db.query(FileDerivative)] == ["f1"]
+    finally:
+        db.close()
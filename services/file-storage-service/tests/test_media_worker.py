@@ -0,0 +1,100 @@
+"""
+Tests for media job leasing: claims, lease expiry and finishing under a held lease
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.media_worker import MediaProcessingWorker
+from app.models import Base, FileProcessingJob
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    Base.metadata.create_all(bind=engine, tables=[FileProcessingJob.__table__])
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+def make_worker(name):
+    worker = MediaProcessingWorker(processes=1, batch_size=4, lease_seconds=60, poll_interval=1)
+    worker.worker_id = name
+    worker.job_types = ["image_processing"]
+    return worker
+
+
+def add_job(db, job_id, **values):
+    job = FileProcessingJob(job_id=job_id, file_id=f"file-{job_id}", job_type="image_processing", **values)
+    db.add(job)
+    db.commit()
+    return job
+
+
+def test_claims_do_not_overlap(db):
+    for job_id in ("a", "b", "c"):
+        add_job(db, job_id)
+
+    first = make_worker("w1").claim_jobs(db, limit=2)
+    second = make_worker("w2").claim_jobs(db, limit=2)
+
+    assert len(first) == 2 and len(second) == 1
+    assert not set(first) & set(second)
+    jobs = db.query(FileProcessingJob).order_by(FileProcessingJob.id).all()
+    assert [(job.status, job.locked_by, job.attempts) for job in jobs] == [
+        ("running", "w1", 1), ("running", "w1", 1), ("running", "w2", 1)
+    ]
+    assert make_worker("w3").claim_jobs(db, limit=2) == []
+
+
+def test_expired_leases_are_reclaimed_or_given_up(db):
+    expired = datetime.utcnow() - timedelta(seconds=1)
+    retry = add_job(db, "retry", status="running", locked_by="w1", locked_until=expired, attempts=1)
+    final = add_job(db, "final", status="running", locked_by="w1", locked_until=expired, attempts=3)
+    live = add_job(db, "live", status="running", locked_by="w1", locked_until=datetime.utcnow() + timedelta(minutes=1), attempts=1)
+
+    assert make_worker("w2").claim_jobs(db, limit=4) == [retry.id]
+
+    db.expire_all()
+    assert (retry.status, retry.locked_by, retry.attempts) == ("running", "w2", 2)
+    assert (final.status, final.locked_by) == ("failed", None)
+    assert (live.status, live.locked_by) == ("running", "w1")
+
+
+def test_finish_requires_the_lease(db):
+    worker = make_worker("w1")
+    add_job(db, "done")
+    add_job(db, "lost")
+    done_pk, lost_pk = worker.claim_jobs(db, limit=2)
+    done, lost = db.get(FileProcessingJob, done_pk), db.get(FileProcessingJob, lost_pk)
+
+    assert worker._finish_job(db, done, "completed")
+    assert (done.status, done.progress, done.locked_by) == ("completed", 100, None)
+
+    # The lease runs out and another worker picks the job up
+    lost.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+    assert make_worker("w2").claim_jobs(db, limit=1) == [lost_pk]
+    lost.output_metadata = {"derivatives": ["stale"]}
+
+    assert not worker._finish_job(db, lost, "completed")
+    db.expire_all()
+    assert (lost.status, lost.locked_by, lost.attempts, lost.output_metadata) == ("running", "w2", 2, None)
+
+
+def test_finish_after_lease_expiry_is_discarded(db):
+    worker = make_worker("w1")
+    add_job(db, "slow")
+    [job_pk] = worker.claim_jobs(db, limit=1)
+    job = db.get(FileProcessingJob, job_pk)
+    job.locked_until = datetime.utcnow() - timedelta(seconds=1)
+    db.commit()
+
+    assert not worker._finish_job(db, job, "failed", error="boom")
+    db.expire_all()
+    assert (job.status, job.locked_by, job.error_message) == ("running", "w1", None)
@@ -0,0 +1,229 @@
+"""
+Tests for atomic quota accounting
+"""
+
+import os
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import BigInteger, Column, Enum, Integer, create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from app.models import Base, FileQuota, FileStatus
+from app.quota import QuotaExceededError, QuotaManager, quota_manager
+
+FileBase = declarative_base()
+
+
+class OwnedFile(FileBase):
+    """The columns of the files table that quota reconciliation reads"""
+    __tablename__ = "files"
+
+    id = Column(Integer, primary_key=True)
+    uploaded_by = Column(Integer)
+    school_id = Column(Integer)
+    file_size = Column(BigInteger)
+    status = Column(Enum(FileStatus), default=FileStatus.READY)
+
+
+class UserOwnedFile(FileBase):
+    """A files table that records the uploader but not the school"""
+    __tablename__ = "user_files"
+
+    id = Column(Integer, primary_key=True)
+    uploaded_by = Column(Integer)
+    file_size = Column(BigInteger)
+    status = Column(Enum(FileStatus), default=FileStatus.READY)
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Session factory on a real database so concurrent transactions contend"""
+    url = os.getenv("TEST_DATABASE_URL", f"sqlite:///{tmp_path / 'quota.db'}")
+    connect_args = {"check_same_thread": False, "timeout": 30} if url.startswith("sqlite") else {}
+    engine = create_engine(url, connect_args=connect_args)
+    Base.metadata.create_all(bind=engine, tables=[FileQuota.__table__])
+    yield sessionmaker(bind=engine)
+    Base.metadata.drop_all(bind=engine, tables=[FileQuota.__table__])
+    engine.dispose()
+
+
+@pytest.fixture
+def files_factory(session_factory):
+    """Session factory that also has the standalone files tables"""
+    engine = session_factory.kw["bind"]
+    FileBase.metadata.create_all(bind=engine)
+    yield session_factory
+    FileBase.metadata.drop_all(bind=engine)
+
+
+def add_quota(factory, entity_type, entity_id, total, file_limit=None, used=0, files=0, updated_at=None):
+    db = factory()
+    db.add(FileQuota(
+        entity_type=entity_type,
+        entity_id=entity_id,
+        total_quota=total,
+        used_quota=used,
+        file_count_limit=file_limit,
+        file_count_used=files,
+        updated_at=updated_at or datetime.utcnow()
+    ))
+    db.commit()
+    db.close()
+
+
+def get_quota(factory, entity_type, entity_id):
+    db = factory()
+    quota = db.query(FileQuota).filter(
+        FileQuota.entity_type == entity_type,
+        FileQuota.entity_id == entity_id
+    ).first()
+    db.close()
+    return quota
+
+
+class TestQuotaReservation:
+    """Test conditional quota reservation"""
+
+    def test_concurrent_reservations_never_overshoot(self, session_factory):
+        """Parallel uploads can fill the quota exactly but never exceed it"""
+        add_quota(session_factory, "user", 1, total=1000)
+        add_quota(session_factory, "school", 10, total=10000)
+
+        workers = 40
+        barrier = threading.Barrier(workers)
+        outcomes = []
+        lock = threading.Lock()
+
+        def upload():
+            db = session_factory()
+            try:
+                barrier.wait()
+                quota_manager.reserve(db, user_id=1, school_id=10, size=100)
+                result = "reserved"
+            except QuotaExceededError:
+                result = "rejected"
+            finally:
+                db.close()
+            with lock:
+                outcomes.append(result)
+
+        threads = [threading.Thread(target=upload) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert outcomes.count("reserved") == 10
+        assert outcomes.count("rejected") == workers - 10
+
+        user_quota = get_quota(session_factory, "user", 1)
+        school_quota = get_quota(session_factory, "school", 10)
+        assert user_quota.used_quota == 1000
+        assert user_quota.file_count_used == 10
+        # Rejected user reservations must not leak into the school total
+        assert school_quota.used_quota == 1000
+
+    def test_school_rejection_rolls_back_user_reservation(self, session_factory):
+        """A full school quota leaves the user quota untouched"""
+        add_quota(session_factory, "user", 2, total=1000)
+        add_quota(session_factory, "school", 20, total=50)
+
+        db = session_factory()
+        with pytest.raises(QuotaExceededError) as exc_info:
+            quota_manager.reserve(db, user_id=2, school_id=20, size=100)
+        db.close()
+
+        assert exc_info.value.entity_type == "school"
+        assert get_quota(session_factory, "user", 2).used_quota == 0
+
+    def test_file_count_limit_enforced(self, session_factory):
+        """The file count limit is checked in the same statement"""
+        add_quota(session_factory, "user", 3, total=10000, file_limit=2)
+
+        db = session_factory()
+        quota_manager.reserve(db, user_id=3, school_id=None, size=1)
+        quota_manager.reserve(db, user_id=3, school_id=None, size=1)
+        with pytest.raises(QuotaExceededError):
+            quota_manager.reserve(db, user_id=3, school_id=None, size=1)
+        db.close()
+
+        assert get_quota(session_factory, "user", 3).file_count_used == 2
+
+    def test_reservation_released_on_failure(self, session_factory):
+        """Space reserved for a failed upload is given back"""
+        add_quota(session_factory, "user", 4, total=1000)
+
+        db = session_factory()
+        with pytest.raises(RuntimeError):
+            with quota_manager.reservation(db, user_id=4, school_id=None, size=300):
+                raise RuntimeError("blob write failed")
+        db.close()
+
+        quota = get_quota(session_factory, "user", 4)
+        assert quota.used_quota == 0
+        assert quota.file_count_used == 0
+
+    def test_entities_without_quota_are_unlimited(self, session_factory):
+        """Missing quota rows do not block uploads"""
+        db = session_factory()
+        quota_manager.reserve(db, user_id=5, school_id=50, size=10 ** 12)
+        db.close()
+
+        assert get_quota(session_factory, "user", 5) is None
+
+
+class TestQuotaReconciliation:
+    """Test resetting quota usage to the stored files"""
+
+    def test_drifted_usage_is_reset(self, files_factory):
+        """Usage is recomputed per uploader and school, ignoring deleted files"""
+        settled = datetime.utcnow() - timedelta(hours=1)
+        add_quota(files_factory, "user", 1, total=1000, used=999, files=9, updated_at=settled)
+        add_quota(files_factory, "user", 2, total=1000, used=40, files=1, updated_at=settled)
+        add_quota(files_factory, "school", 10, total=10000, used=5, files=5, updated_at=settled)
+
+        db = files_factory()
+        db.add_all([
+            OwnedFile(uploaded_by=1, school_id=10, file_size=100),
+            OwnedFile(uploaded_by=1, school_id=10, file_size=50, status=FileStatus.DELETED),
+            OwnedFile(uploaded_by=2, school_id=10, file_size=40),
+        ])
+        db.commit()
+        corrected = QuotaManager(model=OwnedFile).reconcile(db)
+        db.close()
+
+        assert corrected == {"user": 1, "school": 1}
+        user_quota = get_quota(files_factory, "user", 1)
+        assert (user_quota.used_quota, user_quota.file_count_used) == (100, 1)
+        assert user_quota.last_reconciled_at is not None
+        school_quota = get_quota(files_factory, "school", 10)
+        assert (school_quota.used_quota, school_quota.file_count_used) == (140, 2)
+
+    def test_recently_updated_rows_are_skipped(self, files_factory):
+        """Rows inside the grace period may hold in-flight reservations"""
+        add_quota(files_factory, "user", 3, total=1000, used=300, files=1)
+
+        db = files_factory()
+        corrected = QuotaManager(model=OwnedFile).reconcile(db, grace_seconds=300)
+        db.close()
+
+        assert corrected["user"] == 0
+        assert get_quota(files_factory, "user", 3).used_quota == 300
+
+    def test_scopes_without_a_column_are_left_alone(self, files_factory):
+        """School quotas are not zeroed when files do not record their school"""
+        settled = datetime.utcnow() - timedelta(hours=1)
+        add_quota(files_factory, "user", 4, total=1000, used=0, files=0, updated_at=settled)
+        add_quota(files_factory, "school", 40, total=10000, used=700, files=7, updated_at=settled)
+
+        db = files_factory()
+        db.add(UserOwnedFile(uploaded_by=4, file_size=25))
+        db.commit()
+        corrected = QuotaManager(model=UserOwnedFile).reconcile(db)
+        db.close()
+
+        assert corrected == {"user": 1}
+        assert get_quota(files_factory, "user", 4).used_quota == 25
+        assert get_quota(files_factory, "school", 40).used_quota == 700
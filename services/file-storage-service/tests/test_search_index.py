@@ -0,0 +1,126 @@
+"""
+Tests for full-text file search on SQLite FTS5 with signed keyset cursors
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, DateTime, Integer, String, Text, create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from app import models
+from app import search_index as search_index_module
+from app.search_index import FileSearchIndex, InvalidCursorError
+
+Base = declarative_base()
+
+
+class SearchFile(Base):
+    """The searchable columns of the files table"""
+    __tablename__ = "files"
+    id = Column(Integer, primary_key=True)
+    file_id = Column(String(36), unique=True)
+    original_filename = Column(String(255))
+    description = Column(Text)
+    extracted_text = Column(Text)
+    tags = Column(String(500))
+    created_at = Column(DateTime)
+
+
+DOCUMENTS = [
+    ("biology-notes.pdf", "Term 1 notes", "Photosynthesis turns light into chemical energy. Photosynthesis needs chlorophyll."),
+    ("photosynthesis.docx", "Photosynthesis worksheet", "Label the leaf."),
+    ("chemistry.pdf", "Acids and bases", "Indicators change colour."),
+    ("revision.pdf", None, "Photosynthesis and respiration compared."),
+    ("scan.jpg", None, None),
+]
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'search.db'}")
+    Base.metadata.create_all(engine)
+    index = FileSearchIndex(model=SearchFile)
+    index.setup(engine)
+    session = sessionmaker(bind=engine)()
+    started = datetime(2024, 5, 6, 8)
+    for number, (filename, description, text) in enumerate(DOCUMENTS, 1):
+        session.add(SearchFile(
+            id=number, file_id=f"f{number}", original_filename=filename, description=description,
+            extracted_text=text, tags='["term1"]', created_at=started + timedelta(hours=number)
+        ))
+    session.flush()
+    index.index_files(session, session.query(SearchFile).all())
+    session.commit()
+    yield session, index
+    session.close()
+    engine.dispose()
+
+
+def search(session, index, text):
+    return index.apply_text_search(session, session.query(SearchFile), text)
+
+
+def test_extracted_text_is_mapped_on_file():
+    assert "extracted_text" in models.File.__table__.c
+
+
+def test_text_search_matches_extracted_text_and_ranks(db):
+    session, index = db
+    query, rank = search(session, index, "photosynth")
+
+    rows, next_cursor = index.paginate(query, rank, limit=10)
+    ids = [file.file_id for file, _ in rows]
+    assert sorted(ids) == ["f1", "f2", "f4"]
+    # Ranked best first: the worksheet names the topic in its filename and description
+    assert ids[0] == "f2"
+    assert [value for _, value in rows] == sorted((value for _, value in rows), reverse=True)
+    assert next_cursor is None
+
+
+def test_reindex_picks_up_changed_text(db):
+    session, index = db
+    session.query(SearchFile).filter(SearchFile.file_id == "f5").update({"extracted_text": "Photosynthesis diagram"})
+    index.reindex(session, ["f5"])
+    query, rank = search(session, index, "photosynthesis")
+    assert "f5" in [file.file_id for file, _ in index.paginate(query, rank, limit=10)[0]]
+
+
+def test_cursor_pages_through_every_result_once(db):
+    session, index = db
+    scope = index.cursor_scope(None, "created_at")
+    seen, cursor = [], None
+    while True:
+        rows, cursor = index.paginate(
+            session.query(SearchFile), SearchFile.created_at, limit=2, cursor=cursor, scope=scope
+        )
+        seen += [file.file_id for file, _ in rows]
+        if cursor is None:
+            break
+    assert seen == ["f5", "f4", "f3", "f2", "f1"]
+
+
+def test_cursor_is_bound_to_its_search_and_signed(db):
+    session, index = db
+    _, cursor = index.paginate(
+        session.query(SearchFile), SearchFile.created_at, limit=2, scope=index.cursor_scope(None, "created_at")
+    )
+
+    # A newest-first cursor replayed against a ranked text search
+    query, rank = search(session, index, "photosynthesis")
+    with pytest.raises(InvalidCursorError):
+        index.paginate(query, rank, limit=2, cursor=cursor, scope=index.cursor_scope("photosynthesis", "rank"))
+
+    payload, signature = cursor.split(".")
+    with pytest.raises(InvalidCursorError):
+        index.decode_cursor(payload[:-2] + "AA." + signature, index.cursor_scope(None, "created_at"))
+    with pytest.raises(InvalidCursorError):
+        index.decode_cursor("not-a-cursor", "")
+
+
+def test_setup_refuses_to_start_without_a_cursor_secret(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index_module, "CURSOR_SECRET", None)
+    engine = create_engine(f"sqlite:///{tmp_path / 'unsigned.db'}")
+    with pytest.raises(RuntimeError):
+        FileSearchIndex(model=SearchFile).setup(engine)
+    engine.dispose()
@@ -0,0 +1,115 @@
+"""
+Tests for storage counters: increments, rebuilds and the aggregate fallback before backfill
+"""
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import BigInteger, Column, DateTime, Enum, Integer, String, create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from app.models import Base, FileStatus, FileStorageCounter, FileUsageDaily, ServiceMarker
+from app.storage_stats import COUNTERS_MARKER, StorageStatsService
+
+FileBase = declarative_base()
+
+
+class StoredFile(FileBase):
+    """The columns of the files table that storage statistics read"""
+    __tablename__ = "files"
+
+    id = Column(Integer, primary_key=True)
+    file_id = Column(String(36))
+    school_id = Column(Integer)
+    original_filename = Column(String(255))
+    file_type = Column(String(50))
+    file_size = Column(BigInteger)
+    download_count = Column(Integer, default=0)
+    status = Column(Enum(FileStatus), default=FileStatus.READY)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stats.db'}")
+    FileBase.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=engine, tables=[
+        FileStorageCounter.__table__, FileUsageDaily.__table__, ServiceMarker.__table__
+    ])
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def stats():
+    return StorageStatsService(model=StoredFile)
+
+
+def add_files(db):
+    db.add_all([
+        StoredFile(file_id="a", school_id=1, original_filename="a.pdf", file_type="document", file_size=100, download_count=3),
+        StoredFile(file_id="b", school_id=1, original_filename="b.png", file_type="image", file_size=50, download_count=1),
+        StoredFile(file_id="c", school_id=1, original_filename="c.png", file_type="image", file_size=70, status=FileStatus.DELETED),
+        StoredFile(file_id="d", school_id=2, original_filename="d.pdf", file_type="document", file_size=10),
+    ])
+    db.commit()
+
+
+def test_increments_accumulate(db, stats):
+    stats.record_file_change(db, 1, "document", 1, 100)
+    stats.record_file_change(db, 1, "document", 1, 40)
+    stats.record_file_change(db, 1, "image", 1, 50)
+    stats.record_file_change(db, 1, "document", -1, -40)
+    stats.record_download(db, 1, "image")
+    db.commit()
+
+    assert stats.get_storage_totals(db, 1) == {
+        "file_types": {"document": 1, "image": 1},
+        "total_files": 2,
+        "total_size": 150,
+        "download_count": 1
+    }
+    assert stats.get_storage_totals(db, 2)["total_files"] == 0
+
+
+def test_analytics_fall_back_until_backfilled(db, stats):
+    add_files(db)
+    # Uploads after the deploy reach the counters, older files do not
+    stats.record_file_change(db, 1, "image", 1, 5)
+    db.commit()
+
+    analytics = stats.get_analytics(db, 1)
+    assert (analytics["total_files"], analytics["total_size"], analytics["download_count"]) == (2, 150, 4)
+    assert [top["file_id"] for top in analytics["top_files"]] == ["a", "b"]
+
+    assert stats.ensure_counters(db)
+    assert db.get(ServiceMarker, COUNTERS_MARKER) is not None
+    assert not stats.ensure_counters(db)
+
+    # Counters are authoritative once the marker is set
+    stats.record_file_change(db, 1, "video", 1, 30)
+    db.commit()
+    analytics = stats.get_analytics(db, 1)
+    assert (analytics["total_files"], analytics["total_size"]) == (3, 180)
+    assert analytics["file_types"] == {"document": 1, "image": 1, "video": 1}
+
+    # A fresh service instance reads the marker from the database
+    assert StorageStatsService(model=StoredFile).counters_initialized(db)
+
+
+def test_rebuild_repairs_drift(db, stats):
+    add_files(db)
+    stats.record_file_change(db, 1, "document", 5, 999)
+    stats.record_file_change(db, 2, "document", 5, 999)
+    db.commit()
+
+    assert stats.rebuild_counters(db, school_id=2) == 1
+    assert not stats.counters_initialized(db)
+    assert stats.get_storage_totals(db, 2) == stats.aggregate_files(db, 2)
+
+    assert stats.rebuild_counters(db) == 3
+    assert stats.counters_initialized(db)
+    for school_id in (1, 2):
+        assert stats.get_storage_totals(db, school_id) == stats.aggregate_files(db, school_id)
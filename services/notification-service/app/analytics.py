@@ -0,0 +1,242 @@
+"""
+EduNerve Notification Service - Notification Analytics
+Incremental daily counters from delivery events and SQL-aggregated rollups
+"""
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# notification_type -> NotificationAnalytics column counting its recipients
+TYPE_COLUMNS = {
+    "email": "email_sent",
+    "sms": "sms_sent",
+    "whatsapp": "whatsapp_sent",
+    "push": "push_sent",
+    "voice": "voice_sent",
+}
+
+# priority -> NotificationAnalytics column counting its recipients
+PRIORITY_COLUMNS = {
+    "emergency": "emergency_sent",
+    "urgent": "urgent_sent",
+    "high": "high_priority_sent",
+    "normal": "normal_sent",
+    "low": "low_priority_sent",
+}
+
+# Recipient status -> outcome column
+STATUS_COLUMNS = {
+    "delivered": "total_delivered",
+    "failed": "total_failed",
+}
+
+COUNTER_COLUMNS = (
+    ["total_sent", *STATUS_COLUMNS.values()]
+    + list(TYPE_COLUMNS.values())
+    + list(PRIORITY_COLUMNS.values())
+)
+
+
+def _dialect_insert(db: Session):
+    """Return the dialect insert construct that supports ON CONFLICT, if any"""
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+
+def _value(field: Any) -> Optional[str]:
+    """Normalize enum or string values"""
+    return getattr(field, "value", field)
+
+
+def _day(value: Any) -> date:
+    """Normalize a DATE() result (a string on SQLite) or datetime to a date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+class NotificationAnalyticsService:
+    """Maintains NotificationAnalytics rows without rescanning notifications
+
+    Counters are bucketed by the day the notification was created. Queueing adds to
+    total_sent and the type/priority columns; delivery outcomes add to (or, on retry,
+    subtract from) the delivered and failed columns. rollup_days recomputes a date
+    range with one GROUP BY and is used for backfills and drift repair.
+    """
+
+    def _write(self, db: Session, school_id: int, day: date, values: Dict[str, int], additive: bool):
+        """Upsert one school/day row, either adding to or replacing its counters"""
+        now = datetime.utcnow()
+        insert = _dialect_insert(db)
+
+        if insert is not None:
+            initial = {column: 0 for column in COUNTER_COLUMNS}
+            initial.update(values)
+            stmt = insert(models.NotificationAnalytics).values(
+                school_id=school_id,
+                date=day,
+                updated_at=now,
+                **initial
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["school_id", "date"],
+                set_={
+                    **{
+                        column: (
+                            getattr(models.NotificationAnalytics, column) + getattr(stmt.excluded, column)
+                            if additive else getattr(stmt.excluded, column)
+                        )
+                        for column in values
+                    },
+                    "updated_at": now
+                }
+            )
+            db.execute(stmt)
+            return
+
+        result = db.execute(
+            update(models.NotificationAnalytics)
+            .where(
+                models.NotificationAnalytics.school_id == school_id,
+                models.NotificationAnalytics.date == day
+            )
+            .values(
+                updated_at=now,
+                **{
+                    column: getattr(models.NotificationAnalytics, column) + value if additive else value
+                    for column, value in values.items()
+                }
+            )
+        )
+        if result.rowcount == 0:
+            db.add(models.NotificationAnalytics(school_id=school_id, date=day, **values))
+
+    def _notification_day(self, notification: models.Notification) -> date:
+        return (notification.created_at or datetime.utcnow()).date()
+
+    def record_queued(self, db: Session, notification: models.Notification, recipient_count: int):
+        """Count a notification's recipients in the caller's transaction"""
+        if notification.school_id is None or not recipient_count:
+            return
+
+        deltas = {"total_sent": recipient_count}
+        type_column = TYPE_COLUMNS.get(_value(notification.notification_type))
+        if type_column:
+            deltas[type_column] = recipient_count
+        priority_column = PRIORITY_COLUMNS.get(_value(notification.priority))
+        if priority_column:
+            deltas[priority_column] = recipient_count
+
+        self._write(db, notification.school_id, self._notification_day(notification), deltas, additive=True)
+
+    def record_outcomes(self, db: Session, notification: Any, status_deltas: Dict[str, int]):
+        """Apply recipient status changes (e.g. {"failed": 3} or {"failed": -1, "delivered": 1})"""
+        if getattr(notification, "school_id", None) is None:
+            return
+
+        deltas = {
+            STATUS_COLUMNS[status]: delta
+            for status, delta in status_deltas.items()
+            if status in STATUS_COLUMNS and delta
+        }
+        if deltas:
+            self._write(db, notification.school_id, self._notification_day(notification), deltas, additive=True)
+
+    def aggregate_days(self, db: Session, start: date, end: date) -> Dict[Tuple[int, date], Dict[str, int]]:
+        """Counters per (school_id, day) for notifications created in [start, end), in one query"""
+        day = func.date(models.Notification.created_at)
+        rows = db.query(
+            models.Notification.school_id,
+            day.label("day"),
+            models.Notification.notification_type,
+            models.Notification.priority,
+            models.NotificationRecipient.status,
+            func.count(models.NotificationRecipient.id).label("count")
+        ).join(
+            models.NotificationRecipient,
+            models.NotificationRecipient.notification_id == models.Notification.notification_id
+        ).filter(
+            models.Notification.created_at >= datetime.combine(start, datetime.min.time()),
+            models.Notification.created_at < datetime.combine(end, datetime.min.time()),
+            models.Notification.school_id.isnot(None)
+        ).group_by(
+            models.Notification.school_id,
+            day,
+            models.Notification.notification_type,
+            models.Notification.priority,
+            models.NotificationRecipient.status
+        ).all()
+
+        totals: Dict[Tuple[int, date], Dict[str, int]] = defaultdict(lambda: {column: 0 for column in COUNTER_COLUMNS})
+        for row in rows:
+            counters = totals[(row.school_id, _day(row.day))]
+            count = int(row.count)
+            counters["total_sent"] += count
+            for column in (
+                TYPE_COLUMNS.get(_value(row.notification_type)),
+                PRIORITY_COLUMNS.get(_value(row.priority)),
+                STATUS_COLUMNS.get(row.status)
+            ):
+                if column:
+                    counters[column] += count
+        return totals
+
+    def rollup_days(self, db: Session, start: date, end: date) -> int:
+        """Replace the counters of every school/day in [start, end) with aggregated values"""
+        totals = self.aggregate_days(db, start, end)
+        for (school_id, day), values in totals.items():
+            self._write(db, school_id, day, values, additive=False)
+        db.commit()
+        return len(totals)
+
+    async def backfill(
+        self,
+        start: date,
+        end: date,
+        chunk_days: Optional[int] = None,
+        pause_seconds: float = 0.1
+    ) -> Dict[str, int]:
+        """Rebuild historical days in chunks, each in its own short transaction"""
+        chunk_days = chunk_days or int(os.getenv("ANALYTICS_BACKFILL_CHUNK_DAYS", "7"))
+        summary = {"chunks": 0, "rows": 0}
+
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days), end)
+            db = SessionLocal()
+            try:
+                summary["rows"] += self.rollup_days(db, chunk_start, chunk_end)
+                summary["chunks"] += 1
+            finally:
+                db.close()
+
+            chunk_start = chunk_end
+            # Yield between chunks so a long backfill does not monopolise the database
+            await asyncio.sleep(pause_seconds)
+
+        return summary
+
+
+# Initialize service
+notification_analytics = NotificationAnalyticsService()
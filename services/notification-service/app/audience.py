@@ -0,0 +1,359 @@
+"""
+EduNerve Notification Service - Audience Resolution
+Pages through a school's users, drops duplicate addresses and opt-outs,
+and yields campaign recipients in chunks
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import httpx
+import phonenumbers
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from . import models
+from .auth import AUTH_SERVICE_URL
+from .dispatcher import get_recipient_address
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Auth-service role -> recipient_type
+ROLE_RECIPIENT_TYPES = {
+    "student": "student",
+    "teacher": "teacher",
+    "parent": "parent",
+    "school_admin": "admin",
+    "admin": "admin",
+}
+
+# Notification category -> NotificationSettings flag that opts out of it
+CATEGORY_SETTINGS = {
+    "academic": "academic_notifications",
+    "administrative": "administrative_notifications",
+    "marketing": "marketing_notifications",
+}
+
+
+def audience_queries(target_audience: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Translate target audience criteria into user queries
+
+    Supported criteria: all_users, all_students, all_teachers, all_parents,
+    user_types (roles), class_levels or grade_levels (narrows student queries) and
+    specific_users (user ids).
+    """
+    roles: List[str] = []
+    for flag, role in (("all_students", "student"), ("all_teachers", "teacher"), ("all_parents", "parent")):
+        if target_audience.get(flag):
+            roles.append(role)
+    for role in target_audience.get("user_types") or []:
+        if role not in roles:
+            roles.append(role)
+
+    queries: List[Dict[str, Any]] = []
+    if target_audience.get("all_users"):
+        queries.append({})
+    else:
+        class_levels = target_audience.get("class_levels") or target_audience.get("grade_levels") or [None]
+        for role in roles:
+            for class_level in (class_levels if role == "student" else [None]):
+                queries.append({"role": role, "class_level": class_level})
+    if target_audience.get("specific_users"):
+        queries.append({"user_ids": [int(user_id) for user_id in target_audience["specific_users"]]})
+    return queries
+
+
+def _user_record(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize an auth-service user (API response or replica row)"""
+    profile = user.get("profile_data") or {}
+    name = user.get("full_name") or " ".join(
+        part for part in (user.get("first_name"), user.get("last_name")) if part
+    )
+    phone = user.get("phone") or user.get("phone_number")
+    return {
+        "user_id": user.get("id"),
+        "role": user.get("role"),
+        "name": name or user.get("username") or user.get("email") or "",
+        "email": user.get("email"),
+        "phone": phone,
+        "whatsapp_number": profile.get("whatsapp_number") or user.get("whatsapp_number"),
+        "push_token": profile.get("push_token") or user.get("push_token"),
+        "language": profile.get("language") or "en",
+        "timezone": profile.get("timezone") or "UTC",
+    }
+
+
+def normalize_address(notification_type: str, address: str) -> str:
+    """Canonical form of an address, so the same mailbox or number is only messaged once"""
+    if notification_type == "email":
+        return address.strip().lower()
+    if notification_type in ("sms", "voice", "whatsapp"):
+        try:
+            parsed = phonenumbers.parse(address, os.getenv("DEFAULT_PHONE_REGION", "NG"))
+            return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+        except phonenumbers.NumberParseException:
+            return "".join(ch for ch in address if ch.isdigit())
+    return address.strip()
+
+
+class AudienceSource(ABC):
+    """Pages of users matching one audience query"""
+
+    @abstractmethod
+    async def fetch_page(
+        self,
+        school_id: int,
+        query: Dict[str, Any],
+        cursor: Any,
+        limit: int
+    ) -> Tuple[List[Dict[str, Any]], Any]:
+        """Return one page of users and the cursor of the next page (None when exhausted)"""
+        pass
+
+    async def close(self):
+        pass
+
+
+class AuthServiceAudienceSource(AudienceSource):
+    """Reads users from the auth service's user listing with a service token"""
+
+    def __init__(self, base_url: Optional[str] = None, token: Optional[str] = None):
+        self.base_url = (base_url or AUTH_SERVICE_URL).rstrip("/")
+        self.users_path = os.getenv("AUDIENCE_USERS_PATH", "/api/v1/users")
+        self.token = token or os.getenv("AUTH_SERVICE_TOKEN")
+        self.client: Optional[httpx.AsyncClient] = None
+
+    def _client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+            self.client = httpx.AsyncClient(base_url=self.base_url, headers=headers, timeout=30.0)
+        return self.client
+
+    async def fetch_page(self, school_id, query, cursor, limit):
+        client = self._client()
+        offset = cursor or 0
+
+        if "user_ids" in query:
+            ids = query["user_ids"][offset:offset + limit]
+            responses = await asyncio.gather(*(
+                client.get(f"{self.users_path}/{user_id}", params={"school_id": school_id})
+                for user_id in ids
+            ))
+            users = [response.json() for response in responses if response.status_code == 200]
+            next_offset = offset + limit
+            return users, next_offset if next_offset < len(query["user_ids"]) else None
+
+        params = {"skip": offset, "limit": limit, "school_id": school_id}
+        params.update({key: value for key, value in query.items() if value is not None})
+        response = await client.get(self.users_path, params=params)
+        response.raise_for_status()
+        users = response.json()
+        return users, offset + limit if len(users) == limit else None
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+_replica_engine: Optional[Engine] = None
+_replica_engine_lock = threading.Lock()
+
+
+def replica_engine() -> Engine:
+    """Engine of the auth database read replica, created once and shared by every campaign"""
+    global _replica_engine
+    with _replica_engine_lock:
+        if _replica_engine is None:
+            _replica_engine = create_engine(os.environ["AUDIENCE_REPLICA_DATABASE_URL"], pool_pre_ping=True)
+        return _replica_engine
+
+
+class ReplicaAudienceSource(AudienceSource):
+    """Reads users from a local read replica of the auth database with keyset pagination"""
+
+    def __init__(self, engine: Optional[Engine] = None, table: Optional[str] = None):
+        # The shared engine's pool outlives the campaign, so close() has nothing to release
+        self.engine = engine or replica_engine()
+        self.table = table or os.getenv("AUDIENCE_REPLICA_TABLE", "users")
+
+    def _fetch(self, school_id: int, query: Dict[str, Any], after_id: int, limit: int) -> List[Dict[str, Any]]:
+        conditions = ["school_id = :school_id", "id > :after_id", "is_active = :active"]
+        params: Dict[str, Any] = {"school_id": school_id, "after_id": after_id, "limit": limit, "active": True}
+        if query.get("role"):
+            conditions.append("role = :role")
+            params["role"] = query["role"]
+        if query.get("class_level"):
+            conditions.append("class_level = :class_level")
+            params["class_level"] = query["class_level"]
+        if "user_ids" in query:
+            names = [f"user_id_{index}" for index in range(len(query["user_ids"]))]
+            conditions.append(f"id IN ({', '.join(':' + name for name in names)})")
+            params.update(zip(names, query["user_ids"]))
+
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                text(
+                    f"SELECT * FROM {self.table} WHERE {' AND '.join(conditions)} "
+                    f"ORDER BY id LIMIT :limit"
+                ),
+                params
+            ).mappings().all()
+        return [dict(row) for row in rows]
+
+    async def fetch_page(self, school_id, query, cursor, limit):
+        # Run the blocking query off the event loop so sending keeps going meanwhile
+        users = await asyncio.to_thread(self._fetch, school_id, query, cursor or 0, limit)
+        return users, users[-1]["id"] if len(users) == limit else None
+
+
+def default_source() -> AudienceSource:
+    """Audience source selected by AUDIENCE_SOURCE (auth_service or replica)"""
+    if os.getenv("AUDIENCE_SOURCE", "auth_service") == "replica":
+        return ReplicaAudienceSource()
+    return AuthServiceAudienceSource()
+
+
+class AudienceResolver:
+    """Streams the recipients of a campaign in chunks ready for bulk insert
+
+    Users are fetched a page at a time, so memory stays bounded by the page and
+    chunk sizes plus the set of addresses already seen. Each address is used
+    once per campaign, users without an address for the channel are skipped,
+    and NotificationSettings opt-outs are applied one query per page.
+    Emergency notifications ignore channel and category opt-outs unless the
+    user disabled emergency notifications.
+    """
+
+    def __init__(
+        self,
+        source: Optional[AudienceSource] = None,
+        page_size: Optional[int] = None,
+        chunk_size: Optional[int] = None
+    ):
+        self.source = source
+        self.page_size = page_size or int(os.getenv("AUDIENCE_PAGE_SIZE", "500"))
+        self.chunk_size = chunk_size or int(os.getenv("AUDIENCE_CHUNK_SIZE", "500"))
+
+    async def resolve(
+        self,
+        db: Session,
+        school_id: int,
+        target_audience: Dict[str, Any],
+        notification_type: str,
+        category: Optional[str] = None,
+        priority: Optional[str] = None,
+        stats: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield lists of NotificationRecipient column values (without notification_id)"""
+        source = self.source or default_source()
+        stats = stats if stats is not None else {}
+        for key in ("fetched", "duplicates", "no_address", "opted_out", "resolved"):
+            stats.setdefault(key, 0)
+
+        seen_users: Set[int] = set()
+        seen_addresses: Set[str] = set()
+        chunk: List[Dict[str, Any]] = []
+        try:
+            for query in audience_queries(target_audience):
+                cursor = None
+                while True:
+                    users, cursor = await source.fetch_page(school_id, query, cursor, self.page_size)
+                    stats["fetched"] += len(users)
+                    records = [_user_record(user) for user in users]
+                    opted_out = self._opted_out(db, school_id, records, notification_type, category, priority)
+
+                    for record in records:
+                        if record["user_id"] in seen_users:
+                            stats["duplicates"] += 1
+                            continue
+                        address = get_recipient_address(notification_type, SimpleNamespace(**record))
+                        if not address:
+                            stats["no_address"] += 1
+                            continue
+                        key = normalize_address(notification_type, address)
+                        if key in seen_addresses:
+                            stats["duplicates"] += 1
+                            continue
+                        if record["user_id"] in opted_out:
+                            stats["opted_out"] += 1
+                            continue
+
+                        if record["user_id"] is not None:
+                            seen_users.add(record["user_id"])
+                        seen_addresses.add(key)
+                        chunk.append(self._recipient_row(record))
+                        if len(chunk) >= self.chunk_size:
+                            stats["resolved"] += len(chunk)
+                            yield chunk
+                            chunk = []
+
+                    if cursor is None:
+                        break
+
+            if chunk:
+                stats["resolved"] += len(chunk)
+                yield chunk
+        finally:
+            if self.source is None:
+                await source.close()
+
+    def _opted_out(
+        self,
+        db: Session,
+        school_id: int,
+        records: List[Dict[str, Any]],
+        notification_type: str,
+        category: Optional[str],
+        priority: Optional[str]
+    ) -> Set[int]:
+        """User ids in this page whose settings exclude this notification"""
+        user_ids = [record["user_id"] for record in records if record["user_id"] is not None]
+        if not user_ids:
+            return set()
+
+        settings = db.query(models.NotificationSettings).filter(
+            models.NotificationSettings.school_id == school_id,
+            models.NotificationSettings.user_id.in_(user_ids)
+        ).all()
+
+        channel_flag = f"{notification_type}_enabled"
+        category_flag = CATEGORY_SETTINGS.get(category)
+        opted_out = set()
+        for setting in settings:
+            if priority == "emergency":
+                if setting.emergency_notifications is False:
+                    opted_out.add(setting.user_id)
+                continue
+            if getattr(setting, channel_flag, True) is False:
+                opted_out.add(setting.user_id)
+            elif category_flag and getattr(setting, category_flag) is False:
+                opted_out.add(setting.user_id)
+        return opted_out
+
+    def _recipient_row(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "recipient_id": str(uuid.uuid4()),
+            "user_id": record["user_id"],
+            "recipient_type": ROLE_RECIPIENT_TYPES.get(record["role"], "student"),
+            "email": record["email"],
+            "phone": record["phone"],
+            "whatsapp_number": record["whatsapp_number"],
+            "push_token": record["push_token"],
+            "name": record["name"],
+            "language": record["language"],
+            "timezone": record["timezone"],
+            "status": "pending",
+        }
+
+
+# Initialize resolver
+audience_resolver = AudienceResolver()
@@ -0,0 +1,268 @@
+"""
+EduNerve Notification Service - Notification Dispatcher
+Sends to recipients concurrently through the provider pools and
+writes delivery results in batches
+"""
+
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .analytics import notification_analytics
+from .providers import NotificationProviderManager, provider_manager
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Statuses that must not be sent again when a notification is retried
+FINAL_RECIPIENT_STATUSES = ("sent", "delivered")
+
+
+def get_recipient_address(notification_type: str, recipient: Any) -> Optional[str]:
+    """Get the appropriate recipient address based on notification type"""
+    if notification_type == "email":
+        return recipient.email
+    elif notification_type in ("sms", "voice"):
+        return recipient.phone
+    elif notification_type == "whatsapp":
+        return recipient.whatsapp_number or recipient.phone
+    elif notification_type == "push":
+        return recipient.push_token
+    return None
+
+
+def _recipient_content(notification: models.Notification, recipient: Any) -> tuple:
+    """(subject, message, html_message) for a recipient, preferring personalised content"""
+    return (
+        getattr(recipient, "rendered_subject", None) or notification.subject,
+        getattr(recipient, "rendered_message", None) or notification.message,
+        getattr(recipient, "rendered_html_message", None) or notification.html_message
+    )
+
+
+class RecipientSnapshot(NamedTuple):
+    """What sending needs from a recipient, copied before mark_processing commits and expires the ORM rows"""
+    id: int
+    recipient_id: str
+    address: Optional[str]
+    content: tuple
+    delivery_attempts: int
+
+
+def snapshot_recipients(notification: models.Notification, recipients: List[Any]) -> List[RecipientSnapshot]:
+    """Plain copies of the recipients, taken while their attributes are still loaded"""
+    notification_type = notification.notification_type
+    return [
+        RecipientSnapshot(
+            id=recipient.id,
+            recipient_id=recipient.recipient_id,
+            address=get_recipient_address(notification_type, recipient),
+            content=_recipient_content(notification, recipient),
+            delivery_attempts=recipient.delivery_attempts or 0
+        )
+        for recipient in recipients
+    ]
+
+
+def _future_result(future: asyncio.Future) -> Dict[str, Any]:
+    """Provider result of a completed send future"""
+    if future.cancelled():
+        return {"success": False, "error": "Send cancelled"}
+    if future.exception():
+        return {"success": False, "error": str(future.exception())}
+    return future.result()
+
+
+class DeliveryBatchWriter:
+    """Buffers recipient status updates and delivery logs and writes them in batches"""
+
+    def __init__(self, db: Session, notification: models.Notification, provider_name: str, batch_size: int):
+        self.db = db
+        self.notification = notification
+        self.provider_name = provider_name
+        self.batch_size = batch_size
+        # Read once: the notification is expired by every commit
+        self.notification_id = notification.notification_id
+        self.recipient_rows: List[Dict[str, Any]] = []
+        self.log_rows: List[Dict[str, Any]] = []
+        self.flushes = 0
+
+    def mark_processing(self, recipients: List[RecipientSnapshot]):
+        """Mark the given unsent recipients as processing, one UPDATE per batch"""
+        ids = [recipient.id for recipient in recipients]
+        retried = 0
+        for start in range(0, len(ids), self.batch_size):
+            pending = self.db.query(models.NotificationRecipient).filter(
+                models.NotificationRecipient.notification_id == self.notification_id,
+                models.NotificationRecipient.id.in_(ids[start:start + self.batch_size]),
+                models.NotificationRecipient.status.notin_(FINAL_RECIPIENT_STATUSES)
+            )
+            retried += pending.filter(models.NotificationRecipient.status == "failed").count()
+            pending.update({
+                models.NotificationRecipient.status: "processing",
+                models.NotificationRecipient.delivery_attempts: models.NotificationRecipient.delivery_attempts + 1,
+                models.NotificationRecipient.last_attempt: datetime.utcnow()
+            }, synchronize_session=False)
+        # Recipients being retried no longer count as failed until this attempt settles
+        if retried:
+            notification_analytics.record_outcomes(self.db, self.notification, {"failed": -retried})
+        self.db.commit()
+
+    def add(self, recipient: RecipientSnapshot, result: Dict[str, Any], log: bool = True):
+        """Record one send result; flushes automatically when the batch is full"""
+        success = bool(result.get("success"))
+        row = {"id": recipient.id, "status": "sent" if success else "failed"}
+        if success:
+            row.update(external_id=result.get("provider_id"), provider_response=result)
+        else:
+            row["failed_reason"] = result.get("error", "Unknown error")
+        self.recipient_rows.append(row)
+
+        if log:
+            self.log_rows.append({
+                "log_id": str(uuid.uuid4()),
+                "notification_id": self.notification_id,
+                "recipient_id": recipient.recipient_id,
+                "provider": self.provider_name,
+                "provider_id": result.get("provider_id"),
+                # Attempts as snapshotted, before mark_processing counted this one
+                "attempt_number": recipient.delivery_attempts + 1,
+                "status": "sent" if success else "failed",
+                "response_code": result.get("response_code"),
+                "response_message": result.get("error", "Success"),
+                "response_data": result,
+                "attempted_at": datetime.utcnow(),
+                "completed_at": datetime.utcnow()
+            })
+
+        if len(self.recipient_rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered rows in one transaction"""
+        if not self.recipient_rows and not self.log_rows:
+            return
+
+        recipient_rows, log_rows = self.recipient_rows, self.log_rows
+        self.recipient_rows, self.log_rows = [], []
+        self._write(recipient_rows, log_rows)
+        self.flushes += 1
+
+    def _write(self, recipient_rows: List[Dict[str, Any]], log_rows: List[Dict[str, Any]]):
+        try:
+            if recipient_rows:
+                self.db.bulk_update_mappings(models.NotificationRecipient, recipient_rows)
+            if log_rows:
+                self.db.execute(insert(models.NotificationDeliveryLog), log_rows)
+            failed = sum(1 for row in recipient_rows if row["status"] == "failed")
+            notification_analytics.record_outcomes(self.db, self.notification, {"failed": failed})
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+
+class NotificationDispatcher:
+    """Fans a notification out to its recipients through the provider worker pools"""
+
+    def __init__(
+        self,
+        manager: Optional[NotificationProviderManager] = None,
+        batch_size: Optional[int] = None,
+        writer_class=DeliveryBatchWriter
+    ):
+        self.manager = manager or provider_manager
+        self.batch_size = batch_size or int(os.getenv("DISPATCH_WRITE_BATCH_SIZE", "200"))
+        self.writer_class = writer_class
+
+    async def dispatch(
+        self,
+        db: Session,
+        notification: models.Notification,
+        recipients: List[models.NotificationRecipient]
+    ) -> Dict[str, int]:
+        """Send to all recipients concurrently; returns sent/failed counts and write batches"""
+        notification_type = notification.notification_type
+        provider = self.manager.get_provider(notification_type)
+        provider_name = provider.get_provider_name() if provider else notification_type
+        writer = self.writer_class(db, notification, provider_name, self.batch_size)
+
+        # mark_processing commits, which would reload every recipient on its next attribute read
+        recipients = snapshot_recipients(notification, recipients)
+        attachments = notification.attachments
+        writer.mark_processing(recipients)
+        counts = {"sent": 0, "failed": 0}
+
+        if not provider:
+            logger.error(f"No provider for notification type: {notification_type}")
+            for recipient in recipients:
+                writer.add(recipient, {"success": False, "error": f"No provider for {notification_type}"}, log=False)
+            writer.flush()
+            counts["failed"] = len(recipients)
+            return {**counts, "write_batches": writer.flushes}
+
+        # Recipients sharing the same content can go out in one bulk request
+        groups: Dict[tuple, List[tuple]] = {}
+        for recipient in recipients:
+            if recipient.address:
+                groups.setdefault(recipient.content, []).append((recipient, recipient.address))
+            else:
+                writer.add(recipient, {"success": False, "error": f"No valid address for {notification_type}"}, log=False)
+                counts["failed"] += 1
+
+        # Providers with a bulk API take several recipients per request
+        batch_size = self.manager.get_batch_size(notification_type)
+        batches = [
+            (content, members[start:start + batch_size])
+            for content, members in groups.items()
+            for start in range(0, len(members), batch_size)
+        ]
+        sendable = sum(len(batch) for _, batch in batches)
+        results: asyncio.Queue = asyncio.Queue()
+
+        async def produce():
+            # Submitting blocks when the pool queue is full, so memory stays bounded
+            for index, ((subject, message, html_message), batch) in enumerate(batches):
+                try:
+                    futures = await self.manager.submit_batch(
+                        notification_type,
+                        [address for _, address in batch],
+                        message,
+                        subject=subject,
+                        html_message=html_message,
+                        attachments=attachments
+                    )
+                except Exception as e:
+                    for _, remaining in batches[index:]:
+                        for recipient, _ in remaining:
+                            results.put_nowait((recipient, {"success": False, "error": str(e)}))
+                    return
+                for (recipient, _), future in zip(batch, futures):
+                    future.add_done_callback(
+                        lambda done, recipient=recipient: results.put_nowait((recipient, _future_result(done)))
+                    )
+
+        producer = asyncio.create_task(produce())
+        try:
+            for _ in range(sendable):
+                recipient, result = await results.get()
+                counts["sent" if result.get("success") else "failed"] += 1
+                writer.add(recipient, result)
+            await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
+            writer.flush()
+
+        return {**counts, "write_batches": writer.flushes}
+
+
+# Initialize dispatcher
+notification_dispatcher = NotificationDispatcher()
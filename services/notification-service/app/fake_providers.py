@@ -0,0 +1,334 @@
+"""
+EduNerve Notification Service - Fake Providers
+In-process and local-HTTP stand-ins for the real providers, with configurable
+latency, error rate and rate limiting, for load tests and concurrency tuning
+"""
+
+import asyncio
+import logging
+import math
+import os
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+from .providers import NotificationProvider, http_sessions
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_LATENCY = "lognormal:0.08,0.5"
+
+
+class LatencyDistribution:
+    """Provider response times in seconds drawn from a named distribution
+
+    Specs look like "fixed:0.05", "uniform:0.02,0.2", "normal:0.1,0.03",
+    "lognormal:0.08,0.5" (median, sigma) or "exponential:0.1" (mean).
+    """
+
+    KINDS = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exponential": 1}
+
+    def __init__(self, kind: str = "fixed", *params: float):
+        if kind not in self.KINDS or len(params) != self.KINDS[kind]:
+            raise ValueError(f"Invalid latency distribution: {kind}{list(params)}")
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        kind, _, values = spec.strip().partition(":")
+        return cls(kind, *(float(value) for value in values.split(",") if value))
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.params)
+        elif self.kind == "lognormal":
+            median, sigma = self.params
+            value = rng.lognormvariate(math.log(median), sigma)
+        else:
+            value = rng.expovariate(1 / self.params[0])
+        return max(value, 0.0)
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{','.join(str(param) for param in self.params)}"
+
+
+class FakeProviderBehaviour:
+    """How a fake provider answers: latency, random failures and a 429 rate limit
+
+    The rate limit is a fixed one-second window counted in messages, like the
+    real SMS APIs; a request that would exceed it is rejected as a whole with
+    HTTP 429. Shared by the in-process provider and the local HTTP server so
+    both behave identically.
+    """
+
+    def __init__(
+        self,
+        latency: Optional[LatencyDistribution] = None,
+        error_rate: float = 0.0,
+        rate_limit: Optional[float] = None,
+        retry_after: float = 1.0,
+        seed: Optional[int] = None
+    ):
+        self.latency = latency or LatencyDistribution.parse(DEFAULT_LATENCY)
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.window_start = 0.0
+        self.window_count = 0
+        self.accepted_at: Dict[str, float] = {}
+        self.stats = {"requests": 0, "messages": 0, "accepted": 0, "errors": 0, "throttled": 0}
+        self.active = 0
+        self.peak_active = 0
+
+    @classmethod
+    def from_env(cls, seed: Optional[int] = None) -> "FakeProviderBehaviour":
+        """Behaviour configured by FAKE_PROVIDER_LATENCY, _ERROR_RATE and _RATE_LIMIT"""
+        rate_limit = os.getenv("FAKE_PROVIDER_RATE_LIMIT")
+        return cls(
+            latency=LatencyDistribution.parse(os.getenv("FAKE_PROVIDER_LATENCY", DEFAULT_LATENCY)),
+            error_rate=float(os.getenv("FAKE_PROVIDER_ERROR_RATE", "0")),
+            rate_limit=float(rate_limit) if rate_limit else None,
+            seed=seed
+        )
+
+    def _throttled(self, count: int) -> bool:
+        if not self.rate_limit:
+            return False
+        now = time.monotonic()
+        if now - self.window_start >= 1.0:
+            self.window_start, self.window_count = now, 0
+        if self.window_count + count > self.rate_limit:
+            return True
+        self.window_count += count
+        return False
+
+    async def respond(self, recipients: List[str], provider: str = "fake") -> List[Dict[str, Any]]:
+        """Results for one request to the provider, in recipient order"""
+        self.stats["requests"] += 1
+        self.stats["messages"] += len(recipients)
+        if self._throttled(len(recipients)):
+            self.stats["throttled"] += len(recipients)
+            return [self.throttled_result(provider) for _ in recipients]
+
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            await asyncio.sleep(self.latency.sample(self.rng))
+        finally:
+            self.active -= 1
+
+        now = time.time()
+        results = []
+        for recipient in recipients:
+            if self.rng.random() < self.error_rate:
+                self.stats["errors"] += 1
+                results.append({
+                    "success": False,
+                    "error": "Simulated provider error",
+                    "response_code": 500,
+                    "provider": provider
+                })
+                continue
+            self.stats["accepted"] += 1
+            self.accepted_at.setdefault(recipient, now)
+            results.append({
+                "success": True,
+                "provider_id": f"fake_{uuid.uuid4().hex}",
+                "status": "sent",
+                "provider": provider,
+                "sent_at": datetime.utcnow().isoformat()
+            })
+        return results
+
+    def throttled_result(self, provider: str = "fake") -> Dict[str, Any]:
+        return {
+            "success": False,
+            "error": "HTTP 429: Too Many Requests",
+            "response_code": 429,
+            "retry_after": self.retry_after,
+            "provider": provider
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        return {**self.stats, "peak_concurrency": self.peak_active}
+
+
+class FakeProvider(NotificationProvider):
+    """In-process provider answering according to a FakeProviderBehaviour"""
+
+    def __init__(self, channel: str, behaviour: Optional[FakeProviderBehaviour] = None, max_batch_size: int = 1):
+        self.channel = channel
+        self.behaviour = behaviour or FakeProviderBehaviour.from_env()
+        self.max_batch_size = max(int(max_batch_size), 1)
+
+    async def send(self, recipient: str, message: str, **kwargs) -> Dict[str, Any]:
+        return (await self.behaviour.respond([recipient], self.get_provider_name()))[0]
+
+    async def send_batch(self, recipients: List[str], message: str, **kwargs) -> List[Dict[str, Any]]:
+        if self.max_batch_size == 1:
+            return await super().send_batch(recipients, message, **kwargs)
+        return await self.behaviour.respond(recipients, self.get_provider_name())
+
+    def validate_recipient(self, recipient: str) -> bool:
+        return bool(recipient)
+
+    def get_provider_name(self) -> str:
+        return f"{self.channel}_fake"
+
+
+class FakeProviderServer:
+    """Local aiohttp server with a provider-like API for end-to-end HTTP load tests
+
+    POST /messages takes {"recipients": [...], "message": "..."} and answers
+    {"results": [...]}, or HTTP 429 with Retry-After when rate limited.
+    GET /stats returns the behaviour counters.
+    """
+
+    def __init__(self, behaviour: Optional[FakeProviderBehaviour] = None, host: str = "127.0.0.1", port: int = 0):
+        self.behaviour = behaviour or FakeProviderBehaviour.from_env()
+        self.host = host
+        self.port = port
+        self.runner: Optional[web.AppRunner] = None
+
+    def create_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/messages", self.handle_messages)
+        app.router.add_get("/stats", self.handle_stats)
+        return app
+
+    async def handle_messages(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        recipients = payload.get("recipients") or []
+        results = await self.behaviour.respond(recipients, payload.get("provider", "fake"))
+        if recipients and all(result.get("response_code") == 429 for result in results):
+            return web.json_response(
+                {"error": "Too Many Requests"},
+                status=429,
+                headers={"Retry-After": str(self.behaviour.retry_after)}
+            )
+        return web.json_response({"results": results})
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.behaviour.summary())
+
+    async def start(self) -> str:
+        """Start serving and return the base URL"""
+        self.runner = web.AppRunner(self.create_app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+        return self.base_url
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+class HTTPFakeProvider(NotificationProvider):
+    """Provider that sends through the shared HTTP sessions to a FakeProviderServer"""
+
+    def __init__(self, channel: str, base_url: str, max_batch_size: int = 1):
+        self.channel = channel
+        self.base_url = base_url.rstrip("/")
+        self.max_batch_size = max(int(max_batch_size), 1)
+
+    async def send(self, recipient: str, message: str, **kwargs) -> Dict[str, Any]:
+        return (await self._post([recipient], message))[0]
+
+    async def send_batch(self, recipients: List[str], message: str, **kwargs) -> List[Dict[str, Any]]:
+        if self.max_batch_size == 1:
+            return await super().send_batch(recipients, message, **kwargs)
+        return await self._post(recipients, message)
+
+    async def _post(self, recipients: List[str], message: str) -> List[Dict[str, Any]]:
+        provider = self.get_provider_name()
+        payload = {"recipients": recipients, "message": message, "provider": provider}
+        try:
+            async with http_sessions.get().post(f"{self.base_url}/messages", json=payload) as response:
+                if response.status == 429:
+                    result = {
+                        "success": False,
+                        "error": "HTTP 429: Too Many Requests",
+                        "response_code": 429,
+                        "retry_after": float(response.headers.get("Retry-After", "1")),
+                        "provider": provider
+                    }
+                    return [dict(result) for _ in recipients]
+                if response.status != 200:
+                    error = f"HTTP {response.status}: {await response.text()}"
+                    return [
+                        {"success": False, "error": error, "response_code": response.status, "provider": provider}
+                        for _ in recipients
+                    ]
+                return (await response.json())["results"]
+        except aiohttp.ClientError as e:
+            return [{"success": False, "error": str(e), "provider": provider} for _ in recipients]
+
+    def validate_recipient(self, recipient: str) -> bool:
+        return bool(recipient)
+
+    def get_provider_name(self) -> str:
+        return f"{self.channel}_fake_http"
+
+
+def install_fake_providers(manager, channels: Optional[List[str]] = None) -> Dict[str, NotificationProvider]:
+    """Replace the manager's providers for the given channels with fakes
+
+    Channels default to NOTIFICATION_FAKE_PROVIDERS ("sms,email" or "all").
+    With FAKE_PROVIDER_URL set the fakes call that FakeProviderServer over
+    HTTP; otherwise they answer in-process. FAKE_PROVIDER_BATCH_SIZE enables
+    bulk requests. Rate and concurrency budgets stay those of the channel.
+    """
+    if channels is None:
+        configured = os.getenv("NOTIFICATION_FAKE_PROVIDERS", "")
+        channels = list(manager.providers) if configured == "all" else [
+            channel.strip() for channel in configured.split(",") if channel.strip()
+        ]
+    base_url = os.getenv("FAKE_PROVIDER_URL")
+    batch_size = int(os.getenv("FAKE_PROVIDER_BATCH_SIZE", "1"))
+
+    installed: Dict[str, NotificationProvider] = {}
+    for channel in channels:
+        if base_url:
+            provider = HTTPFakeProvider(channel, base_url, max_batch_size=batch_size)
+        else:
+            provider = FakeProvider(channel, max_batch_size=batch_size)
+        manager.register_provider(channel, provider)
+        installed[channel] = provider
+    if installed:
+        logger.warning(f"Using fake notification providers for: {', '.join(installed)}")
+    return installed
+
+
+async def run_fake_provider_server(port: int = 9900):
+    """Serve a FakeProviderServer configured from the environment until cancelled"""
+    server = FakeProviderServer(host=os.getenv("FAKE_PROVIDER_HOST", "127.0.0.1"), port=port)
+    logger.info(f"Fake provider listening on {await server.start()}")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_fake_provider_server(int(os.getenv("FAKE_PROVIDER_PORT", "9900"))))
@@ -0,0 +1,309 @@
+"""
+EduNerve Notification Service - Load Test Harness
+Drives a bulk campaign through send_bulk_notification, the queue and the
+dispatcher against fake providers, and reports throughput, end-to-end
+latency percentiles and database writes
+
+    python -m app.loadtest --recipients 5000 --latency lognormal:0.08,0.5 --error-rate 0.02
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Column, Integer, Table, event, func
+from sqlalchemy.orm import sessionmaker
+
+from . import models, notification_service
+from .audience import AudienceResolver, AudienceSource
+from .database import SessionLocal
+from .dispatcher import NotificationDispatcher
+from .fake_providers import (
+    FakeProvider,
+    FakeProviderBehaviour,
+    FakeProviderServer,
+    HTTPFakeProvider,
+    LatencyDistribution,
+)
+from .providers import NotificationProviderManager
+from .queue_backends import DatabaseQueueBackend
+from .schemas import BulkNotificationRequest
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+LOAD_TEST_SCHOOL_ID = 999999
+
+
+@dataclass
+class LoadTestConfig:
+    """Shape of one load test run"""
+    recipients: int = 1000
+    channel: str = "sms"
+    mode: str = "inprocess"  # inprocess or http
+    latency: str = "lognormal:0.08,0.5"
+    error_rate: float = 0.0
+    provider_rate_limit: Optional[float] = None  # messages/sec before the fake answers 429
+    provider_batch_size: int = 1
+    send_rate: Optional[float] = None  # our client-side budget; defaults to the channel's
+    concurrency: Optional[int] = None
+    retry_base_seconds: int = 1
+    drain_timeout: float = 120.0
+    seed: int = 7
+
+
+@dataclass
+class LoadTestReport:
+    """Outcome of a load test run"""
+    recipients: int
+    sent: int
+    failed: int
+    duration_seconds: float
+    campaign_seconds: float
+    messages_per_second: float
+    latency_ms: Dict[str, float]
+    queue_batches: int
+    db_writes: Dict[str, int]
+    provider: Dict[str, Any]
+    errors: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class SyntheticAudienceSource(AudienceSource):
+    """A school of generated parents with distinct phone numbers and mailboxes"""
+
+    def __init__(self, count: int):
+        self.count = count
+
+    async def fetch_page(self, school_id, query, cursor, limit):
+        start = cursor or 0
+        users = [
+            {
+                "id": user_id,
+                "role": "parent",
+                "full_name": f"Parent {user_id}",
+                "email": f"parent{user_id}@loadtest.example.com",
+                "phone_number": f"+23480{user_id:08d}",
+            }
+            for user_id in range(start + 1, min(start + limit, self.count) + 1)
+        ]
+        next_cursor = start + limit
+        return users, next_cursor if next_cursor < self.count else None
+
+
+class DBWriteCounter:
+    """Counts INSERT, UPDATE and DELETE statements (and the rows they carry) on an engine"""
+
+    def __init__(self, bind):
+        self.bind = bind
+        self.statements: Counter = Counter()
+        self.rows = 0
+        event.listen(bind, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(None, 1)[0].upper()
+        if verb in ("INSERT", "UPDATE", "DELETE"):
+            self.statements[verb] += 1
+            self.rows += len(parameters) if executemany else 1
+
+    def summary(self) -> Dict[str, int]:
+        return {
+            "insert": self.statements["INSERT"],
+            "update": self.statements["UPDATE"],
+            "delete": self.statements["DELETE"],
+            "statements": sum(self.statements.values()),
+            "rows": self.rows
+        }
+
+    def close(self):
+        event.remove(self.bind, "before_cursor_execute", self._record)
+
+
+def percentiles(values: List[float], points=(50, 90, 95, 99)) -> Dict[str, float]:
+    """Nearest-rank percentiles (and the max) of the values"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    result = {
+        f"p{point}": ordered[min(len(ordered) - 1, max(0, -(-point * len(ordered) // 100) - 1))]
+        for point in points
+    }
+    result["max"] = ordered[-1]
+    return {key: round(value, 2) for key, value in result.items()}
+
+
+def create_notification_tables(bind):
+    """Create the notification tables on a scratch database"""
+    metadata = models.Base.metadata
+    # Foreign keys point at tables owned by other services
+    for name in ("users", "notification_templates"):
+        if name not in metadata.tables:
+            Table(name, metadata, Column("id", Integer, primary_key=True))
+    metadata.create_all(bind)
+
+
+async def _drain_queue(session_factory, queue_name: str, deadline: float) -> int:
+    """Work the campaign's queue (retries of failed sends) until it is empty; returns batches processed"""
+    Queue = models.NotificationQueue
+    db = session_factory()
+    batches = 0
+    try:
+        while time.perf_counter() < deadline:
+            outstanding = db.query(Queue).filter(Queue.status.in_(["pending", "processing"])).count()
+            db.commit()
+            if not outstanding:
+                break
+            results = await notification_service.NotificationService(db).process_queue(
+                queue_name, batch_size=10, wait_seconds=0.5
+            )
+            batches += 1 if results["processed"] else 0
+    finally:
+        db.close()
+    return batches
+
+
+async def run_load_test(config: LoadTestConfig, session_factory: Optional[sessionmaker] = None) -> LoadTestReport:
+    """Run one campaign end to end against a fake provider
+
+    The campaign goes through send_bulk_notification (resolution and sending
+    in parallel); failed sends then go through the queue's retries until the
+    queue is empty. The service's session factory, queue and dispatcher are
+    swapped for the run's own and restored afterwards.
+    """
+    session_factory = session_factory or SessionLocal
+    bind = session_factory.kw["bind"]
+
+    behaviour = FakeProviderBehaviour(
+        latency=LatencyDistribution.parse(config.latency),
+        error_rate=config.error_rate,
+        rate_limit=config.provider_rate_limit,
+        seed=config.seed
+    )
+    server = None
+    if config.mode == "http":
+        server = FakeProviderServer(behaviour)
+        provider = HTTPFakeProvider(config.channel, await server.start(), max_batch_size=config.provider_batch_size)
+    else:
+        provider = FakeProvider(config.channel, behaviour, max_batch_size=config.provider_batch_size)
+
+    manager = NotificationProviderManager(providers={})
+    manager.register_provider(
+        config.channel,
+        provider,
+        rate=config.send_rate,
+        burst=int(config.send_rate) if config.send_rate else None,
+        concurrency=config.concurrency
+    )
+    queue = DatabaseQueueBackend(session_factory=session_factory, bind=bind)
+    originals = (
+        notification_service.SessionLocal,
+        notification_service.notification_queue,
+        notification_service.notification_dispatcher,
+    )
+    notification_service.SessionLocal = session_factory
+    notification_service.notification_queue = queue
+    notification_service.notification_dispatcher = NotificationDispatcher(manager)
+    retry_base = os.environ.get("QUEUE_RETRY_BASE_SECONDS")
+    os.environ["QUEUE_RETRY_BASE_SECONDS"] = str(config.retry_base_seconds)
+
+    counter = DBWriteCounter(bind)
+    db = session_factory()
+    try:
+        request = BulkNotificationRequest(
+            type=config.channel,
+            subject="Load test",
+            message="EduNerve load test message",
+            target_audience={"all_parents": True}
+        )
+        resolver = AudienceResolver(SyntheticAudienceSource(config.recipients))
+        started_at = time.time()
+        started = time.perf_counter()
+
+        result = await notification_service.NotificationService(db).send_bulk_notification(
+            request, LOAD_TEST_SCHOOL_ID, resolver=resolver
+        )
+        campaign_seconds = time.perf_counter() - started
+        queue_batches = await _drain_queue(
+            session_factory, f"{request.priority.value}_priority", started + config.drain_timeout
+        )
+        duration = time.perf_counter() - started
+
+        Recipient = models.NotificationRecipient
+        statuses = dict(
+            db.query(Recipient.status, func.count(Recipient.id))
+            .filter(Recipient.notification_id == result.notification_id)
+            .group_by(Recipient.status)
+            .all()
+        )
+        sent = statuses.get("sent", 0) + statuses.get("delivered", 0)
+        latencies = [(accepted - started_at) * 1000 for accepted in behaviour.accepted_at.values()]
+        return LoadTestReport(
+            recipients=result.total_recipients,
+            sent=sent,
+            failed=result.total_recipients - sent,
+            duration_seconds=round(duration, 3),
+            campaign_seconds=round(campaign_seconds, 3),
+            messages_per_second=round(sent / duration, 1) if duration else 0.0,
+            latency_ms=percentiles(latencies),
+            queue_batches=queue_batches,
+            db_writes=counter.summary(),
+            provider={**behaviour.summary(), "name": provider.get_provider_name()},
+            errors=result.errors
+        )
+    finally:
+        counter.close()
+        db.close()
+        (
+            notification_service.SessionLocal,
+            notification_service.notification_queue,
+            notification_service.notification_dispatcher,
+        ) = originals
+        if retry_base is None:
+            os.environ.pop("QUEUE_RETRY_BASE_SECONDS", None)
+        else:
+            os.environ["QUEUE_RETRY_BASE_SECONDS"] = retry_base
+        await manager.close()
+        await queue.close()
+        if server is not None:
+            await server.stop()
+
+
+def main(argv: Optional[List[str]] = None):
+    defaults = LoadTestConfig()
+    parser = argparse.ArgumentParser(description="Load test the notification pipeline against fake providers")
+    parser.add_argument("--recipients", type=int, default=defaults.recipients)
+    parser.add_argument("--channel", default=defaults.channel, choices=["sms", "email", "whatsapp", "voice"])
+    parser.add_argument("--mode", default=defaults.mode, choices=["inprocess", "http"])
+    parser.add_argument("--latency", default=defaults.latency, help="e.g. fixed:0.05, uniform:0.02,0.2, lognormal:0.08,0.5")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--provider-rate-limit", type=float, help="messages/sec before the fake provider answers 429")
+    parser.add_argument("--provider-batch-size", type=int, default=defaults.provider_batch_size)
+    parser.add_argument("--send-rate", type=float, help="client-side messages/sec budget")
+    parser.add_argument("--concurrency", type=int)
+    parser.add_argument("--drain-timeout", type=float, default=defaults.drain_timeout)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--create-tables", action="store_true", help="create the notification tables first")
+    args = parser.parse_args(argv)
+
+    create_tables = args.create_tables
+    config = LoadTestConfig(**{
+        key: value for key, value in vars(args).items()
+        if key != "create_tables" and value is not None
+    })
+    if create_tables:
+        create_notification_tables(SessionLocal.kw["bind"])
+    report = asyncio.run(run_load_test(config))
+    print(json.dumps(report.to_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    main()
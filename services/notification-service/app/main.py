@@ -3,21 +3,28 @@ EduNerve Notification Service - FastAPI Application
 Main application for handling notification requests and management
 """
 
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, status
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
 import asyncio
 import logging
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import os
 from contextlib import asynccontextmanager
 
 from . import models, schemas
 from .database import engine, get_db
 from .auth import verify_token, get_current_user
-from .notification_service import NotificationService
+from .notification_service import NotificationService, run_bulk_campaign
+from .providers import provider_manager
+from .queue_backends import notification_queue
+from .template_engine import template_engine
+from .analytics import notification_analytics
+from .retention import retention_manager
+from .scheduler import publish_schedule_change
+from .receipts import parse_receipts, receipt_ingestor, verify_signature, RECEIPT_PARSERS
 from .security_config import SecurityConfig
 from .cors_config import apply_secure_cors
 from .error_handling import SecureErrorHandler
@@ -50,6 +57,7 @@ async def lifespan(app: FastAPI):
     # Start background task processor
     global notification_processor_task
     notification_processor_task = asyncio.create_task(notification_processor())
+    receipt_flusher_task = asyncio.create_task(receipt_ingestor.start())
     
     yield
     
@@ -63,6 +71,15 @@ async def lifespan(app: FastAPI):
             await notification_processor_task
         except asyncio.CancelledError:
             pass
+    
+    # Write buffered delivery receipts before the database goes away
+    await receipt_ingestor.stop()
+    await receipt_flusher_task
+    
+    # Stop provider worker pools and queue connections
+    await provider_manager.close()
+    await notification_queue.close()
+    template_engine.close()
 
 # Create FastAPI app
 app = FastAPI(
@@ -203,23 +220,20 @@ async def send_bulk_notification(
     try:
         service = NotificationService(db)
         
-        result = await service.send_bulk_notification(
+        campaign, notification = await service.create_bulk_campaign(
             request=request,
             school_id=user["school_id"],
             sender_id=user["user_id"]
         )
         
-        if not result.success:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Failed to send bulk notification: {', '.join(result.errors)}"
-            )
+        # Recipients are resolved and sent in the background, chunk by chunk
+        background_tasks.add_task(run_bulk_campaign, notification.notification_id)
         
         return {
             "success": True,
-            "notification_id": result.notification_id,
-            "recipients": result.total_recipients,
-            "queued": result.queued_count
+            "notification_id": notification.notification_id,
+            "campaign_id": campaign.campaign_id,
+            "status": "processing"
         }
         
     except Exception as e:
@@ -323,6 +337,13 @@ async def update_notification(
         notification.updated_at = datetime.utcnow()
         db.commit()
         
+        if "scheduled_at" in update_dict or "status" in update_dict:
+            publish_schedule_change(
+                db,
+                notification.notification_id,
+                notification.scheduled_at if notification.status == "pending" else None
+            )
+        
         return schemas.NotificationResponse.from_orm(notification)
         
     except HTTPException:
@@ -362,6 +383,7 @@ async def cancel_notification(
         notification.status = "cancelled"
         notification.updated_at = datetime.utcnow()
         db.commit()
+        publish_schedule_change(db, notification.notification_id, None)
         
         return {"message": "Notification cancelled successfully"}
         
@@ -495,8 +517,13 @@ async def update_template(
         for field, value in update_dict.items():
             setattr(template, field, value)
         
+        # A content change gets a new version so cached compiled templates are not reused
+        if {"subject_template", "message_template", "html_template"} & update_dict.keys():
+            template.version = (template.version or 1) + 1
+        
         template.updated_at = datetime.utcnow()
         db.commit()
+        template_engine.invalidate(template_id)
         
         return schemas.NotificationTemplateResponse.from_orm(template)
         
@@ -531,6 +558,7 @@ async def delete_template(
         template.is_active = False
         template.updated_at = datetime.utcnow()
         db.commit()
+        template_engine.invalidate(template_id)
         
         return {"message": "Template deleted successfully"}
         
@@ -676,37 +704,61 @@ async def update_notification_settings(
             detail="Failed to update settings"
         )
 
+# === WEBHOOK ENDPOINTS ===
+
+@app.get("/webhooks/delivery/meta")
+async def verify_meta_webhook(request: Request):
+    """Answer Meta's webhook subscription handshake"""
+    params = request.query_params
+    verify_token = os.getenv("META_WEBHOOK_VERIFY_TOKEN")
+    if params.get("hub.mode") != "subscribe" or not verify_token or params.get("hub.verify_token") != verify_token:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid verify token")
+    return Response(content=params.get("hub.challenge", ""), media_type="text/plain")
+
+@app.post("/webhooks/delivery/{provider}")
+async def receive_delivery_receipts(provider: str, request: Request):
+    """Accept provider delivery receipts; they are applied to recipients in batches"""
+    try:
+        if provider not in RECEIPT_PARSERS:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Unknown provider")
+        
+        body = await request.body()
+        if not verify_signature(provider, body, request.headers, str(request.url), request.query_params):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid signature")
+        
+        try:
+            receipts = parse_receipts(provider, body)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Malformed receipt")
+        
+        # Acknowledge straight away; providers retry slow or failed callbacks
+        accepted = receipt_ingestor.add(receipts)
+        return {"received": len(receipts), "accepted": accepted}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error receiving {provider} delivery receipts: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to receive delivery receipts"
+        )
+
 # === BACKGROUND TASKS ===
 
 async def notification_processor():
-    """Background task to process notification queue"""
-    while True:
-        try:
-            # Process different priority queues
-            for queue in ["emergency_priority", "urgent_priority", "high_priority", "normal_priority", "low_priority"]:
-                db = next(get_db())
-                try:
-                    service = NotificationService(db)
-                    result = await service.process_queue(queue_name=queue, batch_size=50)
-                    
-                    if result["processed"] > 0:
-                        logger.info(f"Processed {result['processed']} notifications from {queue} queue")
-                    
-                finally:
-                    db.close()
-            
-            # Wait before next processing cycle
-            await asyncio.sleep(30)  # Process every 30 seconds
-            
-        except Exception as e:
-            logger.error(f"Error in notification processor: {str(e)}")
-            await asyncio.sleep(60)  # Wait longer on error
+    """Background task consuming the notification queues"""
+    # Imported here because the background module builds on this app's services
+    from .background_tasks import processor
+    
+    # Consumers block on the queue backend, so new notifications are picked up immediately
+    await processor.run_queue_workers()
 
 # === ADMIN ENDPOINTS ===
 
 @app.post("/admin/process-queue")
 async def process_queue_manually(
-    queue_name: str = "normal",
+    queue_name: str = "normal_priority",
     batch_size: int = 100,
     user: Dict[str, Any] = Depends(get_current_user_with_school),
     db: Session = Depends(get_db)
@@ -776,6 +828,169 @@ async def get_queue_status(
             detail="Failed to get queue status"
         )
 
+
+@app.get("/admin/dead-letters")
+async def list_dead_letters(
+    limit: int = 100,
+    user: Dict[str, Any] = Depends(get_current_user_with_school)
+):
+    """List dead-lettered queue messages (admin only)"""
+    try:
+        # Check if user is admin
+        if user.get("user_type") != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Admin access required"
+            )
+        
+        return await notification_queue.list_dead_letters(limit=limit)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error listing dead letters: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to list dead letters"
+        )
+
+@app.post("/admin/dead-letters/{message_id}/requeue")
+async def requeue_dead_letter(
+    message_id: str,
+    user: Dict[str, Any] = Depends(get_current_user_with_school)
+):
+    """Put a dead-lettered message back on its queue (admin only)"""
+    try:
+        # Check if user is admin
+        if user.get("user_type") != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Admin access required"
+            )
+        
+        if not await notification_queue.requeue_dead_letter(message_id):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Dead-lettered message not found"
+            )
+        
+        return {"message": "Message requeued", "message_id": message_id}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error requeuing dead letter: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to requeue message"
+        )
+
+@app.post("/admin/analytics/backfill")
+async def backfill_analytics(
+    start_date: date,
+    background_tasks: BackgroundTasks,
+    end_date: Optional[date] = None,
+    user: Dict[str, Any] = Depends(get_current_user_with_school)
+):
+    """Rebuild daily analytics for a date range in chunks (admin only)"""
+    try:
+        # Check if user is admin
+        if user.get("user_type") != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Admin access required"
+            )
+        
+        end_date = end_date or datetime.utcnow().date()
+        if start_date > end_date:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="start_date must not be after end_date"
+            )
+        
+        # The end date is inclusive for callers; the rollup range is half-open
+        background_tasks.add_task(
+            notification_analytics.backfill,
+            start_date,
+            end_date + timedelta(days=1)
+        )
+        
+        return {
+            "message": "Analytics backfill started",
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat()
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error starting analytics backfill: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to start analytics backfill"
+        )
+
+@app.get("/admin/retention")
+async def get_retention_report(
+    user: Dict[str, Any] = Depends(get_current_user_with_school)
+):
+    """Get the report of the last retention run (admin only)"""
+    try:
+        # Check if user is admin
+        if user.get("user_type") != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Admin access required"
+            )
+        
+        report = retention_manager.last_report
+        return {
+            "last_run": report.to_dict() if report else None,
+            "batch_size": retention_manager.batch_size,
+            "time_budget_seconds": retention_manager.time_budget_seconds,
+            "use_partitions": retention_manager.use_partitions,
+            "policies": {policy.name: policy.days for policy in retention_manager.policies}
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting retention report: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get retention report"
+        )
+
+@app.post("/admin/retention/run")
+async def run_retention(
+    background_tasks: BackgroundTasks,
+    user: Dict[str, Any] = Depends(get_current_user_with_school)
+):
+    """Start a retention cleanup run; GET /admin/retention reports it (super admin only)"""
+    try:
+        # Retention deletes data of every school
+        if user.get("user_type") != "super_admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Super admin access required"
+            )
+        
+        background_tasks.add_task(retention_manager.run_in_new_session)
+        
+        return {
+            "message": "Retention run started",
+            "time_budget_seconds": retention_manager.time_budget_seconds
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error starting retention run: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to start retention run"
+        )
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
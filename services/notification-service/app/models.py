@@ -1,8 +1,9 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON, Enum
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Boolean, ForeignKey, JSON, Enum, Index, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
+import uuid
 
 Base = declarative_base()
 
@@ -40,7 +41,13 @@ class User(Base):
 
 class Notification(Base):
     __tablename__ = "notifications"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Analytics rollups scan a school's notifications by creation day
+        Index("ix_notifications_school_created", "school_id", "created_at"),
+        # The scheduler loads pending notifications due within its window
+        Index("ix_notifications_status_scheduled", "status", "scheduled_at"),
+        {'extend_existing': True}
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     notification_id = Column(String(100), unique=True, nullable=False)
@@ -53,7 +60,7 @@ class Notification(Base):
     sender_type = Column(String(50))
     school_id = Column(Integer)
     context = Column(JSON)
-    template_id = Column(Integer, ForeignKey("notification_templates.id"))
+    template_id = Column(String(100), ForeignKey("notification_templates.template_id"))
     template_data = Column(JSON)
     priority = Column(String(20), default="normal")
     category = Column(String(50))
@@ -71,18 +78,29 @@ class NotificationTemplate(Base):
     __tablename__ = "notification_templates"
     
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String(100), unique=True, nullable=False)
+    template_id = Column(String(100), unique=True, nullable=False, default=lambda: str(uuid.uuid4()))
+    school_id = Column(Integer, index=True)
+    name = Column(String(100), nullable=False)
+    description = Column(Text)
     template_type = Column(String(20), nullable=False)  # email, sms, push, whatsapp
-    subject = Column(String(200))
-    content = Column(Text, nullable=False)
-    html_content = Column(Text)
+    subject_template = Column(String(200))
+    message_template = Column(Text, nullable=False)
+    html_template = Column(Text)
+    language = Column(String(10), default="en")
+    translations = Column(JSON)
     variables = Column(JSON)  # Template variables
+    category = Column(String(50))
+    is_system_template = Column(Boolean, default=False)
     is_active = Column(Boolean, default=True)
+    version = Column(Integer, default=1, nullable=False)  # Bumped on every content change; keys the compiled template cache
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class NotificationRecipient(Base):
     __tablename__ = "notification_recipients"
+    __table_args__ = (
+        Index("ix_notification_recipients_notification_status", "notification_id", "status"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     recipient_id = Column(String(100), unique=True, nullable=False)
@@ -97,12 +115,47 @@ class NotificationRecipient(Base):
     language = Column(String(10), default="en")
     timezone = Column(String(50))
     status = Column(String(20), default="pending")
+    delivery_attempts = Column(Integer, default=0)
+    last_attempt = Column(DateTime)
+    external_id = Column(String(100), index=True)  # Provider's message ID, matched by delivery receipts
+    provider_response = Column(JSON)
     delivered_at = Column(DateTime)
+    read_at = Column(DateTime)
+    receipt_checked_at = Column(DateTime)  # Last time the receipt sweeper polled the provider
     failed_reason = Column(Text)
+    # Per-recipient content when the template personalises on `recipient`
+    rendered_subject = Column(String(200))
+    rendered_message = Column(Text)
+    rendered_html_message = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
 
+class NotificationAnalytics(Base):
+    """Daily per-school notification counters, maintained incrementally from delivery events"""
+    __tablename__ = "notification_analytics"
+    __table_args__ = (
+        UniqueConstraint("school_id", "date", name="uq_notification_analytics_school_date"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    school_id = Column(Integer, nullable=False)
+    date = Column(Date, nullable=False)  # Day the notifications were created
+    total_sent = Column(Integer, default=0, nullable=False)  # Recipients queued
+    total_delivered = Column(Integer, default=0, nullable=False)
+    total_failed = Column(Integer, default=0, nullable=False)
+    email_sent = Column(Integer, default=0, nullable=False)
+    sms_sent = Column(Integer, default=0, nullable=False)
+    whatsapp_sent = Column(Integer, default=0, nullable=False)
+    push_sent = Column(Integer, default=0, nullable=False)
+    voice_sent = Column(Integer, default=0, nullable=False)
+    emergency_sent = Column(Integer, default=0, nullable=False)
+    urgent_sent = Column(Integer, default=0, nullable=False)
+    high_priority_sent = Column(Integer, default=0, nullable=False)
+    normal_sent = Column(Integer, default=0, nullable=False)
+    low_priority_sent = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class NotificationDeliveryLog(Base):
     __tablename__ = "notification_delivery_logs"
     
@@ -111,7 +164,12 @@ class NotificationDeliveryLog(Base):
     notification_id = Column(String(100), ForeignKey("notifications.notification_id"))
     recipient_id = Column(String(100), ForeignKey("notification_recipients.recipient_id"))
     provider = Column(String(50), nullable=False)
+    provider_id = Column(String(100))  # Provider's message ID
+    attempt_number = Column(Integer, default=1)
     status = Column(String(20), nullable=False)
+    response_code = Column(String(20))
+    response_message = Column(Text)
+    response_data = Column(JSON)
     attempted_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime)
     error_message = Column(Text)
@@ -127,7 +185,7 @@ class BulkNotification(Base):
     created_by = Column(Integer, ForeignKey("users.id"))
     school_id = Column(Integer)
     notification_type = Column(String(50), nullable=False)
-    template_id = Column(Integer, ForeignKey("notification_templates.id"))
+    template_id = Column(String(100), ForeignKey("notification_templates.template_id"))
     target_audience = Column(JSON)
     estimated_recipients = Column(Integer, default=0)
     actual_recipients = Column(Integer, default=0)
@@ -146,23 +204,28 @@ class BulkNotification(Base):
 
 class NotificationQueue(Base):
     __tablename__ = "notification_queue"
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        Index("ix_notification_queue_claim", "queue_name", "status", "priority", "queued_at"),
+        {'extend_existing': True}
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    template_id = Column(Integer, ForeignKey("notification_templates.id"))
-    recipient = Column(String(200), nullable=False)  # email, phone, device_token
-    notification_type = Column(String(20), nullable=False)
-    subject = Column(String(200))
-    content = Column(Text, nullable=False)
-    variables = Column(JSON)
-    status = Column(String(20), default='pending')  # pending, sent, failed, retrying
+    queue_id = Column(String(100), unique=True, nullable=False)
+    notification_id = Column(String(100), ForeignKey("notifications.notification_id"))
+    queue_name = Column(String(50), nullable=False)
+    priority = Column(Integer, default=2)
+    status = Column(String(20), default='pending')  # pending, processing, completed, dead_letter
     attempts = Column(Integer, default=0)
     max_attempts = Column(Integer, default=3)
+    next_retry = Column(DateTime)
+    worker_id = Column(String(100))
+    locked_until = Column(DateTime)  # Visibility timeout of the current lease
     error_message = Column(Text)
-    scheduled_at = Column(DateTime, default=datetime.utcnow)
-    sent_at = Column(DateTime)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    queue_metadata = Column(JSON)
+    queued_at = Column(DateTime, default=datetime.utcnow)
+    processing_started = Column(DateTime)
+    processing_completed = Column(DateTime)
+    dead_lettered_at = Column(DateTime)
 
 class NotificationLog(Base):
     __tablename__ = "notification_logs"
@@ -177,7 +240,7 @@ class NotificationLog(Base):
     error_message = Column(Text)
     sent_at = Column(DateTime)
     delivered_at = Column(DateTime)
-    metadata = Column(JSON, default={})
+    log_metadata = Column(JSON, default={})  # Renamed from metadata to avoid SQLAlchemy reserved name
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -202,6 +265,45 @@ class WhatsAppTemplate(Base):
     error_message = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class SchedulerLease(Base):
+    """Leader lease so only one replica fires scheduled notifications"""
+    __tablename__ = "scheduler_leases"
+    
+    name = Column(String(100), primary_key=True)
+    holder = Column(String(200), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+    renewed_at = Column(DateTime, default=datetime.utcnow)
+
+class NotificationSettings(Base):
+    """Per-user channel and category preferences; a disabled channel or category is an opt-out"""
+    __tablename__ = "notification_settings"
+    __table_args__ = (
+        UniqueConstraint("user_id", "school_id", name="uq_notification_settings_user_school"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False)
+    school_id = Column(Integer, nullable=False)
+    user_type = Column(String(20), default="student")
+    email_enabled = Column(Boolean, default=True)
+    sms_enabled = Column(Boolean, default=True)
+    whatsapp_enabled = Column(Boolean, default=True)
+    push_enabled = Column(Boolean, default=True)
+    voice_enabled = Column(Boolean, default=False)
+    academic_notifications = Column(Boolean, default=True)
+    administrative_notifications = Column(Boolean, default=True)
+    emergency_notifications = Column(Boolean, default=True)
+    marketing_notifications = Column(Boolean, default=False)
+    quiet_hours_start = Column(String(5))
+    quiet_hours_end = Column(String(5))
+    timezone = Column(String(50), default="UTC")
+    language = Column(String(10), default="en")
+    auto_translate = Column(Boolean, default=True)
+    digest_mode = Column(Boolean, default=False)
+    digest_frequency = Column(String(20), default="daily")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class UserNotificationPreference(Base):
     __tablename__ = "user_notification_preferences"
     
@@ -4,21 +4,23 @@ Handles notification processing, queuing, and delivery management
 """
 
 import asyncio
-import json
 import logging
 from typing import Dict, List, Optional, Any, Tuple
-from datetime import datetime, timedelta
+from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
+from sqlalchemy import insert
+from types import SimpleNamespace
 from . import models, schemas
-from .providers import (
-    SMSProvider, WhatsAppProvider, EmailProvider, 
-    PushProvider, VoiceProvider
-)
-from .database import get_db
+from .providers import provider_manager
+from .dispatcher import notification_dispatcher, get_recipient_address
+from .queue_backends import QueueMessage, notification_queue
+from .template_engine import template_engine
+from .analytics import notification_analytics
+from .audience import AudienceResolver, audience_resolver
+from .database import SessionLocal
+from .scheduler import publish_schedule_change
 import uuid
 import os
-from jinja2 import Template
 from dataclasses import dataclass
 
 # Configure logging
@@ -39,13 +41,8 @@ class NotificationService:
     
     def __init__(self, db: Session):
         self.db = db
-        self.providers = {
-            "sms": SMSProvider(),
-            "whatsapp": WhatsAppProvider(),
-            "email": EmailProvider(),
-            "push": PushProvider(),
-            "voice": VoiceProvider()
-        }
+        # Providers are shared so their worker pools and rate budgets are process-wide
+        self.providers = provider_manager.providers
     
     async def create_notification(
         self, 
@@ -80,10 +77,6 @@ class NotificationService:
             self.db.add(notification)
             self.db.flush()  # Get the ID without committing
             
-            # Process template if provided
-            if notification_data.template_id:
-                await self._apply_template(notification, notification_data.template_data)
-            
             # Create recipient records
             recipients_created = []
             for recipient_data in notification_data.recipients:
@@ -104,15 +97,21 @@ class NotificationService:
                 self.db.add(recipient)
                 recipients_created.append(recipient)
             
+            # Process template if provided
+            if notification_data.template_id:
+                await self._apply_template(notification, notification_data.template_data, recipients_created)
+            
+            # Count the recipients in the same transaction as the notification
+            notification_analytics.record_queued(self.db, notification, len(recipients_created))
+            
             self.db.commit()
             
-            # Queue for processing
+            # Queue for processing, or hand future notifications to the scheduler
             queued_count = 0
             if notification_data.scheduled_at is None or notification_data.scheduled_at <= datetime.utcnow():
                 queued_count = await self._queue_notification(notification)
-            
-            # Update analytics
-            await self._update_analytics(school_id, notification_data.notification_type, len(recipients_created))
+            else:
+                publish_schedule_change(self.db, notification.notification_id, notification.scheduled_at)
             
             return NotificationResult(
                 success=True,
@@ -175,64 +174,188 @@ class NotificationService:
                 provider_responses=[]
             )
     
+    async def create_bulk_campaign(
+        self,
+        request: schemas.BulkNotificationRequest,
+        school_id: int,
+        sender_id: Optional[int] = None
+    ) -> Tuple[models.BulkNotification, models.Notification]:
+        """Create a bulk campaign and its notification; recipients are added by run_bulk_campaign"""
+        campaign = models.BulkNotification(
+            campaign_id=str(uuid.uuid4()),
+            name=f"Bulk {request.type} - {datetime.utcnow().strftime('%Y-%m-%d %H:%M')}",
+            description=f"Bulk notification: {request.subject or request.message[:50]}...",
+            created_by=sender_id,
+            school_id=school_id,
+            notification_type=request.type,
+            template_id=request.template_id,
+            target_audience=request.target_audience,
+            scheduled_at=request.scheduled_at,
+            expires_at=request.expires_at,
+            content=request.message,
+            variables=request.template_data,
+            status="processing"
+        )
+        
+        # "resolving" keeps the scheduler and queue workers away until recipients are in
+        notification = models.Notification(
+            notification_id=str(uuid.uuid4()),
+            notification_type=request.type,
+            subject=request.subject,
+            message=request.message,
+            sender_id=sender_id,
+            school_id=school_id,
+            template_id=request.template_id,
+            template_data=request.template_data,
+            priority=request.priority,
+            scheduled_at=request.scheduled_at,
+            expires_at=request.expires_at,
+            status="resolving",
+            notification_metadata={"bulk_campaign_id": campaign.campaign_id}
+        )
+        
+        self.db.add_all([campaign, notification])
+        self.db.commit()
+        return campaign, notification
+    
+    async def run_bulk_campaign(
+        self,
+        notification_id: str,
+        resolver: Optional[AudienceResolver] = None
+    ) -> NotificationResult:
+        """Resolve a campaign's audience in chunks and send each chunk as soon as it is stored
+        
+        Recipients are bulk-inserted a chunk at a time while a sender task
+        dispatches the chunks already stored, so the first messages go out
+        before the audience is fully resolved. Scheduled campaigns only store
+        their recipients and are sent by the scheduler.
+        """
+        resolver = resolver or audience_resolver
+        notification = self.db.query(models.Notification).filter(
+            models.Notification.notification_id == notification_id
+        ).first()
+        campaign_id = ((notification.notification_metadata or {}) if notification else {}).get("bulk_campaign_id")
+        campaign = self.db.query(models.BulkNotification).filter(
+            models.BulkNotification.campaign_id == campaign_id
+        ).first() if campaign_id else None
+        if not campaign:
+            return NotificationResult(False, notification_id, 0, 0, [f"Bulk notification {notification_id} not found"], [])
+        
+        send_now = notification.scheduled_at is None or notification.scheduled_at <= datetime.utcnow()
+        chunks: asyncio.Queue = asyncio.Queue(maxsize=int(os.getenv("AUDIENCE_PIPELINE_DEPTH", "4")))
+        sender = asyncio.create_task(self._send_campaign_chunks(notification.notification_id, chunks)) if send_now else None
+        stats: Dict[str, int] = {}
+        errors: List[str] = []
+        
+        try:
+            template = await self._apply_template(notification, notification.template_data, [])
+            async for rows in resolver.resolve(
+                self.db,
+                campaign.school_id,
+                campaign.target_audience or {},
+                notification.notification_type,
+                category=notification.category,
+                priority=notification.priority,
+                stats=stats
+            ):
+                if template is not None:
+                    await self._render_recipients(template, notification.template_data, [SimpleNamespace(**row) for row in rows], rows)
+                for row in rows:
+                    row["notification_id"] = notification.notification_id
+                
+                self.db.execute(insert(models.NotificationRecipient), rows)
+                notification_analytics.record_queued(self.db, notification, len(rows))
+                campaign.actual_recipients = (campaign.actual_recipients or 0) + len(rows)
+                self.db.commit()
+                
+                if sender is not None:
+                    await chunks.put([row["recipient_id"] for row in rows])
+        except Exception as e:
+            logger.error(f"Error resolving audience for campaign {campaign_id}: {str(e)}")
+            self.db.rollback()
+            errors.append(str(e))
+        finally:
+            if sender is not None:
+                await chunks.put(None)
+        
+        counts = await sender if sender is not None else {"sent": 0, "failed": 0}
+        total = campaign.actual_recipients or 0
+        campaign.estimated_recipients = stats.get("fetched", total)
+        campaign.sent_count = counts["sent"]
+        
+        if not send_now:
+            notification.status = "pending"
+        elif counts["sent"] == total and total > 0:
+            notification.status = "sent"
+            notification.sent_at = datetime.utcnow()
+        elif counts["sent"] > 0:
+            notification.status = "partially_sent"
+        else:
+            notification.status = "failed"
+        campaign.status = "failed" if errors or (send_now and total and not counts["sent"]) else "completed"
+        campaign.completed_at = datetime.utcnow()
+        self.db.commit()
+        if not send_now:
+            publish_schedule_change(self.db, notification.notification_id, notification.scheduled_at)
+        
+        # Failed sends (and recipients stored before a resolution error) get the queue's retries
+        queued_count = 0
+        if send_now and (counts["failed"] or counts["sent"] < total):
+            queued_count = await self._queue_notification(notification)
+        
+        logger.info(f"Campaign {campaign_id}: {stats}, sent {counts['sent']}, failed {counts['failed']}")
+        return NotificationResult(
+            success=not errors,
+            notification_id=notification.notification_id,
+            total_recipients=total,
+            queued_count=queued_count,
+            errors=errors,
+            provider_responses=[]
+        )
+    
+    async def _send_campaign_chunks(self, notification_id: str, chunks: asyncio.Queue) -> Dict[str, int]:
+        """Dispatch stored recipient chunks until the resolver signals the end with None"""
+        counts = {"sent": 0, "failed": 0}
+        db = SessionLocal()
+        try:
+            notification = db.query(models.Notification).filter(
+                models.Notification.notification_id == notification_id
+            ).first()
+            while True:
+                recipient_ids = await chunks.get()
+                if recipient_ids is None:
+                    break
+                try:
+                    recipients = db.query(models.NotificationRecipient).filter(
+                        models.NotificationRecipient.recipient_id.in_(recipient_ids)
+                    ).all()
+                    summary = await notification_dispatcher.dispatch(db, notification, recipients)
+                    counts["sent"] += summary["sent"]
+                    counts["failed"] += summary["failed"]
+                except Exception as e:
+                    # Keep draining so the resolver is never blocked; the queue retries these later
+                    logger.error(f"Error sending campaign chunk for {notification_id}: {str(e)}")
+                    db.rollback()
+                    counts["failed"] += len(recipient_ids)
+        finally:
+            db.close()
+        return counts
+    
     async def send_bulk_notification(
         self, 
         request: schemas.BulkNotificationRequest,
         school_id: int,
-        sender_id: Optional[int] = None
+        sender_id: Optional[int] = None,
+        resolver: Optional[AudienceResolver] = None
     ) -> NotificationResult:
         """Send bulk notification to target audience"""
         try:
-            # Create bulk notification campaign
-            campaign = models.BulkNotification(
-                campaign_id=str(uuid.uuid4()),
-                name=f"Bulk {request.type} - {datetime.utcnow().strftime('%Y-%m-%d %H:%M')}",
-                description=f"Bulk notification: {request.subject or request.message[:50]}...",
-                created_by=sender_id,
-                school_id=school_id,
-                notification_type=request.type,
-                template_id=request.template_id,
-                target_audience=request.target_audience,
-                scheduled_at=request.scheduled_at,
-                expires_at=request.expires_at,
-                status="processing"
-            )
-            
-            self.db.add(campaign)
-            self.db.flush()
-            
-            # Get recipients based on target audience
-            recipients = await self._get_bulk_recipients(request.target_audience, school_id)
-            campaign.estimated_recipients = len(recipients)
-            campaign.actual_recipients = len(recipients)
-            
-            # Create notification for bulk processing
-            notification_data = schemas.NotificationCreate(
-                notification_type=request.type,
-                subject=request.subject,
-                message=request.message,
-                template_id=request.template_id,
-                template_data=request.template_data,
-                priority=request.priority,
-                scheduled_at=request.scheduled_at,
-                expires_at=request.expires_at,
-                recipients=recipients,
-                metadata={"bulk_campaign_id": campaign.campaign_id}
-            )
-            
-            result = await self.create_notification(notification_data, school_id, sender_id)
-            
-            # Update campaign status
-            campaign.status = "completed" if result.success else "failed"
-            campaign.sent_count = result.queued_count
-            campaign.completed_at = datetime.utcnow()
-            
-            self.db.commit()
-            
-            return result
+            _, notification = await self.create_bulk_campaign(request, school_id, sender_id)
+            return await self.run_bulk_campaign(notification.notification_id, resolver=resolver)
             
         except Exception as e:
             logger.error(f"Failed to send bulk notification: {str(e)}")
+            self.db.rollback()
             return NotificationResult(
                 success=False,
                 notification_id="",
@@ -242,26 +365,16 @@ class NotificationService:
                 provider_responses=[]
             )
     
-    async def process_queue(self, queue_name: str = "normal", batch_size: int = 100) -> Dict[str, Any]:
-        """Process notifications in the queue"""
+    async def process_queue(
+        self,
+        queue_name: str = "normal_priority",
+        batch_size: int = 100,
+        wait_seconds: float = 0,
+        consumer: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Lease a batch from the queue backend and process it"""
         try:
-            # Get pending queue items
-            queue_items = (
-                self.db.query(models.NotificationQueue)
-                .filter(
-                    and_(
-                        models.NotificationQueue.status == "pending",
-                        models.NotificationQueue.notification_type == queue_name,
-                        or_(
-                            models.NotificationQueue.next_retry.is_(None),
-                            models.NotificationQueue.next_retry <= datetime.utcnow()
-                        )
-                    )
-                )
-                .order_by(models.NotificationQueue.priority.desc(), models.NotificationQueue.queued_at)
-                .limit(batch_size)
-                .all()
-            )
+            messages = await notification_queue.claim(queue_name, batch_size, wait_seconds, consumer=consumer)
             
             results = {
                 "processed": 0,
@@ -270,43 +383,27 @@ class NotificationService:
                 "errors": []
             }
             
-            for queue_item in queue_items:
-                try:
-                    # Mark as processing
-                    queue_item.status = "processing"
-                    queue_item.processing_started = datetime.utcnow()
-                    queue_item.worker_id = f"worker_{os.getpid()}"
-                    self.db.commit()
-                    
-                    # Process notification
-                    success = await self._process_notification_item(queue_item)
-                    
-                    # Update queue item
+            # Keep every lease of the batch alive, not just the message being processed,
+            # so messages waiting their turn are not reclaimed and sent twice
+            leased = {message.message_id: message for message in messages}
+            heartbeat = asyncio.create_task(notification_queue.keep_alive(leased))
+            try:
+                for message in messages:
+                    if message.message_id not in leased:
+                        # Reclaimed by another consumer while waiting
+                        results["errors"].append(f"Lease lost on queue message {message.message_id}")
+                        continue
+                    success, error = await self.handle_queue_message(message)
+                    leased.pop(message.message_id, None)
+                    results["processed"] += 1
                     if success:
-                        queue_item.status = "completed"
-                        queue_item.processing_completed = datetime.utcnow()
                         results["success"] += 1
                     else:
-                        queue_item.retry_count += 1
-                        if queue_item.retry_count >= queue_item.max_retries:
-                            queue_item.status = "failed"
-                        else:
-                            queue_item.status = "pending"
-                            queue_item.next_retry = datetime.utcnow() + timedelta(minutes=5 * queue_item.retry_count)
                         results["failed"] += 1
-                    
-                    results["processed"] += 1
-                    
-                except Exception as e:
-                    logger.error(f"Error processing queue item {queue_item.id}: {str(e)}")
-                    results["errors"].append(str(e))
-                    
-                    # Reset queue item status
-                    queue_item.status = "pending"
-                    queue_item.processing_started = None
-                    queue_item.worker_id = None
-                
-                self.db.commit()
+                        if error:
+                            results["errors"].append(error)
+            finally:
+                heartbeat.cancel()
             
             return results
             
@@ -319,6 +416,27 @@ class NotificationService:
                 "errors": [str(e)]
             }
     
+    async def handle_queue_message(self, message: QueueMessage) -> Tuple[bool, Optional[str]]:
+        """Process one leased message, then ack it or hand it back for retry/dead-lettering
+
+        The caller keeps the lease alive (see process_queue).
+        """
+        error = None
+        try:
+            success = await self._process_notification_item(message)
+            if not success:
+                error = f"Delivery failed for notification {message.notification_id}"
+        except Exception as e:
+            logger.error(f"Error processing queue message {message.message_id}: {str(e)}")
+            self.db.rollback()
+            success, error = False, str(e)
+        
+        if success:
+            await notification_queue.ack(message)
+        else:
+            await notification_queue.nack(message, error)
+        return success, error
+    
     async def get_notification_status(self, notification_id: str) -> Optional[Dict[str, Any]]:
         """Get notification status and delivery details"""
         try:
@@ -398,9 +516,20 @@ class NotificationService:
             logger.error(f"Error getting notification status: {str(e)}")
             return None
     
-    async def _apply_template(self, notification: models.Notification, template_data: Optional[Dict[str, Any]]):
-        """Apply template to notification"""
+    async def _apply_template(
+        self,
+        notification: models.Notification,
+        template_data: Optional[Dict[str, Any]],
+        recipients: Optional[List[models.NotificationRecipient]] = None
+    ) -> Optional[models.NotificationTemplate]:
+        """Apply template to notification, personalising per recipient when the template uses `recipient`
+        
+        Returns the template when it personalises on `recipient`, so later recipients can be rendered too.
+        """
         try:
+            if not notification.template_id:
+                return None
+            
             template = (
                 self.db.query(models.NotificationTemplate)
                 .filter(models.NotificationTemplate.template_id == notification.template_id)
@@ -409,23 +538,59 @@ class NotificationService:
             
             if not template:
                 logger.warning(f"Template {notification.template_id} not found")
-                return
+                return None
             
-            # Render templates
-            if template.subject_template and template_data:
-                subject_template = Template(template.subject_template)
-                notification.subject = subject_template.render(**template_data)
+            # Compiled once per template version and shared across notifications
+            compiled = template_engine.get(template)
+            personalised = "recipient" in compiled.variables
+            if not template_data and not personalised:
+                return None
             
-            if template.message_template and template_data:
-                message_template = Template(template.message_template)
-                notification.message = message_template.render(**template_data)
+            context = dict(template_data or {})
+            for field, value in compiled.render({**context, "recipient": {}}).items():
+                setattr(notification, field, value)
             
-            if template.html_template and template_data:
-                html_template = Template(template.html_template)
-                notification.html_message = html_template.render(**template_data)
+            if personalised and recipients:
+                await self._render_recipients(template, template_data, recipients)
+            return template if personalised else None
             
         except Exception as e:
             logger.error(f"Error applying template: {str(e)}")
+            return None
+    
+    async def _render_recipients(
+        self,
+        template: models.NotificationTemplate,
+        template_data: Optional[Dict[str, Any]],
+        recipients: List[Any],
+        targets: Optional[List[Any]] = None
+    ):
+        """Render personalised content for recipients onto targets (the recipients themselves, or row dicts)"""
+        context = dict(template_data or {})
+        rendered = await template_engine.render_batch(template, [
+            {**context, "recipient": self._recipient_context(recipient)}
+            for recipient in recipients
+        ])
+        for target, parts in zip(targets or recipients, rendered):
+            values = {
+                "rendered_subject": parts.get("subject"),
+                "rendered_message": parts.get("message"),
+                "rendered_html_message": parts.get("html_message")
+            }
+            if isinstance(target, dict):
+                target.update(values)
+            else:
+                for field, value in values.items():
+                    setattr(target, field, value)
+    
+    def _recipient_context(self, recipient: models.NotificationRecipient) -> Dict[str, Any]:
+        """Recipient fields exposed to templates as `recipient`"""
+        return {
+            "name": recipient.name,
+            "recipient_type": recipient.recipient_type,
+            "language": recipient.language,
+            "user_id": recipient.user_id
+        }
     
     async def _queue_notification(self, notification: models.Notification) -> int:
         """Queue notification for processing"""
@@ -442,34 +607,30 @@ class NotificationService:
             queue_name = f"{notification.priority}_priority"
             priority = priority_map.get(notification.priority, 2)
             
-            # Create queue item
-            queue_item = models.NotificationQueue(
-                queue_id=str(uuid.uuid4()),
-                notification_id=notification.notification_id,
-                queue_name=queue_name,
-                priority=priority,
-                max_retries=3,
+            # Update notification status before consumers can pick it up
+            notification.status = "queued"
+            if not notification_queue.transactional:
+                self.db.commit()
+            
+            await notification_queue.enqueue(
+                self.db,
+                notification.notification_id,
+                queue_name,
+                priority,
                 metadata={
                     "notification_type": notification.notification_type,
-                    "school_id": notification.school_id,
-                    "recipient_count": len(notification.recipients)
-                }
+                    "school_id": notification.school_id
+                },
+                max_attempts=3
             )
             
-            self.db.add(queue_item)
-            self.db.commit()
-            
-            # Update notification status
-            notification.status = "queued"
-            self.db.commit()
-            
             return 1
             
         except Exception as e:
             logger.error(f"Error queuing notification: {str(e)}")
             return 0
     
-    async def _process_notification_item(self, queue_item: models.NotificationQueue) -> bool:
+    async def _process_notification_item(self, queue_item: QueueMessage) -> bool:
         """Process a single notification from the queue"""
         try:
             # Get notification
@@ -487,22 +648,19 @@ class NotificationService:
             notification.status = "processing"
             self.db.commit()
             
-            # Get recipients
+            # Get recipients that have not been sent yet (retries skip delivered ones)
             recipients = (
                 self.db.query(models.NotificationRecipient)
-                .filter(models.NotificationRecipient.notification_id == notification.notification_id)
+                .filter(
+                    models.NotificationRecipient.notification_id == notification.notification_id,
+                    models.NotificationRecipient.status.notin_(["sent", "delivered"])
+                )
                 .all()
             )
             
-            # Process each recipient
-            success_count = 0
-            for recipient in recipients:
-                try:
-                    success = await self._send_to_recipient(notification, recipient)
-                    if success:
-                        success_count += 1
-                except Exception as e:
-                    logger.error(f"Error sending to recipient {recipient.recipient_id}: {str(e)}")
+            # Send concurrently through the provider pools; results are written in batches
+            summary = await notification_dispatcher.dispatch(self.db, notification, recipients)
+            success_count = summary["sent"]
             
             # Update notification status
             if success_count == len(recipients):
@@ -515,165 +673,22 @@ class NotificationService:
             
             self.db.commit()
             
-            return success_count > 0
+            # Acked only when every recipient went out; a retry resends just the failed ones
+            return success_count == len(recipients)
             
         except Exception as e:
             logger.error(f"Error processing notification item: {str(e)}")
             return False
     
-    async def _send_to_recipient(self, notification: models.Notification, recipient: models.NotificationRecipient) -> bool:
-        """Send notification to a single recipient"""
-        try:
-            # Update recipient status
-            recipient.status = "processing"
-            recipient.delivery_attempts += 1
-            recipient.last_attempt = datetime.utcnow()
-            self.db.commit()
-            
-            # Get the appropriate provider
-            provider = self.providers.get(notification.notification_type)
-            if not provider:
-                logger.error(f"No provider for notification type: {notification.notification_type}")
-                recipient.status = "failed"
-                recipient.failed_reason = f"No provider for {notification.notification_type}"
-                self.db.commit()
-                return False
-            
-            # Determine recipient address
-            recipient_address = self._get_recipient_address(notification.notification_type, recipient)
-            if not recipient_address:
-                recipient.status = "failed"
-                recipient.failed_reason = f"No valid address for {notification.notification_type}"
-                self.db.commit()
-                return False
-            
-            # Send notification
-            result = await provider.send(
-                recipient=recipient_address,
-                message=notification.message,
-                subject=notification.subject,
-                html_message=notification.html_message,
-                attachments=notification.attachments
-            )
-            
-            # Create delivery log
-            delivery_log = models.NotificationDeliveryLog(
-                log_id=str(uuid.uuid4()),
-                notification_id=notification.notification_id,
-                recipient_id=recipient.recipient_id,
-                provider=provider.get_provider_name(),
-                provider_id=result.get("provider_id"),
-                attempt_number=recipient.delivery_attempts,
-                status="sent" if result.get("success") else "failed",
-                response_code=result.get("response_code"),
-                response_message=result.get("error", "Success"),
-                response_data=result,
-                completed_at=datetime.utcnow()
-            )
-            
-            self.db.add(delivery_log)
-            
-            # Update recipient status
-            if result.get("success"):
-                recipient.status = "sent"
-                recipient.external_id = result.get("provider_id")
-                recipient.provider_response = result
-            else:
-                recipient.status = "failed"
-                recipient.failed_reason = result.get("error", "Unknown error")
-            
-            self.db.commit()
-            
-            return result.get("success", False)
-            
-        except Exception as e:
-            logger.error(f"Error sending to recipient: {str(e)}")
-            
-            # Update recipient status
-            recipient.status = "failed"
-            recipient.failed_reason = str(e)
-            self.db.commit()
-            
-            return False
-    
     def _get_recipient_address(self, notification_type: str, recipient: models.NotificationRecipient) -> Optional[str]:
         """Get the appropriate recipient address based on notification type"""
-        if notification_type == "email":
-            return recipient.email
-        elif notification_type == "sms":
-            return recipient.phone
-        elif notification_type == "whatsapp":
-            return recipient.whatsapp_number or recipient.phone
-        elif notification_type == "push":
-            return recipient.push_token
-        elif notification_type == "voice":
-            return recipient.phone
-        return None
-    
-    async def _get_bulk_recipients(self, target_audience: Dict[str, Any], school_id: int) -> List[schemas.NotificationRecipientCreate]:
-        """Get recipients for bulk notification based on target audience criteria"""
-        # This is a simplified implementation
-        # In a real system, you'd query user databases based on criteria
-        recipients = []
-        
-        # Example criteria processing
-        if target_audience.get("all_students"):
-            # Get all students from auth service or user database
-            # This would require integration with user management
-            pass
-        
-        if target_audience.get("specific_users"):
-            user_ids = target_audience["specific_users"]
-            # Get user contact information
-            pass
-        
-        if target_audience.get("user_types"):
-            user_types = target_audience["user_types"]
-            # Get users by type
-            pass
-        
-        # For now, return empty list
-        return recipients
-    
-    async def _update_analytics(self, school_id: int, notification_type: str, recipient_count: int):
-        """Update notification analytics"""
-        try:
-            today = datetime.utcnow().date()
-            
-            # Get or create analytics record
-            analytics = (
-                self.db.query(models.NotificationAnalytics)
-                .filter(
-                    and_(
-                        models.NotificationAnalytics.school_id == school_id,
-                        models.NotificationAnalytics.date == today
-                    )
-                )
-                .first()
-            )
-            
-            if not analytics:
-                analytics = models.NotificationAnalytics(
-                    school_id=school_id,
-                    date=today
-                )
-                self.db.add(analytics)
-            
-            # Update counters
-            analytics.total_sent += recipient_count
-            
-            if notification_type == "email":
-                analytics.email_sent += recipient_count
-            elif notification_type == "sms":
-                analytics.sms_sent += recipient_count
-            elif notification_type == "whatsapp":
-                analytics.whatsapp_sent += recipient_count
-            elif notification_type == "push":
-                analytics.push_sent += recipient_count
-            elif notification_type == "voice":
-                analytics.voice_sent += recipient_count
-            
-            self.db.commit()
-            
-        except Exception as e:
-            logger.error(f"Error updating analytics: {str(e)}")
+        return get_recipient_address(notification_type, recipient)
+
+
+async def run_bulk_campaign(notification_id: str) -> NotificationResult:
+    """Run a bulk campaign with its own session (for background tasks outliving the request)"""
+    db = SessionLocal()
+    try:
+        return await NotificationService(db).run_bulk_campaign(notification_id)
+    finally:
+        db.close()
@@ -10,6 +10,7 @@ from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime
 from abc import ABC, abstractmethod
 import asyncio
+import time
 import aiohttp
 import smtplib
 from email.mime.text import MIMEText
@@ -28,14 +29,67 @@ load_dotenv()
 # Configure logging
 logger = logging.getLogger(__name__)
 
+class HTTPSessionPool:
+    """Shared aiohttp sessions so provider requests reuse pooled keep-alive connections"""
+    
+    def __init__(self):
+        self.pool_size = int(os.getenv("PROVIDER_HTTP_POOL_SIZE", "100"))
+        self.timeout = float(os.getenv("PROVIDER_HTTP_TIMEOUT", "30"))
+        self.sessions: Dict[Any, aiohttp.ClientSession] = {}
+    
+    def get(self) -> aiohttp.ClientSession:
+        """Session bound to the running event loop (created on first use)"""
+        loop = asyncio.get_running_loop()
+        session = self.sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self.sessions[loop] = session
+        return session
+    
+    async def close(self):
+        """Close the sessions of the running loop"""
+        loop = asyncio.get_running_loop()
+        session = self.sessions.pop(loop, None)
+        if session and not session.closed:
+            await session.close()
+
+# Initialize shared HTTP sessions
+http_sessions = HTTPSessionPool()
+
+def _digits(phone: str) -> str:
+    """Phone number reduced to its digits, for matching provider responses"""
+    return "".join(c for c in phone if c.isdigit())
+
 class NotificationProvider(ABC):
     """Abstract base class for notification providers"""
     
+    # Recipients accepted by one send_batch call; 1 means the provider has no bulk API
+    max_batch_size = 1
+    
     @abstractmethod
     async def send(self, recipient: str, message: str, **kwargs) -> Dict[str, Any]:
         """Send notification to recipient"""
         pass
     
+    async def send_batch(self, recipients: List[str], message: str, **kwargs) -> List[Dict[str, Any]]:
+        """Send one message to several recipients; results are returned in recipient order
+        
+        Providers without a bulk endpoint send concurrently; callers bound the
+        concurrency and rate through the provider worker pool.
+        """
+        results = await asyncio.gather(
+            *(self.send(recipient, message, **kwargs) for recipient in recipients),
+            return_exceptions=True
+        )
+        return [
+            {"success": False, "error": str(result), "provider": self.get_provider_name()}
+            if isinstance(result, Exception) else result
+            for result in results
+        ]
+    
     @abstractmethod
     def validate_recipient(self, recipient: str) -> bool:
         """Validate recipient format"""
@@ -49,10 +103,23 @@ class NotificationProvider(ABC):
 class SMSProvider(NotificationProvider):
     """SMS notification provider with multiple backend support"""
     
+    # Recipients per bulk request for backends with a multi-recipient API
+    BULK_BATCH_SIZES = {
+        "termii": 100,
+        "africastalking": 100,
+        "infobip": 100,
+    }
+    
     def __init__(self):
         self.provider = os.getenv("SMS_PROVIDER", "twilio")
         self.setup_provider()
     
+    @property
+    def max_batch_size(self) -> int:
+        if self.provider not in self.BULK_BATCH_SIZES:
+            return 1
+        return int(os.getenv("SMS_BULK_BATCH_SIZE", self.BULK_BATCH_SIZES[self.provider]))
+    
     def setup_provider(self):
         """Setup SMS provider based on configuration"""
         if self.provider == "twilio":
@@ -61,24 +128,26 @@ class SMSProvider(NotificationProvider):
                 os.getenv("TWILIO_AUTH_TOKEN")
             )
             self.from_number = os.getenv("TWILIO_PHONE_NUMBER")
+        elif self.provider == "termii":
+            self.setup_termii()
         elif self.provider == "africastalking":
             self.setup_africastalking()
         elif self.provider == "infobip":
             self.setup_infobip()
     
+    def setup_termii(self):
+        """Setup Termii SMS"""
+        self.base_url = os.getenv("TERMII_API_URL", "https://api.ng.termii.com/api")
+        self.api_key = os.getenv("TERMII_API_KEY")
+        self.sender_id = os.getenv("TERMII_SENDER_ID", "EduNerve")
+    
     def setup_africastalking(self):
         """Setup Africa's Talking SMS"""
-        try:
-            import africastalking
-            self.username = os.getenv("AFRICASTALKING_USERNAME")
-            self.api_key = os.getenv("AFRICASTALKING_API_KEY")
-            self.sender_id = os.getenv("AFRICASTALKING_SENDER_ID", "EduNerve")
-            
-            africastalking.initialize(self.username, self.api_key)
-            self.sms_client = africastalking.SMS
-        except ImportError:
-            logger.error("africastalking library not installed")
-            raise
+        self.username = os.getenv("AFRICASTALKING_USERNAME")
+        self.api_key = os.getenv("AFRICASTALKING_API_KEY")
+        self.sender_id = os.getenv("AFRICASTALKING_SENDER_ID", "EduNerve")
+        # The sandbox account uses api.sandbox.africastalking.com
+        self.base_url = os.getenv("AFRICASTALKING_BASE_URL", "https://api.africastalking.com")
     
     def setup_infobip(self):
         """Setup Infobip SMS"""
@@ -98,10 +167,8 @@ class SMSProvider(NotificationProvider):
             
             if self.provider == "twilio":
                 return await self.send_twilio_sms(recipient, message, **kwargs)
-            elif self.provider == "africastalking":
-                return await self.send_africastalking_sms(recipient, message, **kwargs)
-            elif self.provider == "infobip":
-                return await self.send_infobip_sms(recipient, message, **kwargs)
+            elif self.provider in self.BULK_BATCH_SIZES:
+                return (await self.send_bulk(self.provider, [recipient], message))[0]
             else:
                 return {
                     "success": False,
@@ -117,10 +184,48 @@ class SMSProvider(NotificationProvider):
                 "provider": self.provider
             }
     
+    async def send_batch(self, recipients: List[str], message: str, **kwargs) -> List[Dict[str, Any]]:
+        """Send SMS to several recipients with the backend's bulk API where it has one"""
+        if self.provider not in self.BULK_BATCH_SIZES:
+            return await super().send_batch(recipients, message, **kwargs)
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(recipients)
+        valid = []
+        for index, recipient in enumerate(recipients):
+            if self.validate_recipient(recipient):
+                valid.append(index)
+            else:
+                results[index] = {
+                    "success": False,
+                    "error": "Invalid phone number format",
+                    "provider": self.provider
+                }
+        
+        if valid:
+            try:
+                sent = await self.send_bulk(self.provider, [recipients[i] for i in valid], message)
+            except Exception as e:
+                logger.error(f"Bulk SMS send error: {str(e)}")
+                sent = [{"success": False, "error": str(e), "provider": self.provider}] * len(valid)
+            for index, result in zip(valid, sent):
+                results[index] = result
+        
+        return results
+    
+    async def send_bulk(self, backend: str, recipients: List[str], message: str) -> List[Dict[str, Any]]:
+        """Send one bulk request; returns a normalized result per recipient"""
+        if backend == "termii":
+            return await self.send_termii_sms(recipients, message)
+        elif backend == "africastalking":
+            return await self.send_africastalking_sms(recipients, message)
+        return await self.send_infobip_sms(recipients, message)
+    
     async def send_twilio_sms(self, recipient: str, message: str, **kwargs) -> Dict[str, Any]:
         """Send SMS via Twilio"""
         try:
-            message_obj = self.client.messages.create(
+            # The Twilio client is blocking, so keep it off the event loop
+            message_obj = await asyncio.to_thread(
+                self.client.messages.create,
                 body=message,
                 from_=self.from_number,
                 to=recipient
@@ -143,85 +248,153 @@ class SMSProvider(NotificationProvider):
                 "provider": "twilio"
             }
     
-    async def send_africastalking_sms(self, recipient: str, message: str, **kwargs) -> Dict[str, Any]:
-        """Send SMS via Africa's Talking"""
-        try:
-            response = self.sms_client.send(
-                message=message,
-                recipients=[recipient],
-                sender_id=self.sender_id
-            )
+    def _failed_batch(self, recipients: List[str], error: str, provider: str) -> List[Dict[str, Any]]:
+        return [{"success": False, "error": error, "provider": provider} for _ in recipients]
+    
+    async def send_termii_sms(self, recipients: List[str], message: str) -> List[Dict[str, Any]]:
+        """Send SMS via Termii
+
+        The bulk endpoint returns one message id for the whole batch, so every
+        recipient stores it; receipts and status polls name the receiving number.
+        """
+        bulk = len(recipients) > 1
+        url = f"{self.base_url}/sms/send/bulk" if bulk else f"{self.base_url}/sms/send"
+        numbers = [_digits(recipient) for recipient in recipients]
+        payload = {
+            "to": numbers if bulk else numbers[0],
+            "from": self.sender_id,
+            "sms": message,
+            "type": "plain",
+            "channel": "generic",
+            "api_key": self.api_key
+        }
+        
+        async with http_sessions.get().post(url, json=payload) as response:
+            if response.status == 200:
+                result = await response.json()
+                if result.get("code") == "ok":
+                    sent_at = datetime.utcnow().isoformat()
+                    return [{
+                        "success": True,
+                        "provider_id": result.get("message_id"),
+                        "status": "sent",
+                        "provider": "termii",
+                        "sent_at": sent_at
+                    } for _ in recipients]
+                return self._failed_batch(recipients, result.get("message", "Unknown error"), "termii")
             
-            if response['SMSMessageData']['Recipients']:
-                recipient_data = response['SMSMessageData']['Recipients'][0]
-                return {
+            error_text = await response.text()
+            return self._failed_batch(recipients, f"HTTP {response.status}: {error_text}", "termii")
+    
+    async def send_africastalking_sms(self, recipients: List[str], message: str) -> List[Dict[str, Any]]:
+        """Send SMS via Africa's Talking (one request accepts a comma-separated recipient list)"""
+        url = f"{self.base_url}/version1/messaging"
+        headers = {
+            "apiKey": self.api_key or "",
+            "Accept": "application/json"
+        }
+        data = {
+            "username": self.username or "",
+            "to": ",".join(recipients),
+            "message": message,
+            "from": self.sender_id
+        }
+        
+        async with http_sessions.get().post(url, headers=headers, data=data) as response:
+            if response.status not in (200, 201):
+                error_text = await response.text()
+                return self._failed_batch(recipients, f"HTTP {response.status}: {error_text}", "africastalking")
+            
+            result = await response.json()
+        
+        by_number = {
+            _digits(entry.get("number", "")): entry
+            for entry in result.get("SMSMessageData", {}).get("Recipients", [])
+        }
+        sent_at = datetime.utcnow().isoformat()
+        results = []
+        for recipient in recipients:
+            entry = by_number.get(_digits(recipient))
+            if entry is None:
+                results.append({
+                    "success": False,
+                    "error": result.get("SMSMessageData", {}).get("Message", "No recipient in response"),
+                    "provider": "africastalking"
+                })
+            # 100 processed, 101 sent, 102 queued
+            elif entry.get("statusCode") in (100, 101, 102):
+                results.append({
                     "success": True,
-                    "provider_id": recipient_data.get('messageId'),
-                    "status": recipient_data.get('status'),
+                    "provider_id": entry.get("messageId"),
+                    "status": entry.get("status"),
                     "provider": "africastalking",
-                    "cost": recipient_data.get('cost'),
-                    "sent_at": datetime.utcnow().isoformat()
-                }
+                    "cost": entry.get("cost"),
+                    "sent_at": sent_at
+                })
             else:
-                return {
+                results.append({
                     "success": False,
-                    "error": "No recipients in response",
+                    "error": entry.get("status", "Unknown error"),
+                    "response_code": entry.get("statusCode"),
                     "provider": "africastalking"
+                })
+        return results
+    
+    async def send_infobip_sms(self, recipients: List[str], message: str) -> List[Dict[str, Any]]:
+        """Send SMS via Infobip (one message with multiple destinations)"""
+        url = f"{self.base_url}/sms/2/text/advanced"
+        headers = {
+            "Authorization": f"App {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        
+        payload = {
+            "messages": [
+                {
+                    "from": self.sender,
+                    "destinations": [{"to": recipient} for recipient in recipients],
+                    "text": message
                 }
+            ]
+        }
         
-        except Exception as e:
-            return {
-                "success": False,
-                "error": str(e),
-                "provider": "africastalking"
-            }
-    
-    async def send_infobip_sms(self, recipient: str, message: str, **kwargs) -> Dict[str, Any]:
-        """Send SMS via Infobip"""
-        try:
-            url = f"{self.base_url}/sms/2/text/advanced"
-            headers = {
-                "Authorization": f"App {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "messages": [
-                    {
-                        "from": self.sender,
-                        "destinations": [{"to": recipient}],
-                        "text": message
-                    }
-                ]
-            }
+        async with http_sessions.get().post(url, headers=headers, json=payload) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                return self._failed_batch(recipients, f"HTTP {response.status}: {error_text}", "infobip")
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        if result.get('messages'):
-                            msg_data = result['messages'][0]
-                            return {
-                                "success": True,
-                                "provider_id": msg_data.get('messageId'),
-                                "status": msg_data.get('status', {}).get('name'),
-                                "provider": "infobip",
-                                "sent_at": datetime.utcnow().isoformat()
-                            }
-                    
-                    error_text = await response.text()
-                    return {
-                        "success": False,
-                        "error": f"HTTP {response.status}: {error_text}",
-                        "provider": "infobip"
-                    }
+            result = await response.json()
         
-        except Exception as e:
-            return {
-                "success": False,
-                "error": str(e),
-                "provider": "infobip"
-            }
+        by_number = {_digits(entry.get("to", "")): entry for entry in result.get("messages", [])}
+        sent_at = datetime.utcnow().isoformat()
+        results = []
+        for recipient in recipients:
+            entry = by_number.get(_digits(recipient))
+            if entry is None:
+                results.append({
+                    "success": False,
+                    "error": "No recipient in response",
+                    "provider": "infobip"
+                })
+                continue
+            
+            status = entry.get("status", {})
+            if status.get("groupName") in ("REJECTED", "UNDELIVERABLE", "EXPIRED"):
+                results.append({
+                    "success": False,
+                    "error": status.get("description") or status.get("name", "Rejected"),
+                    "response_code": status.get("id"),
+                    "provider": "infobip"
+                })
+            else:
+                results.append({
+                    "success": True,
+                    "provider_id": entry.get("messageId"),
+                    "status": status.get("name"),
+                    "provider": "infobip",
+                    "sent_at": sent_at
+                })
+        return results
     
     def validate_recipient(self, recipient: str) -> bool:
         """Validate phone number format"""
@@ -300,7 +473,8 @@ class WhatsAppProvider(NotificationProvider):
     async def send_twilio_whatsapp(self, recipient: str, message: str, **kwargs) -> Dict[str, Any]:
         """Send WhatsApp via Twilio"""
         try:
-            message_obj = self.client.messages.create(
+            message_obj = await asyncio.to_thread(
+                self.client.messages.create,
                 body=message,
                 from_=self.from_number,
                 to=f"whatsapp:{recipient}"
@@ -338,24 +512,23 @@ class WhatsAppProvider(NotificationProvider):
                 "text": {"body": message}
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return {
-                            "success": True,
-                            "provider_id": result.get('messages', [{}])[0].get('id'),
-                            "status": "sent",
-                            "provider": "meta_whatsapp",
-                            "sent_at": datetime.utcnow().isoformat()
-                        }
-                    
-                    error_text = await response.text()
+            async with http_sessions.get().post(url, headers=headers, json=payload) as response:
+                if response.status == 200:
+                    result = await response.json()
                     return {
-                        "success": False,
-                        "error": f"HTTP {response.status}: {error_text}",
-                        "provider": "meta_whatsapp"
+                        "success": True,
+                        "provider_id": result.get('messages', [{}])[0].get('id'),
+                        "status": "sent",
+                        "provider": "meta_whatsapp",
+                        "sent_at": datetime.utcnow().isoformat()
                     }
+                
+                error_text = await response.text()
+                return {
+                    "success": False,
+                    "error": f"HTTP {response.status}: {error_text}",
+                    "provider": "meta_whatsapp"
+                }
         
         except Exception as e:
             return {
@@ -381,24 +554,23 @@ class WhatsAppProvider(NotificationProvider):
                 }
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        return {
-                            "success": True,
-                            "provider_id": result.get('messageId'),
-                            "status": result.get('status', {}).get('name'),
-                            "provider": "infobip_whatsapp",
-                            "sent_at": datetime.utcnow().isoformat()
-                        }
-                    
-                    error_text = await response.text()
+            async with http_sessions.get().post(url, headers=headers, json=payload) as response:
+                if response.status == 200:
+                    result = await response.json()
                     return {
-                        "success": False,
-                        "error": f"HTTP {response.status}: {error_text}",
-                        "provider": "infobip_whatsapp"
+                        "success": True,
+                        "provider_id": result.get('messageId'),
+                        "status": result.get('status', {}).get('name'),
+                        "provider": "infobip_whatsapp",
+                        "sent_at": datetime.utcnow().isoformat()
                     }
+                
+                error_text = await response.text()
+                return {
+                    "success": False,
+                    "error": f"HTTP {response.status}: {error_text}",
+                    "provider": "infobip_whatsapp"
+                }
         
         except Exception as e:
             return {
@@ -591,7 +763,8 @@ class PushNotificationProvider(NotificationProvider):
             )
             
             # Send message
-            response = self.messaging.send(fcm_message)
+            # firebase_admin is blocking, so keep it off the event loop
+            response = await asyncio.to_thread(self.messaging.send, fcm_message)
             
             return {
                 "success": True,
@@ -609,6 +782,58 @@ class PushNotificationProvider(NotificationProvider):
                 "provider": "push"
             }
     
+    @property
+    def max_batch_size(self) -> int:
+        # FCM multicast accepts up to 500 tokens per call
+        return 500 if self.firebase_available else 1
+    
+    async def send_batch(self, recipients: List[str], message: str, **kwargs) -> List[Dict[str, Any]]:
+        """Send one push notification to many device tokens with an FCM multicast"""
+        if not self.firebase_available:
+            return await super().send_batch(recipients, message, **kwargs)
+        
+        results: List[Optional[Dict[str, Any]]] = [None] * len(recipients)
+        valid = []
+        for index, recipient in enumerate(recipients):
+            if self.validate_recipient(recipient):
+                valid.append(index)
+            else:
+                results[index] = {"success": False, "error": "Invalid push token", "provider": "push"}
+        
+        if valid:
+            try:
+                multicast = self.messaging.MulticastMessage(
+                    notification=self.messaging.Notification(
+                        title=kwargs.get('subject', 'EduNerve'),
+                        body=message
+                    ),
+                    data=kwargs.get('data', {}),
+                    tokens=[recipients[i] for i in valid]
+                )
+                response = await asyncio.to_thread(self.messaging.send_each_for_multicast, multicast)
+                sent_at = datetime.utcnow().isoformat()
+                for index, send_response in zip(valid, response.responses):
+                    if send_response.success:
+                        results[index] = {
+                            "success": True,
+                            "provider_id": send_response.message_id,
+                            "status": "sent",
+                            "provider": "push",
+                            "sent_at": sent_at
+                        }
+                    else:
+                        results[index] = {
+                            "success": False,
+                            "error": str(send_response.exception),
+                            "provider": "push"
+                        }
+            except Exception as e:
+                logger.error(f"Push multicast error: {str(e)}")
+                for index in valid:
+                    results[index] = {"success": False, "error": str(e), "provider": "push"}
+        
+        return results
+    
     def validate_recipient(self, recipient: str) -> bool:
         """Validate push token format"""
         # Basic validation - FCM tokens are typically long strings
@@ -669,7 +894,8 @@ class VoiceProvider(NotificationProvider):
             # Create TwiML for voice message
             twiml = f'<Response><Say voice="alice" language="en">{message}</Say></Response>'
             
-            call = self.client.calls.create(
+            call = await asyncio.to_thread(
+                self.client.calls.create,
                 twiml=twiml,
                 to=recipient,
                 from_=self.from_number
@@ -702,39 +928,262 @@ class VoiceProvider(NotificationProvider):
     def get_provider_name(self) -> str:
         return f"voice_{self.provider}"
 
+# notification_type -> (messages per second, burst, concurrent requests)
+# Defaults follow the providers' documented API limits; override with
+# <TYPE>_RATE_LIMIT, <TYPE>_RATE_BURST and <TYPE>_CONCURRENCY
+DEFAULT_PROVIDER_BUDGETS = {
+    "sms": (30, 30, 20),
+    "whatsapp": (80, 80, 40),
+    "email": (10, 20, 5),
+    "push": (500, 500, 100),
+    "voice": (1, 1, 2),
+}
+
+class TokenBucket:
+    """Async token bucket enforcing a provider's sustained rate and burst size"""
+    
+    def __init__(self, rate: float, burst: int):
+        self.rate = float(rate)
+        self.capacity = max(int(burst), 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self, tokens: int = 1):
+        """Wait until the budget allows sending `tokens` messages
+        
+        Requests larger than the burst size are paid for in burst-sized chunks.
+        """
+        # The lock keeps waiters in FIFO order so no sender starves
+        async with self._lock:
+            remaining = tokens
+            while remaining > 0:
+                chunk = min(remaining, self.capacity)
+                self._refill()
+                if self.tokens >= chunk:
+                    self.tokens -= chunk
+                    remaining -= chunk
+                    continue
+                await asyncio.sleep((chunk - self.tokens) / self.rate)
+
+class ProviderWorkerPool:
+    """Bounded pool of asyncio workers sending through one provider under its rate budget"""
+    
+    def __init__(self, provider: NotificationProvider, bucket: TokenBucket, concurrency: int):
+        self.provider = provider
+        self.bucket = bucket
+        self.concurrency = max(int(concurrency), 1)
+        self.queue: Optional[asyncio.Queue] = None
+        self.workers: List[asyncio.Task] = []
+        self._loop = None
+    
+    def _ensure_started(self):
+        """Start workers on the running loop (lazily, and again if the loop changed)"""
+        loop = asyncio.get_running_loop()
+        if self.workers and self._loop is loop:
+            return
+        self._loop = loop
+        # A short queue gives producers backpressure instead of buffering a whole campaign
+        self.queue = asyncio.Queue(maxsize=self.concurrency * 4)
+        self.workers = [loop.create_task(self._worker()) for _ in range(self.concurrency)]
+    
+    async def submit(self, recipient: str, message: str, **kwargs) -> asyncio.Future:
+        """Queue a send and return a future resolving to the provider result"""
+        return (await self.submit_batch([recipient], message, **kwargs))[0]
+    
+    async def submit_batch(self, recipients: List[str], message: str, **kwargs) -> List[asyncio.Future]:
+        """Queue one send of a message to several recipients; returns a future per recipient
+        
+        The batch goes to the provider's bulk API in a single request, so callers
+        should keep it within provider.max_batch_size.
+        """
+        self._ensure_started()
+        futures = [self._loop.create_future() for _ in recipients]
+        await self.queue.put((list(recipients), message, kwargs, futures))
+        return futures
+    
+    async def _worker(self):
+        while True:
+            recipients, message, kwargs, futures = await self.queue.get()
+            try:
+                pending = [i for i, future in enumerate(futures) if not future.cancelled()]
+                if not pending:
+                    continue
+                recipients = [recipients[i] for i in pending]
+                futures = [futures[i] for i in pending]
+                
+                # The budget counts messages, whether they go out singly or in bulk
+                await self.bucket.acquire(len(recipients))
+                if len(recipients) == 1:
+                    results = [await self.provider.send(recipients[0], message, **kwargs)]
+                else:
+                    results = await self.provider.send_batch(recipients, message, **kwargs)
+                for future, result in zip(futures, results):
+                    if not future.done():
+                        future.set_result(result)
+                # A short result list must not leave the remaining senders waiting forever
+                for future in futures[len(results):]:
+                    if not future.done():
+                        future.set_result({
+                            "success": False,
+                            "error": "No result returned for recipient",
+                            "provider": self.provider.get_provider_name()
+                        })
+            except asyncio.CancelledError:
+                for future in futures:
+                    if not future.done():
+                        future.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"{self.provider.get_provider_name()} send error: {str(e)}")
+                for future in futures:
+                    if not future.done():
+                        future.set_result({
+                            "success": False,
+                            "error": str(e),
+                            "provider": self.provider.get_provider_name()
+                        })
+            finally:
+                self.queue.task_done()
+    
+    async def close(self):
+        """Stop the workers; queued sends are cancelled"""
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
 class NotificationProviderManager:
     """Manager for all notification providers"""
     
-    def __init__(self):
-        self.providers = {
+    def __init__(self, providers: Optional[Dict[str, NotificationProvider]] = None):
+        self.providers = providers if providers is not None else {
             "sms": SMSProvider(),
             "whatsapp": WhatsAppProvider(),
             "email": EmailProvider(),
             "push": PushNotificationProvider(),
             "voice": VoiceProvider()
         }
+        self.budgets = {
+            notification_type: self._load_budget(notification_type)
+            for notification_type in self.providers
+        }
+        self.pools: Dict[str, ProviderWorkerPool] = {}
+    
+    def _load_budget(self, notification_type: str) -> Tuple[float, int, int]:
+        """Read a provider's rate, burst and concurrency from the environment"""
+        rate, burst, concurrency = DEFAULT_PROVIDER_BUDGETS.get(notification_type, (10, 10, 5))
+        prefix = notification_type.upper()
+        return (
+            float(os.getenv(f"{prefix}_RATE_LIMIT", rate)),
+            int(os.getenv(f"{prefix}_RATE_BURST", burst)),
+            int(os.getenv(f"{prefix}_CONCURRENCY", concurrency))
+        )
+    
+    def register_provider(
+        self,
+        notification_type: str,
+        provider: NotificationProvider,
+        rate: Optional[float] = None,
+        burst: Optional[int] = None,
+        concurrency: Optional[int] = None
+    ):
+        """Add or replace a provider, optionally with its own budget"""
+        default_rate, default_burst, default_concurrency = self._load_budget(notification_type)
+        self.providers[notification_type] = provider
+        self.budgets[notification_type] = (
+            rate or default_rate,
+            burst or default_burst,
+            concurrency or default_concurrency
+        )
+        self.pools.pop(notification_type, None)
     
     def get_provider(self, notification_type: str) -> Optional[NotificationProvider]:
         """Get provider for notification type"""
         return self.providers.get(notification_type)
     
-    async def send_notification(
+    def get_pool(self, notification_type: str) -> Optional[ProviderWorkerPool]:
+        """Get the rate-limited worker pool of a provider"""
+        provider = self.get_provider(notification_type)
+        if not provider:
+            return None
+        
+        pool = self.pools.get(notification_type)
+        if pool is None:
+            rate, burst, concurrency = self.budgets[notification_type]
+            pool = ProviderWorkerPool(provider, TokenBucket(rate, burst), concurrency)
+            self.pools[notification_type] = pool
+        return pool
+    
+    async def submit(
         self,
         notification_type: str,
         recipient: str,
         message: str,
         **kwargs
-    ) -> Dict[str, Any]:
-        """Send notification using appropriate provider"""
-        provider = self.get_provider(notification_type)
-        if not provider:
-            return {
+    ) -> asyncio.Future:
+        """Queue a send on the provider's pool and return a future for its result"""
+        pool = self.get_pool(notification_type)
+        if not pool:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result({
                 "success": False,
                 "error": f"No provider for type: {notification_type}",
                 "provider": notification_type
-            }
+            })
+            return future
+        
+        return await pool.submit(recipient, message, **kwargs)
+    
+    def get_batch_size(self, notification_type: str) -> int:
+        """Recipients per provider request (1 when the provider has no bulk API)"""
+        provider = self.get_provider(notification_type)
+        return max(getattr(provider, "max_batch_size", 1), 1) if provider else 1
+    
+    async def submit_batch(
+        self,
+        notification_type: str,
+        recipients: List[str],
+        message: str,
+        **kwargs
+    ) -> List[asyncio.Future]:
+        """Queue a message for many recipients in provider-sized batches; returns a future per recipient"""
+        pool = self.get_pool(notification_type)
+        if not pool:
+            return [await self.submit(notification_type, recipient, message) for recipient in recipients]
         
-        return await provider.send(recipient, message, **kwargs)
+        batch_size = self.get_batch_size(notification_type)
+        futures = []
+        for start in range(0, len(recipients), batch_size):
+            futures.extend(await pool.submit_batch(recipients[start:start + batch_size], message, **kwargs))
+        return futures
+    
+    async def send_batch(
+        self,
+        notification_type: str,
+        recipients: List[str],
+        message: str,
+        **kwargs
+    ) -> List[Dict[str, Any]]:
+        """Send one message to many recipients; results are normalized and in recipient order"""
+        futures = await self.submit_batch(notification_type, recipients, message, **kwargs)
+        return list(await asyncio.gather(*futures))
+    
+    async def send_notification(
+        self,
+        notification_type: str,
+        recipient: str,
+        message: str,
+        **kwargs
+    ) -> Dict[str, Any]:
+        """Send notification using appropriate provider within its rate budget"""
+        future = await self.submit(notification_type, recipient, message, **kwargs)
+        return await future
     
     def validate_recipient(self, notification_type: str, recipient: str) -> bool:
         """Validate recipient for notification type"""
@@ -747,6 +1196,17 @@ class NotificationProviderManager:
     def get_available_providers(self) -> List[str]:
         """Get list of available providers"""
         return list(self.providers.keys())
+    
+    async def close(self):
+        """Stop all provider worker pools and close their HTTP connections"""
+        await asyncio.gather(*(pool.close() for pool in self.pools.values()))
+        self.pools = {}
+        await http_sessions.close()
 
 # Initialize global provider manager
 provider_manager = NotificationProviderManager()
+
+# Load tests swap in fake providers instead of spending real credits
+if os.getenv("NOTIFICATION_FAKE_PROVIDERS"):
+    from .fake_providers import install_fake_providers
+    install_fake_providers(provider_manager)
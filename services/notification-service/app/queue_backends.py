@@ -0,0 +1,629 @@
+"""
+EduNerve Notification Service - Queue Backends
+Leased notification queues on Postgres (SKIP LOCKED + LISTEN/NOTIFY) or
+Redis Streams (consumer groups + blocking reads), with dead-letter handling
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, or_, select, text, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal, engine
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import ResponseError
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "notification_queue"
+QUEUE_NAMES = ["emergency_priority", "urgent_priority", "high_priority", "normal_priority", "low_priority"]
+
+
+@dataclass
+class QueueMessage:
+    """A leased queue entry handed to a consumer"""
+    message_id: str
+    notification_id: str
+    queue_name: str
+    priority: int
+    attempt: int  # 1-based number of the delivery attempt in progress
+    max_attempts: int
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    receipt: Any = None  # Backend handle used to ack, nack or extend the lease
+    consumer: Optional[str] = None  # Consumer holding the lease
+
+
+def retry_delay(attempt: int) -> int:
+    """Exponential backoff in seconds before the next attempt"""
+    base = int(os.getenv("QUEUE_RETRY_BASE_SECONDS", "60"))
+    return min(base * 2 ** max(attempt - 1, 0), 3600)
+
+
+class QueueBackend(ABC):
+    """Interface shared by the queue backends"""
+
+    # Whether enqueue participates in the caller's database transaction
+    transactional = False
+
+    def __init__(self, visibility_timeout: Optional[int] = None):
+        self.worker_id = f"worker_{socket.gethostname()}_{os.getpid()}"
+        self.visibility_timeout = visibility_timeout or int(os.getenv("QUEUE_VISIBILITY_TIMEOUT", "300"))
+
+    def consumer_name(self, consumer: Optional[str] = None) -> str:
+        """Lease owner name: the process, plus the consumer within it (a fresh one when not given)"""
+        return f"{self.worker_id}_{consumer or uuid.uuid4().hex[:8]}"
+
+    @abstractmethod
+    async def enqueue(
+        self,
+        db: Session,
+        notification_id: str,
+        queue_name: str,
+        priority: int,
+        metadata: Optional[Dict[str, Any]] = None,
+        max_attempts: int = 3,
+        commit: bool = True
+    ) -> str:
+        """Add a notification to a queue and return the message id"""
+
+    @abstractmethod
+    async def claim(
+        self,
+        queue_name: str,
+        limit: int,
+        wait_seconds: float = 0,
+        consumer: Optional[str] = None
+    ) -> List[QueueMessage]:
+        """Lease up to `limit` messages for a consumer, waiting up to `wait_seconds` for one to arrive"""
+
+    @abstractmethod
+    async def ack(self, message: QueueMessage):
+        """Mark a message as done"""
+
+    @abstractmethod
+    async def nack(self, message: QueueMessage, error: Optional[str] = None):
+        """Schedule a retry, or dead-letter the message once its attempts are used up"""
+
+    @abstractmethod
+    async def extend(self, message: QueueMessage) -> bool:
+        """Push out the visibility timeout of a message still being processed"""
+
+    @abstractmethod
+    async def list_dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Dead-lettered messages, newest first"""
+
+    @abstractmethod
+    async def requeue_dead_letter(self, message_id: str) -> bool:
+        """Move a dead-lettered message back onto its queue with fresh attempts"""
+
+    async def keep_alive(self, messages: Dict[str, QueueMessage]):
+        """Extend the leases of messages (by message id) periodically until cancelled
+
+        Callers remove messages once they are acked or nacked; messages whose
+        lease was lost are removed here, so callers can skip them.
+        """
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            for message_id, message in list(messages.items()):
+                if message_id in messages and not await self.extend(message):
+                    logger.warning(f"Lost lease on queue message {message_id}")
+                    messages.pop(message_id, None)
+
+    async def close(self):
+        """Release backend resources"""
+
+
+class DatabaseQueueBackend(QueueBackend):
+    """NotificationQueue rows leased with SELECT ... FOR UPDATE SKIP LOCKED
+
+    On Postgres, enqueues issue NOTIFY so idle consumers wake immediately; other
+    databases fall back to short polling.
+    """
+
+    transactional = True
+
+    def __init__(self, session_factory=SessionLocal, bind=engine, visibility_timeout: Optional[int] = None):
+        super().__init__(visibility_timeout)
+        self.session_factory = session_factory
+        self.bind = bind
+        self.poll_interval = float(os.getenv("QUEUE_POLL_INTERVAL", "1"))
+        self.listen_enabled = bind.dialect.name == "postgresql"
+        self._events: Dict[str, asyncio.Event] = {}
+        self._listener = None
+        self._loop = None
+
+    # === WAKEUPS ===
+
+    def _event(self, queue_name: str) -> asyncio.Event:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Events belong to a loop; start fresh if the loop changed
+            self._loop, self._events = loop, {}
+        if queue_name not in self._events:
+            self._events[queue_name] = asyncio.Event()
+        return self._events[queue_name]
+
+    def _wake(self, queue_name: str):
+        event = self._events.get(queue_name)
+        if event is not None:
+            event.set()
+
+    def _start_listener(self):
+        """LISTEN on a dedicated connection and wake consumers from the event loop"""
+        if self._listener is not None or not self.listen_enabled:
+            return
+
+        raw = self.bind.raw_connection()
+        raw.detach()
+        connection = raw.driver_connection
+        connection.set_session(autocommit=True)
+        connection.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+
+        def on_notify():
+            connection.poll()
+            while connection.notifies:
+                self._wake(connection.notifies.pop(0).payload)
+
+        asyncio.get_running_loop().add_reader(connection.fileno(), on_notify)
+        self._listener = connection
+
+    async def close(self):
+        if self._listener is not None:
+            try:
+                self._loop.remove_reader(self._listener.fileno())
+            finally:
+                self._listener.close()
+                self._listener = None
+
+    # === QUEUE OPERATIONS ===
+
+    async def enqueue(
+        self,
+        db: Session,
+        notification_id: str,
+        queue_name: str,
+        priority: int,
+        metadata: Optional[Dict[str, Any]] = None,
+        max_attempts: int = 3,
+        commit: bool = True
+    ) -> str:
+        queue_id = str(uuid.uuid4())
+        db.add(models.NotificationQueue(
+            queue_id=queue_id,
+            notification_id=notification_id,
+            queue_name=queue_name,
+            priority=priority,
+            max_attempts=max_attempts,
+            queue_metadata=metadata or {}
+        ))
+        if self.listen_enabled:
+            # Delivered to listeners when the transaction commits
+            db.execute(text("SELECT pg_notify(:channel, :queue)"), {"channel": NOTIFY_CHANNEL, "queue": queue_name})
+        if commit:
+            db.commit()
+            self._wake(queue_name)
+        return queue_id
+
+    def _claim(self, queue_name: str, limit: int, consumer: str) -> List[QueueMessage]:
+        Queue = models.NotificationQueue
+        now = datetime.utcnow()
+        db = self.session_factory()
+        try:
+            # Leases that expired on the final attempt go straight to the dead-letter state
+            db.execute(
+                update(Queue)
+                .where(
+                    Queue.queue_name == queue_name,
+                    Queue.status == "processing",
+                    Queue.locked_until < now,
+                    Queue.attempts >= Queue.max_attempts
+                )
+                .values(
+                    status="dead_letter",
+                    dead_lettered_at=now,
+                    locked_until=None,
+                    error_message="Lease expired after final attempt"
+                )
+            )
+
+            claimable = select(Queue.id).where(
+                Queue.queue_name == queue_name,
+                or_(
+                    and_(Queue.status == "pending", or_(Queue.next_retry.is_(None), Queue.next_retry <= now)),
+                    and_(Queue.status == "processing", Queue.locked_until < now)
+                )
+            ).order_by(Queue.priority.desc(), Queue.queued_at).limit(limit).with_for_update(skip_locked=True)
+
+            rows = db.execute(
+                update(Queue)
+                .where(Queue.id.in_(claimable.scalar_subquery()))
+                .values(
+                    status="processing",
+                    worker_id=consumer,
+                    locked_until=now + timedelta(seconds=self.visibility_timeout),
+                    attempts=Queue.attempts + 1,
+                    processing_started=now
+                )
+                .returning(
+                    Queue.id, Queue.queue_id, Queue.notification_id, Queue.queue_name,
+                    Queue.priority, Queue.attempts, Queue.max_attempts, Queue.queue_metadata
+                )
+                .execution_options(synchronize_session=False)
+            ).all()
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        messages = [
+            QueueMessage(
+                message_id=row.queue_id,
+                notification_id=row.notification_id,
+                queue_name=row.queue_name,
+                priority=row.priority,
+                attempt=row.attempts,
+                max_attempts=row.max_attempts,
+                metadata=row.queue_metadata or {},
+                receipt=row.id,
+                consumer=consumer
+            )
+            for row in rows
+        ]
+        return sorted(messages, key=lambda m: -(m.priority or 0))
+
+    async def claim(
+        self,
+        queue_name: str,
+        limit: int,
+        wait_seconds: float = 0,
+        consumer: Optional[str] = None
+    ) -> List[QueueMessage]:
+        consumer = self.consumer_name(consumer)
+        if wait_seconds <= 0:
+            return self._claim(queue_name, limit, consumer)
+
+        self._start_listener()
+        event = self._event(queue_name)
+        deadline = time.monotonic() + wait_seconds
+        while True:
+            # Clear before claiming so a NOTIFY arriving mid-claim is not lost
+            event.clear()
+            messages = self._claim(queue_name, limit, consumer)
+            remaining = deadline - time.monotonic()
+            if messages or remaining <= 0:
+                return messages
+            timeout = remaining if self.listen_enabled else min(remaining, self.poll_interval)
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _finish(self, message: QueueMessage, values: Dict[str, Any]) -> bool:
+        """Update a leased row only if the message's consumer still holds the lease"""
+        Queue = models.NotificationQueue
+        db = self.session_factory()
+        try:
+            result = db.execute(
+                update(Queue)
+                .where(
+                    Queue.id == message.receipt,
+                    Queue.status == "processing",
+                    Queue.worker_id == message.consumer
+                )
+                .values(**values)
+            )
+            db.commit()
+            return result.rowcount == 1
+        finally:
+            db.close()
+
+    async def ack(self, message: QueueMessage):
+        self._finish(message, {
+            "status": "completed",
+            "processing_completed": datetime.utcnow(),
+            "locked_until": None,
+            "error_message": None
+        })
+
+    async def nack(self, message: QueueMessage, error: Optional[str] = None):
+        now = datetime.utcnow()
+        if message.attempt >= message.max_attempts:
+            self._finish(message, {
+                "status": "dead_letter",
+                "dead_lettered_at": now,
+                "locked_until": None,
+                "error_message": error
+            })
+            logger.warning(f"Queue message {message.message_id} dead-lettered after {message.attempt} attempts: {error}")
+            return
+
+        self._finish(message, {
+            "status": "pending",
+            "next_retry": now + timedelta(seconds=retry_delay(message.attempt)),
+            "worker_id": None,
+            "locked_until": None,
+            "error_message": error
+        })
+
+    async def extend(self, message: QueueMessage) -> bool:
+        return self._finish(message, {
+            "locked_until": datetime.utcnow() + timedelta(seconds=self.visibility_timeout)
+        })
+
+    async def list_dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        Queue = models.NotificationQueue
+        db = self.session_factory()
+        try:
+            rows = db.query(
+                Queue.queue_id, Queue.notification_id, Queue.queue_name,
+                Queue.attempts, Queue.error_message, Queue.dead_lettered_at
+            ).filter(Queue.status == "dead_letter").order_by(Queue.dead_lettered_at.desc()).limit(limit).all()
+        finally:
+            db.close()
+
+        return [{
+            "message_id": row.queue_id,
+            "notification_id": row.notification_id,
+            "queue_name": row.queue_name,
+            "attempts": row.attempts,
+            "error": row.error_message,
+            "dead_lettered_at": row.dead_lettered_at
+        } for row in rows]
+
+    async def requeue_dead_letter(self, message_id: str) -> bool:
+        Queue = models.NotificationQueue
+        db = self.session_factory()
+        try:
+            result = db.execute(
+                update(Queue)
+                .where(Queue.queue_id == message_id, Queue.status == "dead_letter")
+                .values(
+                    status="pending",
+                    attempts=0,
+                    next_retry=None,
+                    worker_id=None,
+                    dead_lettered_at=None,
+                    error_message=None
+                )
+                .returning(Queue.queue_name)
+            )
+            row = result.first()
+            if row and self.listen_enabled:
+                db.execute(text("SELECT pg_notify(:channel, :queue)"), {"channel": NOTIFY_CHANNEL, "queue": row.queue_name})
+            db.commit()
+        finally:
+            db.close()
+
+        if row:
+            self._wake(row.queue_name)
+        return row is not None
+
+
+class RedisStreamQueueBackend(QueueBackend):
+    """One Redis Stream per queue consumed through a consumer group
+
+    Consumers block in XREADGROUP, so new messages are picked up immediately.
+    Entries left pending by a crashed consumer are reclaimed with XAUTOCLAIM after
+    the visibility timeout; retries wait in a sorted set until they are due.
+    """
+
+    def __init__(self, url: Optional[str] = None, prefix: Optional[str] = None, visibility_timeout: Optional[int] = None):
+        if not REDIS_AVAILABLE:
+            raise RuntimeError("redis package is required for the Redis queue backend")
+        super().__init__(visibility_timeout)
+        self.redis = aioredis.from_url(url or os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+        self.prefix = prefix or os.getenv("QUEUE_STREAM_PREFIX", "notifications")
+        self.group = os.getenv("QUEUE_CONSUMER_GROUP", "notification-workers")
+        self.max_length = int(os.getenv("QUEUE_STREAM_MAXLEN", "1000000"))
+        self._groups = set()
+
+    def _stream(self, queue_name: str) -> str:
+        return f"{self.prefix}:stream:{queue_name}"
+
+    @property
+    def _dead_stream(self) -> str:
+        return f"{self.prefix}:dead"
+
+    @property
+    def _delayed(self) -> str:
+        return f"{self.prefix}:delayed"
+
+    async def _ensure_group(self, stream: str):
+        if stream in self._groups:
+            return
+        try:
+            await self.redis.xgroup_create(stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._groups.add(stream)
+
+    async def _add(self, fields: Dict[str, Any]) -> str:
+        stream = self._stream(fields["queue_name"])
+        return await self.redis.xadd(stream, fields, maxlen=self.max_length, approximate=True)
+
+    async def _promote_delayed(self):
+        """Move retries whose backoff has elapsed back onto their streams"""
+        due = await self.redis.zrangebyscore(self._delayed, 0, time.time(), start=0, num=100)
+        for member in due:
+            # ZREM succeeds for exactly one consumer, so each retry is promoted once
+            if await self.redis.zrem(self._delayed, member):
+                await self._add(json.loads(member))
+
+    def _to_message(self, entry_id: str, fields: Dict[str, str], consumer: str, deliveries: int = 1) -> QueueMessage:
+        return QueueMessage(
+            message_id=fields.get("message_id", entry_id),
+            notification_id=fields["notification_id"],
+            queue_name=fields["queue_name"],
+            priority=int(fields.get("priority", 2)),
+            attempt=int(fields.get("attempts", 0)) + deliveries,
+            max_attempts=int(fields.get("max_attempts", 3)),
+            metadata=json.loads(fields.get("metadata") or "{}"),
+            receipt=(entry_id, fields),
+            consumer=consumer
+        )
+
+    async def enqueue(
+        self,
+        db: Session,
+        notification_id: str,
+        queue_name: str,
+        priority: int,
+        metadata: Optional[Dict[str, Any]] = None,
+        max_attempts: int = 3,
+        commit: bool = True
+    ) -> str:
+        # Published immediately; callers enqueue only after the notification is committed
+        message_id = str(uuid.uuid4())
+        await self._add({
+            "message_id": message_id,
+            "notification_id": notification_id,
+            "queue_name": queue_name,
+            "priority": priority,
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "metadata": json.dumps(metadata or {}, default=str)
+        })
+        return message_id
+
+    async def claim(
+        self,
+        queue_name: str,
+        limit: int,
+        wait_seconds: float = 0,
+        consumer: Optional[str] = None
+    ) -> List[QueueMessage]:
+        consumer = self.consumer_name(consumer)
+        stream = self._stream(queue_name)
+        await self._ensure_group(stream)
+        await self._promote_delayed()
+
+        messages = []
+        # Reclaim entries whose consumer stopped acknowledging within the visibility timeout
+        _, reclaimed, _ = await self.redis.xautoclaim(
+            stream, self.group, consumer,
+            min_idle_time=self.visibility_timeout * 1000, start_id="0-0", count=limit
+        )
+        for entry_id, fields in reclaimed:
+            pending = await self.redis.xpending_range(stream, self.group, min=entry_id, max=entry_id, count=1)
+            deliveries = pending[0]["times_delivered"] if pending else 1
+            messages.append(self._to_message(entry_id, fields, consumer, deliveries))
+
+        if len(messages) < limit:
+            response = await self.redis.xreadgroup(
+                self.group, consumer, {stream: ">"},
+                count=limit - len(messages),
+                block=int(wait_seconds * 1000) if wait_seconds > 0 and not messages else None
+            )
+            for _, entries in response or []:
+                messages.extend(self._to_message(entry_id, fields, consumer) for entry_id, fields in entries)
+
+        # Reclaimed entries past their last attempt are dead-lettered instead of delivered
+        deliverable = []
+        for message in messages:
+            if message.attempt > message.max_attempts:
+                await self._dead_letter(message, "Lease expired after final attempt")
+            else:
+                deliverable.append(message)
+        return deliverable
+
+    async def _remove(self, message: QueueMessage):
+        entry_id, _ = message.receipt
+        stream = self._stream(message.queue_name)
+        await self.redis.xack(stream, self.group, entry_id)
+        await self.redis.xdel(stream, entry_id)
+
+    async def _dead_letter(self, message: QueueMessage, error: Optional[str]):
+        _, fields = message.receipt
+        await self.redis.xadd(self._dead_stream, {
+            **fields,
+            "attempts": message.attempt,
+            "error": error or "",
+            "dead_lettered_at": datetime.utcnow().isoformat()
+        }, maxlen=self.max_length, approximate=True)
+        await self._remove(message)
+        logger.warning(f"Queue message {message.message_id} dead-lettered after {message.attempt} attempts: {error}")
+
+    async def ack(self, message: QueueMessage):
+        await self._remove(message)
+
+    async def nack(self, message: QueueMessage, error: Optional[str] = None):
+        if message.attempt >= message.max_attempts:
+            await self._dead_letter(message, error)
+            return
+
+        _, fields = message.receipt
+        retry = {**fields, "attempts": message.attempt, "last_error": error or ""}
+        await self.redis.zadd(self._delayed, {json.dumps(retry): time.time() + retry_delay(message.attempt)})
+        await self._remove(message)
+
+    async def extend(self, message: QueueMessage) -> bool:
+        entry_id, _ = message.receipt
+        stream = self._stream(message.queue_name)
+        pending = await self.redis.xpending_range(stream, self.group, min=entry_id, max=entry_id, count=1)
+        if not pending or pending[0]["consumer"] != message.consumer:
+            # Acked, or reclaimed by another consumer
+            return False
+        # Re-claiming for ourselves resets the idle time that XAUTOCLAIM looks at
+        claimed = await self.redis.xclaim(
+            stream, self.group, message.consumer,
+            min_idle_time=0, message_ids=[entry_id], justid=True
+        )
+        return bool(claimed)
+
+    async def list_dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        entries = await self.redis.xrevrange(self._dead_stream, count=limit)
+        return [{
+            "message_id": entry_id,
+            "notification_id": fields.get("notification_id"),
+            "queue_name": fields.get("queue_name"),
+            "attempts": int(fields.get("attempts", 0)),
+            "error": fields.get("error"),
+            "dead_lettered_at": fields.get("dead_lettered_at")
+        } for entry_id, fields in entries]
+
+    async def requeue_dead_letter(self, message_id: str) -> bool:
+        entries = await self.redis.xrange(self._dead_stream, min=message_id, max=message_id)
+        if not entries:
+            return False
+
+        _, fields = entries[0]
+        for key in ("error", "dead_lettered_at", "last_error"):
+            fields.pop(key, None)
+        await self._add({**fields, "attempts": 0})
+        await self.redis.xdel(self._dead_stream, message_id)
+        return True
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_queue_backend() -> QueueBackend:
+    """Build the backend selected by NOTIFICATION_QUEUE_BACKEND (database or redis)"""
+    backend = os.getenv("NOTIFICATION_QUEUE_BACKEND", "database").lower()
+    if backend == "redis":
+        return RedisStreamQueueBackend()
+    return DatabaseQueueBackend()
+
+
+# Global queue instance
+notification_queue = create_queue_backend()
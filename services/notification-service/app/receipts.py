@@ -0,0 +1,549 @@
+"""
+EduNerve Notification Service - Delivery Receipts
+Verifies and parses provider delivery-receipt webhooks, and applies them to
+recipients in coalesced batches
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from sqlalchemy import bindparam, or_, text
+from sqlalchemy.orm import Session
+
+from . import models
+from .analytics import notification_analytics
+from .database import SessionLocal
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Receipt status -> precedence; a receipt never moves a recipient to a lower one
+RECEIPT_STATUS_RANK = {"failed": 1, "delivered": 2, "read": 3}
+
+# Recipient status a receipt may move away from -> allowed receipt statuses
+# (a recipient being retried is left to the dispatcher)
+RECEIPT_TRANSITIONS = {
+    "sent": ("failed", "delivered", "read"),
+    "failed": ("delivered", "read"),
+    "delivered": ("read",),
+}
+
+
+@dataclass
+class DeliveryReceipt:
+    """A provider's final word on one message"""
+    provider: str
+    external_id: str
+    status: str  # failed, delivered or read
+    recipient: Optional[str] = None  # Address, for providers that reuse one ID across a bulk send
+    occurred_at: datetime = field(default_factory=datetime.utcnow)
+    error: Optional[str] = None
+    received_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.external_id, _digits(self.recipient)
+
+
+def _digits(address: Optional[str]) -> str:
+    return "".join(ch for ch in address or "" if ch.isdigit())
+
+
+def _timestamp(value: Any) -> datetime:
+    """Provider timestamp (unix seconds or ISO 8601) as naive UTC, defaulting to now"""
+    try:
+        if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+            return datetime.utcfromtimestamp(int(value))
+        if isinstance(value, str) and value:
+            parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+            return parsed
+    except (ValueError, OverflowError):
+        pass
+    return datetime.utcnow()
+
+
+# === SIGNATURES ===
+
+def _hmac_hex(secret: str, body: bytes, digest) -> str:
+    return hmac.new(secret.encode(), body, digest).hexdigest()
+
+
+def twilio_signature(auth_token: str, url: str, params: Mapping[str, str]) -> str:
+    """Twilio's X-Twilio-Signature: HMAC-SHA1 of the URL followed by the sorted form fields"""
+    payload = url + "".join(f"{key}{params[key]}" for key in sorted(params))
+    return base64.b64encode(hmac.new(auth_token.encode(), payload.encode(), hashlib.sha1).digest()).decode()
+
+
+def verify_signature(provider: str, body: bytes, headers: Mapping[str, str], url: str, query: Mapping[str, str]) -> bool:
+    """Check a webhook came from the provider; fails closed when no secret is configured
+
+    Termii signs the body with HMAC-SHA512, Meta with HMAC-SHA256 and Twilio
+    the URL plus form fields with HMAC-SHA1. Africa's Talking and Infobip do
+    not sign callbacks, so their callback URLs carry RECEIPT_WEBHOOK_TOKEN.
+    """
+    if provider == "termii":
+        secret = os.getenv("TERMII_WEBHOOK_SECRET")
+        expected = _hmac_hex(secret, body, hashlib.sha512) if secret else None
+        supplied = headers.get("x-termii-signature", "")
+    elif provider == "meta":
+        secret = os.getenv("META_APP_SECRET")
+        expected = "sha256=" + _hmac_hex(secret, body, hashlib.sha256) if secret else None
+        supplied = headers.get("x-hub-signature-256", "")
+    elif provider == "twilio":
+        secret = os.getenv("TWILIO_AUTH_TOKEN")
+        # Behind a proxy the public URL differs from the one the app sees
+        base_url = os.getenv("RECEIPT_WEBHOOK_BASE_URL")
+        if base_url:
+            url = base_url.rstrip("/") + "/webhooks/delivery/twilio"
+        params = dict(parse_qsl(body.decode()))
+        expected = twilio_signature(secret, url, params) if secret else None
+        supplied = headers.get("x-twilio-signature", "")
+    elif provider in ("africastalking", "infobip"):
+        expected = os.getenv("RECEIPT_WEBHOOK_TOKEN")
+        supplied = query.get("token", "")
+    else:
+        return False
+
+    if not expected:
+        logger.warning(f"No webhook secret configured for {provider}; rejecting receipt")
+        return False
+    return hmac.compare_digest(expected, supplied)
+
+
+# === PARSERS ===
+
+def _status(value: Optional[str], delivered: Tuple[str, ...], failed: Tuple[str, ...], read: Tuple[str, ...] = ()) -> Optional[str]:
+    value = (value or "").strip().lower()
+    if value in read:
+        return "read"
+    if value in delivered:
+        return "delivered"
+    if value in failed:
+        return "failed"
+    return None  # Intermediate states (queued, sent, buffered) are not recorded
+
+
+def _parse_termii(body: bytes) -> List[DeliveryReceipt]:
+    payload = json.loads(body)
+    status = _status(
+        payload.get("status"),
+        delivered=("delivered",),
+        failed=("failed", "message failed", "rejected", "expired", "dnd active on phone number"),
+        read=("read",)
+    )
+    message_id = payload.get("message_id") or payload.get("id")
+    if not status or not message_id:
+        return []
+    return [DeliveryReceipt(
+        provider="termii",
+        external_id=str(message_id),
+        status=status,
+        recipient=payload.get("receiver"),
+        occurred_at=_timestamp(payload.get("sent_at")),
+        error=payload.get("status") if status == "failed" else None
+    )]
+
+
+def _parse_twilio(body: bytes) -> List[DeliveryReceipt]:
+    params = dict(parse_qsl(body.decode()))
+    status = _status(params.get("MessageStatus"), delivered=("delivered",), failed=("undelivered", "failed"), read=("read",))
+    if not status or not params.get("MessageSid"):
+        return []
+    error = None
+    if status == "failed":
+        error = f"Twilio error {params.get('ErrorCode', 'unknown')}"
+    return [DeliveryReceipt("twilio", params["MessageSid"], status, recipient=params.get("To"), error=error)]
+
+
+def _parse_africastalking(body: bytes) -> List[DeliveryReceipt]:
+    params = dict(parse_qsl(body.decode()))
+    status = _status(params.get("status"), delivered=("success",), failed=("failed", "rejected"))
+    if not status or not params.get("id"):
+        return []
+    return [DeliveryReceipt(
+        "africastalking",
+        params["id"],
+        status,
+        recipient=params.get("phoneNumber"),
+        error=params.get("failureReason")
+    )]
+
+
+def _parse_infobip(body: bytes) -> List[DeliveryReceipt]:
+    receipts = []
+    for result in json.loads(body).get("results", []):
+        group = (result.get("status") or {}).get("groupName")
+        status = _status(group, delivered=("delivered",), failed=("undeliverable", "rejected", "expired"))
+        if not status or not result.get("messageId"):
+            continue
+        error = (result.get("error") or {}).get("description") or (result.get("status") or {}).get("description")
+        receipts.append(DeliveryReceipt(
+            "infobip",
+            result["messageId"],
+            status,
+            recipient=result.get("to"),
+            occurred_at=_timestamp(result.get("doneAt")),
+            error=error if status == "failed" else None
+        ))
+    return receipts
+
+
+def _parse_meta(body: bytes) -> List[DeliveryReceipt]:
+    receipts = []
+    for entry in json.loads(body).get("entry", []):
+        for change in entry.get("changes", []):
+            for item in (change.get("value") or {}).get("statuses", []):
+                status = _status(item.get("status"), delivered=("delivered",), failed=("failed",), read=("read",))
+                if not status or not item.get("id"):
+                    continue
+                errors = item.get("errors") or [{}]
+                receipts.append(DeliveryReceipt(
+                    "meta",
+                    item["id"],
+                    status,
+                    occurred_at=_timestamp(item.get("timestamp")),
+                    error=errors[0].get("title") if status == "failed" else None
+                ))
+    return receipts
+
+
+RECEIPT_PARSERS: Dict[str, Callable[[bytes], List[DeliveryReceipt]]] = {
+    "termii": _parse_termii,
+    "twilio": _parse_twilio,
+    "africastalking": _parse_africastalking,
+    "infobip": _parse_infobip,
+    "meta": _parse_meta,
+}
+
+
+def parse_receipts(provider: str, body: bytes) -> List[DeliveryReceipt]:
+    """Final-state receipts in a provider's webhook payload"""
+    parser = RECEIPT_PARSERS.get(provider)
+    if parser is None:
+        raise ValueError(f"Unsupported receipt provider: {provider}")
+    return parser(body)
+
+
+def _termii_poller() -> Callable[[str], Awaitable[Dict[str, Any]]]:
+    from .services.termii_service import termii_service
+    return termii_service.get_delivery_status
+
+
+def _poll_result_receipts(provider: str, external_id: str, result: Any) -> List[DeliveryReceipt]:
+    """Receipts from a status poll response
+
+    Termii answers with one entry or a list; a bulk message ID has an entry per
+    receiver, and each entry becomes a receipt naming its number.
+    """
+    entries = result if isinstance(result, list) else [result]
+    receipts = []
+    for entry in entries:
+        if not isinstance(entry, dict) or entry.get("error"):
+            continue
+        for receipt in _parse_termii(json.dumps({**entry, "message_id": external_id}).encode()):
+            receipt.provider = provider
+            receipts.append(receipt)
+    return receipts
+
+
+# === INGESTION ===
+
+class DeliveryReceiptIngestor:
+    """Buffers receipts and applies them to NotificationRecipient rows in batches
+
+    Receipts for the same message are coalesced to the highest status and exact
+    redeliveries are dropped before touching the database. Each flush looks up
+    a batch of provider IDs in one query and writes it with one
+    UPDATE ... FROM (VALUES ...) guarded on the recipient's current status, so
+    receipts applied twice, by another replica or out of order change nothing.
+    Receipts that arrive before the send result is stored are retried until
+    RECEIPT_UNMATCHED_TTL_SECONDS. Messages whose receipt never arrives are
+    polled by sweep().
+    """
+
+    def __init__(self, session_factory=SessionLocal, batch_size: Optional[int] = None, flush_interval: Optional[float] = None):
+        self.session_factory = session_factory
+        self.batch_size = batch_size or int(os.getenv("RECEIPT_BATCH_SIZE", "500"))
+        self.flush_interval = flush_interval or float(os.getenv("RECEIPT_FLUSH_INTERVAL", "1"))
+        self.unmatched_ttl = float(os.getenv("RECEIPT_UNMATCHED_TTL_SECONDS", "600"))
+        self.seen_limit = int(os.getenv("RECEIPT_DEDUPE_WINDOW", "100000"))
+        self.pending: Dict[Tuple[str, str], DeliveryReceipt] = {}
+        self.seen: "OrderedDict[Tuple[str, str, str], None]" = OrderedDict()
+        self.stats: Counter = Counter()
+        self.pollers: Dict[str, Callable[[], Callable[[str], Awaitable[Dict[str, Any]]]]] = {"termii": _termii_poller}
+        self.running = False
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, receipts: List[DeliveryReceipt]) -> int:
+        """Buffer receipts; returns how many were new"""
+        accepted = 0
+        for receipt in receipts:
+            marker = (*receipt.key, receipt.status)
+            if marker in self.seen:
+                self.stats["duplicates"] += 1
+                continue
+            self.seen[marker] = None
+            if len(self.seen) > self.seen_limit:
+                self.seen.popitem(last=False)
+
+            accepted += 1
+            current = self.pending.get(receipt.key)
+            if current is not None:
+                self.stats["coalesced"] += 1
+                if RECEIPT_STATUS_RANK[receipt.status] <= RECEIPT_STATUS_RANK[current.status]:
+                    continue
+                receipt.received_at = current.received_at
+            self.pending[receipt.key] = receipt
+
+        self.stats["received"] += accepted
+        if len(self.pending) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+        return accepted
+
+    async def flush(self) -> Dict[str, int]:
+        """Apply everything buffered so far"""
+        if not self.pending:
+            return {"updated": 0, "unmatched": 0}
+
+        receipts = list(self.pending.values())
+        self.pending = {}
+        summary = {"updated": 0, "unmatched": 0}
+        db = self.session_factory()
+        try:
+            for start in range(0, len(receipts), self.batch_size):
+                chunk = receipts[start:start + self.batch_size]
+                try:
+                    updated, unmatched = self.apply(db, chunk)
+                except Exception as e:
+                    logger.error(f"Error applying delivery receipts: {str(e)}")
+                    db.rollback()
+                    self._requeue(chunk)
+                    continue
+                summary["updated"] += updated
+                summary["unmatched"] += len(unmatched)
+                self._requeue(unmatched)
+        finally:
+            db.close()
+        return summary
+
+    def _requeue(self, receipts: List[DeliveryReceipt]):
+        """Put receipts back for the next flush unless they are too old"""
+        now = time.monotonic()
+        for receipt in receipts:
+            if now - receipt.received_at > self.unmatched_ttl:
+                self.stats["expired"] += 1
+                continue
+            current = self.pending.get(receipt.key)
+            if current is None or RECEIPT_STATUS_RANK[receipt.status] > RECEIPT_STATUS_RANK[current.status]:
+                self.pending[receipt.key] = receipt
+
+    def apply(self, db: Session, receipts: List[DeliveryReceipt]) -> Tuple[int, List[DeliveryReceipt]]:
+        """Write one batch of receipts; returns the rows updated and the receipts with no recipient yet"""
+        Recipient = models.NotificationRecipient
+        rows = db.query(
+            Recipient.id,
+            Recipient.external_id,
+            Recipient.phone,
+            Recipient.whatsapp_number,
+            Recipient.status,
+            Recipient.read_at,
+            Recipient.notification_id,
+            models.Notification.school_id,
+            models.Notification.created_at
+        ).join(
+            models.Notification,
+            models.Notification.notification_id == Recipient.notification_id
+        ).filter(
+            Recipient.external_id.in_({receipt.external_id for receipt in receipts})
+        ).all()
+
+        by_external_id: Dict[str, List[Any]] = {}
+        for row in rows:
+            by_external_id.setdefault(row.external_id, []).append(row)
+
+        updates: Dict[int, Dict[str, Any]] = {}
+        unmatched = []
+        for receipt in receipts:
+            candidates = by_external_id.get(receipt.external_id)
+            if not candidates:
+                unmatched.append(receipt)
+                continue
+            # Bulk sends share one message ID across numbers; the receipt names the number
+            if len(candidates) > 1:
+                if not receipt.recipient:
+                    # Cannot tell whose message this is; never apply one answer to the whole batch
+                    self.stats["ambiguous"] += 1
+                    continue
+                digits = _digits(receipt.recipient)
+                candidates = [
+                    row for row in candidates
+                    if any(digits[-9:] and _digits(address).endswith(digits[-9:]) for address in (row.phone, row.whatsapp_number))
+                ]
+            for row in candidates:
+                already_read = row.status == "delivered" and row.read_at is not None
+                if receipt.status not in RECEIPT_TRANSITIONS.get(row.status, ()) or already_read:
+                    self.stats["ignored"] += 1
+                    continue
+                updates[row.id] = {
+                    "id": row.id,
+                    "expected_status": row.status,
+                    "status": "failed" if receipt.status == "failed" else "delivered",
+                    "delivered_at": receipt.occurred_at if receipt.status in ("delivered", "read") else None,
+                    "read_at": receipt.occurred_at if receipt.status == "read" else None,
+                    "failed_reason": receipt.error if receipt.status == "failed" else None,
+                    "row": row,
+                }
+
+        updated_ids = self._update(db, list(updates.values())) if updates else set()
+
+        # Analytics follow the transitions that were actually written
+        deltas: Dict[str, Counter] = {}
+        notifications: Dict[str, Any] = {}
+        for recipient_id in updated_ids:
+            update = updates[recipient_id]
+            row = update["row"]
+            if update["status"] == update["expected_status"]:
+                continue
+            counter = deltas.setdefault(row.notification_id, Counter())
+            notifications[row.notification_id] = SimpleNamespace(school_id=row.school_id, created_at=row.created_at)
+            counter[update["status"]] += 1
+            if update["expected_status"] in ("failed", "delivered"):
+                counter[update["expected_status"]] -= 1
+        for notification_id, counter in deltas.items():
+            notification_analytics.record_outcomes(db, notifications[notification_id], dict(counter))
+
+        db.commit()
+        self.stats["updated"] += len(updated_ids)
+        self.stats["unmatched"] += len(unmatched)
+        return len(updated_ids), unmatched
+
+    def _update(self, db: Session, updates: List[Dict[str, Any]]) -> set:
+        """UPDATE ... FROM (VALUES ...) RETURNING id for one batch"""
+        table = models.NotificationRecipient.__tablename__
+        columns = ("id", "expected_status", "status", "delivered_at", "read_at", "failed_reason")
+        # Postgres types VALUES columns from untyped parameters as text
+        casts = {"delivered_at": "TIMESTAMP", "read_at": "TIMESTAMP"} if db.bind.dialect.name == "postgresql" else {}
+        selected = ", ".join(
+            f"CAST(column{index} AS {casts[name]}) AS {name}" if name in casts else f"column{index} AS {name}"
+            for index, name in enumerate(columns, start=1)
+        )
+        values = ", ".join(
+            "(" + ", ".join(f":{name}_{row}" for name in columns) + ")"
+            for row in range(len(updates))
+        )
+        params = {
+            f"{name}_{row}": update[name]
+            for row, update in enumerate(updates)
+            for name in columns
+        }
+        statement = text(
+            f"UPDATE {table} SET "
+            f"status = receipts.status, "
+            f"delivered_at = COALESCE(receipts.delivered_at, {table}.delivered_at), "
+            f"read_at = COALESCE(receipts.read_at, {table}.read_at), "
+            f"failed_reason = COALESCE(receipts.failed_reason, {table}.failed_reason) "
+            f"FROM (SELECT {selected} FROM (VALUES {values}) AS v) AS receipts "
+            f"WHERE {table}.id = receipts.id AND {table}.status = receipts.expected_status "
+            f"RETURNING {table}.id"
+        ).bindparams(*(
+            bindparam(f"{name}_{row}", type_=models.NotificationRecipient.__table__.c[name].type)
+            for row in range(len(updates))
+            for name in ("delivered_at", "read_at")
+        ))
+        return {row[0] for row in db.execute(statement, params)}
+
+    # === SWEEPER ===
+
+    async def sweep(self, db: Session, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Poll providers for sent messages whose receipt never arrived
+
+        Picks the oldest sent recipients past RECEIPT_SWEEP_AFTER_MINUTES (and not
+        older than RECEIPT_SWEEP_MAX_AGE_HOURS) that were not checked within that
+        time, polls the providers that have a status API and applies the answers
+        like webhook receipts.
+        """
+        now = now or datetime.utcnow()
+        Recipient = models.NotificationRecipient
+        cutoff = now - timedelta(minutes=int(os.getenv("RECEIPT_SWEEP_AFTER_MINUTES", "30")))
+        oldest = now - timedelta(hours=int(os.getenv("RECEIPT_SWEEP_MAX_AGE_HOURS", "72")))
+        candidates = db.query(Recipient.id, Recipient.external_id, Recipient.provider_response).filter(
+            Recipient.status == "sent",
+            Recipient.external_id.isnot(None),
+            Recipient.last_attempt < cutoff,
+            Recipient.last_attempt >= oldest,
+            or_(Recipient.receipt_checked_at.is_(None), Recipient.receipt_checked_at < cutoff)
+        ).order_by(Recipient.last_attempt).limit(int(os.getenv("RECEIPT_SWEEP_BATCH_SIZE", "200"))).all()
+        if not candidates:
+            return {"checked": 0, "polled": 0, "updated": 0}
+
+        # Recipients of a bulk send share a message ID; poll it once and match the answers by number
+        polls = list(dict.fromkeys(
+            ((candidate.provider_response or {}).get("provider"), candidate.external_id)
+            for candidate in candidates
+            if (candidate.provider_response or {}).get("provider") in self.pollers
+        ))
+        # Each provider client bounds its own request concurrency
+        results = await asyncio.gather(
+            *(self.pollers[provider]()(external_id) for provider, external_id in polls),
+            return_exceptions=True
+        )
+        receipts = [
+            receipt
+            for (provider, external_id), result in zip(polls, results)
+            if not isinstance(result, Exception)
+            for receipt in _poll_result_receipts(provider, external_id, result)
+        ]
+
+        db.query(Recipient).filter(Recipient.id.in_([candidate.id for candidate in candidates])).update(
+            {Recipient.receipt_checked_at: now}, synchronize_session=False
+        )
+        db.commit()
+        updated = self.apply(db, receipts)[0] if receipts else 0
+        self.stats["swept"] += updated
+        return {"checked": len(candidates), "polled": len(polls), "updated": updated}
+
+    # === LIFECYCLE ===
+
+    async def start(self):
+        """Flush every RECEIPT_FLUSH_INTERVAL seconds, or as soon as a batch is full"""
+        self.running = True
+        self._wakeup = asyncio.Event()
+        while self.running:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing delivery receipts: {str(e)}")
+
+    async def stop(self):
+        """Stop the flusher and write what is still buffered"""
+        self.running = False
+        if self._wakeup is not None:
+            self._wakeup.set()
+        await self.flush()
+
+    def summary(self) -> Dict[str, int]:
+        return {**self.stats, "pending": len(self.pending)}
+
+
+# Initialize receipt ingestor
+receipt_ingestor = DeliveryReceiptIngestor()
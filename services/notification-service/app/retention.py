@@ -0,0 +1,296 @@
+"""
+EduNerve Notification Service - Retention
+Deletes expired notification data in small batches, or drops whole monthly
+partitions where the tables are partitioned
+"""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetentionPolicy:
+    """How long rows of one table are kept"""
+    name: str
+    model: Any
+    column: str  # Timestamp (or date) the age of a row is measured from
+    days: int
+    keep: Optional[Callable[[], List[Any]]] = None  # Extra conditions a row must meet to be deleted
+    partition_column: Optional[str] = None  # Range-partition key when the table is partitioned by month
+
+    def cutoff(self, now: datetime) -> datetime:
+        return now - timedelta(days=self.days)
+
+    def conditions(self, now: datetime) -> List[Any]:
+        column = getattr(self.model, self.column)
+        cutoff = self.cutoff(now)
+        if column.type.python_type is date:
+            cutoff = cutoff.date()
+        return [column < cutoff, *(self.keep() if self.keep else [])]
+
+
+@dataclass
+class RetentionReport:
+    """Outcome of one retention run"""
+    started_at: datetime
+    deleted: Dict[str, int] = field(default_factory=dict)
+    batches: int = 0
+    partitions_dropped: List[str] = field(default_factory=list)
+    duration_seconds: float = 0.0
+    complete: bool = True  # False when the time budget ran out before every table was done
+
+    def to_dict(self) -> Dict[str, Any]:
+        report = asdict(self)
+        report["started_at"] = self.started_at.isoformat()
+        report["total_deleted"] = sum(self.deleted.values())
+        return report
+
+
+def default_policies() -> List[RetentionPolicy]:
+    """Retention periods, overridable per table through RETENTION_<NAME>_DAYS"""
+    def days(name: str, default: int) -> int:
+        return int(os.getenv(f"RETENTION_{name.upper()}_DAYS", str(default)))
+
+    return [
+        RetentionPolicy(
+            "delivery_logs",
+            models.NotificationDeliveryLog,
+            "attempted_at",
+            days("delivery_logs", 90),
+            partition_column="attempted_at"
+        ),
+        RetentionPolicy(
+            "queue_completed",
+            models.NotificationQueue,
+            "processing_completed",
+            days("queue_completed", 30),
+            keep=lambda: [models.NotificationQueue.status == "completed"]
+        ),
+        RetentionPolicy(
+            "analytics",
+            models.NotificationAnalytics,
+            "date",
+            days("analytics", 365)
+        ),
+        RetentionPolicy(
+            "notifications",
+            models.Notification,
+            "created_at",
+            days("notifications", 180),
+            keep=lambda: [models.Notification.priority.in_(["low", "normal"])],  # Keep high priority
+            partition_column="created_at"
+        ),
+    ]
+
+
+# Rows that reference a notification and go with it
+NOTIFICATION_CHILDREN = (
+    models.NotificationDeliveryLog,
+    models.NotificationQueue,
+    models.NotificationRecipient,
+)
+
+
+class RetentionManager:
+    """Removes expired rows without long-running transactions
+
+    Each policy deletes in keyset order (by primary key) in batches of
+    RETENTION_BATCH_SIZE, committing and sleeping RETENTION_BATCH_PAUSE_SECONDS
+    between batches so queue workers and replication keep up. A run stops once
+    RETENTION_TIME_BUDGET_SECONDS is spent and the next run carries on.
+
+    When RETENTION_USE_PARTITIONS is enabled on PostgreSQL, tables that are
+    range-partitioned by month are kept supplied with upcoming partitions, and
+    partitions wholly older than the cutoff are detached and dropped instead of
+    deleted row by row. Policies with extra keep conditions always delete by row.
+    """
+
+    def __init__(
+        self,
+        policies: Optional[List[RetentionPolicy]] = None,
+        batch_size: Optional[int] = None,
+        pause_seconds: Optional[float] = None,
+        time_budget_seconds: Optional[float] = None,
+        use_partitions: Optional[bool] = None
+    ):
+        self.policies = policies if policies is not None else default_policies()
+        self.batch_size = batch_size or int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+        self.pause_seconds = (
+            pause_seconds if pause_seconds is not None
+            else float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "0.2"))
+        )
+        self.time_budget_seconds = time_budget_seconds or float(os.getenv("RETENTION_TIME_BUDGET_SECONDS", "300"))
+        self.use_partitions = (
+            use_partitions if use_partitions is not None
+            else os.getenv("RETENTION_USE_PARTITIONS", "false").lower() == "true"
+        )
+        self.partitions_ahead = int(os.getenv("RETENTION_PARTITIONS_AHEAD", "3"))
+        self.last_report: Optional[RetentionReport] = None
+
+    async def run(self, db: Session, now: Optional[datetime] = None) -> RetentionReport:
+        """Apply every policy until done or out of time; returns the run's report"""
+        now = now or datetime.utcnow()
+        report = RetentionReport(started_at=now)
+        started = time.monotonic()
+        deadline = started + self.time_budget_seconds
+
+        # Database work runs in a worker thread so the event loop stays responsive
+        try:
+            for policy in self.policies:
+                report.deleted.setdefault(policy.name, 0)
+                if await asyncio.to_thread(self._partitioned, db, policy):
+                    await asyncio.to_thread(self.ensure_partitions, db, policy, now)
+                    if not policy.keep:
+                        report.partitions_dropped.extend(
+                            await asyncio.to_thread(self.drop_expired_partitions, db, policy, now)
+                        )
+
+                last_id = 0
+                while True:
+                    if time.monotonic() >= deadline:
+                        report.complete = False
+                        break
+                    ids = await asyncio.to_thread(self._delete_batch, db, policy, now, last_id)
+                    report.deleted[policy.name] += len(ids)
+                    if ids:
+                        report.batches += 1
+                        last_id = ids[-1]
+                    if len(ids) < self.batch_size:
+                        break
+                    await asyncio.sleep(self.pause_seconds)
+
+                if not report.complete:
+                    break
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            report.duration_seconds = round(time.monotonic() - started, 3)
+            self.last_report = report
+
+        logger.info(
+            f"Retention run removed {sum(report.deleted.values())} rows in {report.batches} batches "
+            f"({report.deleted}), dropped {len(report.partitions_dropped)} partitions "
+            f"in {report.duration_seconds}s{'' if report.complete else ' (time budget reached)'}"
+        )
+        return report
+
+    async def run_in_new_session(self) -> RetentionReport:
+        """Run with a session of its own, for callers that do not have one (background tasks)"""
+        db = SessionLocal()
+        try:
+            return await self.run(db)
+        finally:
+            db.close()
+
+    # === ROW DELETES ===
+
+    def _delete_batch(self, db: Session, policy: RetentionPolicy, now: datetime, after_id: int) -> List[int]:
+        """Delete the next batch of expired rows after after_id in one short transaction"""
+        model = policy.model
+        ids = db.execute(
+            select(model.id)
+            .where(model.id > after_id, *policy.conditions(now))
+            .order_by(model.id)
+            .limit(self.batch_size)
+        ).scalars().all()
+        if not ids:
+            return []
+
+        if model is models.Notification:
+            # Children first so foreign keys hold, then the notifications themselves
+            notification_ids = db.execute(
+                select(models.Notification.notification_id).where(models.Notification.id.in_(ids))
+            ).scalars().all()
+            for child in NOTIFICATION_CHILDREN:
+                db.execute(
+                    delete(child)
+                    .where(child.notification_id.in_(notification_ids))
+                    .execution_options(synchronize_session=False)
+                )
+
+        db.execute(delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False))
+        db.commit()
+        return ids
+
+    # === PARTITIONS ===
+
+    def _partitioned(self, db: Session, policy: RetentionPolicy) -> bool:
+        """Whether the policy's table is a partitioned table we manage"""
+        if not (self.use_partitions and policy.partition_column and db.bind.dialect.name == "postgresql"):
+            return False
+        return bool(db.execute(
+            text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+            {"table": policy.model.__tablename__}
+        ).scalar())
+
+    def ensure_partitions(self, db: Session, policy: RetentionPolicy, now: datetime):
+        """Create monthly partitions from the current month up to RETENTION_PARTITIONS_AHEAD months out"""
+        table = policy.model.__tablename__
+        month = date(now.year, now.month, 1)
+        for _ in range(self.partitions_ahead + 1):
+            following = _next_month(month)
+            db.execute(text(
+                f'CREATE TABLE IF NOT EXISTS "{_partition_name(table, month)}" PARTITION OF "{table}" '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+            ))
+            month = following
+        db.commit()
+
+    def drop_expired_partitions(self, db: Session, policy: RetentionPolicy, now: datetime) -> List[str]:
+        """Detach and drop partitions whose whole range is older than the cutoff"""
+        table = policy.model.__tablename__
+        cutoff = policy.cutoff(now)
+        partitions = db.execute(text(
+            "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) "
+            "FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:table)"
+        ), {"table": table}).all()
+
+        dropped = []
+        for name, bound in partitions:
+            upper = _upper_bound(bound)
+            if upper is None or upper > cutoff:
+                continue
+            db.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+            db.execute(text(f'DROP TABLE "{name}"'))
+            db.commit()
+            dropped.append(name)
+        return dropped
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def _upper_bound(bound: Optional[str]) -> Optional[datetime]:
+    """Upper bound of a "FOR VALUES FROM ('...') TO ('...')" partition expression"""
+    if not bound or " TO (" not in bound:
+        return None
+    value = bound.split(" TO (", 1)[1].strip(" ()'")
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+# Initialize manager
+retention_manager = RetentionManager()
@@ -0,0 +1,384 @@
+"""
+EduNerve Notification Service - Notification Scheduler
+Fires scheduled notifications from an in-memory heap fed by an indexed window
+query and push updates, on whichever replica holds the scheduler lease
+"""
+
+import asyncio
+import heapq
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal, engine
+from .queue_backends import notification_queue
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SCHEDULE_CHANNEL = "notification_schedule"
+LEASE_NAME = "notification_scheduler"
+
+PRIORITY_VALUES = {
+    "emergency": 5,
+    "urgent": 4,
+    "high": 3,
+    "normal": 2,
+    "low": 1
+}
+
+
+class NotificationScheduler:
+    """Queues scheduled notifications within about a second of their time
+
+    Upcoming notifications (status "pending", scheduled within the next
+    SCHEDULER_WINDOW_SECONDS) are loaded into a heap with one indexed query and
+    reloaded every SCHEDULER_REFRESH_SECONDS. Creates, reschedules and cancels
+    are pushed in between: directly when the scheduler runs in the same process,
+    and over Postgres NOTIFY otherwise. The loop sleeps until the earliest entry
+    is due or a push arrives. Only the replica holding the scheduler lease fires
+    notifications; the others wait to take over when the lease expires.
+    """
+
+    def __init__(self, session_factory=SessionLocal, bind=engine, queue=None):
+        self.session_factory = session_factory
+        self.bind = bind
+        self.queue = queue or notification_queue
+        self.window = timedelta(seconds=int(os.getenv("SCHEDULER_WINDOW_SECONDS", "300")))
+        self.refresh_interval = float(os.getenv("SCHEDULER_REFRESH_SECONDS", "60"))
+        self.lease_ttl = timedelta(seconds=int(os.getenv("SCHEDULER_LEASE_SECONDS", "15")))
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self.running = False
+        self.scheduler_task = None
+        self.is_leader = False
+        self.fired = 0
+        # Heap of (due, notification_id); self.due holds the live time so stale heap entries are skipped
+        self._heap: List[Tuple[datetime, str]] = []
+        self.due: Dict[str, datetime] = {}
+        self._horizon = datetime.min  # Heap holds every pending notification scheduled before this
+        self._wakeup: Optional[asyncio.Event] = None
+        self._listener = None
+        self._loop = None
+
+    # === LIFECYCLE ===
+
+    async def start(self):
+        """Start the scheduler"""
+        if self.running:
+            logger.warning("Scheduler already running")
+            return
+
+        self.running = True
+        logger.info(f"Starting notification scheduler {self.holder}")
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._start_listener()
+        local_schedulers.append(self)
+
+        self.scheduler_task = asyncio.create_task(self._schedule_worker())
+        try:
+            await self.scheduler_task
+        except asyncio.CancelledError:
+            logger.info("Scheduler cancelled")
+        except Exception as e:
+            logger.error(f"Error in scheduler: {str(e)}")
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        """Stop the scheduler and give up the lease"""
+        if not self.running:
+            return
+
+        logger.info("Stopping notification scheduler")
+        self.running = False
+        if self in local_schedulers:
+            local_schedulers.remove(self)
+
+        if self.scheduler_task and self.scheduler_task is not asyncio.current_task():
+            self.scheduler_task.cancel()
+            try:
+                await self.scheduler_task
+            except asyncio.CancelledError:
+                pass
+
+        if self._listener is not None:
+            try:
+                self._loop.remove_reader(self._listener.fileno())
+            finally:
+                self._listener.close()
+                self._listener = None
+
+        if self.is_leader:
+            self._release_lease()
+        logger.info("Notification scheduler stopped")
+
+    async def _schedule_worker(self):
+        """Hold the lease, keep the heap filled and fire due notifications"""
+        next_renewal = datetime.min
+        next_refresh = datetime.min
+
+        while self.running:
+            try:
+                now = datetime.utcnow()
+                if now >= next_renewal:
+                    leader = self._acquire_lease(now)
+                    if leader != self.is_leader:
+                        logger.info(f"Scheduler {self.holder} {'acquired' if leader else 'lost'} the lease")
+                        self.is_leader = leader
+                        self._clear()
+                        next_refresh = datetime.min
+                    next_renewal = now + self.lease_ttl / 3
+
+                if self.is_leader:
+                    if now >= next_refresh:
+                        self._load_window(now)
+                        next_refresh = now + timedelta(seconds=self.refresh_interval)
+                    await self._fire_due()
+
+                # Sleep until the next due entry, refresh or renewal, or until a push arrives
+                wake_at = min(next_renewal, next_refresh if self.is_leader else next_renewal)
+                if self.is_leader and self._heap:
+                    wake_at = min(wake_at, self._heap[0][0])
+                timeout = max((wake_at - datetime.utcnow()).total_seconds(), 0)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in scheduler worker: {str(e)}")
+                await asyncio.sleep(1)
+
+        logger.info("Scheduler worker stopped")
+
+    # === HEAP ===
+
+    def _clear(self):
+        self._heap, self.due = [], {}
+        self._horizon = datetime.min
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def schedule(self, notification_id: str, scheduled_at: Optional[datetime]):
+        """Add, move or (with scheduled_at=None) remove an entry; called on push updates"""
+        scheduled_at = _utc(scheduled_at)
+        if scheduled_at is None or scheduled_at >= self._horizon:
+            # Cancelled, or beyond the loaded window: a later refresh picks it up
+            self.due.pop(notification_id, None)
+            return
+        self.due[notification_id] = scheduled_at
+        heapq.heappush(self._heap, (scheduled_at, notification_id))
+        self._wake()
+
+    def _load_window(self, now: datetime):
+        """Load pending notifications due before now + window (uses ix_notifications_status_scheduled)"""
+        horizon = now + self.window
+        db = self.session_factory()
+        try:
+            rows = db.query(models.Notification.notification_id, models.Notification.scheduled_at).filter(
+                models.Notification.status == "pending",
+                models.Notification.scheduled_at.isnot(None),
+                models.Notification.scheduled_at < horizon
+            ).all()
+        finally:
+            db.close()
+
+        self._heap = [(row.scheduled_at, row.notification_id) for row in rows]
+        heapq.heapify(self._heap)
+        self.due = {row.notification_id: row.scheduled_at for row in rows}
+        self._horizon = horizon
+
+    def _pop_due(self, now: datetime) -> List[str]:
+        ready = []
+        while self._heap and self._heap[0][0] <= now:
+            scheduled_at, notification_id = heapq.heappop(self._heap)
+            # Skip entries superseded by a reschedule or cancel
+            if self.due.get(notification_id) == scheduled_at:
+                del self.due[notification_id]
+                ready.append(notification_id)
+        return ready
+
+    async def _fire_due(self):
+        """Move due notifications from pending to queued and enqueue them"""
+        now = datetime.utcnow()
+        ready = self._pop_due(now)
+        if not ready:
+            return
+
+        db = self.session_factory()
+        try:
+            fired = []
+            for notification_id in ready:
+                # Guarded so a cancel or reschedule that raced the push is respected
+                result = db.execute(
+                    update(models.Notification)
+                    .where(
+                        models.Notification.notification_id == notification_id,
+                        models.Notification.status == "pending",
+                        models.Notification.scheduled_at <= now
+                    )
+                    .values(status="queued", updated_at=now)
+                )
+                if result.rowcount:
+                    fired.append(notification_id)
+            if not self.queue.transactional:
+                # Publish only once the status change is durable
+                db.commit()
+
+            notifications = db.query(models.Notification).filter(
+                models.Notification.notification_id.in_(fired)
+            ).all() if fired else []
+            for notification in notifications:
+                await self.queue.enqueue(
+                    db,
+                    notification.notification_id,
+                    f"{notification.priority}_priority",
+                    PRIORITY_VALUES.get(notification.priority, 2),
+                    metadata={
+                        "scheduled": True,
+                        "original_scheduled_at": notification.scheduled_at.isoformat(),
+                        "fired_at": now.isoformat()
+                    },
+                    commit=False
+                )
+            db.commit()
+            self.fired += len(notifications)
+            for notification in notifications:
+                logger.info(
+                    f"Queued scheduled notification {notification.notification_id} "
+                    f"{(datetime.utcnow() - notification.scheduled_at).total_seconds():.2f}s after its time"
+                )
+        except Exception as e:
+            logger.error(f"Error firing scheduled notifications: {str(e)}")
+            db.rollback()
+            # Leave them to the next refresh, which reloads anything still pending
+        finally:
+            db.close()
+
+    # === LEADER LEASE ===
+
+    def _acquire_lease(self, now: datetime) -> bool:
+        """Take or renew the scheduler lease; True while this replica holds it"""
+        db = self.session_factory()
+        try:
+            Lease = models.SchedulerLease
+            result = db.execute(
+                update(Lease)
+                .where(
+                    Lease.name == LEASE_NAME,
+                    (Lease.holder == self.holder) | (Lease.expires_at < now)
+                )
+                .values(holder=self.holder, expires_at=now + self.lease_ttl, renewed_at=now)
+            )
+            if result.rowcount:
+                db.commit()
+                return True
+            try:
+                db.execute(insert(Lease).values(
+                    name=LEASE_NAME, holder=self.holder, expires_at=now + self.lease_ttl, renewed_at=now
+                ))
+                db.commit()
+                return True
+            except IntegrityError:
+                db.rollback()
+                return False
+        except Exception as e:
+            logger.error(f"Error renewing scheduler lease: {str(e)}")
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def _release_lease(self):
+        db = self.session_factory()
+        try:
+            db.execute(
+                update(models.SchedulerLease)
+                .where(models.SchedulerLease.name == LEASE_NAME, models.SchedulerLease.holder == self.holder)
+                .values(expires_at=datetime.utcnow())
+            )
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error releasing scheduler lease: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+            self.is_leader = False
+
+    # === PUSH UPDATES ===
+
+    def _start_listener(self):
+        """LISTEN for schedule changes published by other processes (Postgres only)"""
+        if self._listener is not None or self.bind.dialect.name != "postgresql":
+            return
+
+        raw = self.bind.raw_connection()
+        raw.detach()
+        connection = raw.driver_connection
+        connection.set_session(autocommit=True)
+        connection.cursor().execute(f"LISTEN {SCHEDULE_CHANNEL}")
+
+        def on_notify():
+            connection.poll()
+            while connection.notifies:
+                try:
+                    change = json.loads(connection.notifies.pop(0).payload)
+                    scheduled_at = change.get("scheduled_at")
+                    self.schedule(
+                        change["notification_id"],
+                        datetime.fromisoformat(scheduled_at) if scheduled_at else None
+                    )
+                except (ValueError, KeyError) as e:
+                    logger.warning(f"Ignoring malformed schedule change: {str(e)}")
+
+        self._loop.add_reader(connection.fileno(), on_notify)
+        self._listener = connection
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Naive UTC, as stored in scheduled_at"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+# Schedulers running in this process, which receive schedule changes directly
+local_schedulers: List[NotificationScheduler] = []
+
+
+def publish_schedule_change(db: Session, notification_id: str, scheduled_at: Optional[datetime]):
+    """Tell the scheduler that a notification was scheduled, rescheduled or (scheduled_at=None) cancelled
+
+    Call after the change is committed. Other processes hear about it over
+    Postgres NOTIFY; without Postgres they pick it up on their next refresh.
+    """
+    for local in local_schedulers:
+        local.schedule(notification_id, scheduled_at)
+
+    if db.bind.dialect.name == "postgresql":
+        payload = json.dumps({
+            "notification_id": notification_id,
+            "scheduled_at": scheduled_at.isoformat() if scheduled_at else None
+        })
+        try:
+            db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": SCHEDULE_CHANNEL, "payload": payload})
+            db.commit()
+        except Exception as e:
+            logger.warning(f"Could not publish schedule change for {notification_id}: {str(e)}")
+            db.rollback()
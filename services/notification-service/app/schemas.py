@@ -206,6 +206,7 @@ class NotificationTemplateResponse(NotificationTemplateBase):
     school_id: Optional[int]
     is_system_template: bool
     is_active: bool
+    version: int
     created_at: datetime
     updated_at: datetime
 
@@ -3,6 +3,7 @@ Termii Integration Service
 SMS and WhatsApp messaging via Termii API
 """
 
+import asyncio
 import httpx
 import json
 import logging
@@ -45,6 +46,34 @@ class TermiiService:
         
         if not self.config.api_key:
             logger.warning("Termii API key not configured")
+        
+        # Numbers per request to the bulk SMS endpoint
+        self.bulk_batch_size = int(os.getenv("TERMII_BULK_BATCH_SIZE", "100"))
+        # Requests in flight at once, shared by every send so bulk jobs cannot swamp the API
+        self.concurrency = int(os.getenv("TERMII_CONCURRENCY", "10"))
+        self._limiter = asyncio.Semaphore(self.concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Pooled HTTP client for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=30.0,
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency
+                )
+            )
+            self._client_loop = loop
+        return self._client
+    
+    async def close(self):
+        """Close pooled connections"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
     
     async def send_sms(
         self,
@@ -83,7 +112,8 @@ class TermiiService:
                 "api_key": self.config.api_key
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            client = self._get_client()
+            async with self._limiter:
                 response = await client.post(url, json=payload)
                 
                 if response.status_code == 200:
@@ -173,7 +203,8 @@ class TermiiService:
             else:
                 payload["body"] = message
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            client = self._get_client()
+            async with self._limiter:
                 response = await client.post(url, json=payload)
                 
                 if response.status_code == 200:
@@ -220,30 +251,96 @@ class TermiiService:
         sender_id: Optional[str] = None
     ) -> List[MessageResult]:
         """
-        Send bulk SMS messages
+        Send bulk SMS messages through Termii's bulk endpoint
+        
+        Results are returned per recipient, in the order given.
         """
-        results = []
+        results: List[Optional[MessageResult]] = [None] * len(recipients)
         
-        # Send messages in batches to avoid rate limits
-        batch_size = 50
-        for i in range(0, len(recipients), batch_size):
-            batch = recipients[i:i + batch_size]
-            
-            # Send each message in the batch
-            for phone in batch:
-                result = await self.send_sms(
-                    to=phone,
-                    message=message,
-                    sender_id=sender_id
+        if not self.config.api_key:
+            return [
+                MessageResult(success=False, error="Termii API key not configured")
+                for _ in recipients
+            ]
+        
+        valid = []
+        for index, recipient in enumerate(recipients):
+            phone = self._clean_phone_number(recipient)
+            if phone:
+                valid.append((index, phone))
+            else:
+                results[index] = MessageResult(
+                    success=False,
+                    error="Invalid phone number format",
+                    status="failed"
                 )
-                results.append(result)
-            
-            # Small delay between batches
-            if i + batch_size < len(recipients):
-                await asyncio.sleep(1)
+        
+        batches = [
+            valid[i:i + self.bulk_batch_size]
+            for i in range(0, len(valid), self.bulk_batch_size)
+        ]
+        # Batches run concurrently; the shared limiter bounds requests in flight
+        batch_results = await asyncio.gather(*(
+            self._send_bulk_batch([phone for _, phone in batch], message, sender_id)
+            for batch in batches
+        ))
+        
+        for batch, batch_result in zip(batches, batch_results):
+            for (index, _), result in zip(batch, batch_result):
+                results[index] = result
         
         return results
     
+    async def _send_bulk_batch(
+        self,
+        phones: List[str],
+        message: str,
+        sender_id: Optional[str]
+    ) -> List[MessageResult]:
+        """
+        Send one request to the bulk endpoint; Termii returns one message ID for the batch
+        """
+        try:
+            url = f"{self.config.api_url}/sms/send/bulk"
+            
+            payload = {
+                "to": phones,
+                "from": sender_id or self.config.sender_id,
+                "sms": message,
+                "type": "plain",
+                "channel": "generic",
+                "api_key": self.config.api_key
+            }
+            
+            client = self._get_client()
+            async with self._limiter:
+                response = await client.post(url, json=payload)
+            
+            if response.status_code == 200:
+                result = response.json()
+                
+                if result.get("code") == "ok":
+                    return [
+                        MessageResult(
+                            success=True,
+                            message_id=result.get("message_id"),
+                            status="sent"
+                        )
+                        for _ in phones
+                    ]
+                error = result.get("message", "Unknown error")
+            else:
+                error = f"HTTP {response.status_code}: {response.text}"
+            
+            return [MessageResult(success=False, error=error, status="failed") for _ in phones]
+        
+        except httpx.TimeoutException:
+            logger.error("Termii bulk SMS timeout")
+            return [MessageResult(success=False, error="Request timeout", status="timeout") for _ in phones]
+        except Exception as e:
+            logger.error(f"Termii bulk SMS error: {e}")
+            return [MessageResult(success=False, error=str(e), status="error") for _ in phones]
+    
     async def get_delivery_status(self, message_id: str) -> Dict[str, Any]:
         """
         Get message delivery status
@@ -256,7 +353,8 @@ class TermiiService:
                 "api_key": self.config.api_key
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            client = self._get_client()
+            async with self._limiter:
                 response = await client.get(url, params=params)
                 
                 if response.status_code == 200:
@@ -281,7 +379,8 @@ class TermiiService:
                 "api_key": self.config.api_key
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            client = self._get_client()
+            async with self._limiter:
                 response = await client.get(url, params=params)
                 
                 if response.status_code == 200:
@@ -316,7 +415,8 @@ class TermiiService:
                 "api_key": self.config.api_key
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            client = self._get_client()
+            async with self._limiter:
                 response = await client.post(url, json=payload)
                 
                 if response.status_code == 200:
@@ -500,45 +600,51 @@ class ParentSummaryService:
         """
         Send summaries to multiple parents
         """
-        results = []
-        
-        for item in student_parent_list:
-            try:
-                student_id = item["student_id"]
-                student_name = item["student_name"]
-                parent_phone = item["parent_phone"]
-                
-                # Generate summary (would use actual data)
-                summary = await self.generate_summary(
-                    student_id=student_id,
-                    week_start=week_start,
-                    week_end=week_end,
-                    db_session=None
-                )
-                
-                # Send summary
-                result = await self.send_parent_summary(
-                    student_id=student_id,
-                    parent_phone=parent_phone,
-                    summary=summary,
-                    student_name=student_name,
-                    method=method
-                )
-                
-                results.append(result)
-                
-                # Small delay between sends
-                await asyncio.sleep(0.5)
-                
-            except Exception as e:
-                logger.error(f"Bulk summary error for student {item.get('student_id')}: {e}")
-                results.append(MessageResult(
-                    success=False,
-                    error=str(e),
-                    status="error"
-                ))
-        
-        return results
+        # Sends run concurrently; TermiiService's shared limiter bounds requests in flight
+        return list(await asyncio.gather(*(
+            self._send_item_summary(item, week_start, week_end, method)
+            for item in student_parent_list
+        )))
+    
+    async def _send_item_summary(
+        self,
+        item: Dict[str, Any],
+        week_start: datetime,
+        week_end: datetime,
+        method: str
+    ) -> MessageResult:
+        """
+        Generate and send the summary for one student-parent entry
+        """
+        try:
+            student_id = item["student_id"]
+            student_name = item["student_name"]
+            parent_phone = item["parent_phone"]
+            
+            # Generate summary (would use actual data)
+            summary = await self.generate_summary(
+                student_id=student_id,
+                week_start=week_start,
+                week_end=week_end,
+                db_session=None
+            )
+            
+            # Send summary
+            return await self.send_parent_summary(
+                student_id=student_id,
+                parent_phone=parent_phone,
+                summary=summary,
+                student_name=student_name,
+                method=method
+            )
+            
+        except Exception as e:
+            logger.error(f"Bulk summary error for student {item.get('student_id')}: {e}")
+            return MessageResult(
+                success=False,
+                error=str(e),
+                status="error"
+            )
 
 
 # Global service instances
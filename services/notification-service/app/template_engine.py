@@ -0,0 +1,209 @@
+"""
+EduNerve Notification Service - Template Engine
+Compiled, cached Jinja templates with batch rendering for large campaigns
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from jinja2 import BaseLoader, Environment, FileSystemBytecodeCache, Template, TemplateNotFound, meta
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Template parts rendered for a notification, mapped to the notification field they fill
+TEMPLATE_PARTS = {
+    "subject_template": "subject",
+    "message_template": "message",
+    "html_template": "html_message",
+}
+
+
+class _SourceLoader(BaseLoader):
+    """Serves registered template sources so Jinja's bytecode cache applies to them"""
+
+    def __init__(self):
+        self.sources: Dict[str, str] = {}
+
+    def get_source(self, environment: Environment, name: str):
+        if name not in self.sources:
+            raise TemplateNotFound(name)
+        source = self.sources[name]
+        return source, None, lambda: self.sources.get(name) == source
+
+
+@dataclass
+class CompiledTemplate:
+    """Compiled parts of one template version"""
+    template_id: str
+    version: int
+    parts: Dict[str, Template]
+    variables: Set[str] = field(default_factory=set)  # Undeclared variables the parts reference
+
+    def render(self, context: Dict[str, Any]) -> Dict[str, str]:
+        """Render every part against one context, keyed by notification field"""
+        return {TEMPLATE_PARTS[part]: template.render(context) for part, template in self.parts.items()}
+
+
+def template_sources(template: Any) -> Dict[str, str]:
+    """The non-empty template parts of a NotificationTemplate (or any object with the same fields)"""
+    return {
+        part: getattr(template, part)
+        for part in TEMPLATE_PARTS
+        if getattr(template, part, None)
+    }
+
+
+class TemplateEngine:
+    """Shared Jinja environment with a compiled template cache keyed by (template_id, version)
+
+    Parsing and compiling happen once per template version. A template update bumps
+    its version, which changes the cache key; invalidate() also drops stale versions
+    eagerly. When TEMPLATE_BYTECODE_CACHE_DIR is set, compiled bytecode is shared on
+    disk so process-pool workers and restarts skip compilation too.
+    """
+
+    def __init__(self, cache_size: Optional[int] = None, bytecode_cache_dir: Optional[str] = None):
+        self.cache_size = cache_size or int(os.getenv("TEMPLATE_CACHE_SIZE", "500"))
+        bytecode_cache_dir = bytecode_cache_dir or os.getenv("TEMPLATE_BYTECODE_CACHE_DIR")
+        bytecode_cache = None
+        if bytecode_cache_dir:
+            os.makedirs(bytecode_cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache_dir)
+
+        self.loader = _SourceLoader()
+        # Jinja's own cache is disabled; compiled templates live in self.compiled
+        self.environment = Environment(
+            loader=self.loader,
+            bytecode_cache=bytecode_cache,
+            cache_size=0,
+            auto_reload=False,
+            keep_trailing_newline=True
+        )
+        self.compiled: "OrderedDict[Tuple[str, int], CompiledTemplate]" = OrderedDict()
+        self.stats: Counter = Counter()  # Compiled cache hits and misses
+        self._lock = threading.Lock()
+
+        # Campaigns at least this large are rendered in a process pool when one is configured
+        self.process_threshold = int(os.getenv("TEMPLATE_PROCESS_POOL_THRESHOLD", "5000"))
+        self.processes = int(os.getenv("TEMPLATE_RENDER_PROCESSES", "0"))
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    # === COMPILATION ===
+
+    def compile(self, template_id: str, version: int, sources: Dict[str, str]) -> CompiledTemplate:
+        """Return the compiled template for this version, compiling it on first use"""
+        key = (template_id, version or 1)
+        with self._lock:
+            compiled = self.compiled.get(key)
+            if compiled is not None:
+                self.compiled.move_to_end(key)
+                self.stats["hits"] += 1
+                return compiled
+            self.stats["misses"] += 1
+
+            parts, variables = {}, set()
+            for part, source in sources.items():
+                if part not in TEMPLATE_PARTS or not source:
+                    continue
+                name = f"{key[0]}@{key[1]}/{part}"
+                self.loader.sources[name] = source
+                parts[part] = self.environment.get_template(name)
+                variables |= meta.find_undeclared_variables(self.environment.parse(source))
+            compiled = CompiledTemplate(key[0], key[1], parts, variables)
+
+            self.compiled[key] = compiled
+            while len(self.compiled) > self.cache_size:
+                evicted, _ = self.compiled.popitem(last=False)
+                self._forget_sources(evicted)
+            return compiled
+
+    def get(self, template: Any) -> CompiledTemplate:
+        """Compiled form of a NotificationTemplate row"""
+        return self.compile(template.template_id, template.version, template_sources(template))
+
+    def invalidate(self, template_id: str):
+        """Drop every cached version of a template (call after it is updated or deleted)"""
+        with self._lock:
+            for key in [key for key in self.compiled if key[0] == template_id]:
+                del self.compiled[key]
+                self._forget_sources(key)
+
+    def _forget_sources(self, key: Tuple[str, int]):
+        prefix = f"{key[0]}@{key[1]}/"
+        for name in [name for name in self.loader.sources if name.startswith(prefix)]:
+            del self.loader.sources[name]
+
+    def clear(self):
+        """Drop all compiled templates"""
+        with self._lock:
+            self.compiled.clear()
+            self.loader.sources.clear()
+
+    # === RENDERING ===
+
+    def render(self, template: Any, context: Dict[str, Any]) -> Dict[str, str]:
+        """Render one context; returns the rendered parts keyed by notification field"""
+        return self.get(template).render(context)
+
+    async def render_batch(
+        self,
+        template: Any,
+        contexts: List[Dict[str, Any]],
+        processes: Optional[int] = None
+    ) -> List[Dict[str, str]]:
+        """Render one template against many recipient contexts, in order
+
+        The template is compiled once and every context is rendered in a single pass.
+        Very large batches are split across a process pool when one is configured.
+        """
+        compiled = self.get(template)
+        processes = self.processes if processes is None else processes
+        if processes <= 1 or len(contexts) < self.process_threshold:
+            return [compiled.render(context) for context in contexts]
+
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=processes)
+
+        sources = template_sources(template)
+        chunk_size = -(-len(contexts) // processes)
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(*(
+            loop.run_in_executor(
+                self.executor,
+                _render_chunk,
+                compiled.template_id,
+                compiled.version,
+                sources,
+                contexts[start:start + chunk_size]
+            )
+            for start in range(0, len(contexts), chunk_size)
+        ))
+        return [rendered for chunk in chunks for rendered in chunk]
+
+    def close(self):
+        """Shut down the render process pool"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+
+def _render_chunk(
+    template_id: str,
+    version: int,
+    sources: Dict[str, str],
+    contexts: List[Dict[str, Any]]
+) -> List[Dict[str, str]]:
+    """Render a slice of a batch inside a pool worker, reusing the worker's compiled cache"""
+    compiled = template_engine.compile(template_id, version, sources)
+    return [compiled.render(context) for context in contexts]
+
+
+# Initialize engine
+template_engine = TemplateEngine()
@@ -1,5 +1,6 @@
-import requests
-import json
+import asyncio
+import httpx
+import os
 from typing import Dict, List, Optional, Any
 from datetime import datetime, timedelta
 import logging
@@ -19,8 +20,39 @@ class WhatsAppService:
         self.headers = {
             "Content-Type": "application/json"
         }
+        # Requests in flight at once, shared by single and bulk sends
+        self.concurrency = int(os.getenv("WHATSAPP_CONCURRENCY", "10"))
+        self._limiter = asyncio.Semaphore(self.concurrency)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop = None
     
-    def send_whatsapp_message(
+    def _get_client(self) -> httpx.AsyncClient:
+        """Pooled HTTP client for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                timeout=30.0,
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency
+                )
+            )
+            self._client_loop = loop
+        return self._client
+    
+    async def _post(self, path: str, payload: Dict[str, Any]) -> httpx.Response:
+        async with self._limiter:
+            return await self._get_client().post(path, json=payload)
+    
+    async def close(self):
+        """Close pooled connections"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+    
+    async def send_whatsapp_message(
         self, 
         phone_number: str, 
         message: str, 
@@ -35,9 +67,9 @@ class WhatsAppService:
             clean_phone = self._clean_phone_number(phone_number)
             
             if message_type == "template" and template_id:
-                return self._send_template_message(clean_phone, template_id, template_data or {})
+                return await self._send_template_message(clean_phone, template_id, template_data or {})
             else:
-                return self._send_text_message(clean_phone, message)
+                return await self._send_text_message(clean_phone, message)
                 
         except Exception as e:
             logger.error(f"WhatsApp send error: {str(e)}")
@@ -47,7 +79,7 @@ class WhatsAppService:
                 "message_id": None
             }
     
-    def _send_text_message(self, phone_number: str, message: str) -> Dict[str, Any]:
+    async def _send_text_message(self, phone_number: str, message: str) -> Dict[str, Any]:
         """Send text message via WhatsApp"""
         
         payload = {
@@ -59,11 +91,7 @@ class WhatsAppService:
             "api_key": self.api_key
         }
         
-        response = requests.post(
-            f"{self.base_url}/sms/send",
-            headers=self.headers,
-            data=json.dumps(payload)
-        )
+        response = await self._post("/sms/send", payload)
         
         if response.status_code == 200:
             result = response.json()
@@ -80,7 +108,7 @@ class WhatsAppService:
                 "message_id": None
             }
     
-    def _send_template_message(self, phone_number: str, template_id: str, template_data: Dict) -> Dict[str, Any]:
+    async def _send_template_message(self, phone_number: str, template_id: str, template_data: Dict) -> Dict[str, Any]:
         """Send template-based WhatsApp message"""
         
         payload = {
@@ -92,11 +120,7 @@ class WhatsAppService:
             "data": template_data
         }
         
-        response = requests.post(
-            f"{self.base_url}/sms/send/template",
-            headers=self.headers,
-            data=json.dumps(payload)
-        )
+        response = await self._post("/sms/send/template", payload)
         
         if response.status_code == 200:
             result = response.json()
@@ -127,14 +151,15 @@ class WhatsAppService:
         
         return cleaned
     
-    def get_delivery_status(self, message_id: str) -> Dict[str, Any]:
+    async def get_delivery_status(self, message_id: str) -> Dict[str, Any]:
         """Get delivery status of a message"""
         
         try:
-            response = requests.get(
-                f"{self.base_url}/sms/status/{message_id}",
-                params={"api_key": self.api_key}
-            )
+            async with self._limiter:
+                response = await self._get_client().get(
+                    f"/sms/status/{message_id}",
+                    params={"api_key": self.api_key}
+                )
             
             if response.status_code == 200:
                 return response.json()
@@ -157,7 +182,7 @@ class ParentNotificationService:
         self.db = db
         self.whatsapp = WhatsAppService(whatsapp_api_key)
     
-    def send_attendance_alert(
+    async def send_attendance_alert(
         self, 
         parent_phone: str, 
         student_name: str, 
@@ -169,7 +194,7 @@ class ParentNotificationService:
         
         message = self._format_attendance_message(student_name, date, status, school_name)
         
-        result = self.whatsapp.send_whatsapp_message(
+        result = await self.whatsapp.send_whatsapp_message(
             phone_number=parent_phone,
             message=message
         )
@@ -184,7 +209,7 @@ class ParentNotificationService:
         
         return result
     
-    def send_academic_update(
+    async def send_academic_update(
         self, 
         parent_phone: str, 
         student_name: str, 
@@ -199,7 +224,7 @@ class ParentNotificationService:
             student_name, subject, score, teacher_comment, school_name
         )
         
-        result = self.whatsapp.send_whatsapp_message(
+        result = await self.whatsapp.send_whatsapp_message(
             phone_number=parent_phone,
             message=message
         )
@@ -213,7 +238,7 @@ class ParentNotificationService:
         
         return result
     
-    def send_fee_reminder(
+    async def send_fee_reminder(
         self, 
         parent_phone: str, 
         student_name: str, 
@@ -225,7 +250,7 @@ class ParentNotificationService:
         
         message = self._format_fee_message(student_name, amount, due_date, school_name)
         
-        result = self.whatsapp.send_whatsapp_message(
+        result = await self.whatsapp.send_whatsapp_message(
             phone_number=parent_phone,
             message=message
         )
@@ -239,7 +264,7 @@ class ParentNotificationService:
         
         return result
     
-    def send_announcement(
+    async def send_announcement(
         self, 
         parent_phone: str, 
         student_name: str, 
@@ -250,7 +275,7 @@ class ParentNotificationService:
         
         message = self._format_announcement_message(student_name, announcement, school_name)
         
-        result = self.whatsapp.send_whatsapp_message(
+        result = await self.whatsapp.send_whatsapp_message(
             phone_number=parent_phone,
             message=message
         )
@@ -264,7 +289,7 @@ class ParentNotificationService:
         
         return result
     
-    def send_emergency_alert(
+    async def send_emergency_alert(
         self, 
         parent_phone: str, 
         student_name: str, 
@@ -278,7 +303,7 @@ class ParentNotificationService:
             student_name, alert_message, contact_number, school_name
         )
         
-        result = self.whatsapp.send_whatsapp_message(
+        result = await self.whatsapp.send_whatsapp_message(
             phone_number=parent_phone,
             message=message
         )
@@ -292,7 +317,7 @@ class ParentNotificationService:
         
         return result
     
-    def bulk_send_to_parents(
+    async def bulk_send_to_parents(
         self, 
         recipients: List[Dict[str, str]], 
         message_template: str,
@@ -307,41 +332,45 @@ class ParentNotificationService:
             "results": []
         }
         
-        for recipient in recipients:
+        async def send_one(recipient: Dict[str, str]):
             try:
                 # Format message with recipient data
                 formatted_message = message_template.format(**recipient, school_name=school_name)
-                
-                result = self.whatsapp.send_whatsapp_message(
+                result = await self.whatsapp.send_whatsapp_message(
                     phone_number=recipient["parent_phone"],
                     message=formatted_message
                 )
-                
-                self._log_notification(
+                return formatted_message, result
+            except Exception as e:
+                return None, {"success": False, "error": str(e), "message_id": None}
+        
+        # Messages are personalised, so they go out concurrently under the service's shared limiter
+        sent = await asyncio.gather(*(send_one(recipient) for recipient in recipients))
+        
+        log_entries = []
+        for recipient, (formatted_message, result) in zip(recipients, sent):
+            if formatted_message is not None:
+                log_entries.append(self._build_log_entry(
                     phone_number=recipient["parent_phone"],
                     message_type=message_type,
                     content=formatted_message,
                     result=result
-                )
-                
-                if result["success"]:
-                    results["success_count"] += 1
-                else:
-                    results["failed_count"] += 1
-                
-                results["results"].append({
-                    "phone": recipient["parent_phone"],
-                    "success": result["success"],
-                    "error": result.get("error")
-                })
-                
-            except Exception as e:
+                ))
+            
+            if result["success"]:
+                results["success_count"] += 1
+            else:
                 results["failed_count"] += 1
-                results["results"].append({
-                    "phone": recipient.get("parent_phone", "unknown"),
-                    "success": False,
-                    "error": str(e)
-                })
+            
+            results["results"].append({
+                "phone": recipient.get("parent_phone", "unknown"),
+                "success": result["success"],
+                "error": result.get("error")
+            })
+        
+        # One commit for the whole batch instead of one per message
+        self.db.add_all(log_entries)
+        self.db.commit()
         
         return results
     
@@ -399,9 +428,15 @@ class ParentNotificationService:
     def _log_notification(self, phone_number: str, message_type: str, content: str, result: Dict) -> None:
         """Log notification attempt to database"""
         
+        self.db.add(self._build_log_entry(phone_number, message_type, content, result))
+        self.db.commit()
+    
+    def _build_log_entry(self, phone_number: str, message_type: str, content: str, result: Dict) -> NotificationLog:
+        """Build the log row for a notification attempt"""
+        
         status = NotificationStatus.SENT if result["success"] else NotificationStatus.FAILED
         
-        log_entry = NotificationLog(
+        return NotificationLog(
             phone_number=phone_number,
             message_type=message_type,
             content=content,
@@ -411,9 +446,6 @@ class ParentNotificationService:
             error_message=result.get("error"),
             sent_at=datetime.utcnow() if result["success"] else None
         )
-        
-        self.db.add(log_entry)
-        self.db.commit()
     
     def get_notification_history(
         self, 
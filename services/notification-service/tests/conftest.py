@@ -0,0 +1,40 @@
+"""
+Test configuration for the notification service
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import Column, Integer, Table, create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Make the service's app package importable when running pytest from anywhere
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app import models  # noqa: E402
+
+NOTIFICATION_TABLES = [
+    "notifications",
+    "notification_recipients",
+    "notification_analytics",
+    "notification_delivery_logs",
+    "notification_queue",
+    "notification_settings",
+    "bulk_notifications",
+    "scheduler_leases",
+]
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Sessions on a throwaway SQLite database with the notification tables"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'notifications.db'}")
+    metadata = models.Base.metadata
+    # Foreign keys point at tables owned by other services
+    for name in ("users", "notification_templates"):
+        if name not in metadata.tables:
+            Table(name, metadata, Column("id", Integer, primary_key=True))
+    metadata.create_all(engine, tables=[metadata.tables[name] for name in NOTIFICATION_TABLES])
+    yield sessionmaker(bind=engine)
+    engine.dispose()
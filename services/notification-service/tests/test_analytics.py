@@ -0,0 +1,104 @@
+"""
+Tests for incremental notification analytics and SQL rollups
+"""
+
+import asyncio
+import uuid
+from datetime import date, datetime
+
+from app import analytics, models
+from app.analytics import COUNTER_COLUMNS, NotificationAnalyticsService
+
+
+def _notification(db, school_id, created_at, notification_type="sms", priority="normal", statuses=("pending",)):
+    notification = models.Notification(
+        notification_id=str(uuid.uuid4()),
+        notification_type=notification_type,
+        message="Fees are due",
+        school_id=school_id,
+        priority=priority,
+        created_at=created_at
+    )
+    db.add(notification)
+    db.flush()
+    for status in statuses:
+        db.add(models.NotificationRecipient(
+            recipient_id=str(uuid.uuid4()),
+            notification_id=notification.notification_id,
+            recipient_type="parent",
+            status=status
+        ))
+    return notification
+
+
+def _counters(db):
+    return {
+        (row.school_id, row.date): {column: getattr(row, column) for column in COUNTER_COLUMNS}
+        for row in db.query(models.NotificationAnalytics).all()
+    }
+
+
+def test_incremental_counters_match_rollup(session_factory):
+    service = NotificationAnalyticsService()
+    db = session_factory()
+    day = datetime(2024, 3, 4, 9, 30)
+
+    campaigns = [
+        (1, day, "sms", "normal", ("sent", "failed", "failed")),
+        (1, day, "email", "urgent", ("sent",)),
+        (2, day, "push", "low", ("sent", "failed")),
+        (1, datetime(2024, 3, 5, 8), "sms", "high", ("sent", "sent")),
+    ]
+    for school_id, created_at, notification_type, priority, statuses in campaigns:
+        notification = _notification(db, school_id, created_at, notification_type, priority, statuses)
+        service.record_queued(db, notification, len(statuses))
+        service.record_outcomes(db, notification, {"failed": statuses.count("failed")})
+    db.commit()
+
+    incremental = _counters(db)
+    assert incremental[(1, date(2024, 3, 4))]["total_sent"] == 4
+    assert incremental[(1, date(2024, 3, 4))]["total_failed"] == 2
+    assert incremental[(1, date(2024, 3, 4))]["sms_sent"] == 3
+    assert incremental[(1, date(2024, 3, 4))]["urgent_sent"] == 1
+    assert incremental[(2, date(2024, 3, 4))]["push_sent"] == 2
+
+    # A retry moves a failure back out of the failed column
+    service.record_outcomes(db, db.query(models.Notification).first(), {"failed": -1})
+    service.record_outcomes(db, db.query(models.Notification).first(), {"failed": 1})
+    db.commit()
+
+    assert service.rollup_days(db, date(2024, 3, 1), date(2024, 3, 8)) == 3
+    assert _counters(db) == incremental
+    db.close()
+
+
+def test_rollup_repairs_drift(session_factory):
+    service = NotificationAnalyticsService()
+    db = session_factory()
+    _notification(db, 7, datetime(2024, 3, 4, 12), statuses=("delivered", "delivered", "failed"))
+    db.add(models.NotificationAnalytics(school_id=7, date=date(2024, 3, 4), total_sent=99, total_delivered=1))
+    db.commit()
+
+    service.rollup_days(db, date(2024, 3, 4), date(2024, 3, 5))
+
+    row = db.query(models.NotificationAnalytics).one()
+    assert (row.total_sent, row.total_delivered, row.total_failed, row.sms_sent) == (3, 2, 1, 3)
+    db.close()
+
+
+def test_backfill_runs_in_chunks(session_factory, monkeypatch):
+    monkeypatch.setattr(analytics, "SessionLocal", session_factory)
+    db = session_factory()
+    for day in range(1, 11):
+        _notification(db, 1, datetime(2024, 1, day, 10), statuses=("sent",))
+    db.commit()
+    db.close()
+
+    summary = asyncio.run(
+        NotificationAnalyticsService().backfill(date(2024, 1, 1), date(2024, 1, 11), chunk_days=3, pause_seconds=0)
+    )
+
+    assert summary == {"chunks": 4, "rows": 10}
+    db = session_factory()
+    assert sum(row.total_sent for row in db.query(models.NotificationAnalytics).all()) == 10
+    db.close()
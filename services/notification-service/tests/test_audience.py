@@ -0,0 +1,166 @@
+"""
+Tests for streaming audience resolution and bulk campaigns
+"""
+
+import asyncio
+import time
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app import audience, models, notification_service
+from app.audience import AudienceResolver, ReplicaAudienceSource, audience_queries
+from app.dispatcher import NotificationDispatcher
+from app.notification_service import NotificationService
+from app.providers import NotificationProvider, NotificationProviderManager
+from app.schemas import BulkNotificationRequest
+
+SCHOOL_ID = 3
+
+
+@pytest.fixture
+def replica(tmp_path):
+    """A users table shaped like the auth service's, standing in for the read replica"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'auth.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, school_id INTEGER, role TEXT, full_name TEXT, "
+            "email TEXT, phone_number TEXT, class_level TEXT, is_active BOOLEAN, profile_data TEXT)"
+        ))
+        rows = [
+            {"id": i, "role": "parent", "phone": f"+234803{i:07d}", "email": f"parent{i}@example.com"}
+            for i in range(1, 201)
+        ]
+        rows += [
+            # Same number as parent 1 written locally, same mailbox as parent 2 in capitals
+            {"id": 201, "role": "parent", "phone": "08030000001", "email": "PARENT2@example.com"},
+            {"id": 202, "role": "parent", "phone": None, "email": None},
+            {"id": 203, "role": "student", "phone": "+2348090000001", "email": "student@example.com"},
+        ]
+        for row in rows:
+            connection.execute(
+                text(
+                    "INSERT INTO users (id, school_id, role, full_name, email, phone_number, is_active) "
+                    "VALUES (:id, :school_id, :role, :name, :email, :phone, 1)"
+                ),
+                {**row, "school_id": SCHOOL_ID, "name": f"User {row['id']}"}
+            )
+    yield engine
+    engine.dispose()
+
+
+class SlowReplicaSource(ReplicaAudienceSource):
+    """Replica source that records when each page was fetched"""
+
+    def __init__(self, engine, delay=0.02):
+        super().__init__(engine)
+        self.delay = delay
+        self.fetched_at = []
+
+    async def fetch_page(self, school_id, query, cursor, limit):
+        await asyncio.sleep(self.delay)
+        self.fetched_at.append(time.perf_counter())
+        return await super().fetch_page(school_id, query, cursor, limit)
+
+
+class RecordingProvider(NotificationProvider):
+    def __init__(self):
+        self.sent_at = []
+
+    async def send(self, recipient, message, **kwargs):
+        self.sent_at.append(time.perf_counter())
+        return {"success": True, "provider_id": f"fake_{recipient}", "provider": "fake"}
+
+    def validate_recipient(self, recipient):
+        return True
+
+    def get_provider_name(self):
+        return "sms_fake"
+
+
+def test_audience_queries():
+    assert audience_queries({"all_students": True, "class_levels": ["JSS1", "JSS2"], "user_types": ["parent"]}) == [
+        {"role": "student", "class_level": "JSS1"},
+        {"role": "student", "class_level": "JSS2"},
+        {"role": "parent", "class_level": None},
+    ]
+    assert audience_queries({"all_users": True, "specific_users": ["4"]}) == [{}, {"user_ids": [4]}]
+
+
+def test_resolver_pages_dedupes_and_applies_opt_outs(session_factory, replica):
+    db = session_factory()
+    db.add(models.NotificationSettings(user_id=5, school_id=SCHOOL_ID, sms_enabled=False))
+    db.add(models.NotificationSettings(user_id=6, school_id=SCHOOL_ID, sms_enabled=False, emergency_notifications=False))
+    db.commit()
+
+    resolver = AudienceResolver(ReplicaAudienceSource(replica), page_size=30, chunk_size=50)
+
+    async def resolve(priority):
+        stats = {}
+        chunks = [
+            chunk async for chunk in resolver.resolve(
+                db, SCHOOL_ID, {"all_parents": True, "specific_users": [3, 203]}, "sms", priority=priority, stats=stats
+            )
+        ]
+        return chunks, stats
+
+    chunks, stats = asyncio.run(resolve("normal"))
+    assert [len(chunk) for chunk in chunks] == [50, 50, 50, 49]
+    assert stats == {"fetched": 204, "duplicates": 2, "no_address": 1, "opted_out": 2, "resolved": 199}
+    user_ids = [row["user_id"] for chunk in chunks for row in chunk]
+    assert len(user_ids) == len(set(user_ids))
+    assert 5 not in user_ids and 201 not in user_ids and 203 in user_ids
+
+    # Emergencies ignore channel opt-outs but not an emergency opt-out
+    _, stats = asyncio.run(resolve("emergency"))
+    assert stats["opted_out"] == 1
+    db.close()
+
+
+def test_bulk_campaign_sends_while_resolving(session_factory, replica, monkeypatch):
+    provider = RecordingProvider()
+    manager = NotificationProviderManager(providers={})
+    manager.register_provider("sms", provider, rate=100000, burst=1000, concurrency=20)
+    monkeypatch.setattr(notification_service, "notification_dispatcher", NotificationDispatcher(manager, batch_size=50))
+    monkeypatch.setattr(notification_service, "SessionLocal", session_factory)
+
+    source = SlowReplicaSource(replica)
+    resolver = AudienceResolver(source, page_size=25, chunk_size=25)
+    db = session_factory()
+    service = NotificationService(db)
+    request = BulkNotificationRequest(type="sms", message="School resumes on Monday", target_audience={"all_parents": True})
+
+    async def main():
+        try:
+            _, notification = await service.create_bulk_campaign(request, SCHOOL_ID, sender_id=None)
+            return await service.run_bulk_campaign(notification.notification_id, resolver=resolver)
+        finally:
+            await manager.close()
+
+    result = asyncio.run(main())
+
+    assert result.success
+    assert result.total_recipients == 200
+    assert result.queued_count == 0
+    assert len(provider.sent_at) == 200
+    # The first chunk went out before the last page of users was fetched
+    assert min(provider.sent_at) < max(source.fetched_at)
+
+    notification = db.query(models.Notification).one()
+    campaign = db.query(models.BulkNotification).one()
+    assert notification.status == "sent"
+    assert (campaign.status, campaign.actual_recipients, campaign.sent_count) == ("completed", 200, 200)
+    assert db.query(models.NotificationRecipient).filter(models.NotificationRecipient.status == "sent").count() == 200
+    assert db.query(models.NotificationAnalytics).one().total_sent == 200
+    db.close()
+
+
+def test_replica_sources_share_one_engine(tmp_path, monkeypatch):
+    monkeypatch.setenv("AUDIENCE_SOURCE", "replica")
+    monkeypatch.setenv("AUDIENCE_REPLICA_DATABASE_URL", f"sqlite:///{tmp_path / 'auth.db'}")
+    monkeypatch.setattr(audience, "_replica_engine", None)
+
+    first, second = audience.default_source(), audience.default_source()
+    assert isinstance(first, ReplicaAudienceSource)
+    assert first.engine is second.engine
+    audience.replica_engine().dispose()
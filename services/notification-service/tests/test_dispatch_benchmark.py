@@ -0,0 +1,160 @@
+"""
+Throughput benchmark for the concurrent notification dispatcher
+Runs against a local fake provider so no real messages are sent
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+from app.dispatcher import DeliveryBatchWriter, NotificationDispatcher
+from app.providers import NotificationProvider, NotificationProviderManager
+
+PROVIDER_LATENCY = 0.02
+
+
+class FakeSMSProvider(NotificationProvider):
+    """Answers every send after a fixed latency and tracks peak concurrency"""
+
+    def __init__(self, latency: float = PROVIDER_LATENCY):
+        self.latency = latency
+        self.sent = 0
+        self.active = 0
+        self.peak_active = 0
+
+    async def send(self, recipient, message, **kwargs):
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            await asyncio.sleep(self.latency)
+            self.sent += 1
+            return {"success": True, "provider_id": f"fake_{recipient}", "provider": "fake"}
+        finally:
+            self.active -= 1
+
+    def validate_recipient(self, recipient):
+        return True
+
+    def get_provider_name(self):
+        return "sms_fake"
+
+
+class FakeBulkSMSProvider(FakeSMSProvider):
+    """Accepts up to 100 recipients per request and rejects numbers ending in 7"""
+
+    max_batch_size = 100
+
+    def __init__(self, latency: float = PROVIDER_LATENCY):
+        super().__init__(latency)
+        self.requests = []
+
+    async def send_batch(self, recipients, message, **kwargs):
+        self.requests.append(len(recipients))
+        await asyncio.sleep(self.latency)
+        return [
+            {"success": False, "error": "Rejected", "provider": "fake"} if recipient.endswith("7")
+            else {"success": True, "provider_id": f"fake_{recipient}", "provider": "fake"}
+            for recipient in recipients
+        ]
+
+
+class RecordingWriter(DeliveryBatchWriter):
+    """Batch writer that records write batches instead of touching a database"""
+
+    batches = []
+
+    def mark_processing(self, recipients):
+        pass
+
+    def _write(self, recipient_rows, log_rows):
+        RecordingWriter.batches.append((len(recipient_rows), len(log_rows)))
+
+
+def _campaign(size: int):
+    notification = SimpleNamespace(
+        notification_id="bench",
+        notification_type="sms",
+        message="Fees are due on Friday",
+        subject=None,
+        html_message=None,
+        attachments=None
+    )
+    recipients = [
+        SimpleNamespace(id=i, recipient_id=f"r{i}", phone=f"+23480{i:08d}", delivery_attempts=0)
+        for i in range(size)
+    ]
+    return notification, recipients
+
+
+def _run(provider, size, rate, burst, concurrency, batch_size=100):
+    manager = NotificationProviderManager(providers={})
+    manager.register_provider("sms", provider, rate=rate, burst=burst, concurrency=concurrency)
+    dispatcher = NotificationDispatcher(manager, batch_size=batch_size, writer_class=RecordingWriter)
+    notification, recipients = _campaign(size)
+    RecordingWriter.batches = []
+
+    async def main():
+        started = time.perf_counter()
+        try:
+            summary = await dispatcher.dispatch(None, notification, recipients)
+        finally:
+            await manager.close()
+        return summary, time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+def test_dispatch_throughput_with_concurrent_pool():
+    provider = FakeSMSProvider()
+    size = 1000
+
+    summary, elapsed = _run(provider, size, rate=100000, burst=1000, concurrency=50)
+    throughput = size / elapsed
+    serial_throughput = 1 / PROVIDER_LATENCY
+    print(f"\ndispatched {size} messages in {elapsed:.2f}s ({throughput:.0f} msg/s, serial {serial_throughput:.0f} msg/s)")
+
+    assert summary["sent"] == size
+    assert provider.peak_active == 50
+    assert throughput > serial_throughput * 10
+
+
+def test_dispatch_writes_results_in_batches():
+    size = 450
+
+    summary, _ = _run(FakeSMSProvider(latency=0), size, rate=100000, burst=1000, concurrency=20, batch_size=100)
+
+    assert summary["write_batches"] == 5
+    assert [rows for rows, _ in RecordingWriter.batches] == [100, 100, 100, 100, 50]
+    assert sum(logs for _, logs in RecordingWriter.batches) == size
+
+
+def test_dispatch_respects_provider_rate_budget():
+    size, rate, burst = 200, 400, 40
+
+    summary, elapsed = _run(FakeSMSProvider(latency=0), size, rate=rate, burst=burst, concurrency=50)
+
+    assert summary["sent"] == size
+    # The burst goes out immediately, the rest is paced at the sustained rate
+    assert elapsed >= (size - burst) / rate * 0.9
+
+
+def test_dispatch_uses_provider_bulk_api():
+    provider = FakeBulkSMSProvider()
+    size = 450
+
+    summary, _ = _run(provider, size, rate=100000, burst=1000, concurrency=5)
+
+    assert sorted(provider.requests, reverse=True) == [100, 100, 100, 100, 50]
+    assert provider.sent == 0
+    assert summary["failed"] == size // 10
+    assert summary["sent"] == size - size // 10
+
+
+def test_bulk_sends_are_paced_per_message():
+    size, rate, burst = 300, 1000, 50
+
+    summary, elapsed = _run(FakeBulkSMSProvider(latency=0), size, rate=rate, burst=burst, concurrency=5)
+
+    assert summary["sent"] + summary["failed"] == size
+    # A batch larger than the burst pays for every message it carries
+    assert elapsed >= (size - burst) / rate * 0.9
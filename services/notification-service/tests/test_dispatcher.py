@@ -0,0 +1,112 @@
+"""
+Tests for the notification dispatcher's batched writes against a real database session
+"""
+
+import asyncio
+
+from sqlalchemy import event
+
+from app import models
+from app.dispatcher import NotificationDispatcher
+from app.providers import NotificationProvider, NotificationProviderManager, ProviderWorkerPool, TokenBucket
+
+
+class InstantSMSProvider(NotificationProvider):
+    async def send(self, recipient, message, **kwargs):
+        return {"success": True, "provider_id": f"fake_{recipient}", "provider": "fake"}
+
+    def validate_recipient(self, recipient):
+        return True
+
+    def get_provider_name(self):
+        return "sms_fake"
+
+
+class ShortBatchProvider(InstantSMSProvider):
+    """Bulk API that drops the last recipient's result"""
+
+    async def send_batch(self, recipients, message, **kwargs):
+        return [await self.send(recipient, message) for recipient in recipients[:-1]]
+
+
+def _seed(db, size, attempts=0):
+    notification = models.Notification(
+        notification_id="n1", notification_type="sms", message="Fees are due on Friday", school_id=1
+    )
+    db.add(notification)
+    db.add_all([
+        models.NotificationRecipient(
+            recipient_id=f"r{i}", notification_id="n1", recipient_type="student",
+            phone=f"+23480{i:08d}", status="pending", delivery_attempts=attempts
+        )
+        for i in range(size)
+    ])
+    db.commit()
+
+
+def _dispatch(session_factory, size, batch_size=100):
+    db = session_factory()
+    _seed(db, size)
+    notification = db.query(models.Notification).one()
+    recipients = db.query(models.NotificationRecipient).all()
+
+    manager = NotificationProviderManager(providers={})
+    manager.register_provider("sms", InstantSMSProvider(), rate=100000, burst=1000, concurrency=20)
+    dispatcher = NotificationDispatcher(manager, batch_size=batch_size)
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.get_bind(), "before_cursor_execute", listener)
+
+    async def main():
+        try:
+            return await dispatcher.dispatch(db, notification, recipients)
+        finally:
+            await manager.close()
+
+    try:
+        summary = asyncio.run(main())
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", listener)
+    return db, summary, statements
+
+
+def test_dispatch_does_not_reload_recipients(session_factory):
+    db, summary, statements = _dispatch(session_factory, 300)
+    try:
+        assert summary == {"sent": 300, "failed": 0, "write_batches": 3}
+        # A fixed number of statements per write batch, not one reload per recipient
+        assert len(statements) < 40
+        assert not [sql for sql in statements if "FROM notification_recipients WHERE notification_recipients.id = ?" in sql]
+    finally:
+        db.close()
+
+
+def test_dispatch_records_attempts(session_factory):
+    db, _, _ = _dispatch(session_factory, 10)
+    try:
+        recipients = db.query(models.NotificationRecipient).all()
+        assert {(r.status, r.delivery_attempts) for r in recipients} == {("sent", 1)}
+        assert recipients[0].external_id == f"fake_{recipients[0].phone}"
+
+        logs = db.query(models.NotificationDeliveryLog).all()
+        assert len(logs) == 10
+        # The first attempt is logged as attempt 1
+        assert {log.attempt_number for log in logs} == {1}
+    finally:
+        db.close()
+
+
+def test_pool_fails_recipients_missing_from_batch_results():
+    pool = ProviderWorkerPool(ShortBatchProvider(), TokenBucket(rate=1000, burst=100), concurrency=1)
+
+    async def main():
+        try:
+            futures = await pool.submit_batch(["+2348000000001", "+2348000000002", "+2348000000003"], "Fees are due")
+            return await asyncio.wait_for(asyncio.gather(*futures), timeout=5)
+        finally:
+            await pool.close()
+
+    results = asyncio.run(main())
+    assert [result["success"] for result in results] == [True, True, False]
+    assert results[2]["error"] == "No result returned for recipient"
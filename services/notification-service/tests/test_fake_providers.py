@@ -0,0 +1,97 @@
+"""
+Tests for the fake providers and the load test harness
+"""
+
+import asyncio
+import random
+
+import pytest
+
+from app.fake_providers import (
+    FakeProvider,
+    FakeProviderBehaviour,
+    FakeProviderServer,
+    HTTPFakeProvider,
+    LatencyDistribution,
+)
+from app.loadtest import LoadTestConfig, percentiles, run_load_test
+from app.providers import http_sessions
+
+
+def test_latency_distributions():
+    rng = random.Random(1)
+    assert LatencyDistribution.parse("fixed:0.05").sample(rng) == 0.05
+    uniform = [LatencyDistribution.parse("uniform:0.01,0.02").sample(rng) for _ in range(100)]
+    assert all(0.01 <= value <= 0.02 for value in uniform)
+    lognormal = sorted(LatencyDistribution.parse("lognormal:0.1,0.5").sample(rng) for _ in range(1001))
+    assert 0.08 < lognormal[500] < 0.12
+    with pytest.raises(ValueError):
+        LatencyDistribution.parse("uniform:0.1")
+
+
+def test_error_rate_and_rate_limit():
+    behaviour = FakeProviderBehaviour(LatencyDistribution("fixed", 0), error_rate=0.2, rate_limit=50, seed=3)
+    provider = FakeProvider("sms", behaviour, max_batch_size=10)
+
+    async def main():
+        return [await provider.send_batch([f"+2348030000{i:03d}" for i in range(start, start + 10)], "Hi")
+                for start in range(0, 80, 10)]
+
+    batches = asyncio.run(main())
+
+    # Five batches fit the 50/sec window; the rest are rejected whole with 429
+    assert [all(result.get("response_code") == 429 for result in batch) for batch in batches] == [False] * 5 + [True] * 3
+    assert behaviour.stats["throttled"] == 30
+    assert behaviour.stats["errors"] + behaviour.stats["accepted"] == 50
+    assert 0 < behaviour.stats["errors"] < 25
+    assert len(behaviour.accepted_at) == behaviour.stats["accepted"]
+
+
+def test_http_fake_provider_round_trip():
+    behaviour = FakeProviderBehaviour(LatencyDistribution("fixed", 0.01), rate_limit=3)
+    server = FakeProviderServer(behaviour)
+
+    async def main():
+        provider = HTTPFakeProvider("sms", await server.start(), max_batch_size=2)
+        try:
+            first = await provider.send_batch(["+2348030000001", "+2348030000002"], "Hi")
+            second = await provider.send_batch(["+2348030000003", "+2348030000004"], "Hi")
+            return first, second
+        finally:
+            await http_sessions.close()
+            await server.stop()
+
+    first, second = asyncio.run(main())
+
+    assert [result["success"] for result in first] == [True, True]
+    assert all(result["provider"] == "sms_fake_http" for result in first)
+    assert [result["response_code"] for result in second] == [429, 429]
+    assert second[0]["retry_after"] == 1.0
+
+
+def test_percentiles():
+    assert percentiles(list(range(1, 101))) == {"p50": 50, "p90": 90, "p95": 95, "p99": 99, "max": 100}
+    assert percentiles([]) == {}
+
+
+def test_load_test_runs_campaign_through_queue(session_factory):
+    config = LoadTestConfig(
+        recipients=300,
+        latency="fixed:0.005",
+        error_rate=0.1,
+        send_rate=5000,
+        concurrency=50,
+        drain_timeout=30
+    )
+
+    report = asyncio.run(run_load_test(config, session_factory))
+
+    assert report.recipients == 300
+    assert report.sent + report.failed == 300
+    # Failed sends were retried through the queue until sent or out of attempts
+    assert 1 <= report.queue_batches <= 3
+    assert report.provider["messages"] > 300
+    assert report.sent > 295
+    assert report.messages_per_second > 0
+    assert set(report.latency_ms) == {"p50", "p90", "p95", "p99", "max"}
+    assert report.db_writes["insert"] > 0 and report.db_writes["rows"] >= 600
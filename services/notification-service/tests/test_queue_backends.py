@@ -0,0 +1,89 @@
+"""
+Tests for queue leases held by several consumers of the database queue backend
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from app import models, notification_service
+from app.queue_backends import DatabaseQueueBackend
+
+
+def _backend(session_factory, visibility_timeout=300):
+    return DatabaseQueueBackend(
+        session_factory=session_factory, bind=session_factory.kw["bind"], visibility_timeout=visibility_timeout
+    )
+
+
+def _enqueue(backend, session_factory, count):
+    db = session_factory()
+    try:
+        for i in range(count):
+            asyncio.run(backend.enqueue(db, f"n{i}", "normal_priority", 2))
+    finally:
+        db.close()
+
+
+def test_consumers_in_one_process_own_their_leases(session_factory):
+    backend = _backend(session_factory)
+    _enqueue(backend, session_factory, 1)
+
+    async def main():
+        [first] = await backend.claim("normal_priority", 10, consumer="high_priority")
+        # The lease runs out and a sibling consumer of the same process reclaims the message
+        db = session_factory()
+        db.query(models.NotificationQueue).update({"locked_until": datetime.utcnow() - timedelta(seconds=1)})
+        db.commit()
+        db.close()
+        [second] = await backend.claim("normal_priority", 10, consumer="normal_priority")
+
+        assert first.consumer != second.consumer
+        assert not await backend.extend(first)
+        await backend.ack(first)
+        return second
+
+    second = asyncio.run(main())
+    db = session_factory()
+    try:
+        row = db.query(models.NotificationQueue).one()
+        # The first consumer's ack was ignored: the message is still leased to the second
+        assert (row.status, row.worker_id, row.attempts) == ("processing", second.consumer, 2)
+    finally:
+        db.close()
+
+
+def test_process_queue_keeps_the_whole_batch_leased(session_factory, monkeypatch):
+    backend = _backend(session_factory, visibility_timeout=0.3)
+    _enqueue(backend, session_factory, 3)
+    monkeypatch.setattr(notification_service, "notification_queue", backend)
+
+    async def slow_success(self, message):
+        # Together longer than the visibility timeout
+        await asyncio.sleep(0.2)
+        return True
+
+    monkeypatch.setattr(notification_service.NotificationService, "_process_notification_item", slow_success)
+
+    async def main():
+        db = session_factory()
+        try:
+            consumer = asyncio.create_task(
+                notification_service.NotificationService(db).process_queue("normal_priority", batch_size=10)
+            )
+            stolen = []
+            while not consumer.done():
+                await asyncio.sleep(0.05)
+                stolen += await backend.claim("normal_priority", 10, consumer="other")
+            return await consumer, stolen
+        finally:
+            db.close()
+
+    results, stolen = asyncio.run(main())
+
+    assert stolen == []
+    assert (results["processed"], results["success"]) == (3, 3)
+    db = session_factory()
+    try:
+        assert {row.status for row in db.query(models.NotificationQueue)} == {"completed"}
+    finally:
+        db.close()
@@ -0,0 +1,210 @@
+"""
+Tests for delivery receipt webhooks and batched receipt ingestion
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import uuid
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+from sqlalchemy import event
+
+from app import models
+from app.receipts import DeliveryReceipt, DeliveryReceiptIngestor, parse_receipts, twilio_signature, verify_signature
+
+
+def _campaign(db, statuses, created_at=datetime(2024, 5, 6, 8)):
+    notification = models.Notification(
+        notification_id=str(uuid.uuid4()),
+        notification_type="sms",
+        message="Exams start Monday",
+        school_id=4,
+        created_at=created_at
+    )
+    db.add(notification)
+    recipients = []
+    for index, status in enumerate(statuses):
+        recipient = models.NotificationRecipient(
+            recipient_id=str(uuid.uuid4()),
+            notification_id=notification.notification_id,
+            recipient_type="parent",
+            phone=f"+23480300000{index:02d}",
+            status=status,
+            external_id=f"msg-{index}",
+            last_attempt=created_at,
+            provider_response={"provider": "termii"}
+        )
+        recipients.append(recipient)
+    db.add_all(recipients)
+    db.commit()
+    return notification, recipients
+
+
+def _statuses(db, recipients):
+    for recipient in recipients:
+        db.refresh(recipient)
+    return [recipient.status for recipient in recipients]
+
+
+def test_signatures(monkeypatch):
+    body = json.dumps({"message_id": "abc", "status": "Delivered"}).encode()
+    monkeypatch.setenv("TERMII_WEBHOOK_SECRET", "termii-secret")
+    signature = hmac.new(b"termii-secret", body, hashlib.sha512).hexdigest()
+    assert verify_signature("termii", body, {"x-termii-signature": signature}, "", {})
+    assert not verify_signature("termii", body + b" ", {"x-termii-signature": signature}, "", {})
+
+    monkeypatch.setenv("TWILIO_AUTH_TOKEN", "twilio-token")
+    url = "https://notify.example.com/webhooks/delivery/twilio"
+    params = {"MessageSid": "SM1", "MessageStatus": "delivered"}
+    headers = {"x-twilio-signature": twilio_signature("twilio-token", url, params)}
+    assert verify_signature("twilio", urlencode(params).encode(), headers, url, {})
+
+    # Providers without a configured secret are rejected
+    monkeypatch.delenv("META_APP_SECRET", raising=False)
+    assert not verify_signature("meta", body, {"x-hub-signature-256": "sha256=x"}, "", {})
+
+
+def test_parsers_keep_final_states_only():
+    meta = {"entry": [{"changes": [{"value": {"statuses": [
+        {"id": "wamid.1", "status": "sent", "timestamp": "1714982400"},
+        {"id": "wamid.1", "status": "read", "timestamp": "1714982460"},
+        {"id": "wamid.2", "status": "failed", "timestamp": "1714982400", "errors": [{"title": "Blocked"}]},
+    ]}}]}]}
+    receipts = parse_receipts("meta", json.dumps(meta).encode())
+    assert [(r.external_id, r.status, r.error) for r in receipts] == [("wamid.1", "read", None), ("wamid.2", "failed", "Blocked")]
+    assert receipts[0].occurred_at == datetime(2024, 5, 6, 8, 1)
+
+    infobip = {"results": [
+        {"messageId": "ib1", "to": "2348030000001", "status": {"groupName": "DELIVERED"}, "doneAt": "2024-05-06T08:00:00.000+0100"},
+        {"messageId": "ib2", "status": {"groupName": "PENDING"}},
+    ]}
+    receipts = parse_receipts("infobip", json.dumps(infobip).encode())
+    assert [(r.external_id, r.status, r.occurred_at) for r in receipts] == [("ib1", "delivered", datetime(2024, 5, 6, 7))]
+
+
+def test_receipts_are_coalesced_and_written_in_one_batch(session_factory):
+    db = session_factory()
+    notification, recipients = _campaign(db, ["sent", "sent", "sent", "failed", "delivered"])
+    ingestor = DeliveryReceiptIngestor(session_factory=session_factory, batch_size=100)
+
+    receipts = [
+        DeliveryReceipt("termii", "msg-0", "delivered"),
+        DeliveryReceipt("termii", "msg-0", "delivered"),  # Provider retried the callback
+        DeliveryReceipt("termii", "msg-1", "delivered"),
+        DeliveryReceipt("termii", "msg-1", "failed"),  # Out of order: delivered wins
+        DeliveryReceipt("termii", "msg-2", "failed", error="Expired"),
+        DeliveryReceipt("termii", "msg-3", "delivered"),  # Late delivery of a failed send
+        DeliveryReceipt("termii", "msg-4", "read"),
+        DeliveryReceipt("termii", "unknown", "delivered"),
+    ]
+    assert ingestor.add(receipts) == 7
+
+    updates = []
+
+    def listener(conn, cursor, statement, *args):
+        if statement.startswith("UPDATE notification_recipients"):
+            updates.append(statement)
+
+    engine = session_factory.kw["bind"]
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        summary = asyncio.run(ingestor.flush())
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+
+    assert summary == {"updated": 5, "unmatched": 1}
+    assert len(updates) == 1
+    assert _statuses(db, recipients) == ["delivered", "delivered", "failed", "delivered", "delivered"]
+    assert recipients[2].failed_reason == "Expired"
+    assert recipients[4].read_at is not None and recipients[0].read_at is None
+    # The unknown message waits for its send result to be stored
+    assert list(ingestor.pending) == [("unknown", "")]
+
+    analytics = db.query(models.NotificationAnalytics).one()
+    assert (analytics.total_delivered, analytics.total_failed) == (3, 0)
+
+    # Replaying the same receipts elsewhere changes nothing
+    replay = DeliveryReceiptIngestor(session_factory=session_factory)
+    replay.add(receipts)
+    assert asyncio.run(replay.flush())["updated"] == 0
+    db.refresh(analytics)
+    assert (analytics.total_delivered, analytics.total_failed) == (3, 0)
+    db.close()
+
+
+def test_bulk_message_ids_match_by_number(session_factory):
+    db = session_factory()
+    _, recipients = _campaign(db, ["sent", "sent"])
+    for recipient in recipients:
+        recipient.external_id = "bulk-1"
+    db.commit()
+
+    ingestor = DeliveryReceiptIngestor(session_factory=session_factory)
+    ingestor.add([DeliveryReceipt("termii", "bulk-1", "failed", recipient="2348030000001")])
+    asyncio.run(ingestor.flush())
+
+    assert _statuses(db, recipients) == ["sent", "failed"]
+
+    # A receipt that names no number cannot be attributed within the batch
+    ingestor.add([DeliveryReceipt("termii", "bulk-1", "delivered")])
+    asyncio.run(ingestor.flush())
+    assert _statuses(db, recipients) == ["sent", "failed"]
+    assert ingestor.stats["ambiguous"] == 1
+    db.close()
+
+
+def test_sweeper_polls_only_stale_sent_messages(session_factory):
+    db = session_factory()
+    now = datetime(2024, 5, 6, 12)
+    _, recipients = _campaign(db, ["sent", "sent", "delivered"], created_at=now - timedelta(hours=2))
+    recipients[1].last_attempt = now - timedelta(minutes=5)
+    db.commit()
+
+    polled = []
+
+    async def poll(message_id):
+        polled.append(message_id)
+        return [{"message_id": message_id, "status": "Delivered"}]
+
+    ingestor = DeliveryReceiptIngestor(session_factory=session_factory)
+    ingestor.pollers = {"termii": lambda: poll}
+
+    assert asyncio.run(ingestor.sweep(db, now=now)) == {"checked": 1, "polled": 1, "updated": 1}
+    assert polled == ["msg-0"]
+    assert _statuses(db, recipients) == ["delivered", "sent", "delivered"]
+
+    # Checked recipients are not polled again until the sweep interval has passed
+    recipients[0].status = "sent"
+    db.commit()
+    assert asyncio.run(ingestor.sweep(db, now=now + timedelta(minutes=1)))["checked"] == 0
+    db.close()
+
+
+def test_sweeper_polls_bulk_message_ids_once(session_factory):
+    db = session_factory()
+    now = datetime(2024, 5, 6, 12)
+    _, recipients = _campaign(db, ["sent", "sent", "sent"], created_at=now - timedelta(hours=2))
+    for recipient in recipients:
+        recipient.external_id = "bulk-1"
+    db.commit()
+
+    polled = []
+
+    async def poll(message_id):
+        polled.append(message_id)
+        return [
+            {"message_id": message_id, "receiver": "2348030000000", "status": "Delivered"},
+            {"message_id": message_id, "receiver": "2348030000001", "status": "DND Active on Phone Number"},
+        ]
+
+    ingestor = DeliveryReceiptIngestor(session_factory=session_factory)
+    ingestor.pollers = {"termii": lambda: poll}
+
+    assert asyncio.run(ingestor.sweep(db, now=now)) == {"checked": 3, "polled": 1, "updated": 2}
+    assert polled == ["bulk-1"]
+    # The third number has no answer yet and stays sent
+    assert _statuses(db, recipients) == ["delivered", "failed", "sent"]
+    db.close()
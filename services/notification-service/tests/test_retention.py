@@ -0,0 +1,103 @@
+"""
+Tests for batched retention cleanup
+"""
+
+import asyncio
+import uuid
+from datetime import date, datetime, timedelta
+
+from app import models
+from app.retention import RetentionManager, _upper_bound
+
+NOW = datetime(2024, 6, 1, 3, 0)
+
+
+def _notification(db, age_days, priority="normal"):
+    notification = models.Notification(
+        notification_id=str(uuid.uuid4()),
+        notification_type="sms",
+        message="Fees are due",
+        school_id=1,
+        priority=priority,
+        created_at=NOW - timedelta(days=age_days)
+    )
+    recipient = models.NotificationRecipient(
+        recipient_id=str(uuid.uuid4()),
+        notification_id=notification.notification_id,
+        recipient_type="parent",
+        status="sent"
+    )
+    log = models.NotificationDeliveryLog(
+        log_id=str(uuid.uuid4()),
+        notification_id=notification.notification_id,
+        recipient_id=recipient.recipient_id,
+        provider="sms_fake",
+        status="sent",
+        attempted_at=notification.created_at
+    )
+    db.add_all([notification, recipient, log])
+
+
+def _seed(db):
+    for age in range(200, 100, -1):
+        _notification(db, age)
+    _notification(db, 300, priority="high")
+    _notification(db, 10)
+    for age, status in ((40, "completed"), (40, "pending"), (5, "completed")):
+        db.add(models.NotificationQueue(
+            queue_id=str(uuid.uuid4()),
+            queue_name="normal_priority",
+            status=status,
+            processing_completed=NOW - timedelta(days=age)
+        ))
+    db.add(models.NotificationAnalytics(school_id=1, date=date(2023, 1, 1)))
+    db.add(models.NotificationAnalytics(school_id=1, date=date(2024, 5, 1)))
+    db.commit()
+
+
+def test_retention_deletes_in_batches_and_reports(session_factory):
+    db = session_factory()
+    _seed(db)
+
+    manager = RetentionManager(batch_size=7, pause_seconds=0, time_budget_seconds=60, use_partitions=True)
+    report = asyncio.run(manager.run(db, now=NOW))
+
+    # Logs older than 90 days, notifications older than 180 days unless high priority
+    assert report.deleted == {"delivery_logs": 101, "queue_completed": 1, "analytics": 1, "notifications": 20}
+    assert report.complete
+    assert report.batches == 15 + 1 + 1 + 3
+    assert report.partitions_dropped == []
+    assert report.to_dict()["total_deleted"] == 123
+    assert manager.last_report is report
+
+    assert db.query(models.Notification).count() == 82
+    assert db.query(models.Notification).filter(models.Notification.priority == "high").count() == 1
+    # Recipients of deleted notifications go with them
+    assert db.query(models.NotificationRecipient).count() == 82
+    assert db.query(models.NotificationQueue).count() == 2
+    db.close()
+
+
+def test_retention_stops_at_time_budget(session_factory):
+    db = session_factory()
+    _seed(db)
+
+    manager = RetentionManager(batch_size=5, pause_seconds=0.05, time_budget_seconds=0.01)
+    report = asyncio.run(manager.run(db, now=NOW))
+
+    assert not report.complete
+    assert 0 < report.deleted["delivery_logs"] < 101
+    assert "notifications" not in report.deleted
+
+    # The next run carries on where this one stopped
+    manager.time_budget_seconds = 60
+    report = asyncio.run(manager.run(db, now=NOW))
+    assert report.complete
+    assert db.query(models.NotificationDeliveryLog).count() == 1
+    db.close()
+
+
+def test_partition_upper_bound():
+    assert _upper_bound("FOR VALUES FROM ('2024-01-01') TO ('2024-02-01')") == datetime(2024, 2, 1)
+    assert _upper_bound("FOR VALUES FROM ('2024-01-01 00:00:00') TO ('2024-02-01 00:00:00')") == datetime(2024, 2, 1)
+    assert _upper_bound("DEFAULT") is None
@@ -0,0 +1,121 @@
+"""
+Tests for the heap-based notification scheduler
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+from app import models
+from app.scheduler import NotificationScheduler, publish_schedule_change
+
+
+class RecordingQueue:
+    """Queue backend stand-in that records what was enqueued and when"""
+
+    transactional = True
+
+    def __init__(self):
+        self.enqueued = {}
+
+    async def enqueue(self, db, notification_id, queue_name, priority, metadata=None, max_attempts=3, commit=True):
+        self.enqueued[notification_id] = datetime.utcnow()
+        return notification_id
+
+
+def _scheduled(db, delay_seconds, status="pending"):
+    notification = models.Notification(
+        notification_id=str(uuid.uuid4()),
+        notification_type="sms",
+        message="Reminder",
+        school_id=1,
+        status=status,
+        scheduled_at=datetime.utcnow() + timedelta(seconds=delay_seconds)
+    )
+    db.add(notification)
+    db.commit()
+    return notification
+
+
+def _scheduler(session_factory, queue):
+    scheduler = NotificationScheduler(session_factory=session_factory, bind=session_factory.kw["bind"], queue=queue)
+    # A long refresh interval shows that firing comes from the heap and pushes, not polling
+    scheduler.refresh_interval = 3600
+    return scheduler
+
+
+def test_scheduler_fires_on_time_and_honours_pushes(session_factory):
+    db = session_factory()
+    queue = RecordingQueue()
+    scheduler = _scheduler(session_factory, queue)
+
+    soon = _scheduled(db, 0.4)
+    cancelled = _scheduled(db, 0.5)
+    moved = _scheduled(db, 5)
+    sent_already = _scheduled(db, 0.2, status="sent")
+
+    async def main():
+        task = asyncio.create_task(scheduler.start())
+        await asyncio.sleep(0.2)
+
+        # Created after the window was loaded: only the push tells the scheduler about it
+        pushed = _scheduled(db, 0.3)
+        publish_schedule_change(db, pushed.notification_id, pushed.scheduled_at)
+
+        cancelled.status = "cancelled"
+        db.commit()
+        publish_schedule_change(db, cancelled.notification_id, None)
+
+        moved.scheduled_at = datetime.utcnow() + timedelta(seconds=0.6)
+        db.commit()
+        publish_schedule_change(db, moved.notification_id, moved.scheduled_at)
+
+        await asyncio.sleep(1.2)
+        await scheduler.stop()
+        await task
+        return pushed
+
+    pushed = asyncio.run(main())
+
+    assert set(queue.enqueued) == {soon.notification_id, pushed.notification_id, moved.notification_id}
+    for notification in (soon, pushed, moved):
+        db.refresh(notification)
+        lateness = (queue.enqueued[notification.notification_id] - notification.scheduled_at).total_seconds()
+        assert 0 <= lateness < 1
+        assert notification.status == "queued"
+    db.refresh(cancelled)
+    db.refresh(sent_already)
+    assert (cancelled.status, sent_already.status) == ("cancelled", "sent")
+    db.close()
+
+
+def test_only_the_lease_holder_schedules(session_factory):
+    db = session_factory()
+    queue = RecordingQueue()
+    first, second = _scheduler(session_factory, queue), _scheduler(session_factory, queue)
+    for scheduler in (first, second):
+        scheduler.lease_ttl = timedelta(seconds=0.6)
+    _scheduled(db, 0.2)
+
+    async def main():
+        tasks = [asyncio.create_task(first.start())]
+        await asyncio.sleep(0.1)
+        tasks.append(asyncio.create_task(second.start()))
+        await asyncio.sleep(0.4)
+        before = (first.is_leader, second.is_leader, first.fired, second.fired)
+
+        # Stopping the leader releases the lease, so the other replica takes over
+        late = _scheduled(db, 0.3)
+        await first.stop()
+        await asyncio.sleep(0.8)
+        after = (second.is_leader, late.notification_id in queue.enqueued)
+
+        await second.stop()
+        await asyncio.gather(*tasks)
+        return before, after
+
+    before, after = asyncio.run(main())
+
+    assert before == (True, False, 1, 0)
+    assert after == (True, True)
+    db.close()
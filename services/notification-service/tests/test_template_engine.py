@@ -0,0 +1,66 @@
+"""
+Tests for the compiled template cache and batch rendering
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+from app.template_engine import TemplateEngine
+
+
+def _template(version=1, message="Dear {{ recipient.name }}, fees of {{ amount }} are due"):
+    return SimpleNamespace(
+        template_id="fees",
+        version=version,
+        subject_template="Fees for {{ recipient.name }}",
+        message_template=message,
+        html_template=None
+    )
+
+
+def _contexts(size):
+    return [{"amount": 5000, "recipient": {"name": f"Parent {i}"}} for i in range(size)]
+
+
+def test_templates_compile_once_per_version():
+    engine = TemplateEngine()
+
+    first = engine.get(_template())
+    assert engine.get(_template()) is first
+    assert first.variables == {"amount", "recipient"}
+    assert engine.stats == {"misses": 1, "hits": 1}
+
+    updated = engine.get(_template(version=2, message="Reminder: {{ amount }}"))
+    assert updated is not first
+    assert updated.render({"amount": 1, "recipient": {"name": "A"}})["message"] == "Reminder: 1"
+
+    engine.invalidate("fees")
+    assert engine.compiled == {}
+    assert engine.loader.sources == {}
+
+
+def test_batch_render_is_ordered_and_compiles_once():
+    engine = TemplateEngine()
+    template = _template()
+    contexts = _contexts(2000)
+
+    rendered = asyncio.run(engine.render_batch(template, contexts))
+    assert rendered[0] == {"subject": "Fees for Parent 0", "message": "Dear Parent 0, fees of 5000 are due"}
+    assert rendered[-1]["subject"] == "Fees for Parent 1999"
+    assert engine.stats == {"misses": 1}
+
+    # Later batches of the same version reuse the compiled template
+    asyncio.run(engine.render_batch(template, contexts[:10]))
+    assert engine.stats == {"misses": 1, "hits": 1}
+
+
+def test_large_batches_render_in_process_pool():
+    engine = TemplateEngine()
+    engine.process_threshold = 100
+    try:
+        rendered = asyncio.run(engine.render_batch(_template(), _contexts(500), processes=2))
+    finally:
+        engine.close()
+
+    assert len(rendered) == 500
+    assert [item["subject"] for item in rendered[:3]] == ["Fees for Parent 0", "Fees for Parent 1", "Fees for Parent 2"]
@@ -56,7 +56,7 @@ from .auth import (
     get_student_user, get_teacher_user, get_admin_user, CurrentUser
 )
 from .sync_messaging_service import sync_messaging_service
-from .websocket_manager import connection_manager, event_broadcaster
+from .websocket_manager import connection_manager, event_broadcaster, user_event_relay
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -73,11 +73,15 @@ async def lifespan(app: FastAPI):
     os.makedirs("sync_data", exist_ok=True)
     os.makedirs("temp", exist_ok=True)
     
+    # Relay per-user events (e.g. quiz results ready) from other services
+    user_event_relay.start()
+    
     logger.info("✅ Sync & Messaging Service startup complete")
     yield
     
     # Shutdown
     logger.info("🔽 Shutting down Sync & Messaging Service...")
+    await user_event_relay.stop()
     logger.info("✅ Sync & Messaging Service shutdown complete")
 
 # Initialize FastAPI app
@@ -9,8 +9,15 @@ import json
 import logging
 import asyncio
 from datetime import datetime
+import os
 import uuid
 
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
 from .models import WebSocketConnection
 from .schemas import RealTimeEvent, WebSocketMessage
 from .auth import CurrentUser
@@ -445,3 +452,69 @@ class EventBroadcaster:
 
 # Global event broadcaster instance
 event_broadcaster = EventBroadcaster(connection_manager)
+
+
+class UserEventRelay:
+    """Forwards per-user events published by other services to the user's WebSocket connections
+
+    Services publish JSON messages {"user_id", "event_type", "data"} on a Redis
+    pub/sub channel (e.g. the content service when a quiz has been graded).
+    Every instance of this service subscribes and delivers to the users
+    connected to it.
+    """
+    
+    def __init__(self, broadcaster: EventBroadcaster, channel: Optional[str] = None, redis_url: Optional[str] = None):
+        self.broadcaster = broadcaster
+        self.channel = channel or os.getenv("USER_EVENTS_CHANNEL", "edunerve:user_events")
+        self.redis_url = redis_url or os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        self._task: Optional[asyncio.Task] = None
+    
+    async def handle(self, payload: str):
+        """Deliver one published event"""
+        try:
+            event = json.loads(payload)
+            await self.broadcaster.send_user_notification(int(event["user_id"]), {
+                "event_type": event.get("event_type"),
+                "data": event.get("data", {}),
+                "timestamp": event.get("timestamp") or datetime.utcnow().isoformat()
+            })
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring malformed user event: {e}")
+    
+    async def _run(self):
+        while True:
+            client = aioredis.from_url(self.redis_url, decode_responses=True)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                logger.info(f"Relaying user events from {self.channel}")
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        await self.handle(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"User event relay disconnected, retrying: {e}")
+                await asyncio.sleep(5)
+            finally:
+                await pubsub.close()
+                await client.close()
+    
+    def start(self):
+        if not REDIS_AVAILABLE:
+            logger.warning("redis package not installed; user events will not be relayed")
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+# Global user event relay instance
+user_event_relay = UserEventRelay(event_broadcaster)